@@ -0,0 +1,51 @@
+"""add_report_unique_constraints
+
+Revision ID: b2c3d4e5f6a7
+Revises: 7a8b9c0d1e2f
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b2c3d4e5f6a7'
+down_revision: Union[str, Sequence[str], None] = '7a8b9c0d1e2f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    Add unique constraints on report periods so reports can be upserted
+    for all clients at once with INSERT ... ON CONFLICT.
+    """
+    # Drop duplicate reports left by the old per-client upsert, keep the latest row
+    op.execute("""
+        DELETE FROM weekly_reports a USING weekly_reports b
+        WHERE a.client_id = b.client_id AND a.week_start = b.week_start AND a.id < b.id
+    """)
+    op.execute("""
+        DELETE FROM monthly_reports a USING monthly_reports b
+        WHERE a.client_id = b.client_id AND a.year = b.year AND a.month = b.month AND a.id < b.id
+    """)
+
+    op.create_unique_constraint(
+        'uq_weekly_reports_client_week',
+        'weekly_reports',
+        ['client_id', 'week_start']
+    )
+    op.create_unique_constraint(
+        'uq_monthly_reports_client_period',
+        'monthly_reports',
+        ['client_id', 'year', 'month']
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('uq_monthly_reports_client_period', 'monthly_reports', type_='unique')
+    op.drop_constraint('uq_weekly_reports_client_week', 'weekly_reports', type_='unique')
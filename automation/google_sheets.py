@@ -1,5 +1,8 @@
 import os
+import heapq
 import logging
+from datetime import date
+from typing import Dict, List, Optional, Set
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
 from sqlalchemy.orm import Session
@@ -7,37 +10,104 @@ from core import models
 
 logger = logging.getLogger(__name__)
 
+RAW_DATA_SHEET = "Raw Data"
+RAW_DATA_HEADER = ["Date", "Platform", "Campaign", "Impressions", "Clicks", "Cost", "Conversions"]
+
+# Rows per value range and value ranges per values.batchUpdate call.
+# Keeps every request well below the Sheets API payload limits.
+CHUNK_ROWS = 2000
+RANGES_PER_BATCH = 10
+
+
 class GoogleSheetsService:
+    # Sheet titles per spreadsheet, shared between instances so that the
+    # metadata is fetched once per process instead of once per write.
+    _sheet_titles: Dict[str, Set[str]] = {}
+
     def __init__(self):
         self.scopes = ['https://www.googleapis.com/auth/spreadsheets']
         self.creds_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS", "service_account.json")
         self.service = None
-        
+
         if os.path.exists(self.creds_path):
             creds = Credentials.from_service_account_file(self.creds_path, scopes=self.scopes)
             self.service = build('sheets', 'v4', credentials=creds)
         else:
             logger.warning(f"Google Service Account file not found at {self.creds_path}. Sheets export will be disabled.")
 
-    def export_raw_data(self, spreadsheet_id: str, client_id: str, db: Session):
+    def export_raw_data(self, spreadsheet_id: str, client_id: str, db: Session, since: Optional[date] = None):
         """
         Exports Yandex and VK raw data to the specified spreadsheet.
+
+        Rows are ordered by date. When `since` is given only the rows from that
+        date onwards are rewritten, everything above it is left untouched.
+        Falls back to a full rewrite if the sheet is empty or not date-ordered.
         """
         if not self.service: return
 
-        # Fetch data
-        yandex_data = db.query(models.YandexStats).filter_by(client_id=client_id).all()
-        vk_data = db.query(models.VKStats).filter_by(client_id=client_id).all()
+        start_row = None
+        if since is not None:
+            start_row = self._find_first_row(spreadsheet_id, RAW_DATA_SHEET, since.isoformat())
+
+        if start_row is None:
+            rows = self._fetch_raw_rows(db, client_id, None)
+            self._write_to_sheet(spreadsheet_id, f"{RAW_DATA_SHEET}!A1", [RAW_DATA_HEADER] + rows)
+            return
+
+        rows = self._fetch_raw_rows(db, client_id, since)
+        logger.info(f"Incremental Raw Data export for {client_id}: {len(rows)} rows from {since} (row {start_row})")
+        self._write_rows(spreadsheet_id, RAW_DATA_SHEET, start_row, rows)
+
+    def _fetch_raw_rows(self, db: Session, client_id: str, since: Optional[date]) -> List[list]:
+        """Loads raw stats rows for both platforms, merged in date order."""
+        def query(model, platform):
+            q = db.query(
+                model.date, model.campaign_name, model.impressions,
+                model.clicks, model.cost, model.conversions
+            ).filter(model.client_id == client_id)
+            if since is not None:
+                q = q.filter(model.date >= since)
+            for r in q.order_by(model.date).yield_per(CHUNK_ROWS):
+                yield r.date, platform, r
+
+        merged = heapq.merge(
+            query(models.YandexStats, "Yandex"),
+            query(models.VKStats, "VK"),
+            key=lambda item: item[0]
+        )
+        return [
+            [str(d), platform, r.campaign_name, r.impressions, r.clicks, float(r.cost or 0), r.conversions]
+            for d, platform, r in merged
+        ]
+
+    def _find_first_row(self, spreadsheet_id: str, sheet_name: str, since: str) -> Optional[int]:
+        """
+        Returns the 1-based sheet row of the first data row dated `since` or later.
+        None means the sheet can't be updated incrementally.
+        """
+        try:
+            self._ensure_sheet_exists(spreadsheet_id, sheet_name)
+            result = self.service.spreadsheets().values().get(
+                spreadsheetId=spreadsheet_id,
+                range=f"{sheet_name}!A1:A"
+            ).execute()
+        except Exception as e:
+            logger.error(f"Error reading {sheet_name} dates: {e}")
+            return None
+
+        column = [r[0] if r else "" for r in result.get("values", [])]
+        if not column or column[0] != RAW_DATA_HEADER[0]:
+            return None
 
-        rows = [["Date", "Platform", "Campaign", "Impressions", "Clicks", "Cost", "Conversions"]]
-        
-        for item in yandex_data:
-            rows.append([str(item.date), "Yandex", item.campaign_name, item.impressions, item.clicks, float(item.cost), item.conversions])
-            
-        for item in vk_data:
-            rows.append([str(item.date), "VK", item.campaign_name, item.impressions, item.clicks, float(item.cost), item.conversions])
+        dates = column[1:]
+        if dates != sorted(dates):
+            # Legacy layout (Yandex rows followed by VK rows)
+            return None
 
-        self._write_to_sheet(spreadsheet_id, "Raw Data!A1", rows)
+        for idx, value in enumerate(dates):
+            if value >= since:
+                return idx + 2
+        return len(dates) + 2
 
     def export_reports(self, spreadsheet_id: str, client_id: str, db: Session):
         """
@@ -49,7 +119,7 @@ class GoogleSheetsService:
         rows = [["Week Start", "Week End", "Cost", "Clicks", "Conversions", "CPC", "CPA"]]
         for r in weekly:
             rows.append([str(r.week_start), str(r.week_end), float(r.total_cost), r.total_clicks, r.total_conversions, float(r.avg_cpc), float(r.avg_cpa)])
-        
+
         self._write_to_sheet(spreadsheet_id, "Weekly Reports!A1", rows)
 
     def export_metrika_goals(self, spreadsheet_id: str, client_id: str, db: Session, integration_id: str = None):
@@ -60,51 +130,103 @@ class GoogleSheetsService:
         if not self.service: return
 
         query = db.query(models.MetrikaGoals).filter_by(client_id=client_id)
-        
+
         # Filter by integration_id if provided
         if integration_id:
             query = query.filter_by(integration_id=integration_id)
-        
+
         goals = query.all()
         rows = [["Date", "Goal ID", "Goal Name", "Conversions", "Integration ID"]]
         for g in goals:
             rows.append([str(g.date), g.goal_id, g.goal_name, g.conversion_count, str(g.integration_id) if g.integration_id else "N/A"])
-        
+
         self._write_to_sheet(spreadsheet_id, "Goals!A1", rows)
 
     def _write_to_sheet(self, spreadsheet_id: str, range_name: str, values: list):
+        sheet_name, cell = range_name.split('!')
+        start_row = int(''.join(ch for ch in cell if ch.isdigit()) or 1)
+        self._write_rows(spreadsheet_id, sheet_name, start_row, values)
+
+    def _write_rows(self, spreadsheet_id: str, sheet_name: str, start_row: int, rows: list):
+        """
+        Writes rows starting at `start_row` via values.batchUpdate in chunks and
+        clears whatever was left below the written block. The tail is cleared
+        only after a successful write, so a failed export leaves no gap.
+        """
         try:
             # First ensure the sheet exists
-            sheet_name = range_name.split('!')[0]
             self._ensure_sheet_exists(spreadsheet_id, sheet_name)
 
-            body = {'values': values}
-            self.service.spreadsheets().values().update(
-                spreadsheetId=spreadsheet_id, 
-                range=range_name,
-                valueInputOption='RAW', 
-                body=body
+            values = self.service.spreadsheets().values()
+            end_row = start_row + len(rows)
+
+            data = [
+                {"range": f"{sheet_name}!A{start_row + offset}", "values": rows[offset:offset + CHUNK_ROWS]}
+                for offset in range(0, len(rows), CHUNK_ROWS)
+            ]
+            for i in range(0, len(data), RANGES_PER_BATCH):
+                values.batchUpdate(
+                    spreadsheetId=spreadsheet_id,
+                    body={"valueInputOption": "RAW", "data": data[i:i + RANGES_PER_BATCH]}
+                ).execute()
+
+            values.clear(
+                spreadsheetId=spreadsheet_id,
+                range=f"{sheet_name}!A{end_row}:Z"
             ).execute()
         except Exception as e:
-            logger.error(f"Error writing to Google Sheets {range_name}: {e}")
+            # Cached metadata may be stale (e.g. sheet deleted by a user)
+            self._sheet_titles.pop(spreadsheet_id, None)
+            logger.error(f"Error writing to Google Sheets {sheet_name}: {e}")
 
     def _ensure_sheet_exists(self, spreadsheet_id: str, sheet_name: str):
-        try:
-            spreadsheet = self.service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
-            sheets = [s['properties']['title'] for s in spreadsheet.get('sheets', [])]
-            if sheet_name not in sheets:
-                body = {
-                    'requests': [
-                        {
-                            'addSheet': {
-                                'properties': {
-                                    'title': sheet_name
-                                }
+        titles = self._sheet_titles.get(spreadsheet_id)
+        if titles is None:
+            spreadsheet = self.service.spreadsheets().get(
+                spreadsheetId=spreadsheet_id,
+                fields="sheets.properties.title"
+            ).execute()
+            titles = {s['properties']['title'] for s in spreadsheet.get('sheets', [])}
+            self._sheet_titles[spreadsheet_id] = titles
+
+        if sheet_name not in titles:
+            body = {
+                'requests': [
+                    {
+                        'addSheet': {
+                            'properties': {
+                                'title': sheet_name
                             }
                         }
-                    ]
-                }
-                self.service.spreadsheets().batchUpdate(spreadsheetId=spreadsheet_id, body=body).execute()
-                logger.info(f"Created new sheet: {sheet_name} in {spreadsheet_id}")
-        except Exception as e:
-            logger.error(f"Error ensuring sheet exists {sheet_name}: {e}")
+                    }
+                ]
+            }
+            self.service.spreadsheets().batchUpdate(spreadsheetId=spreadsheet_id, body=body).execute()
+            titles.add(sheet_name)
+            logger.info(f"Created new sheet: {sheet_name} in {spreadsheet_id}")
+
+
+def export_clients(clients: List[tuple], since: Optional[date] = None):
+    """
+    Exports data of the given (client_id, client_name, spreadsheet_id) tuples.
+
+    googleapiclient is blocking, so the scheduler runs this in a worker thread
+    (asyncio.to_thread) with its own DB session.
+    """
+    gs = GoogleSheetsService()
+    if not gs.service:
+        return
+
+    from core.database import SessionLocal
+    db = SessionLocal()
+    try:
+        for client_id, client_name, spreadsheet_id in clients:
+            try:
+                gs.export_raw_data(spreadsheet_id, client_id, db, since=since)
+                gs.export_reports(spreadsheet_id, client_id, db)
+                gs.export_metrika_goals(spreadsheet_id, client_id, db)
+                logger.info(f"Data exported to Google Sheets for client {client_name}")
+            except Exception as e:
+                logger.error(f"Error exporting to Sheets for client {client_name}: {e}")
+    finally:
+        db.close()
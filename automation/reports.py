@@ -1,127 +1,116 @@
 from sqlalchemy.orm import Session
 from core import models
-from sqlalchemy import func, extract
+from sqlalchemy import func, select, union_all, literal_column, Date, Integer
+from sqlalchemy.dialects import postgresql, sqlite
 from datetime import date, timedelta
 import logging
 
 logger = logging.getLogger(__name__)
 
-def generate_weekly_report(db: Session, client_id: str, target_date: date):
+def _stats_in_range(date_from: date, date_to: date):
     """
-    Generates a weekly report for the week containing target_date.
-    Week starts on Monday.
+    Yandex and VK daily stats of all clients within [date_from, date_to].
+    Plain range filter on `date` so the date index can be used.
     """
-    start_of_week = target_date - timedelta(days=target_date.weekday())
-    end_of_week = start_of_week + timedelta(days=6)
+    parts = [
+        select(
+            model.client_id.label("client_id"),
+            model.date.label("date"),
+            model.cost.label("cost"),
+            model.clicks.label("clicks"),
+            model.conversions.label("conversions")
+        ).where(
+            model.date >= date_from,
+            model.date <= date_to
+        )
+        for model in (models.YandexStats, models.VKStats)
+    ]
+    return union_all(*parts).subquery("stats")
 
-    # Aggregate Yandex stats
-    yandex_summary = db.query(
-        func.sum(models.YandexStats.cost).label("cost"),
-        func.sum(models.YandexStats.clicks).label("clicks"),
-        func.sum(models.YandexStats.conversions).label("conversions")
-    ).filter(
-        models.YandexStats.client_id == client_id,
-        models.YandexStats.date >= start_of_week,
-        models.YandexStats.date <= end_of_week
-    ).first()
+def _totals(stats):
+    """SUM columns plus averages, shared by weekly and monthly statements."""
+    total_cost = func.coalesce(func.sum(stats.c.cost), 0)
+    total_clicks = func.coalesce(func.sum(stats.c.clicks), 0)
+    total_convs = func.coalesce(func.sum(stats.c.conversions), 0)
+    # 1.0 keeps the division exact where whole costs are stored as integers (SQLite)
+    cost = total_cost * literal_column("1.0")
+    return [
+        total_cost.label("total_cost"),
+        total_clicks.label("total_clicks"),
+        total_convs.label("total_conversions"),
+        func.coalesce(cost / func.nullif(total_clicks, 0), 0).label("avg_cpc"),
+        func.coalesce(cost / func.nullif(total_convs, 0), 0).label("avg_cpa"),
+    ]
 
-    # Aggregate VK stats
-    vk_summary = db.query(
-        func.sum(models.VKStats.cost).label("cost"),
-        func.sum(models.VKStats.clicks).label("clicks"),
-        func.sum(models.VKStats.conversions).label("conversions")
-    ).filter(
-        models.VKStats.client_id == client_id,
-        models.VKStats.date >= start_of_week,
-        models.VKStats.date <= end_of_week
-    ).first()
+def _week_bounds(db: Session, column):
+    """Monday and Sunday of the week containing `column`."""
+    if db.get_bind().dialect.name == "sqlite":
+        week_start = func.date(column, "-6 days", "weekday 1")
+        return week_start, func.date(week_start, "+6 days")
+    week_start = func.date_trunc("week", column).cast(Date)
+    return week_start, (week_start + literal_column("interval '6 days'")).cast(Date)
 
-    total_cost = float((yandex_summary.cost or 0) + (vk_summary.cost or 0))
-    total_clicks = int((yandex_summary.clicks or 0) + (vk_summary.clicks or 0))
-    total_convs = int((yandex_summary.conversions or 0) + (vk_summary.conversions or 0))
+def _upsert(db: Session, model, columns: list, query, index_elements: list):
+    """INSERT ... SELECT ... ON CONFLICT DO UPDATE of the total columns."""
+    insert = sqlite.insert if db.get_bind().dialect.name == "sqlite" else postgresql.insert
+    stmt = insert(model).from_select(columns, query)
+    return stmt.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={col: stmt.excluded[col] for col in _TOTAL_COLUMNS}
+    )
 
-    avg_cpc = total_cost / total_clicks if total_clicks > 0 else 0
-    avg_cpa = total_cost / total_convs if total_convs > 0 else 0
+_TOTAL_COLUMNS = ["total_cost", "total_clicks", "total_conversions", "avg_cpc", "avg_cpa"]
 
-    # Save or update report
-    report = db.query(models.WeeklyReport).filter_by(
-        client_id=client_id, 
-        week_start=start_of_week
-    ).first()
-
-    if report:
-        report.total_cost = total_cost
-        report.total_clicks = total_clicks
-        report.total_conversions = total_convs
-        report.avg_cpc = avg_cpc
-        report.avg_cpa = avg_cpa
-    else:
-        db.add(models.WeeklyReport(
-            client_id=client_id,
-            week_start=start_of_week,
-            week_end=end_of_week,
-            total_cost=total_cost,
-            total_clicks=total_clicks,
-            total_conversions=total_convs,
-            avg_cpc=avg_cpc,
-            avg_cpa=avg_cpa
-        ))
-    db.commit()
-
-def generate_monthly_report(db: Session, client_id: str, year: int, month: int):
+def generate_weekly_reports(db: Session, date_from: date, date_to: date):
     """
-    Generates a monthly report for the specified month and year.
+    Recomputes weekly reports of all clients for every week touched by
+    [date_from, date_to] in one INSERT ... SELECT ... ON CONFLICT statement.
+    Week starts on Monday. The caller commits.
     """
-    # Aggregate data for the month
-    yandex_summary = db.query(
-        func.sum(models.YandexStats.cost).label("cost"),
-        func.sum(models.YandexStats.clicks).label("clicks"),
-        func.sum(models.YandexStats.conversions).label("conversions")
-    ).filter(
-        models.YandexStats.client_id == client_id,
-        extract('year', models.YandexStats.date) == year,
-        extract('month', models.YandexStats.date) == month
-    ).first()
+    start = date_from - timedelta(days=date_from.weekday())
+    end = date_to + timedelta(days=6 - date_to.weekday())
+
+    stats = _stats_in_range(start, end)
+    week_start, week_end = _week_bounds(db, stats.c.date)
 
-    vk_summary = db.query(
-        func.sum(models.VKStats.cost).label("cost"),
-        func.sum(models.VKStats.clicks).label("clicks"),
-        func.sum(models.VKStats.conversions).label("conversions")
-    ).filter(
-        models.VKStats.client_id == client_id,
-        extract('year', models.VKStats.date) == year,
-        extract('month', models.VKStats.date) == month
-    ).first()
+    query = select(
+        stats.c.client_id,
+        week_start.label("week_start"),
+        week_end.label("week_end"),
+        *_totals(stats)
+    ).group_by(stats.c.client_id, week_start)
 
-    total_cost = float((yandex_summary.cost or 0) + (vk_summary.cost or 0))
-    total_clicks = int((yandex_summary.clicks or 0) + (vk_summary.clicks or 0))
-    total_convs = int((yandex_summary.conversions or 0) + (vk_summary.conversions or 0))
+    stmt = _upsert(
+        db, models.WeeklyReport, ["client_id", "week_start", "week_end", *_TOTAL_COLUMNS], query,
+        index_elements=["client_id", "week_start"]
+    )
+    result = db.execute(stmt)
+    logger.info(f"Weekly reports upserted for {start} - {end}: {result.rowcount} rows")
+
+def generate_monthly_reports(db: Session, date_from: date, date_to: date):
+    """
+    Recomputes monthly reports of all clients for every month touched by
+    [date_from, date_to] in one INSERT ... SELECT ... ON CONFLICT statement.
+    The caller commits.
+    """
+    start = date_from.replace(day=1)
+    next_month = (date_to.replace(day=1) + timedelta(days=32)).replace(day=1)
+    end = next_month - timedelta(days=1)
 
-    avg_cpc = total_cost / total_clicks if total_clicks > 0 else 0
-    avg_cpa = total_cost / total_convs if total_convs > 0 else 0
+    stats = _stats_in_range(start, end)
+    month = func.extract("month", stats.c.date).cast(Integer)
+    year = func.extract("year", stats.c.date).cast(Integer)
 
-    # Save or update report
-    report = db.query(models.MonthlyReport).filter_by(
-        client_id=client_id, 
-        month=month,
-        year=year
-    ).first()
+    query = select(
+        stats.c.client_id,
+        month.label("month"),
+        year.label("year"),
+        *_totals(stats)
+    ).group_by(stats.c.client_id, year, month)
 
-    if report:
-        report.total_cost = total_cost
-        report.total_clicks = total_clicks
-        report.total_conversions = total_convs
-        report.avg_cpc = avg_cpc
-        report.avg_cpa = avg_cpa
-    else:
-        db.add(models.MonthlyReport(
-            client_id=client_id,
-            month=month,
-            year=year,
-            total_cost=total_cost,
-            total_clicks=total_clicks,
-            total_conversions=total_convs,
-            avg_cpc=avg_cpc,
-            avg_cpa=avg_cpa
-        ))
-    db.commit()
+    stmt = _upsert(
+        db, models.MonthlyReport, ["client_id", "month", "year", *_TOTAL_COLUMNS], query,
+        index_elements=["client_id", "year", "month"]
+    )
+    result = db.execute(stmt)
+    logger.info(f"Monthly reports upserted for {start} - {end}: {result.rowcount} rows")
@@ -6,8 +6,8 @@ from core.logging_utils import log_event
 from automation.yandex_direct import YandexDirectAPI
 from automation.yandex_metrica import YandexMetricaAPI
 from automation.vk_ads import VKAdsAPI
-from automation.reports import generate_weekly_report, generate_monthly_report
-from automation.google_sheets import GoogleSheetsService
+from automation.reports import generate_weekly_reports, generate_monthly_reports
+from automation.google_sheets import export_clients
 from datetime import datetime, timedelta
 import asyncio
 import logging
@@ -385,27 +385,30 @@ async def sync_data(days: int = 7, max_concurrent: int = 5):
             
         db.commit()
 
-        # Generate reports for each client
+        # Recompute reports of all clients for the periods touched by this sync window
+        try:
+            generate_weekly_reports(db, start_date, end_date)
+            generate_monthly_reports(db, start_date, end_date)
+            db.commit()
+        except Exception as e:
+            logger.error(f"Error generating reports: {e}")
+            db.rollback()
+
         clients = db.query(models.Client).all()
-        for client in clients:
-            try:
-                generate_weekly_report(db, client.id, end_date)
-                generate_monthly_report(db, client.id, end_date.year, end_date.month)
-            except Exception as e:
-                logger.error(f"Error generating reports for client {client.id}: {e}")
 
         # Google Sheets Export
-        gs = GoogleSheetsService()
-        for client in clients:
-            spreadsheet_id = getattr(client, 'spreadsheet_id', None)
-            if spreadsheet_id and gs.service:
-                try:
-                    gs.export_raw_data(spreadsheet_id, client.id, db)
-                    gs.export_reports(spreadsheet_id, client.id, db)
-                    gs.export_metrika_goals(spreadsheet_id, client.id, db)
-                    logger.info(f"Data exported to Google Sheets for client {client.name}")
-                except Exception as e:
-                    logger.error(f"Error exporting to Sheets for client {client.name}: {e}")
+        # googleapiclient is blocking: run it in a worker thread so the scheduler loop stays responsive.
+        # Only the synced window is rewritten in "Raw Data", older rows are already in the sheet.
+        sheets_clients = [
+            (client.id, client.name, client.spreadsheet_id)
+            for client in clients
+            if getattr(client, 'spreadsheet_id', None)
+        ]
+        if sheets_clients:
+            try:
+                await asyncio.to_thread(export_clients, sheets_clients, start_date)
+            except Exception as e:
+                logger.error(f"Error exporting to Sheets: {e}")
 
         logger.info("Данные успешно синхронизированы и отчеты обновлены")
     except Exception as e:
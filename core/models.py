@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, String, ForeignKey, DateTime, Integer, Numeric, Date, Enum, BigInteger, Boolean
+from sqlalchemy import Column, String, ForeignKey, DateTime, Integer, Numeric, Date, Enum, BigInteger, Boolean, UniqueConstraint
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -176,6 +176,9 @@ class MetrikaGoals(Base):
 
 class WeeklyReport(Base):
     __tablename__ = "weekly_reports"
+    __table_args__ = (
+        UniqueConstraint("client_id", "week_start", name="uq_weekly_reports_client_week"),
+    )
     
     id = Column(BigInteger, primary_key=True, autoincrement=True)
     client_id = Column(UUID(as_uuid=True), ForeignKey("clients.id"))
@@ -191,6 +194,9 @@ class WeeklyReport(Base):
 
 class MonthlyReport(Base):
     __tablename__ = "monthly_reports"
+    __table_args__ = (
+        UniqueConstraint("client_id", "year", "month", name="uq_monthly_reports_client_period"),
+    )
     
     id = Column(BigInteger, primary_key=True, autoincrement=True)
     client_id = Column(UUID(as_uuid=True), ForeignKey("clients.id"))
@@ -0,0 +1,266 @@
+"""
+Dashboard query benchmark.
+
+Times the dashboard endpoints (summary, dynamics, campaigns, keywords,
+/clients/stats) for every benchmark user and date range, and writes a
+JSON report that can be compared between commits. The endpoint functions
+are called directly, without the response cache and HTTP layer, so the
+numbers are the database work plus Python aggregation.
+
+Each case counts SQL statements and, with --explain, stores EXPLAIN
+(ANALYZE, BUFFERS) for its slowest distinct statements (on SQLite:
+EXPLAIN QUERY PLAN).
+
+Seed data first (see seed_test_data.py --synthetic), then:
+
+    python debug_scripts/bench_dashboard.py --explain -o bench_dashboard.json
+    python debug_scripts/bench_dashboard.py --compare bench_dashboard.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.getcwd())
+
+from sqlalchemy import event, func
+
+from core.database import SessionLocal, engine
+from core import models
+from backend_api import clients, stats
+from backend_api.stats_service import StatsService
+
+BENCH_EMAIL_DOMAIN = "bench.local"
+EXPLAIN_TOP = 3
+
+
+class QueryRecorder:
+    """Counts statements on the engine and optionally keeps them for EXPLAIN."""
+
+    def __init__(self):
+        self.count = 0
+        self.capture = False
+        self.statements = []
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+        if self.capture:
+            self.statements.append((statement, parameters))
+
+    def close(self):
+        event.remove(engine, "before_cursor_execute", self._on_execute)
+
+
+def endpoint_calls(user, start_date: str, end_date: str) -> dict:
+    """Endpoint name -> zero-argument callable returning the response data."""
+    common = dict(start_date=start_date, end_date=end_date, client_id=None, current_user=user)
+    dashboard = dict(common, campaign_ids=None, platform="all")
+
+    def run_async(handler, **kwargs):
+        # __wrapped__ skips cache_response
+        return lambda db: asyncio.run(handler.__wrapped__(db=db, **kwargs))
+
+    return {
+        "summary": run_async(stats.get_summary, **dashboard),
+        "dynamics": run_async(stats.get_dynamics, **dashboard),
+        "campaigns": run_async(stats.get_campaign_stats, **dashboard),
+        "keywords": run_async(stats.get_keyword_stats, **common),
+        "clients_stats": lambda db: clients.get_clients_with_stats(
+            start_date=start_date, end_date=end_date, current_user=user, db=db
+        ),
+    }
+
+
+def explain(db, statements: list) -> list:
+    """Plans for the slowest distinct SELECT statements of one call."""
+    dialect = db.get_bind().dialect.name
+    seen, plans = set(), []
+    for statement, parameters in statements:
+        if not statement.lstrip().upper().startswith("SELECT") or statement in seen:
+            continue
+        seen.add(statement)
+        if dialect == "postgresql":
+            rows = db.connection().exec_driver_sql("EXPLAIN (ANALYZE, BUFFERS) " + statement, parameters).all()
+            lines = [row[0] for row in rows]
+            match = re.search(r"Execution Time: ([\d.]+) ms", lines[-1])
+            execution_ms = float(match.group(1)) if match else None
+        else:
+            rows = db.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+            lines = [str(row[-1]) for row in rows]
+            execution_ms = None
+        plans.append({"sql": " ".join(statement.split()), "execution_ms": execution_ms, "plan": lines})
+    if dialect != "postgresql":
+        return plans
+    plans.sort(key=lambda p: p["execution_ms"] or 0, reverse=True)
+    return plans[:EXPLAIN_TOP]
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))], 2)
+
+
+def dataset_info(db, user) -> dict:
+    client_ids = StatsService.get_effective_client_ids(db, user.id)
+    rows = {
+        model.__tablename__: db.query(func.count(model.id)).filter(model.client_id.in_(client_ids)).scalar()
+        for model in (models.YandexStats, models.VKStats, models.YandexKeywords, models.MetrikaGoals)
+    }
+    first_day = db.query(func.min(models.YandexStats.date)).filter(models.YandexStats.client_id.in_(client_ids)).scalar()
+    campaigns = db.query(func.count(models.Campaign.id)).join(models.Integration).filter(
+        models.Integration.client_id.in_(client_ids)
+    ).scalar()
+    return {"email": user.email, "clients": len(client_ids), "campaigns": campaigns, "rows": rows, "first_day": first_day}
+
+
+def run_case(db, recorder: QueryRecorder, call, args) -> tuple:
+    """Warm-up call (queries captured), then timed repeats."""
+    recorder.capture, recorder.statements, recorder.count = True, [], 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        call(db)
+    recorder.capture = False
+    queries, statements = recorder.count, recorder.statements
+
+    timings = []
+    for _ in range(args.repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            call(db)
+            timings.append((time.perf_counter() - started) * 1000)
+        db.rollback()
+    return timings, queries, statements
+
+
+def run(args) -> dict:
+    db = SessionLocal()
+    recorder = QueryRecorder()
+    results, plans, datasets = [], [], {}
+    today = datetime.utcnow().date()
+    try:
+        query = db.query(models.User)
+        if args.email:
+            query = query.filter(models.User.email.in_(args.email))
+        else:
+            query = query.filter(models.User.email.like(f"%@{BENCH_EMAIL_DOMAIN}"))
+        users = query.order_by(models.User.email).all()
+        if not users:
+            raise SystemExit("No benchmark users found: run seed_test_data.py --synthetic or pass --email")
+
+        for user in users:
+            label = user.email.split("@")[0]
+            info = dataset_info(db, user)
+            datasets[label] = {**info, "first_day": str(info["first_day"])}
+            print(f"{label}: {info['clients']} clients, {info['campaigns']} campaigns, rows {info['rows']}")
+
+            for days in args.ranges:
+                first_day = info["first_day"] or today
+                start = first_day if days == 0 else today - timedelta(days=days - 1)
+                range_label = "all" if days == 0 else f"{days}d"
+                for endpoint, call in endpoint_calls(user, str(start), str(today)).items():
+                    if args.endpoints and endpoint not in args.endpoints:
+                        continue
+                    timings, queries, statements = run_case(db, recorder, call, args)
+                    result = {
+                        "dataset": label,
+                        "range": range_label,
+                        "endpoint": endpoint,
+                        "queries": queries,
+                        "min_ms": round(min(timings), 2),
+                        "p50_ms": percentile(timings, 0.5),
+                        "p95_ms": percentile(timings, 0.95),
+                        "max_ms": round(max(timings), 2),
+                    }
+                    results.append(result)
+                    print(f"  {range_label:>5} {endpoint:<14} p50 {result['p50_ms']:>9} ms  "
+                          f"p95 {result['p95_ms']:>9} ms  {queries} queries")
+                    if args.explain:
+                        plans.append({"dataset": label, "range": range_label, "endpoint": endpoint,
+                                      "statements": explain(db, statements)})
+                        db.rollback()
+    finally:
+        recorder.close()
+        db.close()
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "database": engine.dialect.name,
+            "args": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        },
+        "datasets": datasets,
+        "results": results,
+        "explain": plans,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    """p50 regressions and query count growth per (dataset, range, endpoint)."""
+    old = {(r["dataset"], r["range"], r["endpoint"]): r for r in baseline["results"]}
+    regressions = []
+    for r in current["results"]:
+        prev = old.get((r["dataset"], r["range"], r["endpoint"]))
+        if not prev:
+            continue
+        name = f"{r['dataset']} {r['range']} {r['endpoint']}"
+        if prev["p50_ms"] and r["p50_ms"] > prev["p50_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p50 {prev['p50_ms']} -> {r['p50_ms']} ms")
+        if r["queries"] > prev["queries"]:
+            regressions.append(f"{name}: queries {prev['queries']} -> {r['queries']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dashboard queries")
+    parser.add_argument("--email", nargs="+", help="Users to benchmark (default: all bench-*@bench.local)")
+    parser.add_argument("--ranges", type=int, nargs="+", default=[7, 30, 90, 365, 0],
+                        help="Date ranges in days ending today, 0 = all history (default: 7 30 90 365 0)")
+    parser.add_argument("--endpoints", nargs="+",
+                        choices=["summary", "dynamics", "campaigns", "keywords", "clients_stats"],
+                        help="Only these endpoints")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case (default: 5)")
+    parser.add_argument("--explain", action="store_true", help="Capture query plans")
+    parser.add_argument("-o", "--output", default="bench_dashboard.json", help="JSON report file")
+    parser.add_argument("--compare", help="Baseline report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Allowed relative p50 regression for --compare (default: 0.2)")
+    args = parser.parse_args()
+
+    report = run(args)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+    print(f"Report written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.compare} (commit {baseline['meta'].get('commit')})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""
+Offline throughput benchmark of automation.sync.sync_data.
+
+Fixtures from fake_platforms.py are served by a local uvicorn process.
+For each platform, a separate process runs sync_data against them:
+- the platform hosts are redirected to the fake server by an httpx transport;
+- the database holds only that platform's bench integrations.
+
+The report gives wall time, rows/sec, DB round trips (statements sent)
+and peak RSS per platform, plus API requests and Direct Units spent.
+
+The tables are DROPPED and recreated for every platform, so use a
+scratch database (the script refuses to run if it finds non-bench users):
+
+    DATABASE_URL=sqlite:///sync_bench.db python debug_scripts/bench_sync.py --days 30 --campaigns 50
+    DATABASE_URL=postgresql://.../sync_bench python debug_scripts/bench_sync.py --compare bench_sync.json
+
+Sync output (DEBUG_TRACE prints, logs) goes to <fixtures>/sync_<platform>.log.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform as platform_info
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.append(os.getcwd())
+
+import httpx
+
+from debug_scripts.fake_platforms import PLATFORM_HOSTS, build_app, generate_fixtures
+
+BENCH_EMAIL = "bench-sync@bench.local"
+PLATFORMS = ["direct", "vk", "metrika"]
+
+
+class PlatformTransport(httpx.AsyncHTTPTransport):
+    """Sends platform API requests to the fake server, refuses everything else."""
+
+    def __init__(self, port: int):
+        super().__init__()
+        self.port = port
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.url.host not in PLATFORM_HOSTS:
+            raise httpx.ConnectError(f"bench: network access to {request.url.host} is disabled", request=request)
+        request.url = request.url.copy_with(scheme="http", host="127.0.0.1", port=self.port)
+        return await super().handle_async_request(request)
+
+
+def _serve(fixtures_dir: str, port: int, queue_polls: int, retry_after: int):
+    import uvicorn
+    uvicorn.run(build_app(fixtures_dir, queue_polls, retry_after), host="127.0.0.1", port=port, log_level="warning")
+
+
+def _wait_ready(base_url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/_stats").status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Fake platform server did not start at {base_url}")
+
+
+def _seed(db, models, security, platform: str, manifest: dict, integrations: int):
+    """Bench user, one client and `integrations` integrations of the platform."""
+    user = models.User(email=BENCH_EMAIL, username="bench_sync", password_hash=security.get_password_hash("bench"))
+    db.add(user)
+    db.flush()
+    client = models.Client(owner_id=user.id, name="Bench sync client")
+    db.add(client)
+    db.flush()
+
+    platform_enum, account_id = {
+        "direct": (models.IntegrationPlatform.YANDEX_DIRECT, "bench-login"),
+        "vk": (models.IntegrationPlatform.VK_ADS, "bench-vk"),
+        "metrika": (models.IntegrationPlatform.YANDEX_METRIKA, "12345678"),
+    }[platform]
+    for _ in range(integrations):
+        integration = models.Integration(
+            client_id=client.id,
+            platform=platform_enum,
+            access_token=security.encrypt_token("bench-token"),
+            account_id=account_id,
+        )
+        db.add(integration)
+        db.flush()
+        if platform == "direct":
+            # Direct stats are only stored for campaigns discovered beforehand
+            db.add_all(
+                models.Campaign(integration_id=integration.id, external_id=external_id, name=name)
+                for external_id, name in manifest["direct_campaigns"]
+            )
+    db.commit()
+
+
+def run_platform(platform: str, args, manifest: dict, port: int, log_path: str) -> dict:
+    """Child process: reset the schema, seed, run sync_data, measure."""
+    log = open(log_path, "w", encoding="utf-8")
+    os.dup2(log.fileno(), 1)
+    os.dup2(log.fileno(), 2)
+
+    from sqlalchemy import BigInteger, event, func
+    from sqlalchemy.ext.compiler import compiles
+    from core.database import Base, SessionLocal, engine
+
+    if engine.dialect.name == "sqlite":
+        # SQLite only autoincrements INTEGER PRIMARY KEY
+        compiles(BigInteger, "sqlite")(lambda type_, compiler, **kw: "INTEGER")
+
+    from core import models, security
+    from automation.sync import sync_data
+
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    db = SessionLocal()
+    try:
+        _seed(db, models, security, platform, manifest, args.integrations)
+    finally:
+        db.close()
+
+    original_client = httpx.AsyncClient
+
+    class BenchAsyncClient(original_client):
+        def __init__(self, *a, **kw):
+            kw.setdefault("transport", PlatformTransport(port))
+            super().__init__(*a, **kw)
+
+    httpx.AsyncClient = BenchAsyncClient
+    round_trips = [0]
+    event.listen(engine, "before_cursor_execute", lambda *a: round_trips.__setitem__(0, round_trips[0] + 1))
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    asyncio.run(sync_data(days=manifest["days"] - 1, max_concurrent=args.max_concurrent))
+    wall = time.perf_counter() - started
+    rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    statements = round_trips[0]
+
+    db = SessionLocal()
+    try:
+        stored = {
+            model.__tablename__: db.query(func.count(model.id)).scalar()
+            for model in (models.YandexStats, models.YandexGroups, models.YandexKeywords,
+                          models.VKStats, models.MetrikaGoals)
+        }
+        statuses = [
+            {"status": i.sync_status.value if i.sync_status else None, "error": i.error_message}
+            for i in db.query(models.Integration)
+        ]
+    finally:
+        db.close()
+
+    return {
+        "wall_sec": round(wall, 3),
+        "db_round_trips": statements,
+        "rows_stored": {table: count for table, count in stored.items() if count},
+        # ru_maxrss is in KiB on Linux
+        "rss_before_mb": round(rss_before / 1024, 1),
+        "peak_rss_mb": round(rss_peak / 1024, 1),
+        "integrations": statuses,
+    }
+
+
+def expected_rows(platform: str, manifest: dict, integrations: int) -> int:
+    rows = manifest["rows"]
+    per_integration = {
+        "direct": rows["direct_campaign"] + rows["direct_group"] + rows["direct_keyword"],
+        "vk": rows["vk"],
+        "metrika": rows["metrika"],
+    }[platform]
+    return per_integration * integrations
+
+
+def check_scratch_database():
+    """Refuse to drop tables of a database with real users."""
+    from sqlalchemy import inspect, text
+    from core.database import engine
+
+    if "users" not in inspect(engine).get_table_names():
+        return
+    with engine.connect() as conn:
+        real_users = conn.execute(text("SELECT COUNT(*) FROM users WHERE email NOT LIKE '%@bench.local'")).scalar()
+    if real_users:
+        raise SystemExit(f"Database has {real_users} real users: bench_sync drops all tables, use a scratch DATABASE_URL")
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    """Throughput drops, and growth in round trips or peak RSS, beyond threshold."""
+    regressions = []
+    for name, result in current["platforms"].items():
+        old = baseline["platforms"].get(name)
+        if not old or "error" in result or "error" in old:
+            continue
+        if old["rows_per_sec"] and result["rows_per_sec"] < old["rows_per_sec"] * (1 - threshold):
+            regressions.append(f"{name}: rows/sec {old['rows_per_sec']} -> {result['rows_per_sec']}")
+        if result["db_round_trips"] > old["db_round_trips"] * (1 + threshold):
+            regressions.append(f"{name}: DB round trips {old['db_round_trips']} -> {result['db_round_trips']}")
+        if result["peak_rss_mb"] > old["peak_rss_mb"] * (1 + threshold):
+            regressions.append(f"{name}: peak RSS {old['peak_rss_mb']} -> {result['peak_rss_mb']} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sync_data against local platform fixtures")
+    parser.add_argument("--platforms", nargs="+", choices=PLATFORMS, default=PLATFORMS)
+    parser.add_argument("--fixtures", help="Fixture directory: reused if it has manifest.json, generated otherwise")
+    parser.add_argument("--days", type=int, default=30, help="Days of stats in generated fixtures (default: 30)")
+    parser.add_argument("--campaigns", type=int, default=20, help="Direct campaigns (default: 20)")
+    parser.add_argument("--groups", type=int, default=5, help="Ad groups per Direct campaign (default: 5)")
+    parser.add_argument("--keywords", type=int, default=20, help="Keywords per Direct campaign (default: 20)")
+    parser.add_argument("--vk-campaigns", type=int, default=10, help="VK ad plans (default: 10)")
+    parser.add_argument("--integrations", type=int, default=1, help="Integrations per platform (default: 1)")
+    parser.add_argument("--max-concurrent", type=int, default=5, help="sync_data concurrency (default: 5)")
+    parser.add_argument("--queue-polls", type=int, default=2, help="Direct 201/202 responses per report (default: 2)")
+    parser.add_argument("--retry-after", type=int, default=0, help="Direct retryIn seconds (default: 0)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("-o", "--output", default="bench_sync.json", help="JSON report file")
+    parser.add_argument("--compare", help="Baseline report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Allowed relative regression for --compare (default: 0.2)")
+    args = parser.parse_args()
+
+    check_scratch_database()
+
+    fixtures_dir = args.fixtures or tempfile.mkdtemp(prefix="bench_sync_")
+    manifest_path = os.path.join(fixtures_dir, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        print(f"Replaying fixtures from {fixtures_dir}: {manifest['rows']}")
+        if manifest["date_to"] != datetime.now().date().isoformat():
+            # sync_data asks for the window ending today; VK and Metrika are filtered by date
+            print(f"WARNING: fixtures end on {manifest['date_to']}, regenerate them for comparable VK/Metrika rows")
+    else:
+        manifest = generate_fixtures(fixtures_dir, args.days, args.campaigns, args.groups, args.keywords,
+                                     args.vk_campaigns)
+        print(f"Generated fixtures in {fixtures_dir}: {manifest['rows']}")
+
+    context = multiprocessing.get_context("spawn")
+    server = context.Process(target=_serve, args=(fixtures_dir, args.port, args.queue_polls, args.retry_after),
+                             daemon=True)
+    server.start()
+    base_url = f"http://127.0.0.1:{args.port}"
+    results = {}
+    try:
+        _wait_ready(base_url)
+        for name in args.platforms:
+            httpx.post(f"{base_url}/_reset")
+            log_path = os.path.join(fixtures_dir, f"sync_{name}.log")
+            rows = expected_rows(name, manifest, args.integrations)
+            with context.Pool(1) as pool:
+                try:
+                    result = pool.apply(run_platform, (name, args, manifest, args.port, log_path))
+                except Exception as e:
+                    results[name] = {"error": f"{type(e).__name__}: {e}", "log": log_path}
+                    print(f"{name}: failed ({e}), see {log_path}")
+                    continue
+            api = httpx.get(f"{base_url}/_stats").json()
+            result.update({
+                "rows_fetched": rows,
+                "rows_per_sec": round(rows / result["wall_sec"], 1) if result["wall_sec"] else 0.0,
+                "round_trips_per_row": round(result["db_round_trips"] / rows, 2) if rows else 0.0,
+                "api_requests": api["requests"],
+                "units_spent": api["units_spent"],
+                "log": log_path,
+            })
+            results[name] = result
+            failed = [i["error"] for i in result["integrations"] if i["status"] != "SUCCESS"]
+            print(f"{name}: {rows} rows in {result['wall_sec']}s ({result['rows_per_sec']} rows/s), "
+                  f"{result['db_round_trips']} DB round trips, peak RSS {result['peak_rss_mb']} MB"
+                  + (f", FAILED: {failed[0]}" if failed else ""))
+    finally:
+        server.terminate()
+        server.join()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform_info.python_version(),
+            "database": os.getenv("DATABASE_URL", "").split("://")[0],
+            "args": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        },
+        "fixtures": {"dir": fixtures_dir, **{k: manifest[k] for k in ("days", "date_from", "date_to", "rows")}},
+        "platforms": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Report written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.compare} (commit {baseline['meta'].get('commit')})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Local fake of the ad platform APIs used by automation/sync.py.
+
+Fixtures are generated once into a directory and replayed by a FastAPI app:
+- Yandex Direct Reports API (POST /json/v5/reports): CAMPAIGN, ADGROUP and
+  CRITERIA performance reports as TSV. Each report is queued first (201,
+  then 202 for --queue-polls requests) and carries Units and retryIn headers.
+- VK Ads (GET /api/v2/ad_plans.json, /api/v2/statistics/ad_plans/day.json),
+  filtered by date_from/date_to like the real API.
+- Metrika (GET /stat/v1/data): goal reaches by day.
+
+    python debug_scripts/fake_platforms.py generate --out fixtures --days 30 --campaigns 50
+    python debug_scripts/fake_platforms.py serve --fixtures fixtures --port 8765
+"""
+
+import argparse
+import json
+import os
+import random
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+# Real host -> platform name, used by clients that redirect traffic here
+PLATFORM_HOSTS = {
+    "api.direct.yandex.com": "direct",
+    "ads.vk.com": "vk",
+    "api-metrica.yandex.net": "metrika",
+}
+
+REPORT_FILES = {
+    "CAMPAIGN_PERFORMANCE_REPORT": "direct_campaign.tsv",
+    "ADGROUP_PERFORMANCE_REPORT": "direct_group.tsv",
+    "CRITERIA_PERFORMANCE_REPORT": "direct_keyword.tsv",
+}
+REPORT_FIELDS = {
+    "CAMPAIGN_PERFORMANCE_REPORT": ["Date", "CampaignId", "CampaignName"],
+    "ADGROUP_PERFORMANCE_REPORT": ["Date", "CampaignId", "AdGroupName", "CampaignName"],
+    "CRITERIA_PERFORMANCE_REPORT": ["Date", "CampaignId", "Criteria", "CampaignName"],
+}
+METRIC_FIELDS = ["Impressions", "Clicks", "Cost", "Conversions"]
+UNITS_LIMIT = 240000
+
+
+def _metrics(rng: random.Random, scale: float) -> tuple:
+    impressions = int(rng.lognormvariate(7, 1) * scale)
+    clicks = int(impressions * rng.uniform(0.01, 0.08))
+    cost_micros = int(clicks * rng.uniform(10, 80) * 1000000)
+    conversions = int(clicks * rng.uniform(0.02, 0.1))
+    return impressions, clicks, cost_micros, conversions
+
+
+def _write_report(path: str, report_type: str, rows: list) -> None:
+    """TSV as the Reports API returns it: title, header, rows, "Total rows"."""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"\"{report_type}\"\n")
+        f.write("\t".join(REPORT_FIELDS[report_type] + METRIC_FIELDS) + "\n")
+        for row in rows:
+            f.write("\t".join(str(v) for v in row) + "\n")
+        f.write(f"Total rows: {len(rows)}\n")
+
+
+def generate_fixtures(out_dir: str, days: int, campaigns: int, groups: int, keywords: int,
+                      vk_campaigns: int, seed: int = 1, end: date = None) -> dict:
+    """
+    Write fixtures for days ending at `end` (today) and return the
+    manifest: campaign ids/names and row counts per file.
+    """
+    rng = random.Random(seed)
+    end = end or datetime.now().date()
+    dates = [(end - timedelta(days=days - 1 - i)).isoformat() for i in range(days)]
+    os.makedirs(out_dir, exist_ok=True)
+
+    direct = [(str(10000000 + n), f"Direct campaign {n + 1}") for n in range(campaigns)]
+    campaign_rows, group_rows, keyword_rows = [], [], []
+    for d in dates:
+        for campaign_id, name in direct:
+            campaign_rows.append((d, campaign_id, name) + _metrics(rng, 1))
+            for g in range(groups):
+                group_rows.append((d, campaign_id, f"Group {g + 1}", name) + _metrics(rng, 1 / groups))
+            for k in range(keywords):
+                keyword_rows.append((d, campaign_id, f"keyword {campaign_id} {k + 1}", name) + _metrics(rng, 1 / keywords))
+    _write_report(os.path.join(out_dir, REPORT_FILES["CAMPAIGN_PERFORMANCE_REPORT"]), "CAMPAIGN_PERFORMANCE_REPORT", campaign_rows)
+    _write_report(os.path.join(out_dir, REPORT_FILES["ADGROUP_PERFORMANCE_REPORT"]), "ADGROUP_PERFORMANCE_REPORT", group_rows)
+    _write_report(os.path.join(out_dir, REPORT_FILES["CRITERIA_PERFORMANCE_REPORT"]), "CRITERIA_PERFORMANCE_REPORT", keyword_rows)
+
+    vk = [(20000000 + n, f"VK campaign {n + 1}") for n in range(vk_campaigns)]
+    vk_items = []
+    for plan_id, _ in vk:
+        rows = []
+        for d in dates:
+            impressions, clicks, cost_micros, conversions = _metrics(rng, 1)
+            rows.append({"date": d, "base": {
+                "shows": impressions, "clicks": clicks, "spent": f"{cost_micros / 1000000:.2f}", "goals": conversions
+            }})
+        vk_items.append({"id": plan_id, "rows": rows, "total": {}})
+    with open(os.path.join(out_dir, "vk_ad_plans.json"), "w", encoding="utf-8") as f:
+        json.dump({"count": len(vk), "items": [{"id": i, "name": n, "status": "active"} for i, n in vk]}, f)
+    with open(os.path.join(out_dir, "vk_statistics.json"), "w", encoding="utf-8") as f:
+        json.dump({"items": vk_items}, f)
+
+    metrika = [{"dimensions": [{"name": d}], "metrics": [round(rng.uniform(1, 10), 2), rng.randint(0, 300)]} for d in dates]
+    with open(os.path.join(out_dir, "metrika_goals.json"), "w", encoding="utf-8") as f:
+        json.dump({"data": metrika}, f)
+
+    manifest = {
+        "days": days,
+        "date_from": dates[0],
+        "date_to": dates[-1],
+        "direct_campaigns": direct,
+        "vk_campaigns": vk,
+        "rows": {
+            "direct_campaign": len(campaign_rows),
+            "direct_group": len(group_rows),
+            "direct_keyword": len(keyword_rows),
+            "vk": len(vk) * days,
+            "metrika": days,
+        },
+    }
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def build_app(fixtures_dir: str, queue_polls: int = 2, retry_after: int = 0) -> FastAPI:
+    """App replaying fixtures; GET /_stats returns request counters."""
+    app = FastAPI()
+    reports = {}
+    for report_type, name in REPORT_FILES.items():
+        with open(os.path.join(fixtures_dir, name), encoding="utf-8") as f:
+            reports[report_type] = f.read()
+    with open(os.path.join(fixtures_dir, "vk_ad_plans.json"), encoding="utf-8") as f:
+        vk_plans = json.load(f)
+    with open(os.path.join(fixtures_dir, "vk_statistics.json"), encoding="utf-8") as f:
+        vk_stats = json.load(f)
+    with open(os.path.join(fixtures_dir, "metrika_goals.json"), encoding="utf-8") as f:
+        metrika = json.load(f)
+
+    polls = Counter()
+    requests = Counter()
+    units = {"spent": 0}
+
+    @app.post("/json/v5/reports")
+    async def direct_report(request: Request):
+        body = await request.json()
+        params = body["params"]
+        report_type = params["ReportType"]
+        requests[f"direct:{report_type}"] += 1
+
+        cost = 10 + len(reports[report_type]) // 100000
+        units["spent"] += cost
+        headers = {
+            "Units": f"{cost}/{max(0, UNITS_LIMIT - units['spent'])}/{UNITS_LIMIT}",
+            "RequestId": str(random.getrandbits(63)),
+            "retryIn": str(retry_after),
+            "Retry-After": str(retry_after),
+            "reportsInQueue": "1",
+        }
+        if report_type not in reports:
+            return JSONResponse({"error": {"error_code": 8000, "error_string": "Invalid request"}}, 400, headers=headers)
+
+        # Offline reports: queued on first request, ready after queue_polls polls
+        name = params["ReportName"]
+        polls[name] += 1
+        if polls[name] == 1 and queue_polls > 0:
+            return PlainTextResponse("", status_code=201, headers=headers)
+        if polls[name] <= queue_polls:
+            return PlainTextResponse("", status_code=202, headers=headers)
+        return PlainTextResponse(reports[report_type], headers=headers)
+
+    @app.get("/api/v2/ad_plans.json")
+    async def vk_ad_plans():
+        requests["vk:ad_plans"] += 1
+        return vk_plans
+
+    @app.get("/api/v2/statistics/ad_plans/day.json")
+    async def vk_statistics(date_from: str, date_to: str):
+        requests["vk:statistics"] += 1
+        return {"items": [
+            {**item, "rows": [r for r in item["rows"] if date_from <= r["date"] <= date_to]}
+            for item in vk_stats["items"]
+        ]}
+
+    @app.get("/stat/v1/data")
+    async def metrika_data(date1: str, date2: str):
+        requests["metrika:data"] += 1
+        data = [row for row in metrika["data"] if date1 <= row["dimensions"][0]["name"] <= date2]
+        return {"data": data, "total_rows": len(data)}
+
+    @app.get("/_stats")
+    async def stats():
+        return {"requests": dict(requests), "units_spent": units["spent"]}
+
+    @app.post("/_reset")
+    async def reset():
+        polls.clear()
+        requests.clear()
+        units["spent"] = 0
+        return {"ok": True}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Yandex Direct / VK Ads / Metrika APIs")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    gen = sub.add_parser("generate", help="Write fixtures")
+    gen.add_argument("--out", default="fixtures")
+    gen.add_argument("--days", type=int, default=30)
+    gen.add_argument("--campaigns", type=int, default=20)
+    gen.add_argument("--groups", type=int, default=5)
+    gen.add_argument("--keywords", type=int, default=20)
+    gen.add_argument("--vk-campaigns", type=int, default=10)
+    gen.add_argument("--seed", type=int, default=1)
+
+    serve = sub.add_parser("serve", help="Replay fixtures over HTTP")
+    serve.add_argument("--fixtures", default="fixtures")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--queue-polls", type=int, default=2)
+    serve.add_argument("--retry-after", type=int, default=0)
+
+    args = parser.parse_args()
+    if args.command == "generate":
+        manifest = generate_fixtures(args.out, args.days, args.campaigns, args.groups, args.keywords,
+                                     args.vk_campaigns, args.seed)
+        print(f"Fixtures written to {args.out}: {manifest['rows']}")
+    else:
+        import uvicorn
+        uvicorn.run(build_app(args.fixtures, args.queue_polls, args.retry_after),
+                    host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,47 @@
-from core.database import SessionLocal
-from core import models
+"""
+Test data for the dashboard.
+
+Without arguments: one demo client with 14 days of Yandex stats for an
+existing user (bghvhk@gmail.com or admin@example.com).
+
+With --synthetic: realistic synthetic agencies for benchmarks. One user
+per --clients value (bench-<N>@bench.local, password "bench"), each with
+N clients. Every client gets Direct, VK Ads and Metrika integrations,
+campaigns that start and stop over time, years of daily stats with
+weekday/season patterns, keyword and ad group rows and Metrika goals.
+On PostgreSQL rows are loaded with COPY, then tables are ANALYZEd.
+
+    python debug_scripts/seed_test_data.py --synthetic --clients 5 25 100 --years 2
+    python debug_scripts/seed_test_data.py --drop
+"""
+
+import argparse
+import csv
+import io
+import math
+import os
 import random
+import sys
+import time
 from datetime import datetime, timedelta
 
+sys.path.append(os.getcwd())
+
+from sqlalchemy import func, insert, text
+
+from core.database import SessionLocal
+from core import models, security
+
+BENCH_EMAIL_DOMAIN = "bench.local"
+CHUNK_ROWS = 50000
+
+GOALS = [("all", "All goals"), ("1001", "Form submit"), ("1002", "Call click"), ("1003", "Messenger")]
+KEYWORD_WORDS = [
+    "купить", "цена", "недорого", "доставка", "москва", "спб", "отзывы", "официальный",
+    "сайт", "каталог", "заказать", "скидка", "ремонт", "установка", "аренда", "под ключ",
+]
+
+
 def seed():
     db = SessionLocal()
     try:
@@ -68,5 +107,266 @@ def seed():
     finally:
         db.close()
 
+
+# ----------------------------------------------------------------------
+# Synthetic agencies
+# ----------------------------------------------------------------------
+
+def bench_email(clients: int) -> str:
+    return f"bench-{clients}@{BENCH_EMAIL_DOMAIN}"
+
+
+class BulkWriter:
+    """
+    Buffered rows per table: COPY on PostgreSQL, executemany elsewhere.
+    Outside PostgreSQL ids are assigned here: SQLite does not
+    autoincrement BIGINT primary keys.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.copy = db.get_bind().dialect.name == "postgresql"
+        self.buffers = {}
+        self.counts = {}
+        self.next_ids = {}
+
+    def add(self, model, row: dict):
+        rows = self.buffers.setdefault(model, [])
+        rows.append(row)
+        if len(rows) >= CHUNK_ROWS:
+            self.flush(model)
+
+    def flush(self, model=None):
+        for table_model in ([model] if model else list(self.buffers)):
+            rows = self.buffers.get(table_model)
+            if not rows:
+                continue
+            if self.copy:
+                self._copy(table_model.__table__.name, rows)
+            else:
+                if table_model not in self.next_ids:
+                    self.next_ids[table_model] = (self.db.query(func.max(table_model.id)).scalar() or 0) + 1
+                for row in rows:
+                    row["id"] = self.next_ids[table_model]
+                    self.next_ids[table_model] += 1
+                self.db.execute(insert(table_model), rows)
+            name = table_model.__table__.name
+            self.counts[name] = self.counts.get(name, 0) + len(rows)
+            rows.clear()
+
+    def _copy(self, table: str, rows: list):
+        columns = list(rows[0])
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        for row in rows:
+            writer.writerow(["" if row[c] is None else row[c] for c in columns])
+        buf.seek(0)
+        cursor = self.db.connection().connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+        finally:
+            cursor.close()
+
+
+def daily_metrics(rng: random.Random, profile: dict, day) -> tuple:
+    """Impressions, clicks, cost, conversions for one campaign-day."""
+    season = 1 + 0.25 * math.sin(2 * math.pi * day.timetuple().tm_yday / 365)
+    weekday = 0.7 if day.weekday() >= 5 else 1.0
+    impressions = max(0, int(profile["impressions"] * season * weekday * rng.uniform(0.6, 1.4)))
+    clicks = int(impressions * profile["ctr"] * rng.uniform(0.7, 1.3))
+    cost = round(clicks * profile["cpc"] * rng.uniform(0.8, 1.2), 2)
+    conversions = sum(1 for _ in range(clicks) if rng.random() < profile["cr"]) if clicks < 200 \
+        else int(clicks * profile["cr"] * rng.uniform(0.7, 1.3))
+    return impressions, clicks, cost, conversions
+
+
+def campaign_profile(rng: random.Random, first_day, last_day) -> dict:
+    """Random traffic level and active window (campaigns start and stop)."""
+    total = (last_day - first_day).days
+    start = first_day + timedelta(days=rng.randint(0, total // 2))
+    end = last_day if rng.random() < 0.7 else start + timedelta(days=rng.randint(30, max(31, total)))
+    return {
+        "impressions": rng.lognormvariate(7.5, 1.0),
+        "ctr": rng.uniform(0.01, 0.08),
+        "cpc": rng.uniform(10, 80),
+        "cr": rng.uniform(0.02, 0.1),
+        "start": start,
+        "end": min(end, last_day),
+    }
+
+
+def seed_client(db, writer: BulkWriter, rng: random.Random, client, args, first_day, last_day):
+    integrations = {
+        platform: models.Integration(
+            client_id=client.id,
+            platform=platform,
+            access_token="BENCH_TOKEN",
+            account_id=f"bench-{platform.value.lower()}",
+            auto_sync=False,  # Synthetic token, nothing to sync
+            sync_status=models.IntegrationSyncStatus.SUCCESS,
+        )
+        for platform in models.IntegrationPlatform
+    }
+    db.add_all(integrations.values())
+    db.flush()
+
+    vk_campaigns = args.vk_campaigns if rng.random() < args.vk_share else 0
+    for platform, count in ((models.IntegrationPlatform.YANDEX_DIRECT, args.campaigns),
+                            (models.IntegrationPlatform.VK_ADS, vk_campaigns)):
+        stats_model = models.YandexStats if platform == models.IntegrationPlatform.YANDEX_DIRECT else models.VKStats
+        for n in range(count):
+            campaign = models.Campaign(
+                integration_id=integrations[platform].id,
+                external_id=str(rng.randint(10**7, 10**8)),
+                name=f"{client.name} {platform.value} #{n + 1}",
+                is_active=rng.random() < 0.8,
+            )
+            db.add(campaign)
+            db.flush()
+            profile = campaign_profile(rng, first_day, last_day)
+            keywords = [" ".join(rng.sample(KEYWORD_WORDS, 3)) for _ in range(args.keywords)]
+            groups = [f"Group {g + 1}" for g in range(args.groups)]
+
+            day = profile["start"]
+            while day <= profile["end"]:
+                impressions, clicks, cost, conversions = daily_metrics(rng, profile, day)
+                row = {
+                    "client_id": client.id,
+                    "campaign_id": campaign.id,
+                    "date": day,
+                    "campaign_name": campaign.name,
+                    "impressions": impressions,
+                    "clicks": clicks,
+                    "cost": cost,
+                    "conversions": conversions,
+                }
+                if stats_model is models.YandexStats:
+                    row["ctr"] = round(clicks / impressions * 100, 4) if impressions else 0
+                    row["cpc"] = round(cost / clicks, 2) if clicks else 0
+                writer.add(stats_model, row)
+
+                if stats_model is models.YandexStats:
+                    # Keywords and groups split the campaign-day; quiet ones have no row
+                    for model, field, names in ((models.YandexKeywords, "keyword", keywords),
+                                                (models.YandexGroups, "group_name", groups)):
+                        for name in names:
+                            if rng.random() < 0.5:
+                                continue
+                            share = rng.uniform(0, 2 / len(names))
+                            writer.add(model, {
+                                "client_id": client.id,
+                                "date": day,
+                                "campaign_name": campaign.name,
+                                field: name,
+                                "impressions": int(impressions * share),
+                                "clicks": int(clicks * share),
+                                "cost": round(cost * share, 2),
+                                "conversions": int(conversions * share),
+                            })
+                day += timedelta(days=1)
+
+    # Metrika: "all" plus individual goals, every day
+    day = first_day
+    while day <= last_day:
+        counts = [rng.randint(0, 15) for _ in GOALS[1:]]
+        for (goal_id, goal_name), count in zip(GOALS, [sum(counts)] + counts):
+            writer.add(models.MetrikaGoals, {
+                "client_id": client.id,
+                "date": day,
+                "goal_id": goal_id,
+                "goal_name": goal_name,
+                "conversion_count": count,
+            })
+        day += timedelta(days=1)
+
+
+def seed_synthetic(args):
+    db = SessionLocal()
+    rng = random.Random(args.seed)
+    last_day = datetime.utcnow().date()
+    first_day = last_day - timedelta(days=int(args.years * 365) - 1)
+    started = time.perf_counter()
+    try:
+        writer = BulkWriter(db)
+        password_hash = security.get_password_hash("bench")
+        for size in args.clients:
+            email = bench_email(size)
+            if db.query(models.User).filter_by(email=email).first():
+                print(f"{email} already exists, skipping (use --drop to recreate)")
+                continue
+            user = models.User(
+                email=email,
+                username=f"bench_{size}",
+                first_name="Bench",
+                last_name=f"Agency {size}",
+                password_hash=password_hash,
+            )
+            db.add(user)
+            db.flush()
+            for n in range(size):
+                client = models.Client(owner_id=user.id, name=f"Bench {size}/{n + 1}", description="Synthetic benchmark client")
+                db.add(client)
+                db.flush()
+                seed_client(db, writer, rng, client, args, first_day, last_day)
+                writer.flush()
+            db.commit()
+            print(f"{email}: {size} clients, rows so far {writer.counts}")
+
+        if writer.copy:
+            for table in writer.counts:
+                db.execute(text(f"ANALYZE {table}"))
+            db.commit()
+        print(f"Seeded {first_day}..{last_day} in {time.perf_counter() - started:.1f}s: {writer.counts}")
+    except Exception as e:
+        print(f"Seed error: {e}")
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def drop_synthetic():
+    """Remove every bench-*@bench.local user with all their data."""
+    db = SessionLocal()
+    try:
+        users = db.query(models.User).filter(models.User.email.like(f"%@{BENCH_EMAIL_DOMAIN}")).all()
+        user_ids = [u.id for u in users]
+        client_ids = [c.id for c in db.query(models.Client).filter(models.Client.owner_id.in_(user_ids))]
+        integration_ids = [i.id for i in db.query(models.Integration).filter(models.Integration.client_id.in_(client_ids))]
+        for model in (models.YandexStats, models.VKStats, models.YandexKeywords, models.YandexGroups,
+                      models.MetrikaGoals, models.WeeklyReport, models.MonthlyReport):
+            db.query(model).filter(model.client_id.in_(client_ids)).delete(synchronize_session=False)
+        db.query(models.Campaign).filter(models.Campaign.integration_id.in_(integration_ids)).delete(synchronize_session=False)
+        db.query(models.Integration).filter(models.Integration.id.in_(integration_ids)).delete(synchronize_session=False)
+        db.query(models.Client).filter(models.Client.id.in_(client_ids)).delete(synchronize_session=False)
+        db.query(models.User).filter(models.User.id.in_(user_ids)).delete(synchronize_session=False)
+        db.commit()
+        print(f"Dropped {len(users)} bench users and {len(client_ids)} clients")
+    finally:
+        db.close()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Seed dashboard test data")
+    parser.add_argument("--synthetic", action="store_true", help="Generate synthetic benchmark agencies")
+    parser.add_argument("--drop", action="store_true", help="Remove synthetic benchmark agencies")
+    parser.add_argument("--clients", type=int, nargs="+", default=[5, 25, 100],
+                        help="Clients per agency, one bench user per value (default: 5 25 100)")
+    parser.add_argument("--campaigns", type=int, default=10, help="Direct campaigns per client (default: 10)")
+    parser.add_argument("--vk-campaigns", type=int, default=5, help="VK campaigns per client with VK (default: 5)")
+    parser.add_argument("--vk-share", type=float, default=0.5, help="Share of clients with VK Ads (default: 0.5)")
+    parser.add_argument("--keywords", type=int, default=10, help="Keywords per Direct campaign (default: 10)")
+    parser.add_argument("--groups", type=int, default=3, help="Ad groups per Direct campaign (default: 3)")
+    parser.add_argument("--years", type=float, default=2, help="Years of daily history (default: 2)")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser
+
+
 if __name__ == "__main__":
-    seed()
+    args = build_parser().parse_args()
+    if args.drop:
+        drop_synthetic()
+    if args.synthetic:
+        seed_synthetic(args)
+    if not args.drop and not args.synthetic:
+        seed()
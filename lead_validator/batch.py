@@ -0,0 +1,140 @@
+"""
+Пакетная валидация лидов (/lead/batch): переигровка и импорт.
+
+Лиды проверяются параллельно (не больше LEAD_BATCH_CONCURRENCY сразу),
+поэтому одновременные вызовы Redis и DaData сами собираются в пачки
+(pipeline check_lead, микро-батчер DaData), а отклонённые уходят в общую
+очередь trash_logger. Результаты отдаются по мере готовности.
+
+Переигровка не шлёт уведомления в Telegram и конверсии в Метрику —
+только при явном notify=True (конверсия со временем из timestamp лида).
+"""
+
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from lead_validator.config import settings
+from lead_validator.schemas import LeadInput
+from lead_validator.validators import lead_validator
+
+logger = logging.getLogger("lead_validator.batch")
+
+# Элемент входного потока: (данные лида, ошибка разбора)
+BatchItem = Tuple[Any, Optional[str]]
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[BatchItem]:
+    """Разбор NDJSON-потока по строкам, не дожидаясь конца тела запроса."""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield _parse_line(line)
+    if buffer.strip():
+        yield _parse_line(buffer)
+
+
+async def read_ndjson(chunks: AsyncIterator[bytes], max_items: int) -> Optional[List[BatchItem]]:
+    """
+    Прочитать NDJSON-тело целиком до начала ответа.
+
+    StreamingResponse под uvicorn (ASGI 2.3) параллельно ждёт disconnect
+    через тот же receive и забирает куски тела, поэтому читать запрос из
+    генератора ответа нельзя. None — в теле больше max_items лидов.
+    """
+    items = []
+    async for item in iter_ndjson(chunks):
+        if len(items) >= max_items:
+            return None
+        items.append(item)
+    return items
+
+
+def _parse_line(line: bytes) -> BatchItem:
+    try:
+        return json.loads(line), None
+    except ValueError:
+        return None, "invalid_json"
+
+
+async def iter_list(items: list) -> AsyncIterator[BatchItem]:
+    for item in items:
+        yield item, None
+
+
+async def iter_items(items: List[BatchItem]) -> AsyncIterator[BatchItem]:
+    for item in items:
+        yield item
+
+
+async def _validate_one(index: int, item: Any, error: Optional[str], notify: bool) -> Dict[str, Any]:
+    if error:
+        return {"index": index, "success": False, "rejection_reason": error}
+    try:
+        lead = LeadInput.model_validate(item)
+    except ValidationError as e:
+        fields = ",".join(str(err["loc"][0]) for err in e.errors() if err["loc"])
+        return {"index": index, "success": False, "rejection_reason": f"invalid_input:{fields}"}
+
+    try:
+        result = await lead_validator.validate(lead, lead.client_ip, replay=True, notify=notify)
+    except Exception as e:
+        logger.error(f"Batch lead #{index} failed: {e}")
+        return {"index": index, "success": False, "rejection_reason": "internal_error"}
+    return {"index": index, **result.model_dump(mode="json")}
+
+
+async def validate_stream(items: AsyncIterator[BatchItem], notify: bool = False) -> AsyncIterator[str]:
+    """
+    Проверить лиды из items и отдавать NDJSON-строки по мере готовности.
+
+    Порядок ответа — порядок завершения, исходная позиция в поле index.
+    После LEAD_BATCH_MAX_SIZE лидов чтение прекращается строкой
+    {"error": "batch_too_large"}. notify — отправлять уведомления и
+    конверсии о принятых лидах, как для живых заявок.
+    """
+    semaphore = asyncio.Semaphore(settings.LEAD_BATCH_CONCURRENCY)
+    results: asyncio.Queue = asyncio.Queue()
+    tasks = set()
+
+    async def run(index: int, item: Any, error: Optional[str]):
+        try:
+            await results.put(await _validate_one(index, item, error, notify))
+        finally:
+            semaphore.release()
+
+    async def produce():
+        index = 0
+        try:
+            async for item, error in items:
+                if index >= settings.LEAD_BATCH_MAX_SIZE:
+                    await results.put({"error": "batch_too_large", "max_size": settings.LEAD_BATCH_MAX_SIZE})
+                    break
+                await semaphore.acquire()
+                task = asyncio.create_task(run(index, item, error))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                index += 1
+            if tasks:
+                await asyncio.wait(set(tasks))
+        except Exception as e:
+            logger.error(f"Batch input error after {index} leads: {e}")
+            await results.put({"error": "invalid_input_stream"})
+        finally:
+            await results.put(None)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while (line := await results.get()) is not None:
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+    finally:
+        # Клиент отключился — незавершённые проверки не нужны
+        producer.cancel()
+        for task in list(tasks):
+            task.cancel()
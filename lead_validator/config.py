@@ -49,6 +49,12 @@ class LeadValidatorSettings:
     DADATA_API_KEY: str = ""
     DADATA_SECRET_KEY: str = ""
     DADATA_TIMEOUT: float = 5.0
+    DADATA_CACHE_TTL_SEC: int = 604800  # Кэш ответов по хешу телефона/email
+    DADATA_BATCH_SIZE: int = 10  # Значений в одном запросе Clean API
+    DADATA_BATCH_WAIT_MS: int = 5  # Сколько ждать попутчиков для пачки
+    DADATA_RATE_LIMIT_PER_SEC: float = 20.0  # Лимит запросов Clean API
+    # База плана нумерации Россвязи (python -m lead_validator.load_phone_plan)
+    PHONE_PLAN_FILE: str = "data/phone_plan.bin"
     
     # Redis для дедупликации и rate limiting
     REDIS_URL: str = "redis://localhost:6379"
@@ -58,42 +64,129 @@ class LeadValidatorSettings:
     TELEGRAM_BOT_TOKEN: str = ""
     TELEGRAM_CHAT_ID: str = ""
     TELEGRAM_ENABLED: bool = False
+    TELEGRAM_RATE_PER_MIN: float = 20.0  # Лимит Telegram на сообщения в один чат
+    TELEGRAM_BURST: int = 3
+    TELEGRAM_DIGEST_MAX_LEADS: int = 20  # Заявок в одном сводном сообщении
+    TELEGRAM_RETRY_DELAY_SEC: float = 5.0  # Пауза после сетевой ошибки / 5xx
+    TELEGRAM_BUFFER_DIR: str = "logs/telegram"
     
     # Airtable для логирования
     AIRTABLE_API_KEY: Optional[str] = None
     AIRTABLE_BASE_ID: Optional[str] = None
     AIRTABLE_TABLE_NAME: str = "rejected_leads"
+    AIRTABLE_BATCH_SIZE: int = 10  # Максимум Airtable на запрос
+    AIRTABLE_BATCH_WAIT_SEC: float = 1.0
+    AIRTABLE_RATE_LIMIT_PER_SEC: float = 5.0
+    AIRTABLE_MAX_RETRIES: int = 3
+    AIRTABLE_QUEUE_MAX_SIZE: int = 10000
+    
+    # Локальный лог отклонённых заявок
+    TRASH_FSYNC_INTERVAL_SEC: float = 1.0
     
     # CAPTCHA (Yandex SmartCaptcha)
     SMARTCAPTCHA_CLIENT_KEY: Optional[str] = None
     SMARTCAPTCHA_SERVER_KEY: Optional[str] = None
     SMARTCAPTCHA_ENABLED: bool = False
+    CAPTCHA_TIMEOUT_SEC: float = 5.0
+    CAPTCHA_RESULT_TTL_SEC: int = 300  # Кэш результата и запись об использовании токена
+    CAPTCHA_CACHE_MAX_SIZE: int = 10000
     
     # Антибот настройки
     MIN_FORM_FILL_TIME_SEC: int = 3
     MAX_FORM_FILL_TIME_SEC: int = 3600
     
-    # Rate Limiting
+    # Rate Limiting (GCRA, лимит за окно; 0 — измерение выключено)
     RATE_LIMIT_PER_IP: int = 10
     RATE_LIMIT_WINDOW_SEC: int = 3600
+    RATE_LIMIT_PER_SUBNET: int = 30  # /24 для IPv4, /64 для IPv6
+    RATE_LIMIT_SUBNET_WINDOW_SEC: int = 3600
+    RATE_LIMIT_PER_PHONE: int = 5
+    RATE_LIMIT_PHONE_WINDOW_SEC: int = 3600
+    RATE_LIMIT_PER_PLACEMENT: int = 0  # utm_content (площадка РСЯ)
+    RATE_LIMIT_PLACEMENT_WINDOW_SEC: int = 3600
     
     # Дедупликация
     PHONE_DUPLICATE_TTL_SEC: int = 86400
+    LEAD_RESERVATION_TTL_SEC: int = 60  # Резерв телефона/email на время валидации
+    REDIS_CHECK_BATCH_SIZE: int = 100  # check_lead одной итерации loop — одним pipeline
+    BLOOM_ENABLED: bool = False  # Предпроверка для check_*_duplicate (check_lead её не использует)
+    BLOOM_CAPACITY: int = 200000  # Значений на отрезок фильтра
+    BLOOM_ERROR_RATE: float = 0.001
+    BLOOM_RESYNC_DELAY_SEC: float = 5.0
+    
+    # Пакетная валидация (/lead/batch)
+    LEAD_BATCH_MAX_SIZE: int = 10000  # Лидов в одном запросе
+    LEAD_BATCH_CONCURRENCY: int = 200  # Лидов в обработке одновременно
     
     # Fail-open режим (пропускать при недоступности внешних сервисов)
     FAIL_OPEN_MODE: bool = True
     
+    # Circuit breaker внешних сервисов и общий бюджет времени на лид
+    BREAKER_WINDOW_SEC: int = 60  # Окно метрик upstream
+    BREAKER_FAILURE_RATE: float = 0.5  # Доля ошибок, после которой цепь размыкается
+    BREAKER_MIN_CALLS: int = 10  # Минимум вызовов в окне для решения
+    BREAKER_SLOW_CALL_MS: float = 2000  # Вызов дольше — считается ошибкой
+    BREAKER_OPEN_SEC: float = 5.0  # Через сколько пробовать снова
+    LEAD_DEADLINE_MS: int = 3000  # Удалённые проверки лида (0 — без ограничения)
+    
     # Яндекс.Метрика (офлайн-конверсии)
     METRICA_COUNTER_ID: Optional[str] = None
     METRICA_OAUTH_TOKEN: Optional[str] = None
     METRICA_ENABLED: bool = False
+    METRICA_BATCH_SIZE: int = 500  # Строк в одном CSV
+    METRICA_FLUSH_INTERVAL_SEC: int = 60
+    METRICA_BUFFER_DIR: str = "logs/metrica"
+    METRICA_CLAIM_IDLE_SEC: int = 300  # Забрать буфер упавшего воркера
     
     # UTM валидация (Уровень 6)
     UTM_VALIDATION_ENABLED: bool = True
     UTM_BLACKLISTED_PLACEMENTS: List[str] = field(default_factory=list)
     
+    # Внешние списки (горячая перезагрузка из файла и Redis SET lead:lists:*)
+    UTM_BLACKLIST_FILE: str = ""
+    DISPOSABLE_DOMAINS_FILE: str = ""
+    GARBAGE_NAMES_FILE: str = ""
+    LISTS_RELOAD_INTERVAL_SEC: int = 60
+    
     # MX-запись email (проверка существования почтового сервера)
     MX_CHECK_ENABLED: bool = True
+    MX_DNS_TIMEOUT_SEC: float = 5.0
+    MX_CACHE_MAX_SIZE: int = 10000
+    MX_CACHE_MAX_TTL_SEC: int = 3600
+    MX_NEGATIVE_TTL_SEC: int = 300
+    MX_CACHE_SHARED: bool = True  # Общий кэш через Redis (если REDIS_ENABLED)
+    MX_WARMUP_INTERVAL_SEC: int = 1800
+    
+    # Локальный GeoIP (CSV диапазонов или .mmdb)
+    GEOIP_FILE: str = "data/geoip.csv"
+    GEOIP_CACHE_MAX_SIZE: int = 100000
+    GEOIP_CACHE_TTL_SEC: int = 86400
+    
+    # Аналитика источников (счётчики в Redis)
+    ANALYTICS_WINDOW_DAYS: int = 7  # Окно расчёта % отклонений
+    ANALYTICS_RETENTION_DAYS: int = 35
+    ANALYTICS_FLUSH_INTERVAL_SEC: float = 1.0
+    ANALYTICS_REPORT_TOP_SOURCES: int = 50
+    
+    # Outbox побочных эффектов принятого лида (Telegram, Метрика)
+    OUTBOX_ENABLED: bool = True  # False — отправлять сразу, в запросе
+    OUTBOX_STREAM: str = "lead:outbox"
+    OUTBOX_LOCAL_DIR: str = "logs/outbox"  # Fallback при недоступности Redis
+    OUTBOX_WORKERS: int = 2
+    OUTBOX_POLL_SEC: float = 1.0
+    OUTBOX_MAX_ATTEMPTS: int = 8
+    OUTBOX_RETRY_BASE_SEC: float = 5.0
+    OUTBOX_RETRY_MAX_SEC: float = 600.0
+    OUTBOX_CLAIM_IDLE_SEC: int = 300  # Забрать задачи упавшего воркера
+    
+    # Репутация повторного трафика (быстрый путь валидации)
+    REPUTATION_ENABLED: bool = True
+    REPUTATION_HALF_LIFE_SEC: int = 86400  # Вес исхода лида уменьшается вдвое
+    REPUTATION_MIN_ACCEPTED: float = 5.0  # Принятых лидов подсети/ym_uid для доверия
+    REPUTATION_MAX_REJECT_RATE: float = 0.05  # Доля отклонений, после которой доверия нет
+    REPUTATION_CACHE_MAX_SIZE: int = 50000
+    # Проверки, пропускаемые для низкорискового лида
+    REPUTATION_SKIP_CHECKS: List[str] = field(default_factory=lambda: ["mx", "dadata_email"])
     
     def __post_init__(self):
         """Загрузка значений из переменных окружения."""
@@ -101,6 +194,11 @@ class LeadValidatorSettings:
         self.DADATA_API_KEY = _get_env("DADATA_API_KEY")
         self.DADATA_SECRET_KEY = _get_env("DADATA_SECRET_KEY")
         self.DADATA_TIMEOUT = _get_env_float("DADATA_TIMEOUT", 5.0)
+        self.DADATA_CACHE_TTL_SEC = _get_env_int("DADATA_CACHE_TTL_SEC", 604800)
+        self.DADATA_BATCH_SIZE = _get_env_int("DADATA_BATCH_SIZE", 10)
+        self.DADATA_BATCH_WAIT_MS = _get_env_int("DADATA_BATCH_WAIT_MS", 5)
+        self.DADATA_RATE_LIMIT_PER_SEC = _get_env_float("DADATA_RATE_LIMIT_PER_SEC", 20.0)
+        self.PHONE_PLAN_FILE = _get_env("PHONE_PLAN_FILE", "data/phone_plan.bin")
         
         # Redis
         self.REDIS_URL = _get_env("REDIS_URL", "redis://localhost:6379")
@@ -110,16 +208,32 @@ class LeadValidatorSettings:
         self.TELEGRAM_BOT_TOKEN = _get_env("TELEGRAM_BOT_TOKEN")
         self.TELEGRAM_CHAT_ID = _get_env("TELEGRAM_CHAT_ID")
         self.TELEGRAM_ENABLED = _get_env_bool("TELEGRAM_ENABLED", False)
+        self.TELEGRAM_RATE_PER_MIN = _get_env_float("TELEGRAM_RATE_PER_MIN", 20.0)
+        self.TELEGRAM_BURST = _get_env_int("TELEGRAM_BURST", 3)
+        self.TELEGRAM_DIGEST_MAX_LEADS = _get_env_int("TELEGRAM_DIGEST_MAX_LEADS", 20)
+        self.TELEGRAM_RETRY_DELAY_SEC = _get_env_float("TELEGRAM_RETRY_DELAY_SEC", 5.0)
+        self.TELEGRAM_BUFFER_DIR = _get_env("TELEGRAM_BUFFER_DIR", "logs/telegram")
         
         # Airtable
         self.AIRTABLE_API_KEY = _get_env("AIRTABLE_API_KEY") or None
         self.AIRTABLE_BASE_ID = _get_env("AIRTABLE_BASE_ID") or None
         self.AIRTABLE_TABLE_NAME = _get_env("AIRTABLE_TABLE_NAME", "rejected_leads")
+        self.AIRTABLE_BATCH_SIZE = _get_env_int("AIRTABLE_BATCH_SIZE", 10)
+        self.AIRTABLE_BATCH_WAIT_SEC = _get_env_float("AIRTABLE_BATCH_WAIT_SEC", 1.0)
+        self.AIRTABLE_RATE_LIMIT_PER_SEC = _get_env_float("AIRTABLE_RATE_LIMIT_PER_SEC", 5.0)
+        self.AIRTABLE_MAX_RETRIES = _get_env_int("AIRTABLE_MAX_RETRIES", 3)
+        self.AIRTABLE_QUEUE_MAX_SIZE = _get_env_int("AIRTABLE_QUEUE_MAX_SIZE", 10000)
+        
+        # Локальный лог отклонённых заявок
+        self.TRASH_FSYNC_INTERVAL_SEC = _get_env_float("TRASH_FSYNC_INTERVAL_SEC", 1.0)
         
         # CAPTCHA (Yandex SmartCaptcha)
         self.SMARTCAPTCHA_CLIENT_KEY = _get_env("SMARTCAPTCHA_CLIENT_KEY") or None
         self.SMARTCAPTCHA_SERVER_KEY = _get_env("SMARTCAPTCHA_SERVER_KEY") or None
         self.SMARTCAPTCHA_ENABLED = _get_env_bool("SMARTCAPTCHA_ENABLED", False)
+        self.CAPTCHA_TIMEOUT_SEC = _get_env_float("CAPTCHA_TIMEOUT_SEC", 5.0)
+        self.CAPTCHA_RESULT_TTL_SEC = _get_env_int("CAPTCHA_RESULT_TTL_SEC", 300)
+        self.CAPTCHA_CACHE_MAX_SIZE = _get_env_int("CAPTCHA_CACHE_MAX_SIZE", 10000)
         
         # Антибот
         self.MIN_FORM_FILL_TIME_SEC = _get_env_int("MIN_FORM_FILL_TIME_SEC", 3)
@@ -128,17 +242,45 @@ class LeadValidatorSettings:
         # Rate Limiting
         self.RATE_LIMIT_PER_IP = _get_env_int("RATE_LIMIT_PER_IP", 10)
         self.RATE_LIMIT_WINDOW_SEC = _get_env_int("RATE_LIMIT_WINDOW_SEC", 3600)
+        self.RATE_LIMIT_PER_SUBNET = _get_env_int("RATE_LIMIT_PER_SUBNET", 30)
+        self.RATE_LIMIT_SUBNET_WINDOW_SEC = _get_env_int("RATE_LIMIT_SUBNET_WINDOW_SEC", 3600)
+        self.RATE_LIMIT_PER_PHONE = _get_env_int("RATE_LIMIT_PER_PHONE", 5)
+        self.RATE_LIMIT_PHONE_WINDOW_SEC = _get_env_int("RATE_LIMIT_PHONE_WINDOW_SEC", 3600)
+        self.RATE_LIMIT_PER_PLACEMENT = _get_env_int("RATE_LIMIT_PER_PLACEMENT", 0)
+        self.RATE_LIMIT_PLACEMENT_WINDOW_SEC = _get_env_int("RATE_LIMIT_PLACEMENT_WINDOW_SEC", 3600)
         
         # Дедупликация
         self.PHONE_DUPLICATE_TTL_SEC = _get_env_int("PHONE_DUPLICATE_TTL_SEC", 86400)
+        self.LEAD_RESERVATION_TTL_SEC = _get_env_int("LEAD_RESERVATION_TTL_SEC", 60)
+        self.REDIS_CHECK_BATCH_SIZE = _get_env_int("REDIS_CHECK_BATCH_SIZE", 100)
+        self.BLOOM_ENABLED = _get_env_bool("BLOOM_ENABLED", False)
+        self.BLOOM_CAPACITY = _get_env_int("BLOOM_CAPACITY", 200000)
+        self.BLOOM_ERROR_RATE = _get_env_float("BLOOM_ERROR_RATE", 0.001)
+        self.BLOOM_RESYNC_DELAY_SEC = _get_env_float("BLOOM_RESYNC_DELAY_SEC", 5.0)
+        
+        # Пакетная валидация
+        self.LEAD_BATCH_MAX_SIZE = _get_env_int("LEAD_BATCH_MAX_SIZE", 10000)
+        self.LEAD_BATCH_CONCURRENCY = _get_env_int("LEAD_BATCH_CONCURRENCY", 200)
         
         # Fail-open
         self.FAIL_OPEN_MODE = _get_env_bool("FAIL_OPEN_MODE", True)
         
+        # Circuit breaker и бюджет времени
+        self.BREAKER_WINDOW_SEC = _get_env_int("BREAKER_WINDOW_SEC", 60)
+        self.BREAKER_FAILURE_RATE = _get_env_float("BREAKER_FAILURE_RATE", 0.5)
+        self.BREAKER_MIN_CALLS = _get_env_int("BREAKER_MIN_CALLS", 10)
+        self.BREAKER_SLOW_CALL_MS = _get_env_float("BREAKER_SLOW_CALL_MS", 2000)
+        self.BREAKER_OPEN_SEC = _get_env_float("BREAKER_OPEN_SEC", 5.0)
+        self.LEAD_DEADLINE_MS = _get_env_int("LEAD_DEADLINE_MS", 3000)
+        
         # Яндекс.Метрика
         self.METRICA_COUNTER_ID = _get_env("METRICA_COUNTER_ID") or None
         self.METRICA_OAUTH_TOKEN = _get_env("METRICA_OAUTH_TOKEN") or None
         self.METRICA_ENABLED = _get_env_bool("METRICA_ENABLED", False)
+        self.METRICA_BATCH_SIZE = _get_env_int("METRICA_BATCH_SIZE", 500)
+        self.METRICA_FLUSH_INTERVAL_SEC = _get_env_int("METRICA_FLUSH_INTERVAL_SEC", 60)
+        self.METRICA_BUFFER_DIR = _get_env("METRICA_BUFFER_DIR", "logs/metrica")
+        self.METRICA_CLAIM_IDLE_SEC = _get_env_int("METRICA_CLAIM_IDLE_SEC", 300)
         
         # UTM валидация
         self.UTM_VALIDATION_ENABLED = _get_env_bool("UTM_VALIDATION_ENABLED", True)
@@ -147,6 +289,54 @@ class LeadValidatorSettings:
         self.UTM_BLACKLISTED_PLACEMENTS = [
             p.strip() for p in blacklist_str.split(",") if p.strip()
         ]
+        
+        # Внешние списки
+        self.UTM_BLACKLIST_FILE = _get_env("UTM_BLACKLIST_FILE", "")
+        self.DISPOSABLE_DOMAINS_FILE = _get_env("DISPOSABLE_DOMAINS_FILE", "")
+        self.GARBAGE_NAMES_FILE = _get_env("GARBAGE_NAMES_FILE", "")
+        self.LISTS_RELOAD_INTERVAL_SEC = _get_env_int("LISTS_RELOAD_INTERVAL_SEC", 60)
+        
+        # MX-записи
+        self.MX_CHECK_ENABLED = _get_env_bool("MX_CHECK_ENABLED", True)
+        self.MX_DNS_TIMEOUT_SEC = _get_env_float("MX_DNS_TIMEOUT_SEC", 5.0)
+        self.MX_CACHE_MAX_SIZE = _get_env_int("MX_CACHE_MAX_SIZE", 10000)
+        self.MX_CACHE_MAX_TTL_SEC = _get_env_int("MX_CACHE_MAX_TTL_SEC", 3600)
+        self.MX_NEGATIVE_TTL_SEC = _get_env_int("MX_NEGATIVE_TTL_SEC", 300)
+        self.MX_CACHE_SHARED = _get_env_bool("MX_CACHE_SHARED", True)
+        self.MX_WARMUP_INTERVAL_SEC = _get_env_int("MX_WARMUP_INTERVAL_SEC", 1800)
+        
+        # Локальный GeoIP
+        self.GEOIP_FILE = _get_env("GEOIP_FILE", "data/geoip.csv")
+        self.GEOIP_CACHE_MAX_SIZE = _get_env_int("GEOIP_CACHE_MAX_SIZE", 100000)
+        self.GEOIP_CACHE_TTL_SEC = _get_env_int("GEOIP_CACHE_TTL_SEC", 86400)
+        
+        # Аналитика источников
+        self.ANALYTICS_WINDOW_DAYS = _get_env_int("ANALYTICS_WINDOW_DAYS", 7)
+        self.ANALYTICS_RETENTION_DAYS = _get_env_int("ANALYTICS_RETENTION_DAYS", 35)
+        self.ANALYTICS_FLUSH_INTERVAL_SEC = _get_env_float("ANALYTICS_FLUSH_INTERVAL_SEC", 1.0)
+        self.ANALYTICS_REPORT_TOP_SOURCES = _get_env_int("ANALYTICS_REPORT_TOP_SOURCES", 50)
+        
+        # Outbox
+        self.OUTBOX_ENABLED = _get_env_bool("OUTBOX_ENABLED", True)
+        self.OUTBOX_STREAM = _get_env("OUTBOX_STREAM", "lead:outbox")
+        self.OUTBOX_LOCAL_DIR = _get_env("OUTBOX_LOCAL_DIR", "logs/outbox")
+        self.OUTBOX_WORKERS = _get_env_int("OUTBOX_WORKERS", 2)
+        self.OUTBOX_POLL_SEC = _get_env_float("OUTBOX_POLL_SEC", 1.0)
+        self.OUTBOX_MAX_ATTEMPTS = _get_env_int("OUTBOX_MAX_ATTEMPTS", 8)
+        self.OUTBOX_RETRY_BASE_SEC = _get_env_float("OUTBOX_RETRY_BASE_SEC", 5.0)
+        self.OUTBOX_RETRY_MAX_SEC = _get_env_float("OUTBOX_RETRY_MAX_SEC", 600.0)
+        self.OUTBOX_CLAIM_IDLE_SEC = _get_env_int("OUTBOX_CLAIM_IDLE_SEC", 300)
+        
+        # Репутация повторного трафика
+        self.REPUTATION_ENABLED = _get_env_bool("REPUTATION_ENABLED", True)
+        self.REPUTATION_HALF_LIFE_SEC = _get_env_int("REPUTATION_HALF_LIFE_SEC", 86400)
+        self.REPUTATION_MIN_ACCEPTED = _get_env_float("REPUTATION_MIN_ACCEPTED", 5.0)
+        self.REPUTATION_MAX_REJECT_RATE = _get_env_float("REPUTATION_MAX_REJECT_RATE", 0.05)
+        self.REPUTATION_CACHE_MAX_SIZE = _get_env_int("REPUTATION_CACHE_MAX_SIZE", 50000)
+        skip_str = _get_env("REPUTATION_SKIP_CHECKS", "mx,dadata_email")
+        self.REPUTATION_SKIP_CHECKS = [
+            c.strip() for c in skip_str.split(",") if c.strip()
+        ]
 
 
 # Глобальный экземпляр настроек
@@ -0,0 +1,73 @@
+"""
+Сборка локальной базы плана нумерации из CSV Россвязи.
+
+Выгрузки: https://opendata.digital.gov.ru/registry/numeric/downloads
+(ABC-3xx.csv, ABC-4xx.csv, ABC-8xx.csv, DEF-9xx.csv). Файлы можно указать
+путями или URL — тогда они скачиваются во временный каталог.
+
+Пример:
+    python -m lead_validator.load_phone_plan ABC-3xx.csv ABC-4xx.csv ABC-8xx.csv DEF-9xx.csv
+    python -m lead_validator.load_phone_plan --lookup +79161234567
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+from typing import List
+
+import httpx
+
+from lead_validator.config import settings
+from lead_validator.services.phone_plan import PhonePlan, build_phone_plan
+
+logger = logging.getLogger("lead_validator.load_phone_plan")
+
+
+def fetch_sources(sources: List[str], tmp_dir: str) -> List[str]:
+    """Локальные пути CSV: URL скачиваются в tmp_dir."""
+    paths = []
+    for source in sources:
+        if not source.startswith(("http://", "https://")):
+            paths.append(source)
+            continue
+        path = os.path.join(tmp_dir, os.path.basename(source.split("?", 1)[0]) or "plan.csv")
+        logger.info(f"Downloading {source}")
+        with httpx.stream("GET", source, timeout=120.0, follow_redirects=True) as response:
+            response.raise_for_status()
+            with open(path, "wb") as f:
+                for chunk in response.iter_bytes():
+                    f.write(chunk)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the phone numbering plan database from Rossvyaz CSV files")
+    parser.add_argument("sources", nargs="*", help="CSV files or URLs (ABC-3xx, ABC-4xx, ABC-8xx, DEF-9xx)")
+    parser.add_argument("-o", "--output", default=settings.PHONE_PLAN_FILE,
+                        help=f"Output file (default: {settings.PHONE_PLAN_FILE})")
+    parser.add_argument("--lookup", nargs="+", metavar="PHONE", help="Look up phones in the built database")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    if not args.sources and not args.lookup:
+        parser.error("nothing to do: pass CSV sources and/or --lookup")
+
+    if args.sources:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            count = build_phone_plan(fetch_sources(args.sources, tmp_dir), args.output)
+        print(f"{count} ranges written to {args.output}")
+
+    if args.lookup:
+        plan = PhonePlan(args.output)
+        for phone in args.lookup:
+            entry = plan.lookup(phone)
+            print(f"{phone}: {entry._asdict() if entry else 'not found (DaData)'}")
+        plan.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,619 @@
+"""
+Нагрузочный тест Lead Validator.
+
+Поднимает /lead/, /webhook/tilda/ и /webhook/marquiz/ в процессе вместе
+с заглушками внешних API (DaData, SmartCaptcha, Telegram, Метрика,
+Airtable) и Redis (--redis-url или fakeredis), подаёт заявки с заданной
+частотой и пишет JSON-отчёт: p50/p95/p99 по эндпоинтам и этапам
+валидации, доля ошибок, пропускная способность каждого воркера.
+
+Заглушки подключаются через httpx-транспорт по хосту API, с задержкой
+--upstream-latency-ms и долей ответов 503 --upstream-error-rate; код
+сервисов не меняется, запросы в настоящую сеть не уходят. Воркеры
+(--workers) — отдельные процессы, как воркеры uvicorn.
+
+Буферы Метрики, Telegram, outbox и лог отклонённых заявок пишутся во
+временный каталог (или --work-dir), а не в logs/, откуда рабочий сервис
+дочитывает их при старте.
+
+Webhook-заявки приходят без токена капчи: при включённой капче они
+отклоняются на этапе captcha, как и в рабочей конфигурации
+(--no-captcha выключает проверку).
+
+Лимиты и таймауты сервисов берутся из окружения как обычно: например,
+при DADATA_RATE_LIMIT_PER_SEC=20 заявки сверх лимита ждут в очереди
+батчера и упираются в LEAD_DEADLINE_MS — это видно по этапам dadata_*.
+
+Пример:
+    DATABASE_URL=sqlite:// python -m lead_validator.loadtest --rps 200 --duration 30 --workers 4 -o bench.json
+    DATABASE_URL=sqlite:// python -m lead_validator.loadtest --rps 200 --duration 30 --compare bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from lead_validator.config import settings
+from lead_validator.router import router as lead_router
+from lead_validator.webhook_router import router as webhook_router
+from lead_validator.services.dadata import dadata_service
+from lead_validator.services.metrica_service import metrica_service
+from lead_validator.services.outbox import outbox
+from lead_validator.services.redis_service import redis_service
+from lead_validator.services.telegram import telegram_notifier
+from lead_validator.services.trash_logger import trash_logger
+
+logger = logging.getLogger("lead_validator.loadtest")
+
+try:
+    import fakeredis
+    FAKEREDIS_AVAILABLE = True
+except ImportError:
+    FAKEREDIS_AVAILABLE = False
+
+if FAKEREDIS_AVAILABLE:
+    class BlockingFakeRedis(fakeredis.FakeAsyncRedis):
+        """fakeredis игнорирует BLOCK в XREADGROUP — без паузы воркеры outbox крутятся вхолостую."""
+
+        async def xreadgroup(self, *args, block=None, **kwargs):
+            result = await super().xreadgroup(*args, block=block, **kwargs)
+            if not result and block:
+                await asyncio.sleep(block / 1000)
+            return result
+
+# Хосты внешних API -> имя upstream в отчёте
+UPSTREAM_HOSTS = {
+    "cleaner.dadata.ru": "dadata",
+    "smartcaptcha.yandexcloud.net": "smartcaptcha",
+    "api.telegram.org": "telegram",
+    "api-metrica.yandex.net": "metrica",
+    "api.airtable.com": "airtable",
+}
+
+ENDPOINTS = {
+    "lead": "/lead/",
+    "tilda": "/webhook/tilda/",
+    "marquiz": "/webhook/marquiz/",
+}
+
+EMAIL_DOMAINS = ("gmail.com", "mail.ru", "yandex.ru", "bk.ru")
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+)
+LANDING_URL = "https://example.ru/landing?utm_source=yandex&utm_medium=cpc&utm_campaign=loadtest"
+
+
+# ----------------------------------------------------------------------
+# Заглушки внешних API
+# ----------------------------------------------------------------------
+
+def build_stub_app(latency_ms: float, error_rate: float, calls: Counter) -> FastAPI:
+    """Приложение, отвечающее за все внешние API как их настоящие версии."""
+    app = FastAPI()
+
+    async def upstream(name: str) -> Optional[JSONResponse]:
+        calls[name] += 1
+        if latency_ms > 0:
+            await asyncio.sleep(random.uniform(0.5, 1.5) * latency_ms / 1000)
+        if error_rate > 0 and random.random() < error_rate:
+            return JSONResponse({"error": "stub failure"}, status_code=503)
+        return None
+
+    @app.post("/api/v1/clean/phone")
+    async def dadata_phone(request: Request):
+        if failure := await upstream("dadata"):
+            return failure
+        result = []
+        for phone in await request.json():
+            digits = re.sub(r"\D", "", phone)[-10:]
+            result.append({
+                "source": phone,
+                "type": "Мобильный",
+                "phone": f"+7 {digits[:3]} {digits[3:6]}-{digits[6:8]}-{digits[8:]}",
+                "country_code": "7",
+                "city_code": digits[:3],
+                "number": f"{digits[3:6]}-{digits[6:8]}-{digits[8:]}",
+                "provider": "ПАО \"МегаФон\"",
+                "country": "Россия",
+                "region": "Москва и Московская область",
+                "qc_conflict": 0,
+                "qc": 0,
+            })
+        return result
+
+    @app.post("/api/v1/clean/email")
+    async def dadata_email(request: Request):
+        if failure := await upstream("dadata"):
+            return failure
+        return [
+            {"source": email, "email": email.lower(), "type": "PERSONAL", "qc": 0}
+            for email in await request.json()
+        ]
+
+    @app.get("/validate")
+    async def smartcaptcha():
+        return await upstream("smartcaptcha") or {"status": "ok", "message": "", "host": "example.ru"}
+
+    @app.post("/bot{token}/sendMessage")
+    async def telegram(token: str):
+        return await upstream("telegram") or {"ok": True, "result": {"message_id": 1}}
+
+    @app.post("/management/v1/counter/{counter_id}/offline_conversions/upload")
+    async def metrica(counter_id: str):
+        return await upstream("metrica") or {
+            "uploading": {"id": random.randint(1, 10**9), "status": "UPLOADED"}
+        }
+
+    @app.post("/v0/{base_id}/{table}")
+    async def airtable(base_id: str, table: str, request: Request):
+        if failure := await upstream("airtable"):
+            return failure
+        records = (await request.json()).get("records", [])
+        return {"records": [{"id": f"rec{i}", **record} for i, record in enumerate(records)]}
+
+    return app
+
+
+class StubTransport(httpx.AsyncBaseTransport):
+    """Запросы к хостам внешних API — в заглушку, в остальную сеть — ошибка."""
+
+    def __init__(self, stub_app: FastAPI):
+        self._stub = httpx.ASGITransport(app=stub_app)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.url.host in UPSTREAM_HOSTS:
+            return await self._stub.handle_async_request(request)
+        raise httpx.ConnectError(f"loadtest: network access to {request.url.host} is disabled", request=request)
+
+
+@contextmanager
+def stub_upstreams(stub_app: FastAPI):
+    """Все httpx.AsyncClient сервисов ходят в заглушку."""
+    original = httpx.AsyncClient
+    transport = StubTransport(stub_app)
+
+    class StubbedAsyncClient(original):
+        def __init__(self, *args, **kwargs):
+            kwargs.setdefault("transport", transport)
+            super().__init__(*args, **kwargs)
+
+    httpx.AsyncClient = StubbedAsyncClient
+    try:
+        yield
+    finally:
+        httpx.AsyncClient = original
+
+
+@contextmanager
+def bench_settings(args: argparse.Namespace, work_dir: Path):
+    """
+    Включить все интеграции с фиктивными ключами, по выходу вернуть как было.
+    Файлы буферов и логов — в work_dir, в памяти — пустые буферы.
+    """
+    overrides = [
+        (settings, "METRICA_BUFFER_DIR", str(work_dir / "metrica")),
+        (settings, "TELEGRAM_BUFFER_DIR", str(work_dir / "telegram")),
+        (settings, "OUTBOX_LOCAL_DIR", str(work_dir / "outbox")),
+        (metrica_service, "buffer_dir", work_dir / "metrica"),
+        (metrica_service, "_own_file", None),
+        (metrica_service, "_rejected_file", work_dir / "metrica" / "rejected.jsonl"),
+        (metrica_service, "_buffers", {}),
+        (metrica_service, "_unsaved", []),
+        (telegram_notifier, "_backlog_file", work_dir / "telegram" / "backlog.jsonl"),
+        (telegram_notifier, "_backlog", {}),
+        (telegram_notifier, "_backlog_loaded", False),
+        (outbox, "local_dir", work_dir / "outbox"),
+        (trash_logger, "log_dir", work_dir / "rejected_leads"),
+        (trash_logger, "_deltas", {}),
+        (settings, "SMARTCAPTCHA_ENABLED", args.captcha),
+        (settings, "SMARTCAPTCHA_SERVER_KEY", "loadtest"),
+        (settings, "MX_CHECK_ENABLED", args.mx),
+        (settings, "DADATA_API_KEY", "loadtest"),
+        (settings, "AIRTABLE_API_KEY", "loadtest"),
+        (settings, "AIRTABLE_BASE_ID", "loadtest"),
+        (dadata_service, "api_key", "loadtest"),
+        (dadata_service, "secret_key", "loadtest"),
+        (telegram_notifier, "enabled", True),
+        (telegram_notifier, "token", "loadtest"),
+        (telegram_notifier, "chat_id", "1"),
+        (metrica_service, "enabled", True),
+        (metrica_service, "counter_id", "1"),
+        (metrica_service, "oauth_token", "loadtest"),
+        (trash_logger, "airtable_enabled", True),
+        (redis_service, "enabled", bool(args.redis_url) or FAKEREDIS_AVAILABLE),
+    ]
+    if args.redis_url:
+        overrides.append((settings, "REDIS_URL", args.redis_url))
+
+    saved = [(target, name, getattr(target, name)) for target, name, _ in overrides]
+    for target, name, value in overrides:
+        setattr(target, name, value)
+    trash_logger.log_dir.mkdir(parents=True, exist_ok=True)
+    if not args.redis_url and FAKEREDIS_AVAILABLE:
+        redis_service._client = BlockingFakeRedis(decode_responses=True)
+    elif not redis_service.enabled:
+        logger.warning("No --redis-url and fakeredis is not installed: Redis checks are skipped")
+    try:
+        yield
+    finally:
+        for target, name, value in saved:
+            setattr(target, name, value)
+
+
+# ----------------------------------------------------------------------
+# Генерация заявок
+# ----------------------------------------------------------------------
+
+def make_payload(endpoint: str, worker_id: int, seq: int, rng: random.Random) -> dict:
+    """Уникальная заявка: свой телефон, email и IP из случайной подсети."""
+    phone = f"+79{worker_id:02d}{seq:07d}"
+    email = f"user{worker_id}x{seq}@{rng.choice(EMAIL_DOMAINS)}"
+    ip = f"{rng.randint(11, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+
+    if endpoint == "tilda":
+        payload = {"phone": phone, "email": email, "name": "Иван Петров", "formid": "form-loadtest",
+                   "referer": LANDING_URL}
+    elif endpoint == "marquiz":
+        payload = {"phone": phone, "email": email, "name": "Иван Петров", "IP": ip,
+                   "userAgent": USER_AGENT, "source": LANDING_URL, "referrer": "https://example.ru/",
+                   "location": "Россия, Москва", "leadTimezone": "UTC 3", "quiz": "loadtest",
+                   "ym_uid": f"{worker_id}{seq}"}
+    else:
+        payload = {"phone": phone, "email": email, "name": "Иван Петров",
+                   "timestamp": int(time.time()) - 30, "smart_token": f"loadtest-{worker_id}-{seq}",
+                   "utm_source": "yandex", "utm_medium": "cpc", "utm_campaign": "loadtest",
+                   "ym_uid": f"{worker_id}{seq}"}
+    return {"payload": payload, "ip": ip}
+
+
+class Samples:
+    """Сырые замеры одного воркера."""
+
+    def __init__(self):
+        self.latency: Dict[str, List[float]] = defaultdict(list)
+        self.stages: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, Counter] = defaultdict(Counter)
+        self.outcomes: Counter = Counter()
+        self.dropped = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "latency": dict(self.latency),
+            "stages": dict(self.stages),
+            "errors": {endpoint: dict(counter) for endpoint, counter in self.errors.items()},
+            "outcomes": dict(self.outcomes),
+            "dropped": self.dropped,
+        }
+
+
+async def send(client: httpx.AsyncClient, endpoint: str, request: dict, samples: Samples) -> None:
+    started = time.perf_counter()
+    try:
+        response = await client.post(
+            ENDPOINTS[endpoint], json=request["payload"], headers={"X-Forwarded-For": request["ip"]}
+        )
+    except Exception as e:
+        samples.errors[endpoint][type(e).__name__] += 1
+        return
+    samples.latency[endpoint].append((time.perf_counter() - started) * 1000)
+
+    if response.status_code != 200:
+        samples.errors[endpoint][f"http_{response.status_code}"] += 1
+        return
+    result = response.json()
+    for stage, elapsed in (result.get("stage_timings_ms") or {}).items():
+        samples.stages[stage].append(elapsed)
+    samples.outcomes["accepted" if result.get("success") else result.get("rejection_reason") or "rejected"] += 1
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """'lead=0.6,tilda=0.2,marquiz=0.2' -> веса эндпоинтов."""
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"unknown endpoint in --mix: {name}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+async def drive(client: httpx.AsyncClient, worker_id: int, args: argparse.Namespace, samples: Samples) -> int:
+    """
+    Открытая модель нагрузки: заявки уходят по расписанию, не дожидаясь
+    ответов. При --max-in-flight незавершённых запросов новые
+    отбрасываются (dropped) — признак насыщения.
+
+    Returns:
+        Количество отправленных заявок
+    """
+    rps = args.rps / args.workers
+    total = int(rps * args.duration)
+    mix = parse_mix(args.mix)
+    names, weights = list(mix), list(mix.values())
+    rng = random.Random(args.seed + worker_id)
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    in_flight = set()
+    sent = 0
+    for seq in range(total):
+        delay = start + seq / rps - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(in_flight) >= args.max_in_flight:
+            samples.dropped += 1
+            continue
+        endpoint = rng.choices(names, weights)[0]
+        task = asyncio.create_task(send(client, endpoint, make_payload(endpoint, worker_id, seq, rng), samples))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+        sent += 1
+    if in_flight:
+        await asyncio.wait(set(in_flight))
+    return sent
+
+
+async def run_worker(worker_id: int, args: argparse.Namespace) -> dict:
+    """Один воркер: приложение, заглушки и генератор нагрузки в одном event loop."""
+    calls: Counter = Counter()
+    app = FastAPI()
+    app.include_router(lead_router)
+    app.include_router(webhook_router)
+    samples = Samples()
+
+    with tempfile.TemporaryDirectory(prefix="loadtest-") as tmp_dir, \
+            bench_settings(args, Path(args.work_dir or tmp_dir) / f"worker-{worker_id}"), \
+            stub_upstreams(build_stub_app(args.upstream_latency_ms, args.upstream_error_rate, calls)):
+        try:
+            async with lead_router.lifespan_context(app):
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+                    started = time.perf_counter()
+                    sent = await drive(client, worker_id, args, samples)
+                    elapsed = time.perf_counter() - started
+                # Дать фоновым задачам (outbox, Telegram, Метрика) разобрать очереди
+                await asyncio.sleep(args.drain_sec)
+        finally:
+            await redis_service.close()
+
+    return {
+        "worker": worker_id,
+        "sent": sent,
+        "duration_sec": elapsed,
+        "samples": samples.to_dict(),
+        "upstream_calls": dict(calls),
+    }
+
+
+def _worker_entry(worker_id: int, args: argparse.Namespace) -> dict:
+    logging.basicConfig(level=args.log_level, stream=sys.stderr)
+    return asyncio.run(run_worker(worker_id, args))
+
+
+# ----------------------------------------------------------------------
+# Отчёт
+# ----------------------------------------------------------------------
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(values)
+
+    def pick(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))], 2)
+
+    return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": round(ordered[-1], 2)}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def build_report(results: List[dict], args: argparse.Namespace) -> dict:
+    """Сводный отчёт по результатам воркеров."""
+    latency: Dict[str, List[float]] = defaultdict(list)
+    stages: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, Counter] = defaultdict(Counter)
+    outcomes: Counter = Counter()
+    upstream_calls: Counter = Counter()
+    dropped = 0
+
+    for result in results:
+        samples = result["samples"]
+        for endpoint, values in samples["latency"].items():
+            latency[endpoint].extend(values)
+        for stage, values in samples["stages"].items():
+            stages[stage].extend(values)
+        for endpoint, counter in samples["errors"].items():
+            errors[endpoint].update(counter)
+        outcomes.update(samples["outcomes"])
+        upstream_calls.update(result["upstream_calls"])
+        dropped += samples["dropped"]
+
+    duration = max((r["duration_sec"] for r in results), default=0.0)
+    completed = sum(len(values) for values in latency.values())
+    error_count = sum(sum(counter.values()) for counter in errors.values())
+    requests = sum(r["sent"] for r in results)
+
+    endpoints = {}
+    for endpoint in sorted(set(latency) | set(errors)):
+        endpoint_errors = sum(errors[endpoint].values())
+        # HTTP-ошибки тоже имеют замер задержки — не считаем их дважды
+        endpoint_requests = len(latency[endpoint]) + sum(
+            n for kind, n in errors[endpoint].items() if not kind.startswith("http_")
+        )
+        endpoints[endpoint] = {
+            "requests": endpoint_requests,
+            "errors": dict(errors[endpoint]),
+            "error_rate": round(endpoint_errors / endpoint_requests, 4) if endpoint_requests else 0.0,
+            "latency_ms": percentiles(latency[endpoint]),
+        }
+
+    accepted = outcomes.pop("accepted", 0)
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        },
+        "totals": {
+            "requests": requests,
+            "completed": completed,
+            "errors": error_count,
+            "error_rate": round(error_count / requests, 4) if requests else 0.0,
+            "dropped": dropped,
+            "duration_sec": round(duration, 2),
+            "throughput_rps": round(completed / duration, 2) if duration else 0.0,
+            "latency_ms": percentiles([v for values in latency.values() for v in values]),
+        },
+        "endpoints": endpoints,
+        "stages": {
+            stage: {"count": len(values), **percentiles(values)}
+            for stage, values in sorted(stages.items())
+        },
+        "outcomes": {"accepted": accepted, "rejected": dict(outcomes.most_common())},
+        "workers": [
+            {
+                "worker": r["worker"],
+                "requests": r["sent"],
+                "throughput_rps": round(
+                    sum(len(v) for v in r["samples"]["latency"].values()) / r["duration_sec"], 2
+                ) if r["duration_sec"] else 0.0,
+            }
+            for r in results
+        ],
+        "upstream_calls": dict(upstream_calls),
+    }
+
+
+def compare_reports(baseline: dict, current: dict, threshold: float) -> List[str]:
+    """
+    Регрессии current относительно baseline: рост p95 эндпоинтов и этапов
+    или падение пропускной способности больше threshold (доля), рост доли
+    ошибок больше чем на 1 п.п.
+    """
+    regressions = []
+
+    def check_latency(kind: str, name: str, old: Optional[float], new: Optional[float]) -> None:
+        if old and new and new > old * (1 + threshold):
+            regressions.append(f"{kind} {name}: p95 {old} -> {new} ms (+{(new / old - 1):.0%})")
+
+    for name, data in current["endpoints"].items():
+        old = baseline["endpoints"].get(name)
+        if old:
+            check_latency("endpoint", name, old["latency_ms"]["p95"], data["latency_ms"]["p95"])
+    for name, data in current["stages"].items():
+        old = baseline["stages"].get(name)
+        if old:
+            check_latency("stage", name, old["p95"], data["p95"])
+
+    old_rps, new_rps = baseline["totals"]["throughput_rps"], current["totals"]["throughput_rps"]
+    if old_rps and new_rps < old_rps * (1 - threshold):
+        regressions.append(f"throughput: {old_rps} -> {new_rps} rps")
+    old_errors, new_errors = baseline["totals"]["error_rate"], current["totals"]["error_rate"]
+    if new_errors > old_errors + 0.01:
+        regressions.append(f"error rate: {old_errors:.2%} -> {new_errors:.2%}")
+    return regressions
+
+
+def print_summary(report: dict) -> None:
+    totals = report["totals"]
+    print(
+        f"{totals['completed']}/{totals['requests']} requests in {totals['duration_sec']}s, "
+        f"{totals['throughput_rps']} rps, errors {totals['error_rate']:.2%}, dropped {totals['dropped']}"
+    )
+    print(f"{'':<16}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, data in report["endpoints"].items():
+        lat = data["latency_ms"]
+        print(f"{name:<16}{lat['p50']!s:>10}{lat['p95']!s:>10}{lat['p99']!s:>10}")
+    for name, data in report["stages"].items():
+        print(f"  {name:<14}{data['p50']!s:>10}{data['p95']!s:>10}{data['p99']!s:>10}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Load test /lead/ and the webhooks against stub upstreams")
+    parser.add_argument("--rps", type=float, default=50, help="Total request rate (default: 50)")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds of load (default: 10)")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes (default: 1)")
+    parser.add_argument("--mix", default="lead=0.6,tilda=0.2,marquiz=0.2",
+                        help="Endpoint weights (default: lead=0.6,tilda=0.2,marquiz=0.2)")
+    parser.add_argument("--max-in-flight", type=int, default=1000,
+                        help="Unfinished requests per worker before dropping (default: 1000)")
+    parser.add_argument("--upstream-latency-ms", type=float, default=20,
+                        help="Mean stub upstream latency (default: 20)")
+    parser.add_argument("--upstream-error-rate", type=float, default=0.0,
+                        help="Share of stub responses with HTTP 503 (default: 0)")
+    parser.add_argument("--redis-url", help="Local Redis instead of fakeredis")
+    parser.add_argument("--no-captcha", dest="captcha", action="store_false", help="Disable SmartCaptcha check")
+    parser.add_argument("--mx", action="store_true", help="Enable MX check (real DNS)")
+    parser.add_argument("--drain-sec", type=float, default=1.0,
+                        help="Wait for background queues after the load (default: 1)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--work-dir",
+                        help="Directory for buffers and logs of the run (default: temporary, removed afterwards)")
+    parser.add_argument("--log-level", default="ERROR")
+    parser.add_argument("-o", "--output", default="loadtest_results.json", help="JSON report file")
+    parser.add_argument("--compare", help="Baseline JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Allowed relative regression for --compare (default: 0.1)")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    logging.basicConfig(level=args.log_level, stream=sys.stderr)
+
+    if args.workers == 1:
+        results = [asyncio.run(run_worker(0, args))]
+    else:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=context) as pool:
+            futures = [pool.submit(_worker_entry, i, args) for i in range(args.workers)]
+            results = [future.result() for future in futures]
+
+    report = build_report(results, args)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print_summary(report)
+    print(f"Report written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_reports(baseline, report, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.compare} (commit {baseline['meta'].get('commit')})")
+
+
+if __name__ == "__main__":
+    main()
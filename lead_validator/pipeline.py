@@ -0,0 +1,104 @@
+"""
+Исполнитель этапов валидации лида.
+
+Локальные проверки выполняются последовательно и первыми,
+независимые удалённые проверки (CAPTCHA, Redis, DNS, DaData) —
+параллельно, с отменой остальных при первом отклонении
+и в пределах общего бюджета времени на лид (LEAD_DEADLINE_MS).
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Optional
+
+from lead_validator.config import settings
+from lead_validator.services.circuit_breaker import DEADLINE_CANCEL
+
+logger = logging.getLogger("lead_validator.pipeline")
+
+# Проверка возвращает причину отклонения или None если OK
+Check = Callable[[], Awaitable[Optional[str]]]
+
+
+@contextmanager
+def stage_timer(timings: Dict[str, float], name: str):
+    """Замеряет время этапа в миллисекундах и сохраняет в timings."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = round((time.perf_counter() - started) * 1000, 2)
+
+
+async def _run_timed(name: str, check: Check, timings: Dict[str, float]) -> Optional[str]:
+    """
+    Выполнить одну проверку с замером времени.
+    Необработанная ошибка проверки — fail-open, если он включён.
+    """
+    with stage_timer(timings, name):
+        try:
+            return await check()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Check {name} failed: {type(e).__name__}: {e}")
+            if settings.FAIL_OPEN_MODE:
+                return None
+            return f"{name}_error"
+
+
+async def run_concurrent(
+    checks: Dict[str, Check],
+    timings: Dict[str, float],
+    deadline: Optional[float] = None
+) -> Optional[str]:
+    """
+    Запустить независимые проверки параллельно.
+
+    Возвращает причину первого отклонения (остальные проверки отменяются)
+    или None если все проверки пройдены. Время каждой проверки пишется
+    в timings; у отменённых проверок оно равно времени до отмены.
+
+    Args:
+        deadline: Бюджет времени в секундах (None — без ограничения).
+            Не успевшие проверки отменяются: fail-open — лид проходит,
+            иначе отклоняется с причиной "deadline_exceeded"
+    """
+    if not checks:
+        return None
+
+    loop = asyncio.get_running_loop()
+    deadline_at = loop.time() + deadline if deadline is not None else None
+    tasks = {
+        asyncio.create_task(_run_timed(name, check, timings)): name
+        for name, check in checks.items()
+    }
+    pending = set(tasks)
+    cancel_msg = None
+    try:
+        while pending:
+            timeout = None if deadline_at is None else max(0.0, deadline_at - loop.time())
+            done, pending = await asyncio.wait(
+                pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                names = ", ".join(sorted(tasks[t] for t in pending))
+                logger.warning(f"Lead deadline exceeded, unfinished checks: {names}")
+                # С этим сообщением отмены circuit breaker запишет вызов как ошибку
+                cancel_msg = DEADLINE_CANCEL
+                if settings.FAIL_OPEN_MODE:
+                    return None
+                return "deadline_exceeded"
+            for task in done:
+                rejection = task.result()
+                if rejection:
+                    return rejection
+        return None
+    finally:
+        pending = [t for t in tasks if not t.done()]
+        for task in pending:
+            task.cancel(cancel_msg)
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,127 @@
+"""
+Повторная проверка исторических заявок через DaData.
+
+Читает JSONL (логи отклонённых заявок, в т.ч. .jsonl.gz) и пишет JSONL
+с актуальными dadata_qc / phone_type / phone_valid. Запросы идут через
+кэш и микро-батчер dadata_service, поэтому лимиты DaData соблюдаются.
+
+Пример:
+    python -m lead_validator.revalidate logs/rejected_leads/rejected_2026-*.jsonl* -o revalidated.jsonl
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import sys
+from typing import Iterator, Optional, TextIO
+
+from lead_validator.services.dadata import dadata_service
+from lead_validator.services.redis_service import redis_service
+
+logger = logging.getLogger("lead_validator.revalidate")
+
+
+def read_records(paths) -> Iterator[dict]:
+    """Записи из JSONL файлов (gzip определяется по расширению)."""
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"{path}:{line_no}: invalid JSON, skipped")
+
+
+async def revalidate_record(record: dict, check_email: bool) -> dict:
+    """Дополняет запись свежими данными DaData."""
+    phone: Optional[str] = record.get("phone")
+    if phone:
+        result = await dadata_service.validate_phone(phone)
+        if result:
+            record["dadata_qc"] = result.qc
+            record["phone_type"] = result.type
+            record["phone_valid"] = dadata_service.is_phone_valid(result)
+
+    email: Optional[str] = record.get("email")
+    if check_email and email:
+        result = await dadata_service.validate_email(email)
+        if result:
+            record["email_qc"] = result.get("qc")
+            record["email_type"] = dadata_service.get_email_type(result)
+            record["email_valid"] = dadata_service.is_email_valid(result)
+    return record
+
+
+async def revalidate(paths, out: TextIO, concurrency: int = 100, check_email: bool = False) -> int:
+    """
+    Проверяет все записи, держа в полёте не больше concurrency штук —
+    этого достаточно, чтобы батчер собирал полные пачки.
+    
+    Returns:
+        Количество обработанных записей
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    pending = set()
+    processed = 0
+
+    async def worker(record: dict):
+        try:
+            return await revalidate_record(record, check_email)
+        finally:
+            semaphore.release()
+
+    def write_done(done):
+        nonlocal processed
+        for task in done:
+            out.write(json.dumps(task.result(), ensure_ascii=False, default=str) + "\n")
+            processed += 1
+
+    for record in read_records(paths):
+        await semaphore.acquire()
+        pending.add(asyncio.create_task(worker(record)))
+        done = {t for t in pending if t.done()}
+        pending -= done
+        write_done(done)
+
+    if pending:
+        done, _ = await asyncio.wait(pending)
+        write_done(done)
+    return processed
+
+
+async def _main(args) -> None:
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        count = await revalidate(args.files, out, args.concurrency, args.email)
+    finally:
+        await dadata_service.phone_batcher.close()
+        await dadata_service.email_batcher.close()
+        await redis_service.close()
+        if args.output:
+            out.close()
+    logger.info(
+        f"Revalidated {count} records: {dadata_service.stats}, "
+        f"phone batches: {dadata_service.phone_batcher.stats}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-validate historic leads via DaData")
+    parser.add_argument("files", nargs="+", help="JSONL files with leads (.jsonl or .jsonl.gz)")
+    parser.add_argument("-o", "--output", help="Output JSONL file (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=100, help="Records in flight (default: 100)")
+    parser.add_argument("--email", action="store_true", help="Also re-validate emails")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,18 +3,81 @@ FastAPI роутер для приёма лидов.
 Основной эндпоинт: POST /api/lead/
 """
 
+import asyncio
 import logging
-from fastapi import APIRouter, Request, BackgroundTasks, Depends
-from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager, suppress
+from fastapi import APIRouter, FastAPI, Request, BackgroundTasks, Depends, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 from lead_validator.schemas import LeadInput, ValidationResult
 from lead_validator.validators import lead_validator
+from lead_validator.batch import iter_items, iter_list, read_ndjson, validate_stream
 from lead_validator.services.trash_logger import trash_logger
 from lead_validator.services.telegram import telegram_notifier
+from lead_validator.services.email_mx_validator import email_mx_validator
+from lead_validator.services.outbox import outbox
+from lead_validator.services.metrica_service import metrica_service
+from lead_validator.services.analytics import analytics_service
+from lead_validator.services.redis_service import redis_service
+from lead_validator.services.matchers import list_reloader
+from lead_validator.services.captcha import captcha_validator
+from lead_validator.services.circuit_breaker import breakers
+from lead_validator.services.reputation import reputation_cache
+from lead_validator.services.geoip import geoip_resolver
+from lead_validator.config import settings
 from core import models, security
 
 logger = logging.getLogger("lead_validator.router")
 
-router = APIRouter(tags=["Lead Validator"])
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Фоновые задачи Lead Validator на время жизни приложения:
+    - прогрев и обновление кэша MX популярных почтовых доменов
+    - воркеры outbox (Telegram после принятия лида)
+    - пакетная загрузка офлайн-конверсий в Метрику
+    - пакетная запись отклонённых заявок в Airtable
+    - буферизованная запись локального лога отклонённых заявок
+    - отправка счётчиков аналитики источников в Redis
+    - синхронизация Bloom-фильтра дубликатов с Redis
+    - горячая перезагрузка чёрных списков (UTM, домены, имена)
+    - отправка очереди уведомлений Telegram с учётом лимита чата
+    
+    До приёма заявок загружается локальная база GeoIP.
+    """
+    # Задачи останавливаются в обратном порядке: writer файла — последним,
+    # чтобы принять остаток очереди Airtable
+    await asyncio.to_thread(geoip_resolver.load)
+    tasks = [asyncio.create_task(trash_logger.run_file_writer())]
+    tasks.append(asyncio.create_task(list_reloader.run()))
+    if settings.MX_CHECK_ENABLED:
+        tasks.append(asyncio.create_task(email_mx_validator.keep_warm()))
+    if telegram_notifier.enabled:
+        tasks.append(asyncio.create_task(telegram_notifier.run_dispatcher()))
+    if settings.OUTBOX_ENABLED:
+        tasks.append(asyncio.create_task(outbox.drain_local()))
+        for i in range(settings.OUTBOX_WORKERS):
+            tasks.append(asyncio.create_task(outbox.run_worker(outbox.consumer_name(i))))
+    if metrica_service.enabled:
+        tasks.append(asyncio.create_task(metrica_service.run_writer()))
+        tasks.append(asyncio.create_task(metrica_service.run_flusher()))
+    if trash_logger.airtable_enabled:
+        tasks.append(asyncio.create_task(trash_logger.run_airtable_writer()))
+    if redis_service.enabled:
+        tasks.append(asyncio.create_task(analytics_service.run_flusher()))
+        if settings.BLOOM_ENABLED:
+            tasks.append(asyncio.create_task(redis_service.run_seen_sync()))
+    try:
+        yield
+    finally:
+        for task in reversed(tasks):
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+        await captcha_validator.close()
+
+
+router = APIRouter(tags=["Lead Validator"], lifespan=lifespan)
 
 
 
@@ -32,7 +95,7 @@ router = APIRouter(tags=["Lead Validator"])
     4. Дедупликация (проверка дубликатов)
     5. Валидация через DaData
     
-    При успехе — уведомление в Telegram.
+    При успехе — уведомление в Telegram (в фоне, через outbox).
     При отклонении — запись в лог для аналитики.
     """
 )
@@ -58,6 +121,56 @@ async def validate_lead(
     return result
 
 
+@router.post(
+    "/lead/batch",
+    summary="Пакетная валидация лидов",
+    description="""
+    Повторная проверка или импорт лидов одним запросом
+    (выгрузка из CRM, переигровка дня после сбоя DaData).
+    
+    Тело: JSON-массив лидов или NDJSON (Content-Type: application/x-ndjson),
+    один лид на строку. IP для rate limiting — поле client_ip лида.
+    CAPTCHA и время заполнения формы не проверяются.
+    
+    Уведомления в Telegram и конверсии в Метрику о принятых лидах
+    отправляются только с ?notify=true.
+    
+    Ответ — NDJSON по мере готовности: {"index": N, ...ValidationResult}.
+    """
+)
+async def validate_lead_batch(
+    request: Request,
+    notify: bool = False,
+    current_user: models.User = Depends(security.get_current_user)
+) -> StreamingResponse:
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonl" in content_type:
+        # Тело читается до ответа: генератор StreamingResponse его уже не получит
+        parsed = await read_ndjson(request.stream(), settings.LEAD_BATCH_MAX_SIZE)
+        if parsed is None:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Batch too large: max {settings.LEAD_BATCH_MAX_SIZE} leads"
+            )
+        items = iter_items(parsed)
+    else:
+        try:
+            body = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid JSON")
+        if not isinstance(body, list):
+            raise HTTPException(status_code=400, detail="Expected JSON array or NDJSON")
+        if len(body) > settings.LEAD_BATCH_MAX_SIZE:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Batch too large: max {settings.LEAD_BATCH_MAX_SIZE} leads"
+            )
+        items = iter_list(body)
+    
+    logger.info(f"Batch validation started by user {current_user.id}")
+    return StreamingResponse(validate_stream(items, notify), media_type="application/x-ndjson")
+
+
 @router.get(
     "/lead/health",
     summary="Проверка работоспособности",
@@ -67,7 +180,11 @@ async def health_check():
     """Health check эндпоинт для мониторинга"""
     return {
         "status": "ok",
-        "service": "lead_validator"
+        "service": "lead_validator",
+        "captcha": captcha_validator.get_stats(),
+        "circuits": breakers.snapshot(),
+        "reputation": reputation_cache.get_stats(),
+        "geoip": geoip_resolver.get_stats()
     }
 
 
@@ -86,7 +203,10 @@ async def get_stats(
     Args:
         date: Дата в формате YYYY-MM-DD (по умолчанию сегодня)
     """
-    stats = await trash_logger.get_stats(date)
+    try:
+        stats = await trash_logger.get_stats(date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date: expected YYYY-MM-DD")
     return stats
 
 
@@ -181,10 +301,34 @@ async def test_metrica(
     Тестовый эндпоинт для проверки Яндекс.Метрика API.
     Возвращает информацию о счётчике если настроено.
     """
-    from lead_validator.services.metrica_service import metrica_service
     return await metrica_service.test_connection()
 
 
+@router.get(
+    "/lead/metrica/uploads",
+    summary="Загрузки офлайн-конверсий",
+    description="Размер буфера конверсий и статус последних загрузок в Метрику"
+)
+async def metrica_uploads(
+    refresh: bool = False,
+    current_user: models.User = Depends(security.get_current_user)
+):
+    """
+    Args:
+        refresh: Запросить в Метрике актуальный статус загрузок
+    """
+    uploads = (
+        await metrica_service.refresh_upload_statuses()
+        if refresh and metrica_service.enabled
+        else list(metrica_service.uploads)
+    )
+    return {
+        "enabled": metrica_service.enabled,
+        "pending": metrica_service.pending_count(),
+        "uploads": uploads
+    }
+
+
 @router.get(
     "/lead/test-utm",
     summary="Тест UTM валидации",
@@ -3,7 +3,7 @@ Pydantic модели для валидации входящих данных и
 """
 
 from pydantic import BaseModel, Field, field_validator
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import datetime
 import re
 
@@ -106,6 +106,12 @@ class ValidationResult(BaseModel):
     phone_provider: Optional[str] = Field(None, description="Оператор")
     phone_region: Optional[str] = Field(None, description="Регион телефона")
     dadata_qc: Optional[int] = Field(None, description="Код качества DaData")
+    
+    # Время этапов валидации (для мониторинга латентности)
+    stage_timings_ms: Optional[Dict[str, float]] = Field(
+        None,
+        description="Время каждого этапа валидации в мс"
+    )
 
 
 class RejectedLead(BaseModel):
@@ -5,18 +5,55 @@
 - Агрегация отклонённых заявок по источникам
 - Расчёт коэффициента качества
 - Отправка отчётов в Telegram
+
+Счётчики хранятся в Redis (общие для всех воркеров, переживают
+перезапуск): record_lead копит приращения в памяти, фоновая задача
+раз в ANALYTICS_FLUSH_INTERVAL_SEC отправляет их одним пайплайном.
+Без Redis статистика ведётся в памяти процесса, как раньше.
 """
 
+import asyncio
 import logging
+import time
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass, field
 from collections import defaultdict
 
 from lead_validator.config import settings
+from lead_validator.services.redis_service import redis_service
 
 logger = logging.getLogger("lead_validator.analytics")
 
+KEY_PREFIX = "lead:analytics"
+
+# Приращения счётчиков источника за день + пересчёт его процента
+# отклонений за окно в ZSET рейтинга. Выполняется целиком в Redis.
+#
+# KEYS: src_day_hash, all_day_hash, rates_zset, seen_zset, window src hashes...
+# ARGV: source, total, rejected, ttl, now, reason1, count1, reason2, count2...
+RECORD_SOURCE_SCRIPT = """
+for _, key in ipairs({KEYS[1], KEYS[2]}) do
+    redis.call('HINCRBY', key, 'total', ARGV[2])
+    redis.call('HINCRBY', key, 'rejected', ARGV[3])
+    for i = 6, #ARGV, 2 do
+        redis.call('HINCRBY', key, 'r:' .. ARGV[i], ARGV[i + 1])
+    end
+    redis.call('EXPIRE', key, ARGV[4])
+end
+local total, rejected = 0, 0
+for i = 5, #KEYS do
+    local counts = redis.call('HMGET', KEYS[i], 'total', 'rejected')
+    total = total + (tonumber(counts[1]) or 0)
+    rejected = rejected + (tonumber(counts[2]) or 0)
+end
+if total > 0 then
+    redis.call('ZADD', KEYS[3], rejected * 100 / total, ARGV[1])
+end
+redis.call('ZADD', KEYS[4], ARGV[5], ARGV[1])
+return total
+"""
+
 
 @dataclass
 class SourceStats:
@@ -69,13 +106,22 @@ class AnalyticsService:
     - Генерация еженедельных отчётов
     - Определение плохих площадок
     - Отправка алертов в Telegram
+    
+    Redis:
+    - lead:analytics:{day}:src:{source} — HASH total, rejected, r:{reason}
+    - lead:analytics:{day}:all          — то же по всем источникам
+    - lead:analytics:rates — ZSET источников по % отклонений за окно
+    - lead:analytics:seen  — ZSET источников по времени последней заявки
     """
     
     def __init__(self):
-        # In-memory хранилище для статистики
-        # В production использовать Redis или БД
+        # In-memory хранилище (если Redis выключен)
         self._stats: Dict[str, SourceStats] = {}
-        self._daily_stats: Dict[str, Dict] = {}  # По дням
+        # Приращения, ещё не отправленные в Redis: (день, источник) -> счётчики
+        self._pending: Dict[Tuple[str, str], Dict] = {}
+        self._record_script = None
+        self.rates_key = f"{KEY_PREFIX}:rates"
+        self.seen_key = f"{KEY_PREFIX}:seen"
         
     def _get_source_key(
         self, 
@@ -105,6 +151,21 @@ class AnalyticsService:
             rejection_reason: Причина отклонения
         """
         key = self._get_source_key(utm_source, utm_campaign, utm_content)
+        # Группируем причины
+        reason_group = rejection_reason.split(":")[0] if rejected and rejection_reason else None
+        
+        if redis_service.enabled:
+            day = datetime.now().strftime("%Y-%m-%d")
+            pending = self._pending.setdefault(
+                (day, key), {"total": 0, "rejected": 0, "reasons": defaultdict(int)}
+            )
+            pending["total"] += 1
+            if rejected:
+                pending["rejected"] += 1
+                if reason_group:
+                    pending["reasons"][reason_group] += 1
+            logger.debug(f"Recorded lead for {key}: rejected={rejected}")
+            return
         
         if key not in self._stats:
             self._stats[key] = SourceStats(
@@ -118,15 +179,122 @@ class AnalyticsService:
         
         if rejected:
             stats.rejected_leads += 1
-            if rejection_reason:
-                # Группируем причины
-                reason_group = rejection_reason.split(":")[0]
+            if reason_group:
                 stats.rejection_reasons[reason_group] = \
                     stats.rejection_reasons.get(reason_group, 0) + 1
         
         logger.debug(f"Recorded lead for {key}: rejected={rejected}")
     
-    def get_bad_sources(self, min_leads: int = 5, min_rejection_rate: float = 50.0) -> List[SourceStats]:
+    # ------------------------------------------------------------------
+    # Redis
+    # ------------------------------------------------------------------
+    
+    @staticmethod
+    def _window_days(last_day: Optional[str] = None) -> List[str]:
+        """Дни окна отчёта, заканчивающегося last_day (по умолчанию сегодня)."""
+        end = datetime.strptime(last_day, "%Y-%m-%d") if last_day else datetime.now()
+        return [
+            (end - timedelta(days=i)).strftime("%Y-%m-%d")
+            for i in range(settings.ANALYTICS_WINDOW_DAYS)
+        ]
+    
+    @staticmethod
+    def _src_key(day: str, source_key: str) -> str:
+        return f"{KEY_PREFIX}:{day}:src:{source_key}"
+    
+    @staticmethod
+    def _all_key(day: str) -> str:
+        return f"{KEY_PREFIX}:{day}:all"
+    
+    async def flush(self) -> bool:
+        """
+        Отправить накопленные приращения в Redis одним пайплайном.
+        При ошибке приращения возвращаются в буфер.
+        """
+        if not self._pending:
+            return True
+        client = await redis_service.get_client()
+        if client is None:
+            return False
+        
+        pending, self._pending = self._pending, {}
+        try:
+            if self._record_script is None:
+                self._record_script = client.register_script(RECORD_SOURCE_SCRIPT)
+            
+            ttl = settings.ANALYTICS_RETENTION_DAYS * 86400
+            now = time.time()
+            pipe = client.pipeline(transaction=False)
+            for (day, source), counts in pending.items():
+                window = [self._src_key(d, source) for d in self._window_days(day)]
+                args = [source, counts["total"], counts["rejected"], ttl, now]
+                for reason, count in counts["reasons"].items():
+                    args += [reason, count]
+                await self._record_script(
+                    keys=[self._src_key(day, source), self._all_key(day), self.rates_key, self.seen_key, *window],
+                    args=args,
+                    client=pipe
+                )
+            await pipe.execute()
+            return True
+        
+        except Exception as e:
+            logger.error(f"Analytics flush error: {e}")
+            self._record_script = None
+            for item, counts in pending.items():
+                merged = self._pending.setdefault(
+                    item, {"total": 0, "rejected": 0, "reasons": defaultdict(int)}
+                )
+                merged["total"] += counts["total"]
+                merged["rejected"] += counts["rejected"]
+                for reason, count in counts["reasons"].items():
+                    merged["reasons"][reason] += count
+            return False
+    
+    async def run_flusher(self) -> None:
+        """Фоновая задача: периодически отправлять счётчики в Redis."""
+        try:
+            while True:
+                await asyncio.sleep(settings.ANALYTICS_FLUSH_INTERVAL_SEC)
+                await self.flush()
+        finally:
+            await self.flush()
+    
+    async def _load_sources(self, client, sources: List[str]) -> List[SourceStats]:
+        """Суммировать счётчики источников за окно (один пайплайн)."""
+        days = self._window_days()
+        pipe = client.pipeline(transaction=False)
+        for source in sources:
+            for day in days:
+                pipe.hgetall(self._src_key(day, source))
+        results = await pipe.execute()
+        
+        loaded = []
+        for i, source in enumerate(sources):
+            parts = (source.split("|", 2) + ["none", "none"])[:3]
+            stats = SourceStats(source=parts[0], campaign=parts[1], content=parts[2])
+            for counts in results[i * len(days):(i + 1) * len(days)]:
+                stats.total_leads += int(counts.get("total", 0))
+                stats.rejected_leads += int(counts.get("rejected", 0))
+                for field_name, value in counts.items():
+                    if field_name.startswith("r:"):
+                        reason = field_name[2:]
+                        stats.rejection_reasons[reason] = \
+                            stats.rejection_reasons.get(reason, 0) + int(value)
+            loaded.append(stats)
+        return loaded
+    
+    async def _trim_stale(self, client) -> None:
+        """Убрать из рейтинга источники без заявок за окно."""
+        cutoff = time.time() - settings.ANALYTICS_WINDOW_DAYS * 86400
+        stale = await client.zrangebyscore(self.seen_key, "-inf", cutoff)
+        if stale:
+            pipe = client.pipeline(transaction=False)
+            pipe.zrem(self.rates_key, *stale)
+            pipe.zrem(self.seen_key, *stale)
+            await pipe.execute()
+    
+    async def get_bad_sources(self, min_leads: int = 5, min_rejection_rate: float = 50.0) -> List[SourceStats]:
         """
         Получить список плохих источников.
         
@@ -137,6 +305,23 @@ class AnalyticsService:
         Returns:
             Список плохих источников, отсортированный по % отклонений
         """
+        client = await redis_service.get_client()
+        if client is not None:
+            try:
+                await self.flush()
+                await self._trim_stale(client)
+                candidates = await client.zrevrangebyscore(
+                    self.rates_key, "+inf", min_rejection_rate
+                )
+                bad_sources = [
+                    stats for stats in await self._load_sources(client, candidates)
+                    if stats.total_leads >= min_leads and stats.rejection_rate >= min_rejection_rate
+                ]
+                bad_sources.sort(key=lambda x: x.rejection_rate, reverse=True)
+                return bad_sources
+            except Exception as e:
+                logger.error(f"Analytics Redis read error: {e}")
+        
         bad_sources = []
         
         for stats in self._stats.values():
@@ -148,10 +333,13 @@ class AnalyticsService:
         
         return bad_sources
     
-    def generate_weekly_report(self) -> WeeklyReport:
+    async def generate_weekly_report(self) -> WeeklyReport:
         """
         Генерировать еженедельный отчёт.
         
+        В Redis-режиме в sources попадают ANALYTICS_REPORT_TOP_SOURCES
+        источников с наибольшим % отклонений.
+        
         Returns:
             WeeklyReport с агрегированными данными
         """
@@ -166,6 +354,34 @@ class AnalyticsService:
         # Агрегируем по всем источникам
         all_reasons: Dict[str, int] = defaultdict(int)
         
+        client = await redis_service.get_client()
+        if client is not None:
+            try:
+                await self.flush()
+                pipe = client.pipeline(transaction=False)
+                for day in self._window_days():
+                    pipe.hgetall(self._all_key(day))
+                for counts in await pipe.execute():
+                    report.total_leads += int(counts.get("total", 0))
+                    report.total_rejected += int(counts.get("rejected", 0))
+                    for field_name, value in counts.items():
+                        if field_name.startswith("r:"):
+                            all_reasons[field_name[2:]] += int(value)
+                
+                top = await client.zrevrange(
+                    self.rates_key, 0, settings.ANALYTICS_REPORT_TOP_SOURCES - 1
+                )
+                report.sources = await self._load_sources(client, top)
+                report.top_rejection_reasons = dict(
+                    sorted(all_reasons.items(), key=lambda x: x[1], reverse=True)[:10]
+                )
+                report.bad_sources = await self.get_bad_sources()
+                return report
+            except Exception as e:
+                logger.error(f"Analytics Redis read error: {e}")
+                report = WeeklyReport(period_start=week_ago, period_end=now)
+                all_reasons.clear()
+        
         for stats in self._stats.values():
             report.total_leads += stats.total_leads
             report.total_rejected += stats.rejected_leads
@@ -180,7 +396,7 @@ class AnalyticsService:
         )
         
         # Плохие источники
-        report.bad_sources = self.get_bad_sources()
+        report.bad_sources = await self.get_bad_sources()
         
         return report
     
@@ -257,12 +473,26 @@ class AnalyticsService:
             f"💡 *Рекомендуется добавить в исключения*"
         )
     
-    def clear_stats(self):
+    async def clear_stats(self):
         """Очистить статистику (после генерации отчёта)."""
         self._stats.clear()
+        self._pending.clear()
+        
+        client = await redis_service.get_client()
+        if client is not None:
+            try:
+                sources = await client.zrange(self.seen_key, 0, -1)
+                keys = [self.rates_key, self.seen_key]
+                for day in self._window_days():
+                    keys.append(self._all_key(day))
+                    keys.extend(self._src_key(day, source) for source in sources)
+                await client.delete(*keys)
+            except Exception as e:
+                logger.error(f"Analytics Redis clear error: {e}")
+        
         logger.info("Analytics stats cleared")
     
-    def get_source_stats(
+    async def get_source_stats(
         self,
         utm_source: Optional[str] = None,
         utm_campaign: Optional[str] = None,
@@ -270,6 +500,16 @@ class AnalyticsService:
     ) -> Optional[SourceStats]:
         """Получить статистику по конкретному источнику."""
         key = self._get_source_key(utm_source, utm_campaign, utm_content)
+        
+        client = await redis_service.get_client()
+        if client is not None:
+            try:
+                await self.flush()
+                stats = (await self._load_sources(client, [key]))[0]
+                return stats if stats.total_leads else None
+            except Exception as e:
+                logger.error(f"Analytics Redis read error: {e}")
+        
         return self._stats.get(key)
 
 
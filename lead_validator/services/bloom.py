@@ -0,0 +1,68 @@
+"""
+Ротируемый Bloom-фильтр для локальной предпроверки дубликатов.
+
+Ответ "нет" — точный (значение не добавлялось в пределах TTL),
+ответ "возможно" требует проверки в Redis.
+"""
+
+import math
+import time
+from collections import deque
+from typing import Deque, Tuple
+
+
+class BloomFilter:
+    """Классический Bloom-фильтр на bytearray с двойным хешированием."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, hex_digest: str):
+        # Значения — уже SHA256 хеши, берём из них два независимых 64-битных числа
+        h1 = int(hex_digest[:16], 16)
+        h2 = int(hex_digest[16:32], 16) | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, hex_digest: str) -> None:
+        for pos in self._positions(hex_digest):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, hex_digest: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(hex_digest))
+
+
+class RotatingBloomFilter:
+    """
+    Bloom-фильтр с "забыванием" по времени.
+
+    Хранит buckets фильтров, каждый отвечает за отрезок ttl / (buckets - 1)
+    секунд. Новые значения пишутся в текущий, проверка — по всем; при смене
+    отрезка самый старый фильтр выбрасывается. Значение помнится не меньше ttl.
+    """
+
+    def __init__(self, ttl_sec: int, capacity: int, error_rate: float = 0.001, buckets: int = 4):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.span = max(1.0, ttl_sec / (buckets - 1))
+        self.buckets: Deque[Tuple[int, BloomFilter]] = deque(maxlen=buckets)
+
+    def _current(self) -> BloomFilter:
+        slot = int(time.time() // self.span)
+        if not self.buckets or self.buckets[-1][0] != slot:
+            # deque(maxlen) выбрасывает самый старый фильтр
+            self.buckets.append((slot, BloomFilter(self.capacity, self.error_rate)))
+        return self.buckets[-1][1]
+
+    def add(self, hex_digest: str) -> None:
+        self._current().add(hex_digest)
+
+    def __contains__(self, hex_digest: str) -> bool:
+        self._current()
+        oldest = int(time.time() // self.span) - self.buckets.maxlen + 1
+        return any(
+            hex_digest in bloom
+            for slot, bloom in self.buckets
+            if slot >= oldest
+        )
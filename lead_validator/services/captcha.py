@@ -1,92 +1,233 @@
 """
 Сервис валидации Yandex SmartCaptcha.
 Проверяет токен капчи через Yandex API.
+
+Слой проверки:
+- один HTTP-клиент на процесс (keep-alive к API)
+- результат кэшируется по хешу токена (CAPTCHA_RESULT_TTL_SEC): повтор
+  той же отправки формы не проверяется заново
+- использованный токен отмечается в Redis вместе с отпечатком заявки:
+  тот же токен с другой заявкой — повторное использование (replay)
+- задержка и доля ошибок провайдера идут в circuit breaker "smartcaptcha":
+  при открытой цепи fail-open срабатывает сразу, без ожидания таймаута
 """
 
+import asyncio
+import hashlib
 import logging
+from typing import Optional, Tuple
+
 import httpx
-from typing import Tuple, Optional
+
 from lead_validator.config import settings
+from lead_validator.services.circuit_breaker import breakers
+from lead_validator.services.redis_service import redis_service
+from lead_validator.services.ttl_cache import TTLCache
 
 logger = logging.getLogger("lead_validator.captcha")
 
 YANDEX_VALIDATE_URL = "https://smartcaptcha.yandexcloud.net/validate"
+CAPTCHA_KEY_PREFIX = "lead:captcha"
+
+REPLAY_ERROR = "CAPTCHA: token already used"
 
 
 async def validate_smartcaptcha(token: str, client_ip: Optional[str] = None) -> Tuple[bool, str]:
     """
     Проверяет токен Yandex SmartCaptcha.
-    
+
     Args:
         token: Токен капчи (smart-token) от клиента
         client_ip: IP адрес клиента (опционально, рекомендуется)
-    
+
     Returns:
         Tuple[bool, str]: (успех, сообщение об ошибке если есть)
     """
-    if not settings.SMARTCAPTCHA_ENABLED:
-        logger.debug("SmartCaptcha disabled, skipping validation")
+    return await captcha_validator.validate(token, client_ip)
+
+
+def _fail_open(error: str) -> Tuple[bool, str]:
+    if settings.FAIL_OPEN_MODE:
         return True, ""
-    
-    if not settings.SMARTCAPTCHA_SERVER_KEY:
-        logger.warning("SmartCaptcha enabled but server key not set!")
-        # Fail-open: пропускаем если ключ не настроен
-        if settings.FAIL_OPEN_MODE:
-            return True, ""
-        return False, "CAPTCHA: server configuration error"
-    
-    if not token:
-        logger.info("SmartCaptcha token missing")
-        return False, "CAPTCHA: token required"
-    
-    try:
+    return False, error
+
+
+# Экземпляр-синглтон для импорта
+class CaptchaValidator:
+    """Singleton класс для валидации капчи."""
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+        # sha256(токен) -> (успех, ошибка, отпечаток заявки)
+        self.results = TTLCache(max_size=settings.CAPTCHA_CACHE_MAX_SIZE)
+        self.breaker = breakers.get("smartcaptcha")
+        self.counters = {"verified": 0, "cache_hits": 0, "replays": 0}
+
+    def is_enabled(self) -> bool:
+        """Проверяет, включена ли капча."""
+        return settings.SMARTCAPTCHA_ENABLED
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Клиент привязан к event loop своих соединений
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(timeout=settings.CAPTCHA_TIMEOUT_SEC)
+            self._client_loop = loop
+        return self._client
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @staticmethod
+    def _hash(value: str) -> str:
+        return hashlib.sha256(value.encode()).hexdigest()
+
+    def get_stats(self) -> dict:
+        return {**self.counters, "cached_results": len(self.results)}
+
+    async def _call_provider(self, token: str, client_ip: Optional[str]) -> Tuple[bool, str]:
         params = {
             "secret": settings.SMARTCAPTCHA_SERVER_KEY,
             "token": token,
         }
         if client_ip:
             params["ip"] = client_ip
-        
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(YANDEX_VALIDATE_URL, params=params)
-            data = response.json()
-        
+
+        response = await self._get_client().get(YANDEX_VALIDATE_URL, params=params)
+        response.raise_for_status()
+        data = response.json()
+
         logger.debug(f"SmartCaptcha response: {data}")
-        
+
         if data.get("status") == "ok":
             logger.info("SmartCaptcha validation passed")
             return True, ""
-        else:
-            message = data.get("message", "validation failed")
-            logger.warning(f"SmartCaptcha validation failed: {message}")
-            return False, f"CAPTCHA: {message}"
-            
-    except httpx.TimeoutException:
-        logger.error("SmartCaptcha API timeout")
-        if settings.FAIL_OPEN_MODE:
-            return True, ""
-        return False, "CAPTCHA: service timeout"
-        
-    except Exception as e:
-        logger.error(f"SmartCaptcha error: {e}")
-        if settings.FAIL_OPEN_MODE:
+        message = data.get("message", "validation failed")
+        logger.warning(f"SmartCaptcha validation failed: {message}")
+        return False, f"CAPTCHA: {message}"
+
+    async def _verify(self, token: str, client_ip: Optional[str]) -> Tuple[bool, str, bool]:
+        """
+        Проверка у провайдера через circuit breaker.
+
+        Returns:
+            (успех, ошибка, ответ провайдера — можно кэшировать)
+        """
+        if not self.breaker.allow():
+            return (*_fail_open("CAPTCHA: service unavailable"), False)
+
+        try:
+            with self.breaker.track():
+                passed, error = await self._call_provider(token, client_ip)
+            self.counters["verified"] += 1
+            return passed, error, True
+
+        except httpx.TimeoutException:
+            logger.error("SmartCaptcha API timeout")
+            return (*_fail_open("CAPTCHA: service timeout"), False)
+
+        except Exception as e:
+            logger.error(f"SmartCaptcha error: {e}")
+            return (*_fail_open("CAPTCHA: service error"), False)
+
+    async def _token_owner(self, token_hash: str) -> Optional[str]:
+        """Отпечаток заявки, уже использовавшей токен (None — не использован)."""
+        client = await redis_service.get_client()
+        if client is None:
+            return None
+        try:
+            return await client.get(f"{CAPTCHA_KEY_PREFIX}:{token_hash}")
+        except Exception as e:
+            logger.error(f"Redis captcha lookup error: {e}")
+            return None
+
+    async def _consume(self, token_hash: str, fingerprint: str) -> Optional[str]:
+        """
+        Отметить токен использованным заявкой fingerprint.
+
+        Returns:
+            Отпечаток заявки, использовавшей токен раньше (гонка), или None
+        """
+        client = await redis_service.get_client()
+        if client is None:
+            return None
+        key = f"{CAPTCHA_KEY_PREFIX}:{token_hash}"
+        try:
+            if await client.set(key, fingerprint, nx=True, ex=settings.CAPTCHA_RESULT_TTL_SEC):
+                return None
+            return await client.get(key)
+        except Exception as e:
+            logger.error(f"Redis captcha consume error: {e}")
+            return None
+
+    def _replay(self) -> Tuple[bool, str]:
+        self.counters["replays"] += 1
+        logger.warning("SmartCaptcha token replay detected")
+        return False, REPLAY_ERROR
+
+    async def validate(
+        self,
+        token: str,
+        client_ip: Optional[str] = None,
+        submission: Optional[str] = None
+    ) -> Tuple[bool, str]:
+        """
+        Валидация токена капчи.
+
+        Args:
+            token: Токен капчи (smart-token) от клиента
+            client_ip: IP адрес клиента
+            submission: Идентификатор заявки (телефон) для различения
+                повтора той же отправки и повторного использования токена
+
+        Returns:
+            Tuple[bool, str]: (успех, сообщение об ошибке если есть)
+        """
+        if not settings.SMARTCAPTCHA_ENABLED:
+            logger.debug("SmartCaptcha disabled, skipping validation")
             return True, ""
-        return False, f"CAPTCHA: service error"
 
+        if not settings.SMARTCAPTCHA_SERVER_KEY:
+            logger.warning("SmartCaptcha enabled but server key not set!")
+            # Fail-open: пропускаем если ключ не настроен
+            return _fail_open("CAPTCHA: server configuration error")
 
-# Экземпляр-синглтон для импорта
-class CaptchaValidator:
-    """Singleton класс для валидации капчи."""
-    
-    async def validate(self, token: str, client_ip: Optional[str] = None) -> Tuple[bool, str]:
-        """Валидация токена капчи."""
-        return await validate_smartcaptcha(token, client_ip)
-    
-    def is_enabled(self) -> bool:
-        """Проверяет, включена ли капча."""
-        return settings.SMARTCAPTCHA_ENABLED
+        if not token:
+            logger.info("SmartCaptcha token missing")
+            return False, "CAPTCHA: token required"
 
+        token_hash = self._hash(token)
+        fingerprint = self._hash(submission) if submission else "-"
 
-captcha_validator = CaptchaValidator()
+        cached = self.results.get(token_hash)
+        if cached is not None:
+            passed, error, owner = cached
+            if passed and owner != fingerprint:
+                return self._replay()
+            self.counters["cache_hits"] += 1
+            return passed, error
+
+        # Токен уже принят в другом процессе
+        owner = await self._token_owner(token_hash)
+        if owner is not None:
+            if owner != fingerprint:
+                return self._replay()
+            self.counters["cache_hits"] += 1
+            return True, ""
 
+        passed, error, cacheable = await self._verify(token, client_ip)
+        if not cacheable:
+            return passed, error
 
+        if passed:
+            owner = await self._consume(token_hash, fingerprint)
+            if owner is not None and owner != fingerprint:
+                return self._replay()
+        self.results.set(token_hash, (passed, error, fingerprint), settings.CAPTCHA_RESULT_TTL_SEC)
+        return passed, error
+
+
+captcha_validator = CaptchaValidator()
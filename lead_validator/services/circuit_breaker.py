@@ -0,0 +1,199 @@
+"""
+Circuit breaker для внешних сервисов Lead Validator.
+
+У каждого upstream (DaData, Redis, DNS, SmartCaptcha, Telegram, Метрика,
+Airtable) своё скользящее окно вызовов. Если доля ошибок (медленный вызов
+дольше BREAKER_SLOW_CALL_MS тоже считается ошибкой) превышает
+BREAKER_FAILURE_RATE, цепь размыкается: вызовы сразу получают fail-open
+без ожидания таймаута. Через BREAKER_OPEN_SEC пропускается один пробный
+вызов — успех замыкает цепь, ошибка снова размыкает.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Optional, Tuple, Type
+
+from lead_validator.config import settings
+
+logger = logging.getLogger("lead_validator.circuit_breaker")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Сообщение отмены, когда вызов не уложился в бюджет времени на лид
+DEADLINE_CANCEL = "lead_deadline_exceeded"
+
+
+class RollingWindow:
+    """Скользящее окно вызовов: задержка и доля ошибок."""
+
+    def __init__(self, window_sec: float):
+        self.window_sec = window_sec
+        # (время вызова, задержка мс, успех)
+        self.calls: Deque[Tuple[float, float, bool]] = deque()
+
+    def _trim(self) -> None:
+        border = time.monotonic() - self.window_sec
+        while self.calls and self.calls[0][0] < border:
+            self.calls.popleft()
+
+    def record(self, latency_ms: float, ok: bool) -> None:
+        self.calls.append((time.monotonic(), latency_ms, ok))
+        self._trim()
+
+    def clear(self) -> None:
+        self.calls.clear()
+
+    def __len__(self) -> int:
+        self._trim()
+        return len(self.calls)
+
+    def error_rate(self) -> float:
+        self._trim()
+        if not self.calls:
+            return 0.0
+        return sum(1 for _, _, ok in self.calls if not ok) / len(self.calls)
+
+    def snapshot(self) -> dict:
+        self._trim()
+        latencies = sorted(latency for _, latency, _ in self.calls)
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 2)
+
+        return {
+            "calls": len(self.calls),
+            "error_rate": round(self.error_rate(), 3),
+            "latency_p50_ms": percentile(0.5),
+            "latency_p95_ms": percentile(0.95),
+        }
+
+
+class CircuitBreaker:
+    """
+    Состояние одного upstream.
+
+    Использование:
+        if not breaker.allow():
+            return <fail-open результат>
+        with breaker.track():
+            ... вызов (исключение — ошибка upstream) ...
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.window = RollingWindow(settings.BREAKER_WINDOW_SEC)
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.rejected = 0  # Вызовов пропущено из-за открытой цепи
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+
+    def allow(self) -> bool:
+        """Можно ли вызывать upstream сейчас."""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() - self.opened_at >= settings.BREAKER_OPEN_SEC:
+            self.state = HALF_OPEN
+            self._probe_in_flight = False
+        now = time.monotonic()
+        # Пробный вызов мог быть отменён, не записав результат
+        if self.state == HALF_OPEN and (
+            not self._probe_in_flight or now - self._probe_started >= settings.BREAKER_OPEN_SEC
+        ):
+            self._probe_in_flight = True
+            self._probe_started = now
+            return True
+        self.rejected += 1
+        return False
+
+    def record(self, latency_ms: float, ok: bool) -> None:
+        """Записать результат вызова и пересчитать состояние."""
+        if ok and latency_ms > settings.BREAKER_SLOW_CALL_MS:
+            ok = False
+        self.window.record(latency_ms, ok)
+
+        if self.state == HALF_OPEN:
+            self._probe_in_flight = False
+            if ok:
+                self.state = CLOSED
+                self.window.clear()
+                logger.info(f"Circuit '{self.name}' closed")
+            else:
+                self._open()
+        elif (
+            self.state == CLOSED
+            and len(self.window) >= settings.BREAKER_MIN_CALLS
+            and self.window.error_rate() >= settings.BREAKER_FAILURE_RATE
+        ):
+            self._open()
+
+    @contextmanager
+    def track(self, *expected: Type[BaseException]):
+        """
+        Замерить вызов: исключение — ошибка. Отмена по бюджету лида
+        (DEADLINE_CANCEL) или после BREAKER_SLOW_CALL_MS — тоже ошибка,
+        иначе (соседняя проверка уже отклонила лид) не учитывается.
+
+        Args:
+            expected: Исключения-ответы upstream (например NXDOMAIN),
+                которые считаются успешным вызовом
+        """
+        started = time.perf_counter()
+        probe = self._probe_started if self.state == HALF_OPEN else None
+        try:
+            yield
+        except asyncio.CancelledError as e:
+            latency_ms = (time.perf_counter() - started) * 1000
+            if DEADLINE_CANCEL in e.args or latency_ms > settings.BREAKER_SLOW_CALL_MS:
+                self.record(latency_ms, ok=False)
+            elif probe is not None and probe == self._probe_started:
+                # Отменён сам пробный вызов — следующий allow() пустит новый
+                self._probe_in_flight = False
+            raise
+        except expected:
+            self.record((time.perf_counter() - started) * 1000, ok=True)
+            raise
+        except Exception:
+            self.record((time.perf_counter() - started) * 1000, ok=False)
+            raise
+        self.record((time.perf_counter() - started) * 1000, ok=True)
+
+    def _open(self) -> None:
+        if self.state != OPEN:
+            logger.warning(
+                f"Circuit '{self.name}' opened: error rate "
+                f"{self.window.error_rate():.0%} over {len(self.window)} calls"
+            )
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+
+    def snapshot(self) -> dict:
+        return {"state": self.state, "rejected": self.rejected, **self.window.snapshot()}
+
+
+class BreakerRegistry:
+    """Circuit breaker'ы по имени upstream, создаются при первом обращении."""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, name: str) -> CircuitBreaker:
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(name)
+            self._breakers[name] = breaker
+        return breaker
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {name: breaker.snapshot() for name, breaker in sorted(self._breakers.items())}
+
+
+# Глобальный экземпляр
+breakers = BreakerRegistry()
@@ -1,13 +1,29 @@
 """
 DaData API клиент для валидации телефонов и email.
 Использует Clean API для стандартизации и проверки качества.
+
+Ответы кэшируются в Redis по хешу телефона/email (DADATA_CACHE_TTL_SEC),
+одновременные запросы одного значения объединяются в один вызов API.
+Разные значения копятся микро-батчером и уходят одним массивом
+(DADATA_BATCH_SIZE / DADATA_BATCH_WAIT_MS, не чаще DADATA_RATE_LIMIT_PER_SEC).
+При открытой цепи "dadata" (см. circuit_breaker) запросы не отправляются.
+
+Тип, оператор и регион однозначного российского номера берутся из
+локальной базы плана нумерации (services/phone_plan) без запроса к API.
 """
 
+import asyncio
+import json
 import logging
 import httpx
-from typing import Optional
+from typing import Awaitable, Callable, Dict, List, Optional
 from lead_validator.config import settings
 from lead_validator.schemas import DaDataPhoneResponse
+from lead_validator.services.redis_service import redis_service, RedisService
+from lead_validator.services.circuit_breaker import breakers
+from lead_validator.services.phone_plan import phone_plan, PlanEntry
+from lead_validator.services.micro_batcher import MicroBatcher
+from lead_validator.services.token_bucket import TokenBucket
 
 logger = logging.getLogger("lead_validator.dadata")
 
@@ -20,11 +36,29 @@ class DaDataService:
     """
     
     CLEAN_URL = "https://cleaner.dadata.ru/api/v1/clean/phone"
+    CLEAN_EMAIL_URL = "https://cleaner.dadata.ru/api/v1/clean/email"
+    CACHE_PREFIX = "lead:dadata"
     
     def __init__(self):
         self.api_key = settings.DADATA_API_KEY
         self.secret_key = settings.DADATA_SECRET_KEY
         self.timeout = settings.DADATA_TIMEOUT
+        # Запросы в процессе: ключ кэша -> задача загрузки
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.stats = {"api_calls": 0, "cache_hits": 0, "coalesced": 0, "plan_hits": 0}
+        self.breaker = breakers.get("dadata")
+        
+        # Лимит DaData общий на аккаунт — один limiter на оба батчера
+        limiter = TokenBucket(settings.DADATA_RATE_LIMIT_PER_SEC)
+        max_wait = settings.DADATA_BATCH_WAIT_MS / 1000
+        self.phone_batcher = MicroBatcher(
+            lambda phones: self._clean_batch(self.CLEAN_URL, phones),
+            settings.DADATA_BATCH_SIZE, max_wait, limiter
+        )
+        self.email_batcher = MicroBatcher(
+            lambda emails: self._clean_batch(self.CLEAN_EMAIL_URL, emails),
+            settings.DADATA_BATCH_SIZE, max_wait, limiter
+        )
         
     def _get_headers(self) -> dict:
         """Заголовки для авторизации в DaData API"""
@@ -35,6 +69,48 @@ class DaDataService:
             "X-Secret": self.secret_key
         }
     
+    async def _cached(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Optional[dict]]]
+    ) -> Optional[dict]:
+        """
+        Ответ DaData из кэша или из API.
+        
+        Одновременные вызовы с одним ключом ждут одну задачу. Задача
+        защищена от отмены вызывающего: оплаченный ответ всё равно
+        попадёт в кэш. Ошибки (None) не кэшируются.
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load(key, fetch))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.stats["coalesced"] += 1
+        return await asyncio.shield(task)
+    
+    async def _load(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Optional[dict]]]
+    ) -> Optional[dict]:
+        cached = await redis_service.cache_get(key)
+        if cached is not None:
+            self.stats["cache_hits"] += 1
+            logger.debug(f"DaData cache hit: {key[:40]}...")
+            return json.loads(cached)
+        
+        self.stats["api_calls"] += 1
+        data = await fetch()
+        if data is not None:
+            await redis_service.cache_set(
+                key,
+                json.dumps(data, ensure_ascii=False),
+                settings.DADATA_CACHE_TTL_SEC
+            )
+        return data
+    
     async def validate_phone(self, phone: str) -> Optional[DaDataPhoneResponse]:
         """
         Валидация и стандартизация телефона через DaData.
@@ -52,34 +128,81 @@ class DaDataService:
             2 - Пустой или мусорный
             3 - Несколько телефонов, распознан первый
         """
+        entry = phone_plan.lookup(phone)
+        if entry is not None:
+            self.stats["plan_hits"] += 1
+            return self._from_plan(phone, entry)
+        
+        key = f"{self.CACHE_PREFIX}:phone:{RedisService.hash_phone(phone)}"
+        data = await self._cached(key, lambda: self._fetch_phone(phone))
+        return DaDataPhoneResponse(**data) if data else None
+    
+    @staticmethod
+    def _from_plan(phone: str, entry: PlanEntry) -> DaDataPhoneResponse:
+        """Ответ в формате DaData по записи плана нумерации."""
+        n = entry.number
+        number = f"{n[3:6]}-{n[6:8]}-{n[8:]}"
+        return DaDataPhoneResponse(
+            source=phone,
+            type=entry.type,
+            phone=f"+7 {n[:3]} {number}",
+            country_code="7",
+            city_code=n[:3],
+            number=number,
+            provider=entry.provider,
+            country="Россия",
+            region=entry.region,
+            qc=0
+        )
+    
+    async def _fetch_phone(self, phone: str) -> Optional[dict]:
+        """Запрос к DaData Clean API (телефон) через батчер. None при ошибке."""
+        result = await self.phone_batcher.submit(phone)
+        if result:
+            logger.info(
+                f"DaData response for {phone}: qc={result.get('qc')}, "
+                f"type={result.get('type')}"
+            )
+        return result
+    
+    async def _clean_batch(self, url: str, items: List[str]) -> Optional[List[dict]]:
+        """
+        Один запрос к DaData Clean API для массива значений.
+        
+        Returns:
+            Ответы в порядке items или None при ошибке
+        """
+        if not self.breaker.allow():
+            return None
+            
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    self.CLEAN_URL,
-                    headers=self._get_headers(),
-                    json=[phone]  # API принимает массив телефонов
-                )
+            with self.breaker.track():
+                async with httpx.AsyncClient(timeout=self.timeout) as client:
+                    response = await client.post(
+                        url,
+                        headers=self._get_headers(),
+                        json=items  # API принимает массив значений
+                    )
+                # Ошибки сервера и лимит — сбой upstream для circuit breaker
+                if response.status_code >= 500 or response.status_code == 429:
+                    response.raise_for_status()
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    if data and len(data) > 0:
-                        logger.info(
-                            f"DaData response for {phone}: qc={data[0].get('qc')}, "
-                            f"type={data[0].get('type')}"
-                        )
-                        return DaDataPhoneResponse(**data[0])
-                        
-                elif response.status_code == 401:
-                    logger.error("DaData auth error: invalid API key or secret")
-                elif response.status_code == 403:
-                    logger.error("DaData error: email not confirmed or insufficient funds")
-                elif response.status_code == 429:
-                    logger.warning("DaData rate limit exceeded")
-                else:
-                    logger.error(f"DaData error: {response.status_code} - {response.text}")
+            if response.status_code == 200:
+                return response.json()
+            elif response.status_code == 401:
+                logger.error("DaData auth error: invalid API key or secret")
+            elif response.status_code == 403:
+                logger.error("DaData error: email not confirmed or insufficient funds")
+            else:
+                logger.error(f"DaData error: {response.status_code} - {response.text}")
                     
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 429:
+                logger.warning("DaData rate limit exceeded")
+            else:
+                logger.error(f"DaData error: {e.response.status_code} - {e.response.text}")
         except httpx.TimeoutException:
-            logger.warning(f"DaData timeout for phone: {phone}")
+            logger.warning(f"DaData timeout for batch of {len(items)}")
         except httpx.RequestError as e:
             logger.error(f"DaData request error: {e}")
         except Exception as e:
@@ -98,30 +221,18 @@ class DaDataService:
             - qc: 0=OK, 1=исправлен, 2=мусор, 3=несколько адресов
             - type: PERSONAL, CORPORATE, ROLE, DISPOSABLE
         """
-        try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    "https://cleaner.dadata.ru/api/v1/clean/email",
-                    headers=self._get_headers(),
-                    json=[email]
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    if data and len(data) > 0:
-                        result = data[0]
-                        logger.info(
-                            f"DaData email response for {email}: "
-                            f"qc={result.get('qc')}, type={result.get('type')}"
-                        )
-                        return result
-                        
-        except httpx.TimeoutException:
-            logger.warning(f"DaData timeout for email: {email}")
-        except Exception as e:
-            logger.error(f"DaData email validation error: {e}")
-            
-        return None
+        key = f"{self.CACHE_PREFIX}:email:{RedisService.hash_email(email)}"
+        return await self._cached(key, lambda: self._fetch_email(email))
+    
+    async def _fetch_email(self, email: str) -> Optional[dict]:
+        """Запрос к DaData Clean API (email) через батчер. None при ошибке."""
+        result = await self.email_batcher.submit(email)
+        if result:
+            logger.info(
+                f"DaData email response for {email}: "
+                f"qc={result.get('qc')}, type={result.get('type')}"
+            )
+        return result
     
     def is_phone_valid(self, dadata_response: DaDataPhoneResponse) -> bool:
         """
@@ -4,13 +4,20 @@
 Уровень 2 и 4 по ТЗ:
 - Disposable email: mailinator, tempmail, guerrillamail и т.д.
 - Мусорные имена: test, asdf, qwerty и т.д.
+
+Домены проверяются с учётом поддоменов, паттерны имён — одним
+скомпилированным выражением. Списки дополняются из файлов
+(DISPOSABLE_DOMAINS_FILE, GARBAGE_NAMES_FILE) и Redis SET lead:lists:*.
 """
 
 import logging
 import re
-from typing import Optional, Tuple
+from typing import Optional, Set, Tuple
 from dataclasses import dataclass
 
+from lead_validator.config import settings
+from lead_validator.services.matchers import DomainSuffixSet, PatternSet, list_reloader
+
 logger = logging.getLogger("lead_validator.data_quality")
 
 
@@ -119,6 +126,10 @@ SUSPICIOUS_NAME_PATTERNS = [
     r'^[а-яё]{1,2}$',         # Слишком короткие кириллические
 ]
 
+# Повторы символов: 3+ подряд — подозрительно, 4+ — отклоняем
+REPEAT_3_RE = re.compile(r'(.)\1{2,}')
+REPEAT_4_RE = re.compile(r'(.)\1{3,}')
+
 
 @dataclass
 class DataQualityResult:
@@ -140,7 +151,36 @@ class DataQualityValidator:
     def __init__(self):
         self.disposable_domains = DISPOSABLE_EMAIL_DOMAINS.copy()
         self.garbage_names = GARBAGE_NAMES.copy()
-        self.name_patterns = [re.compile(p, re.IGNORECASE) for p in SUSPICIOUS_NAME_PATTERNS]
+        self.name_patterns = PatternSet(SUSPICIOUS_NAME_PATTERNS, re.IGNORECASE)
+        
+        # Записи из внешних источников (файл, Redis)
+        self.external_domains: Set[str] = set()
+        self.external_names: Set[str] = set()
+        self.disposable_matcher = DomainSuffixSet(self.disposable_domains)
+        self.garbage_names_all = frozenset(self.garbage_names)
+        
+        list_reloader.register(
+            "disposable_domains",
+            self.set_external_domains,
+            path=settings.DISPOSABLE_DOMAINS_FILE,
+            redis_key="lead:lists:disposable_domains"
+        )
+        list_reloader.register(
+            "garbage_names",
+            self.set_external_names,
+            path=settings.GARBAGE_NAMES_FILE,
+            redis_key="lead:lists:garbage_names"
+        )
+    
+    def set_external_domains(self, domains: Set[str]) -> None:
+        """Заменить домены из внешних источников (горячая перезагрузка)."""
+        self.external_domains = set(domains)
+        self.disposable_matcher = DomainSuffixSet(self.disposable_domains | self.external_domains)
+    
+    def set_external_names(self, names: Set[str]) -> None:
+        """Заменить имена из внешних источников (горячая перезагрузка)."""
+        self.external_names = {n.strip().lower() for n in names}
+        self.garbage_names_all = frozenset(self.garbage_names | self.external_names)
     
     def validate_email_domain(self, email: Optional[str]) -> DataQualityResult:
         """
@@ -164,8 +204,8 @@ class DataQualityValidator:
         
         domain = email.split("@")[-1].lower().strip()
         
-        # Проверяем в чёрном списке
-        if domain in self.disposable_domains:
+        # Проверяем в чёрном списке (включая поддомены)
+        if self.disposable_matcher.match(domain):
             logger.info(f"Disposable email domain detected: {domain}")
             return DataQualityResult(
                 is_valid=False,
@@ -198,7 +238,7 @@ class DataQualityValidator:
             )
         
         # Проверка в стоп-листе
-        if name_clean in self.garbage_names:
+        if name_clean in self.garbage_names_all:
             logger.info(f"Garbage name detected: '{name}'")
             return DataQualityResult(
                 is_valid=False,
@@ -206,18 +246,17 @@ class DataQualityValidator:
             )
         
         # Проверка по паттернам
-        for pattern in self.name_patterns:
-            if pattern.search(name_clean):
-                logger.info(f"Suspicious name pattern in: '{name}'")
-                return DataQualityResult(
-                    is_valid=False,
-                    rejection_reason="name_suspicious_pattern"
-                )
+        if self.name_patterns.search(name_clean):
+            logger.info(f"Suspicious name pattern in: '{name}'")
+            return DataQualityResult(
+                is_valid=False,
+                rejection_reason="name_suspicious_pattern"
+            )
         
         # Проверка на повторяющиеся символы (3+ подряд)
-        if re.search(r'(.)\1{2,}', name_clean):
+        if REPEAT_3_RE.search(name_clean):
             # Но разрешаем нормальные имена с двойными буквами (Анна, Алла)
-            if re.search(r'(.)\1{3,}', name_clean):
+            if REPEAT_4_RE.search(name_clean):
                 logger.info(f"Repeating chars in name: '{name}'")
                 return DataQualityResult(
                     is_valid=False,
@@ -229,11 +268,13 @@ class DataQualityValidator:
     def add_disposable_domain(self, domain: str):
         """Добавить домен в чёрный список."""
         self.disposable_domains.add(domain.lower())
+        self.disposable_matcher = DomainSuffixSet(self.disposable_domains | self.external_domains)
         logger.info(f"Added disposable domain: {domain}")
     
     def add_garbage_name(self, name: str):
         """Добавить имя в стоп-лист."""
         self.garbage_names.add(name.lower())
+        self.garbage_names_all = frozenset(self.garbage_names | self.external_names)
         logger.info(f"Added garbage name: {name}")
 
 
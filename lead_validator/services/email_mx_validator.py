@@ -6,13 +6,33 @@
 - Timezone: сравнение часового пояса браузера с ожидаемым для IP
 """
 
+import asyncio
+import json
 import logging
+import time
+from typing import Iterable, Optional, Tuple
+from dataclasses import dataclass, asdict
+
+import dns.asyncresolver
+import dns.exception
 import dns.resolver
-from typing import Optional, Tuple
-from dataclasses import dataclass
+
+from lead_validator.config import settings
+from lead_validator.services.circuit_breaker import breakers
+from lead_validator.services.redis_service import redis_service
+from lead_validator.services.ttl_cache import TTLCache
 
 logger = logging.getLogger("lead_validator.email_mx")
 
+# Популярные бесплатные почтовые домены: прогреваются при старте,
+# чтобы типичный лид проверялся без обращения к DNS
+FREE_MAIL_DOMAINS = (
+    "gmail.com", "mail.ru", "yandex.ru", "ya.ru", "yandex.com",
+    "bk.ru", "list.ru", "inbox.ru", "internet.ru", "rambler.ru",
+    "icloud.com", "me.com", "outlook.com", "hotmail.com", "live.com",
+    "yahoo.com", "proton.me", "protonmail.com",
+)
+
 # Маппинг часовых поясов на регионы России
 TIMEZONE_TO_REGION = {
     "Europe/Moscow": "RU",
@@ -53,19 +73,42 @@ class TimezoneCheckResult:
     expected_country: Optional[str] = None
 
 
+# Прежнее имя кэша MX-проверки
+MXCache = TTLCache
+
+
 class EmailMXValidator:
     """
     Проверка MX-записей email домена.
     
     Если у домена нет MX-записей — почтового сервера не существует,
     значит email невалидный.
+    
+    DNS-запросы асинхронные (dns.asyncresolver). Результаты кэшируются
+    в памяти с учётом TTL записи, отрицательные (NXDOMAIN, нет MX) —
+    на MX_NEGATIVE_TTL_SEC. При включённом Redis кэш общий для воркеров.
+    Ошибки и таймауты DNS не кэшируются; при открытой цепи "dns"
+    резолвер не вызывается (fail-open).
     """
     
+    REDIS_KEY_PREFIX = "lead:mx:"
+    
     def __init__(self):
-        self.timeout = 5.0  # секунд на DNS запрос
-        self.cache = {}  # Простой кэш для повторных запросов
+        self.timeout = settings.MX_DNS_TIMEOUT_SEC  # секунд на DNS запрос
+        self.cache = TTLCache(settings.MX_CACHE_MAX_SIZE)
+        self._resolver: Optional[dns.asyncresolver.Resolver] = None
+        self.breaker = breakers.get("dns")
+    
+    def _get_resolver(self) -> dns.asyncresolver.Resolver:
+        """Создать резолвер один раз (чтение resolv.conf блокирующее)."""
+        if self._resolver is None:
+            resolver = dns.asyncresolver.Resolver()
+            resolver.timeout = self.timeout
+            resolver.lifetime = self.timeout
+            self._resolver = resolver
+        return self._resolver
         
-    def check_mx(self, email: str) -> MXCheckResult:
+    async def check_mx(self, email: str) -> MXCheckResult:
         """
         Проверить наличие MX-записей для домена email.
         
@@ -84,71 +127,146 @@ class EmailMXValidator:
         
         domain = email.split("@")[-1].lower().strip()
         
-        # Проверяем кэш
-        if domain in self.cache:
-            return self.cache[domain]
+        # Проверяем кэш в памяти
+        cached = self.cache.get(domain)
+        if cached is not None:
+            return cached
         
-        try:
-            # Запрашиваем MX-записи
-            resolver = dns.resolver.Resolver()
-            resolver.timeout = self.timeout
-            resolver.lifetime = self.timeout
+        # Проверяем общий кэш в Redis
+        shared = await self._get_shared(domain)
+        if shared is not None:
+            result, ttl = shared
+            self.cache.set(domain, result, ttl)
+            return result
+        
+        return await self._resolve_and_cache(domain)
+    
+    async def _resolve_and_cache(self, domain: str) -> MXCheckResult:
+        """Запросить MX в DNS и положить результат в кэши."""
+        result, ttl = await self._resolve(domain)
+        if ttl > 0:
+            self.cache.set(domain, result, ttl)
+            await self._set_shared(domain, result, ttl)
+        return result
+    
+    async def _resolve(self, domain: str) -> Tuple[MXCheckResult, int]:
+        """
+        Запросить MX-записи домена.
+        
+        Returns:
+            (результат, TTL для кэша в секундах; 0 — не кэшировать)
+        """
+        if not self.breaker.allow():
+            return MXCheckResult(
+                has_mx=True,  # Fail-open: DNS недоступен
+                mx_records=[],
+                error="dns_circuit_open"
+            ), 0
             
-            mx_records = resolver.resolve(domain, 'MX')
-            records = [str(r.exchange).rstrip('.') for r in mx_records]
+        try:
+            # Запрашиваем MX-записи (NXDOMAIN и NoAnswer — ответ DNS, не сбой)
+            with self.breaker.track(dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+                answer = await self._get_resolver().resolve(domain, 'MX')
+            records = [str(r.exchange).rstrip('.') for r in answer]
             
-            result = MXCheckResult(
+            logger.info(f"MX records for {domain}: {records[:3]}")
+            ttl = min(answer.rrset.ttl, settings.MX_CACHE_MAX_TTL_SEC)
+            return MXCheckResult(
                 has_mx=len(records) > 0,
                 mx_records=records
-            )
-            
-            logger.info(f"MX records for {domain}: {records[:3]}")
+            ), ttl
             
         except dns.resolver.NXDOMAIN:
             logger.info(f"Domain not found: {domain}")
-            result = MXCheckResult(
+            return MXCheckResult(
                 has_mx=False,
                 mx_records=[],
                 error="domain_not_found"
-            )
+            ), settings.MX_NEGATIVE_TTL_SEC
             
         except dns.resolver.NoAnswer:
             logger.info(f"No MX records for: {domain}")
-            result = MXCheckResult(
+            return MXCheckResult(
                 has_mx=False,
                 mx_records=[],
                 error="no_mx_records"
-            )
+            ), settings.MX_NEGATIVE_TTL_SEC
             
-        except dns.resolver.Timeout:
+        except dns.exception.Timeout:
             logger.warning(f"DNS timeout for: {domain}")
-            result = MXCheckResult(
+            return MXCheckResult(
                 has_mx=True,  # Fail-open: при timeout пропускаем
                 mx_records=[],
                 error="dns_timeout"
-            )
+            ), 0
             
         except Exception as e:
             logger.error(f"MX check error for {domain}: {e}")
-            result = MXCheckResult(
+            return MXCheckResult(
                 has_mx=True,  # Fail-open
                 mx_records=[],
                 error=str(e)
-            )
-        
-        # Кэшируем результат
-        self.cache[domain] = result
-        return result
+            ), 0
     
-    def has_valid_mx(self, email: str) -> bool:
+    async def _get_shared(self, domain: str) -> Optional[Tuple[MXCheckResult, float]]:
+        """Прочитать результат из общего кэша Redis."""
+        if not settings.MX_CACHE_SHARED:
+            return None
+        raw = await redis_service.cache_get(f"{self.REDIS_KEY_PREFIX}{domain}")
+        if not raw:
+            return None
+        try:
+            data = json.loads(raw)
+            ttl = data.pop("expires_at") - time.time()
+            return MXCheckResult(**data), ttl
+        except Exception as e:
+            logger.warning(f"Bad MX cache entry for {domain}: {e}")
+            return None
+    
+    async def _set_shared(self, domain: str, result: MXCheckResult, ttl: int) -> None:
+        """Сохранить результат в общий кэш Redis."""
+        if not settings.MX_CACHE_SHARED:
+            return
+        data = asdict(result)
+        data["expires_at"] = time.time() + ttl
+        await redis_service.cache_set(
+            f"{self.REDIS_KEY_PREFIX}{domain}",
+            json.dumps(data),
+            ttl
+        )
+    
+    async def has_valid_mx(self, email: str) -> bool:
         """
         Быстрая проверка: есть ли у email валидные MX-записи.
         
         Returns:
             True если MX есть или при ошибке (fail-open)
         """
-        result = self.check_mx(email)
+        result = await self.check_mx(email)
         return result.has_mx
+    
+    async def warm_up(self, domains: Iterable[str] = FREE_MAIL_DOMAINS) -> None:
+        """
+        Прогреть кэш популярными почтовыми доменами.
+        Домены запрашиваются в DNS заново, даже если уже есть в кэше.
+        """
+        await asyncio.gather(
+            *(self._resolve_and_cache(d) for d in domains),
+            return_exceptions=True
+        )
+        logger.info(f"MX cache warmed up: {len(self.cache)} domains cached")
+    
+    async def keep_warm(self) -> None:
+        """
+        Фоновая задача: периодически обновлять популярные домены,
+        чтобы они не выпадали из кэша по TTL.
+        """
+        while True:
+            try:
+                await self.warm_up()
+            except Exception as e:
+                logger.error(f"MX cache warm-up failed: {e}")
+            await asyncio.sleep(settings.MX_WARMUP_INTERVAL_SEC)
 
 
 class TimezoneValidator:
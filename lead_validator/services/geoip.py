@@ -0,0 +1,191 @@
+"""
+Локальный GeoIP: страна по IP без внешнего API.
+
+Источник (GEOIP_FILE) загружается один раз при старте:
+- CSV диапазонов: DB-IP Lite (start_ip,end_ip,country), IP2Location LITE
+  DB1 (ip_from,ip_to,country_code,... числами) или network,country (CIDR)
+- .mmdb (MaxMind GeoLite2 / DB-IP) — через maxminddb, если установлен
+
+CSV превращается в отсортированные массивы (array) начала и конца
+диапазонов и кодов стран, поиск — bisect по целому значению IP.
+IPv6 хранится по старшим 64 битам: страновые диапазоны не мельче /64.
+Результаты кэшируются по IP (GEOIP_CACHE_MAX_SIZE).
+"""
+
+import bisect
+import csv
+import ipaddress
+import logging
+import os
+from array import array
+from typing import Iterator, List, Optional, Tuple, Union
+
+from lead_validator.config import settings
+from lead_validator.services.ttl_cache import TTLCache
+
+logger = logging.getLogger("lead_validator.geoip")
+
+# maxminddb нужен только для .mmdb, CSV читается без зависимостей
+try:
+    import maxminddb
+    MAXMINDDB_AVAILABLE = True
+except ImportError:
+    MAXMINDDB_AVAILABLE = False
+
+IPV4_MAPPED = ipaddress.ip_network("::ffff:0:0/96")
+UNKNOWN_COUNTRIES = {"", "-", "ZZ", "XX"}
+
+IPAddress = Union[ipaddress.IPv4Address, ipaddress.IPv6Address]
+
+
+def _pack_country(code: str) -> int:
+    return (ord(code[0]) << 8) | ord(code[1])
+
+
+def _unpack_country(value: int) -> str:
+    return chr(value >> 8) + chr(value & 0xFF)
+
+
+def _parse_ip(value: str) -> IPAddress:
+    """IP из строки или числа (IP2Location); IPv4-mapped IPv6 — как IPv4."""
+    value = value.strip()
+    address = ipaddress.ip_address(int(value) if value.isdigit() else value)
+    if address.version == 6 and address in IPV4_MAPPED:
+        return address.ipv4_mapped
+    return address
+
+
+def read_geoip_csv(path: str) -> Iterator[Tuple[IPAddress, IPAddress, str]]:
+    """Диапазоны из CSV: (первый IP, последний IP, код страны)."""
+    with open(path, encoding="utf-8", newline="") as f:
+        for row in csv.reader(f):
+            if len(row) < 2:
+                continue
+            try:
+                if "/" in row[0]:
+                    network = ipaddress.ip_network(row[0].strip(), strict=False)
+                    first, last, country = network[0], network[-1], row[1]
+                else:
+                    first, last, country = _parse_ip(row[0]), _parse_ip(row[1]), row[2]
+            except (ValueError, IndexError):
+                continue  # Заголовок или битая строка
+            country = country.strip().upper()
+            if country in UNKNOWN_COUNTRIES or len(country) != 2 or first.version != last.version:
+                continue
+            yield first, last, country
+
+
+class _RangeTable:
+    """Отсортированные непересекающиеся диапазоны одной версии IP."""
+
+    def __init__(self, rows: List[Tuple[int, int, int]]):
+        rows.sort()
+        self.starts = array("Q", (start for start, _, _ in rows))
+        self.ends = array("Q", (end for _, end, _ in rows))
+        self.countries = array("H", (country for _, _, country in rows))
+
+    def find(self, value: int) -> Optional[str]:
+        i = bisect.bisect_right(self.starts, value) - 1
+        if i < 0 or value > self.ends[i]:
+            return None
+        return _unpack_country(self.countries[i])
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+
+class GeoIPResolver:
+    """Страна по IP из локальной базы с кэшем по IP."""
+
+    def __init__(self):
+        self._v4: Optional[_RangeTable] = None
+        self._v6: Optional[_RangeTable] = None
+        self._reader = None
+        self.cache = TTLCache(max_size=settings.GEOIP_CACHE_MAX_SIZE)
+        self.stats = {"lookups": 0, "cache_hits": 0, "found": 0}
+
+    @property
+    def loaded(self) -> bool:
+        return self._v4 is not None or self._reader is not None
+
+    def load(self, path: Optional[str] = None) -> bool:
+        """
+        Загрузить базу (блокирующе — при старте вызывать в потоке).
+
+        Returns:
+            False — файла нет или формат не поддерживается
+        """
+        path = path or settings.GEOIP_FILE
+        if not path or not os.path.exists(path):
+            logger.warning(f"GeoIP database not found: {path or '-'}, geo checks use lead data only")
+            return False
+
+        if path.endswith(".mmdb"):
+            if not MAXMINDDB_AVAILABLE:
+                logger.error("GeoIP .mmdb requires the maxminddb package")
+                return False
+            self._reader = maxminddb.open_database(path)
+            self._v4 = self._v6 = None
+        else:
+            v4: List[Tuple[int, int, int]] = []
+            v6: List[Tuple[int, int, int]] = []
+            for first, last, country in read_geoip_csv(path):
+                if first.version == 4:
+                    v4.append((int(first), int(last), _pack_country(country)))
+                else:
+                    v6.append((int(first) >> 64, int(last) >> 64, _pack_country(country)))
+            self._v4, self._v6 = _RangeTable(v4), _RangeTable(v6)
+            self._reader = None
+            logger.info(f"GeoIP loaded: {len(v4)} IPv4 and {len(v6)} IPv6 ranges from {path}")
+
+        self.cache = TTLCache(max_size=settings.GEOIP_CACHE_MAX_SIZE)
+        return True
+
+    def _lookup(self, address: IPAddress) -> Optional[str]:
+        if self._reader is not None:
+            record = self._reader.get(str(address)) or {}
+            country = record.get("country") or record.get("registered_country") or {}
+            return country.get("iso_code")
+        if address.version == 4:
+            return self._v4.find(int(address))
+        return self._v6.find(int(address) >> 64)
+
+    def country(self, ip: Optional[str]) -> Optional[str]:
+        """
+        Код страны (RU, UA, ...) или None, если IP неизвестен
+        или база не загружена.
+        """
+        if not ip or not self.loaded:
+            return None
+        self.stats["lookups"] += 1
+
+        cached = self.cache.get(ip)
+        if cached is not None:
+            self.stats["cache_hits"] += 1
+            return cached or None
+
+        try:
+            address = _parse_ip(ip)
+        except ValueError:
+            return None
+        # Частные и служебные адреса в базе не ищем
+        country = self._lookup(address) if address.is_global else None
+
+        if country:
+            self.stats["found"] += 1
+        # Пустая строка — "страна неизвестна", тоже кэшируется
+        self.cache.set(ip, country or "", settings.GEOIP_CACHE_TTL_SEC)
+        return country
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "loaded": self.loaded,
+            "ipv4_ranges": len(self._v4) if self._v4 is not None else 0,
+            "ipv6_ranges": len(self._v6) if self._v6 is not None else 0,
+            "cached": len(self.cache),
+        }
+
+
+# Глобальный экземпляр
+geoip_resolver = GeoIPResolver()
@@ -0,0 +1,270 @@
+"""
+Скомпилированные матчеры для UTM и проверок качества данных.
+
+- PatternSet — набор регулярок одним скомпилированным выражением
+- SubstringMatcher — автомат Ахо-Корасик для поиска подстрок из списка
+- DomainSuffixSet — домены с учётом поддоменов (a.b.mailinator.com)
+- ListReloader — горячая перезагрузка списков из файла и Redis SET
+
+Стоимость проверки не зависит от размера списка: чёрные списки могут
+расти до 100k+ записей без замедления обработки заявки.
+"""
+
+import asyncio
+import logging
+import os
+import re
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from lead_validator.config import settings
+
+logger = logging.getLogger("lead_validator.matchers")
+
+# pyahocorasick (C-расширение) экономнее по памяти на больших списках,
+# без него используется реализация на Python
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+
+def _shift_backrefs(pattern: str, offset: int) -> str:
+    """Сдвинуть номера обратных ссылок (\\1) при склейке паттернов."""
+    if not offset:
+        return pattern
+    out = []
+    i = 0
+    while i < len(pattern):
+        if pattern[i] == "\\" and i + 1 < len(pattern):
+            j = i + 1
+            while j < len(pattern) and pattern[j].isdigit():
+                j += 1
+            if j > i + 1 and pattern[i + 1] != "0":
+                out.append(f"(?:\\{int(pattern[i + 1:j]) + offset})")
+            else:
+                j = i + 2
+                out.append(pattern[i:j])
+            i = j
+            continue
+        out.append(pattern[i])
+        i += 1
+    return "".join(out)
+
+
+class PatternSet:
+    """
+    Набор регулярных выражений как одно выражение (?:p1)|(?:p2)|...
+
+    search() совпадает, если совпадает хотя бы один исходный паттерн.
+    """
+
+    def __init__(self, patterns: Iterable[str], flags: int = 0):
+        self.patterns = list(patterns)
+        parts = []
+        groups = 0
+        for pattern in self.patterns:
+            parts.append(f"(?:{_shift_backrefs(pattern, groups)})")
+            groups += re.compile(pattern, flags).groups
+        self._regex = re.compile("|".join(parts), flags) if parts else None
+
+    def search(self, value: str) -> bool:
+        return bool(self._regex and self._regex.search(value))
+
+
+class _PyAhoCorasick:
+    """Автомат Ахо-Корасик на словарях (fallback без pyahocorasick)."""
+
+    def __init__(self, words: Iterable[str]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.out: List[Optional[str]] = [None]
+
+        for word in words:
+            node = 0
+            for ch in word:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(None)
+                node = nxt
+            self.out[node] = word
+
+        # Суффиксные ссылки обходом в ширину; out наследуется по ним
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self.goto[node].items():
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[child] = self.goto[f].get(ch, 0)
+                if self.out[child] is None:
+                    self.out[child] = self.out[self.fail[child]]
+                queue.append(child)
+
+    def find(self, text: str) -> Optional[str]:
+        state = 0
+        for ch in text:
+            while state and ch not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(ch, 0)
+            if self.out[state] is not None:
+                return self.out[state]
+        return None
+
+
+class SubstringMatcher:
+    """
+    Поиск любой строки из списка как подстроки (без учёта регистра).
+
+    find() возвращает найденную запись списка или None за один проход
+    по тексту.
+    """
+
+    def __init__(self, words: Iterable[str]):
+        self.words = {w.strip().lower() for w in words if w and w.strip()}
+        if AHOCORASICK_AVAILABLE:
+            self._automaton = ahocorasick.Automaton()
+            for word in self.words:
+                self._automaton.add_word(word, word)
+            self._automaton.make_automaton()
+        else:
+            self._automaton = _PyAhoCorasick(self.words)
+
+    def find(self, text: str) -> Optional[str]:
+        if not self.words or not text:
+            return None
+        text = text.lower()
+        if AHOCORASICK_AVAILABLE:
+            for _, word in self._automaton.iter(text):
+                return word
+            return None
+        return self._automaton.find(text)
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+
+class DomainSuffixSet:
+    """
+    Множество доменов, совпадающее и с их поддоменами:
+    mailinator.com ловит x.mailinator.com, но не mymailinator.com.
+    """
+
+    def __init__(self, domains: Iterable[str]):
+        self.domains: Set[str] = {d.strip().lower().strip(".") for d in domains if d and d.strip()}
+
+    def match(self, domain: str) -> Optional[str]:
+        """Запись множества, которой соответствует домен, или None."""
+        domain = domain.lower().strip().rstrip(".")
+        while domain:
+            if domain in self.domains:
+                return domain
+            _, _, domain = domain.partition(".")
+        return None
+
+    def __len__(self) -> int:
+        return len(self.domains)
+
+
+def _read_list_file(path: str) -> Set[str]:
+    """Файл списка: одно значение на строку, # — комментарий."""
+    values = set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            value = line.split("#", 1)[0].strip()
+            if value:
+                values.add(value)
+    return values
+
+
+@dataclass
+class _ListSource:
+    name: str
+    path: Optional[str]
+    redis_key: Optional[str]
+    on_change: Callable[[Set[str]], None]
+    version: Tuple = field(default_factory=tuple)
+
+
+class ListReloader:
+    """
+    Горячая перезагрузка внешних списков без рестарта.
+
+    Источник — файл (проверяется mtime) и/или Redis SET (проверяются
+    SCARD и счётчик {key}:version, который можно увеличивать при правке).
+    При изменении on_change получает объединение файла и SET и атомарно
+    подменяет матчер в валидаторе.
+    """
+
+    def __init__(self):
+        self.sources: Dict[str, _ListSource] = {}
+
+    def register(
+        self,
+        name: str,
+        on_change: Callable[[Set[str]], None],
+        path: Optional[str] = None,
+        redis_key: Optional[str] = None
+    ) -> None:
+        self.sources[name] = _ListSource(name, path or None, redis_key or None, on_change)
+
+    async def _source_version(self, source: _ListSource, client) -> Tuple:
+        mtime = None
+        if source.path and os.path.exists(source.path):
+            mtime = os.path.getmtime(source.path)
+        redis_version = None
+        if source.redis_key and client is not None:
+            pipe = client.pipeline(transaction=False)
+            pipe.scard(source.redis_key)
+            pipe.get(f"{source.redis_key}:version")
+            redis_version = tuple(await pipe.execute())
+        return mtime, redis_version
+
+    async def reload(self, force: bool = False) -> List[str]:
+        """
+        Перечитать изменившиеся списки.
+
+        Returns:
+            Имена перезагруженных списков
+        """
+        from lead_validator.services.redis_service import redis_service
+
+        client = await redis_service.get_client()
+        reloaded = []
+        for source in self.sources.values():
+            try:
+                version = await self._source_version(source, client)
+                if version == source.version and not force:
+                    continue
+
+                values: Set[str] = set()
+                if version[0] is not None:
+                    values |= await asyncio.to_thread(_read_list_file, source.path)
+                if version[1] is not None:
+                    values |= await client.smembers(source.redis_key)
+
+                source.on_change(values)
+                source.version = version
+                reloaded.append(source.name)
+                logger.info(f"List '{source.name}' reloaded: {len(values)} external entries")
+            except Exception as e:
+                # Остаётся прежний матчер
+                logger.error(f"List '{source.name}' reload error: {e}")
+        return reloaded
+
+    async def run(self) -> None:
+        """Фоновая проверка списков раз в LISTS_RELOAD_INTERVAL_SEC."""
+        while True:
+            await self.reload()
+            await asyncio.sleep(settings.LISTS_RELOAD_INTERVAL_SEC)
+
+
+# Глобальный экземпляр
+list_reloader = ListReloader()
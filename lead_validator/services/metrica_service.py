@@ -2,19 +2,32 @@
 Сервис интеграции с Яндекс.Метрикой.
 Отправка офлайн-конверсий для связи онлайн-визитов с заявками.
 
+Конверсии копятся в буфере (с сохранением на диск) и загружаются
+одним CSV на счётчик при METRICA_BATCH_SIZE строк или раз в
+METRICA_FLUSH_INTERVAL_SEC секунд.
+
 API: https://api-metrica.yandex.net/management/v1/counter/{counterId}/offline_conversions/upload
 """
 
+import asyncio
+import contextlib
 import logging
 import io
 import csv
+import json
+import os
+import time
+import uuid
+from collections import deque
 from datetime import datetime
-from typing import Optional, Literal
-from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Literal
+from dataclasses import dataclass, asdict
 
 import httpx
 
 from lead_validator.config import settings
+from lead_validator.services.circuit_breaker import breakers
 
 logger = logging.getLogger("lead_validator.metrica")
 
@@ -31,6 +44,7 @@ class ConversionData:
     datetime_str: str  # Дата в формате YYYY-MM-DD HH:MM:SS
     price: Optional[float] = None  # Ценность конверсии
     currency: str = "RUB"
+    counter_id: Optional[str] = None  # Счётчик, в который грузить
 
 
 class MetricaService:
@@ -44,8 +58,19 @@ class MetricaService:
     - quality_lead: качественный лид (прошёл все проверки)
     - potential_spam: потенциальный спам (отклонён)
     - all_leads: все лиды (для общей статистики)
+    
+    Буфер:
+    - send_conversion только добавляет строку в буфер счётчика в памяти
+    - run_writer (фоновая задача) сохраняет новые строки одним fsync
+      в файл процесса {METRICA_BUFFER_DIR}/pending-{pid}-{id}.jsonl
+    - run_flusher (фоновая задача) загружает буфер пачками и забирает
+      файлы упавших процессов
+    - пачки, отклонённые Метрикой (4xx кроме 429), — в rejected.jsonl
+    - последние загрузки и их статус — в uploads
     """
     
+    MAX_TRACKED_UPLOADS = 100
+    
     def __init__(self):
         self.enabled = settings.METRICA_ENABLED
         self.counter_id = settings.METRICA_COUNTER_ID
@@ -60,6 +85,18 @@ class MetricaService:
             "all_leads": "все_лиды"
         }
         
+        self._buffers: Dict[str, List[ConversionData]] = {}
+        self._unsaved: List[ConversionData] = []
+        self.buffer_dir = Path(settings.METRICA_BUFFER_DIR)
+        self._own_file: Optional[Path] = None
+        self._rejected_file = self.buffer_dir / "rejected.jsonl"
+        self._file_lock = asyncio.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._flush_needed = asyncio.Event()
+        self._save_needed = asyncio.Event()
+        self.breaker = breakers.get("metrica")
+        self.uploads: Deque[Dict[str, Any]] = deque(maxlen=self.MAX_TRACKED_UPLOADS)
+        
         if self.enabled:
             if not self.counter_id:
                 logger.warning("METRICA_COUNTER_ID not set, disabling Metrica")
@@ -80,7 +117,7 @@ class MetricaService:
         conversion_time: Optional[datetime] = None
     ) -> bool:
         """
-        Отправить офлайн-конверсию в Яндекс.Метрику.
+        Поставить офлайн-конверсию в буфер загрузки в Яндекс.Метрику.
         
         Args:
             client_id: ID посетителя (_ym_uid cookie или IP как fallback)
@@ -89,7 +126,7 @@ class MetricaService:
             conversion_time: Время конверсии (по умолчанию сейчас)
             
         Returns:
-            True если успешно отправлено, False при ошибке
+            True если конверсия принята в буфер, False при ошибке
         """
         if not self.enabled:
             logger.debug("Metrica disabled, skipping conversion")
@@ -106,20 +143,31 @@ class MetricaService:
         # Название цели
         goal_name = self.goal_names.get(goal_type, goal_type)
         
-        # Формируем CSV данные
-        csv_content = self._build_csv(client_id, goal_name, dt_str, price)
+        row = ConversionData(
+            client_id=client_id,
+            goal_name=goal_name,
+            datetime_str=dt_str,
+            price=price,
+            counter_id=self.counter_id
+        )
         
         try:
-            return await self._upload_conversions(csv_content)
+            self._buffer_row(row)
+            return True
         except Exception as e:
-            logger.error(f"Failed to send conversion to Metrica: {e}")
+            logger.error(f"Failed to buffer Metrica conversion: {e}")
             return False
     
-    async def send_quality_lead(self, client_id: str, price: Optional[float] = None) -> bool:
+    async def send_quality_lead(
+        self,
+        client_id: str,
+        price: Optional[float] = None,
+        conversion_time: Optional[datetime] = None
+    ) -> bool:
         """Отправить конверсию 'качественный лид'."""
         # Отправляем обе цели: качественный_лид и все_лиды
-        result1 = await self.send_conversion(client_id, "quality_lead", price)
-        result2 = await self.send_conversion(client_id, "all_leads", price)
+        result1 = await self.send_conversion(client_id, "quality_lead", price, conversion_time)
+        result2 = await self.send_conversion(client_id, "all_leads", price, conversion_time)
         return result1 or result2
     
     async def send_spam_lead(self, client_id: str) -> bool:
@@ -129,34 +177,282 @@ class MetricaService:
         result2 = await self.send_conversion(client_id, "all_leads")
         return result1 or result2
     
-    def _build_csv(
-        self, 
-        client_id: str, 
-        goal_name: str, 
-        datetime_str: str,
-        price: Optional[float] = None
-    ) -> str:
+    # ------------------------------------------------------------------
+    # Буфер конверсий
+    # ------------------------------------------------------------------
+    
+    @property
+    def _buffer_file(self) -> Path:
+        """
+        Файл буфера этого процесса. Имя выбирается при первой записи,
+        чтобы воркеры, созданные fork после импорта, писали в разные файлы.
+        """
+        if self._own_file is None:
+            self._own_file = self.buffer_dir / f"pending-{os.getpid()}-{uuid.uuid4().hex[:8]}.jsonl"
+        return self._own_file
+    
+    @staticmethod
+    def _read_rows(path: Path) -> List[ConversionData]:
+        rows = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    rows.append(ConversionData(**json.loads(line)))
+                except (json.JSONDecodeError, TypeError):
+                    logger.error("Corrupted Metrica buffer line skipped")
+        return rows
+    
+    def _claim_files(self) -> List[Path]:
+        """
+        Забрать буферы других процессов атомарным переименованием, как
+        это делает outbox. Файл "pending-*" без изменений дольше
+        METRICA_CLAIM_IDLE_SEC остался от упавшего процесса (живой
+        владелец обновляет mtime на каждом цикле run_flusher), так же
+        как "claimed-*", не перенесённый к себе до падения;
+        "pending.jsonl" — файл старой версии с общим буфером.
+        """
+        if not self.buffer_dir.exists():
+            return []
+        stale_before = time.time() - settings.METRICA_CLAIM_IDLE_SEC
+        candidates = [self.buffer_dir / "pending.jsonl"]
+        stale = [*self.buffer_dir.glob("pending-*.jsonl"), *self.buffer_dir.glob("claimed-*.jsonl")]
+        for path in stale:
+            if path == self._own_file:
+                continue
+            try:
+                if path.stat().st_mtime < stale_before:
+                    candidates.append(path)
+            except FileNotFoundError:
+                continue
+        
+        claimed = []
+        for path in candidates:
+            target = self.buffer_dir / f"claimed-{os.getpid()}-{uuid.uuid4().hex[:8]}.jsonl"
+            try:
+                path.rename(target)
+            except FileNotFoundError:
+                continue  # Забрал другой процесс
+            claimed.append(target)
+        return claimed
+    
+    async def _restore(self) -> None:
+        """
+        Перенести забранные буферы в память и в свой файл; исходный
+        файл удаляется только после того, как строки записаны к себе.
+        """
+        for path in await asyncio.to_thread(self._claim_files):
+            rows = await asyncio.to_thread(self._read_rows, path)
+            for row in rows:
+                counter = row.counter_id or self.counter_id
+                self._buffers.setdefault(counter, []).append(row)
+            self._unsaved.extend(rows)
+            await self._persist()
+            path.unlink(missing_ok=True)
+            logger.info(f"Metrica buffer restored: {len(rows)} conversions from {path.name}")
+    
+    def _append_to_file(self, rows: List[ConversionData]) -> None:
+        """Дописать строки в файл буфера одним fsync."""
+        self._buffer_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self._buffer_file, "a", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(asdict(row), ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+    
+    def _write_file(self, rows: List[ConversionData]) -> None:
+        """Перезаписать файл буфера (атомарно)."""
+        if not rows:
+            if self._own_file is not None:
+                self._own_file.unlink(missing_ok=True)
+            return
+        self._buffer_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self._buffer_file.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(asdict(row), ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._buffer_file)
+    
+    async def _persist(self) -> None:
+        """Сохранить на диск строки, принятые после прошлой записи."""
+        async with self._file_lock:
+            rows, self._unsaved = self._unsaved, []
+            if rows:
+                await asyncio.to_thread(self._append_to_file, rows)
+    
+    async def _rewrite_file(self) -> None:
+        """Перезаписать файл буфера текущим содержимым."""
+        async with self._file_lock:
+            rows = [row for rows in self._buffers.values() for row in rows]
+            # Несохранённые строки уже есть в _buffers и попадут в файл
+            self._unsaved = []
+            await asyncio.to_thread(self._write_file, rows)
+    
+    def _dead_letter(self, rows: List[ConversionData], error: str) -> None:
+        """Сохранить отклонённую пачку для разбора вручную."""
+        self._rejected_file.parent.mkdir(parents=True, exist_ok=True)
+        rejected_at = datetime.now().isoformat(timespec="seconds")
+        with open(self._rejected_file, "a", encoding="utf-8") as f:
+            for row in rows:
+                record = {**asdict(row), "error": error, "rejected_at": rejected_at}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+    
+    def _buffer_row(self, row: ConversionData) -> None:
+        """
+        Поставить строку в буфер без ожидания диска: на диск её пишет
+        run_flusher, одной записью на все строки, накопленные к этому моменту.
+        """
+        rows = self._buffers.setdefault(row.counter_id, [])
+        rows.append(row)
+        self._unsaved.append(row)
+        self._save_needed.set()
+        if len(rows) >= settings.METRICA_BATCH_SIZE:
+            self._flush_needed.set()
+    
+    def pending_count(self) -> int:
+        """Количество конверсий, ожидающих загрузки."""
+        return sum(len(rows) for rows in self._buffers.values())
+    
+    async def flush(self) -> List[Dict[str, Any]]:
+        """
+        Загрузить буфер: один CSV на счётчик, не больше METRICA_BATCH_SIZE
+        строк в файле. При сетевой ошибке, 5xx, 429 или открытой цепи
+        "metrica" строки остаются в буфере до следующего раза. Пачка,
+        отклонённая с другим 4xx, уходит в rejected.jsonl, чтобы не
+        блокировать следующие конверсии счётчика.
+        
+        Returns:
+            Информация о выполненных загрузках
+        """
+        done = []
+        async with self._flush_lock:
+            await self._restore()
+            batches = [
+                (counter, rows[:settings.METRICA_BATCH_SIZE])
+                for counter, rows in self._buffers.items() if rows
+            ]
+            
+            for counter, batch in batches:
+                if not self.breaker.allow():
+                    break
+                try:
+                    with self.breaker.track():
+                        upload = await self._upload_conversions(self._build_csv(batch), counter)
+                except Exception as e:
+                    logger.error(f"Failed to upload conversions to Metrica: {e}")
+                    upload = None
+                if upload is None:
+                    continue
+                
+                if upload.get("status") == "REJECTED":
+                    logger.error(
+                        f"Metrica rejected {len(batch)} conversions for counter {counter}, "
+                        f"moved to {self._rejected_file}: {upload['error']}"
+                    )
+                    await asyncio.to_thread(self._dead_letter, batch, upload["error"])
+                
+                upload["rows"] = len(batch)
+                self.uploads.append(upload)
+                done.append(upload)
+                
+                # Новые строки дописываются в конец, отправленные — в начале
+                self._buffers[counter] = self._buffers[counter][len(batch):]
+                await self._rewrite_file()
+        
+        return done
+    
+    async def run_writer(self) -> None:
+        """
+        Фоновая задача: сохранять новые строки буфера на диск.
+        Строки, пришедшие во время записи, уходят следующей пачкой.
+        """
+        try:
+            while True:
+                await self._save_needed.wait()
+                self._save_needed.clear()
+                try:
+                    await self._persist()
+                except Exception as e:
+                    logger.error(f"Failed to save Metrica buffer: {e}")
+        finally:
+            # Остановка: дописать то, что не успели
+            if self._unsaved:
+                rows, self._unsaved = self._unsaved, []
+                self._append_to_file(rows)
+    
+    async def run_flusher(self) -> None:
+        """
+        Фоновая задача: загружать буфер по таймеру
+        или сразу при накоплении METRICA_BATCH_SIZE строк.
+        """
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._flush_needed.wait(),
+                    timeout=settings.METRICA_FLUSH_INTERVAL_SEC
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._flush_needed.clear()
+            
+            # Свой файл не должны забрать как брошенный
+            if self._own_file is not None:
+                with contextlib.suppress(FileNotFoundError):
+                    os.utime(self._own_file)
+            
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Metrica flush failed: {e}")
+            
+            # Буфер всё ещё полон — грузим следующую пачку без ожидания
+            if any(len(rows) >= settings.METRICA_BATCH_SIZE for rows in self._buffers.values()):
+                self._flush_needed.set()
+    
+    def _build_csv(self, rows: List[ConversionData]) -> str:
         """Сформировать CSV для загрузки в Метрику."""
         output = io.StringIO()
         writer = csv.writer(output)
         
-        # Заголовки
-        if price is not None:
+        # Колонки цены нужны, только если хотя бы у одной строки есть цена
+        with_price = any(row.price is not None for row in rows)
+        if with_price:
             writer.writerow(["ClientId", "Target", "DateTime", "Price", "Currency"])
-            writer.writerow([client_id, goal_name, datetime_str, price, "RUB"])
         else:
             writer.writerow(["ClientId", "Target", "DateTime"])
-            writer.writerow([client_id, goal_name, datetime_str])
+        
+        for row in rows:
+            line = [row.client_id, row.goal_name, row.datetime_str]
+            if with_price:
+                line += ["" if row.price is None else row.price, row.currency]
+            writer.writerow(line)
         
         return output.getvalue()
     
-    async def _upload_conversions(self, csv_content: str) -> bool:
+    async def _upload_conversions(
+        self, 
+        csv_content: str, 
+        counter_id: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
         """
         Загрузить CSV с конверсиями в Метрику.
         
         API endpoint: POST /management/v1/counter/{counterId}/offline_conversions/upload
+        
+        Returns:
+            {"upload_id", "counter_id", "status", "uploaded_at"}; при 4xx
+            (кроме 429) status = "REJECTED" и текст ответа в "error"
+        
+        Raises:
+            httpx.HTTPStatusError: 5xx или 429 — пачку можно повторить
         """
-        url = f"{self.base_url}/counter/{self.counter_id}/offline_conversions/upload"
+        counter_id = counter_id or self.counter_id
+        url = f"{self.base_url}/counter/{counter_id}/offline_conversions/upload"
         
         headers = {
             "Authorization": f"OAuth {self.oauth_token}"
@@ -167,19 +463,62 @@ class MetricaService:
             "file": ("conversions.csv", csv_content, "text/csv")
         }
         
-        async with httpx.AsyncClient(timeout=10.0) as client:
+        async with httpx.AsyncClient(timeout=30.0) as client:
             response = await client.post(url, headers=headers, files=files)
+            # Ошибка сервера или лимит запросов — строки останутся в буфере
+            if response.status_code >= 500 or response.status_code == 429:
+                response.raise_for_status()
             
             if response.status_code == 200:
                 data = response.json()
-                upload_id = data.get("upload_id")
-                logger.info(f"Conversion uploaded successfully, upload_id: {upload_id}")
-                return True
+                uploading = data.get("uploading", {})
+                upload_id = uploading.get("id") or data.get("upload_id")
+                logger.info(f"Conversions uploaded successfully, upload_id: {upload_id}")
+                return {
+                    "upload_id": upload_id,
+                    "counter_id": counter_id,
+                    "status": uploading.get("status", "UPLOADED"),
+                    "uploaded_at": datetime.now().isoformat(timespec="seconds")
+                }
             else:
                 logger.error(
                     f"Metrica API error: {response.status_code} - {response.text}"
                 )
-                return False
+                # Повтор того же CSV снова получит отказ
+                return {
+                    "upload_id": None,
+                    "counter_id": counter_id,
+                    "status": "REJECTED",
+                    "error": f"{response.status_code} {response.text[:500]}",
+                    "uploaded_at": datetime.now().isoformat(timespec="seconds")
+                }
+    
+    async def refresh_upload_statuses(self) -> List[Dict[str, Any]]:
+        """
+        Обновить статусы последних загрузок, ещё не обработанных Метрикой.
+        
+        API endpoint: GET /management/v1/counter/{counterId}/offline_conversions/uploading/{id}
+        """
+        final = ("LINKED", "PROCESSED", "LINKAGE_FAILURE", "PROCESSING_FAILED")
+        headers = {"Authorization": f"OAuth {self.oauth_token}"}
+        
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            for upload in self.uploads:
+                if not upload.get("upload_id") or upload.get("status") in final:
+                    continue
+                url = (
+                    f"{self.base_url}/counter/{upload['counter_id']}"
+                    f"/offline_conversions/uploading/{upload['upload_id']}"
+                )
+                try:
+                    response = await client.get(url, headers=headers)
+                    if response.status_code == 200:
+                        uploading = response.json().get("uploading", {})
+                        upload["status"] = uploading.get("status", upload["status"])
+                except Exception as e:
+                    logger.error(f"Failed to get Metrica upload status: {e}")
+        
+        return list(self.uploads)
     
     async def test_connection(self) -> dict:
         """
@@ -0,0 +1,130 @@
+"""
+Микро-батчинг запросов к API, принимающим массивы (DaData Clean).
+
+Одновременные вызовы копятся до max_size элементов или max_wait секунд,
+затем уходят одним запросом; результаты раздаются ожидающим корутинам.
+С max_wait=0 пачка собирается из вызовов одной итерации event loop.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from lead_validator.services.token_bucket import TokenBucket
+
+logger = logging.getLogger("lead_validator.micro_batcher")
+
+
+class MicroBatcher:
+    """
+    Собирает элементы в пачки для send(items) -> results.
+    
+    send должен вернуть список результатов в порядке items. Ошибка send
+    отдаёт None всем ожидающим (fail-open, как у одиночных запросов).
+    Частота запросов ограничивается limiter.
+    
+    dedupe=True — одинаковые элементы пачки отправляются один раз
+    (элементы должны быть хешируемыми). Для операций с побочными
+    эффектами (резерв в Redis) нужен dedupe=False: каждый вызов
+    выполняется отдельно, в порядке поступления.
+    
+    Элементы, все вызывающие которых отменены до отправки, не
+    отправляются. Если отмена пришла, когда пачка уже ушла, результат
+    передаётся в on_abandoned(item, result) — там можно откатить
+    побочный эффект.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[List[str]], Awaitable[List[Optional[Any]]]],
+        max_size: int,
+        max_wait: float,
+        limiter: Optional[TokenBucket] = None,
+        dedupe: bool = True,
+        on_abandoned: Optional[Callable[[Any, Any], Awaitable[None]]] = None
+    ):
+        self.send = send
+        self.max_size = max(1, max_size)
+        self.max_wait = max_wait
+        self.limiter = limiter
+        self.dedupe = dedupe
+        self.on_abandoned = on_abandoned
+        self._items: List[Any] = []
+        self._futures: List[List[asyncio.Future]] = []
+        self._index: Dict[Hashable, int] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+        self.stats = {"requests": 0, "items": 0}
+
+    async def submit(self, item: Any) -> Optional[Any]:
+        """Поставить элемент в текущую пачку и дождаться результата."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if self.dedupe and item in self._index:
+            self._futures[self._index[item]].append(future)
+        else:
+            if self.dedupe:
+                self._index[item] = len(self._items)
+            self._items.append(item)
+            self._futures.append([future])
+
+        if len(self._items) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._items:
+            return
+        items, futures = self._items, self._futures
+        self._items, self._futures, self._index = [], [], {}
+        task = asyncio.create_task(self._send(items, futures))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, items: List[Any], futures: List[List[asyncio.Future]]) -> None:
+        if self.limiter:
+            await self.limiter.acquire()
+        
+        # Никто не ждёт результат — элемент не отправляем
+        waiting = [i for i, waiters in enumerate(futures) if not all(f.done() for f in waiters)]
+        if len(waiting) < len(items):
+            items = [items[i] for i in waiting]
+            futures = [futures[i] for i in waiting]
+            if not items:
+                return
+        
+        results: List[Optional[Any]] = [None] * len(items)
+        try:
+            self.stats["requests"] += 1
+            self.stats["items"] += len(items)
+            response = await self.send(items)
+            if response is not None and len(response) == len(items):
+                results = response
+            elif response is not None:
+                logger.error(f"Batch response size mismatch: {len(response)} != {len(items)}")
+        except Exception as e:
+            logger.error(f"Batch request failed ({len(items)} items): {e}")
+
+        for item, waiters, result in zip(items, futures, results):
+            abandoned = True
+            for future in waiters:
+                # Отменённые вызывающие уже не ждут результат
+                if not future.done():
+                    future.set_result(result)
+                    abandoned = False
+            if abandoned and result is not None and self.on_abandoned:
+                try:
+                    await self.on_abandoned(item, result)
+                except Exception as e:
+                    logger.error(f"Abandoned batch item handler failed: {e}")
+
+    async def close(self) -> None:
+        """Отправить накопленное и дождаться запросов в полёте."""
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
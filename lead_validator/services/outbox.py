@@ -0,0 +1,393 @@
+"""
+Outbox побочных эффектов принятого лида.
+
+Решение по лиду принимается в запросе, а уведомления (Telegram)
+кладутся в outbox и доставляются фоновыми воркерами с повторами
+и экспоненциальной задержкой.
+
+Хранилище: Redis Stream с группой потребителей (общий для всех воркеров
+приложения). Если Redis недоступен — локальный append-only JSONL файл,
+который разбирается отдельной фоновой задачей.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from lead_validator.config import settings
+from lead_validator.services.redis_service import redis_service
+
+logger = logging.getLogger("lead_validator.outbox")
+
+# Обработчик задачи: True — доставлено, False — повторить позже
+Handler = Callable[[Dict[str, Any]], Awaitable[bool]]
+
+CONSUMER_GROUP = "lead-outbox"
+
+# Перенести задачи с наступившим временем повтора из ZSET в поток
+PROMOTE_DUE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, job in ipairs(due) do
+    redis.call('ZREM', KEYS[1], job)
+    redis.call('XADD', KEYS[2], '*', 'job', job)
+end
+return #due
+"""
+
+
+class Outbox:
+    """
+    Очередь задач "после принятия лида" с гарантией at-least-once.
+
+    Redis:
+    - {stream}        — поток задач, читается через XREADGROUP
+    - {stream}:retry  — ZSET задач, ожидающих повтора (score = время запуска)
+    - {stream}:dead   — поток задач, исчерпавших попытки
+
+    Локальный fallback: {OUTBOX_LOCAL_DIR}/pending.jsonl
+    """
+
+    BATCH_SIZE = 10
+    DEAD_MAX_LEN = 10000
+
+    def __init__(self):
+        self.enabled = settings.OUTBOX_ENABLED
+        self.stream = settings.OUTBOX_STREAM
+        self.retry_key = f"{self.stream}:retry"
+        self.dead_stream = f"{self.stream}:dead"
+        self.local_dir = Path(settings.OUTBOX_LOCAL_DIR)
+        self._handlers: Dict[str, Handler] = {}
+        self._group_ready = False
+        self._promote_script = None
+        self._local_lock = asyncio.Lock()
+        self.stats = {"enqueued": 0, "delivered": 0, "retried": 0, "dead": 0}
+
+    def register(self, kind: str, handler: Handler) -> None:
+        """Зарегистрировать обработчик задач типа kind."""
+        self._handlers[kind] = handler
+
+    async def enqueue(self, kind: str, payload: Dict[str, Any]) -> None:
+        """Поставить одну задачу в outbox (см. enqueue_many)."""
+        await self.enqueue_many([(kind, payload)])
+
+    async def enqueue_many(self, items: List[Tuple[str, Dict[str, Any]]]) -> None:
+        """
+        Поставить задачи в outbox одним обращением к хранилищу.
+        Не бросает исключений.
+
+        Порядок: Redis Stream → локальный файл.
+        При OUTBOX_ENABLED=False задачи выполняются сразу.
+        """
+        jobs = [
+            {
+                "id": uuid.uuid4().hex,
+                "kind": kind,
+                "payload": payload,
+                "attempts": 0,
+                "created_at": time.time()
+            }
+            for kind, payload in items
+        ]
+        if not jobs:
+            return
+
+        if not self.enabled:
+            for job in jobs:
+                await self._deliver(job)
+            return
+
+        self.stats["enqueued"] += len(jobs)
+        if await self._push_redis(jobs):
+            return
+        try:
+            await self._append_local(jobs)
+        except Exception as e:
+            logger.error(f"Outbox local write failed, {len(jobs)} jobs lost: {e}")
+
+    # ------------------------------------------------------------------
+    # Доставка
+    # ------------------------------------------------------------------
+
+    async def _deliver(self, job: Dict[str, Any]) -> bool:
+        """Выполнить задачу. Неизвестный тип считается доставленным."""
+        handler = self._handlers.get(job["kind"])
+        if handler is None:
+            logger.error(f"Outbox: no handler for {job['kind']}, job dropped")
+            return True
+
+        try:
+            ok = await handler(job["payload"])
+        except Exception as e:
+            logger.error(f"Outbox job {job['kind']} failed: {type(e).__name__}: {e}")
+            ok = False
+
+        if ok:
+            self.stats["delivered"] += 1
+        return ok
+
+    @staticmethod
+    def _backoff(attempts: int) -> float:
+        """Экспоненциальная задержка перед повтором с джиттером."""
+        delay = min(
+            settings.OUTBOX_RETRY_BASE_SEC * (2 ** (attempts - 1)),
+            settings.OUTBOX_RETRY_MAX_SEC
+        )
+        return delay * random.uniform(0.8, 1.2)
+
+    def _next_attempt(self, job: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Подготовить задачу к повтору.
+
+        Returns:
+            Задача с увеличенным attempts и next_at, или None если попытки исчерпаны
+        """
+        job = dict(job, attempts=job.get("attempts", 0) + 1)
+        if job["attempts"] >= settings.OUTBOX_MAX_ATTEMPTS:
+            self.stats["dead"] += 1
+            logger.error(
+                f"Outbox job {job['kind']} {job['id']} gave up after {job['attempts']} attempts"
+            )
+            return None
+        job["next_at"] = time.time() + self._backoff(job["attempts"])
+        self.stats["retried"] += 1
+        return job
+
+    # ------------------------------------------------------------------
+    # Redis Stream
+    # ------------------------------------------------------------------
+
+    async def _push_redis(self, jobs: List[Dict[str, Any]]) -> bool:
+        client = await redis_service.get_client()
+        if client is None:
+            return False
+        try:
+            pipe = client.pipeline(transaction=False)
+            for job in jobs:
+                pipe.xadd(self.stream, {"job": json.dumps(job, ensure_ascii=False)})
+            await pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"Outbox XADD failed: {e}")
+            return False
+
+    async def _ensure_group(self, client) -> None:
+        if self._group_ready:
+            return
+        try:
+            await client.xgroup_create(self.stream, CONSUMER_GROUP, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_ready = True
+
+    async def _promote_due(self, client) -> None:
+        if self._promote_script is None:
+            self._promote_script = client.register_script(PROMOTE_DUE_SCRIPT)
+        await self._promote_script(
+            keys=[self.retry_key, self.stream],
+            args=[time.time(), self.BATCH_SIZE]
+        )
+
+    async def _process_entry(self, client, entry_id: str, fields: Dict[str, str]) -> None:
+        """
+        Выполнить задачу из потока. Повтор планируется до XACK,
+        так что падение воркера между шагами не теряет задачу.
+        """
+        job = json.loads(fields["job"])
+        if not await self._deliver(job):
+            retry = self._next_attempt(job)
+            if retry is not None:
+                await client.zadd(
+                    self.retry_key,
+                    {json.dumps(retry, ensure_ascii=False): retry["next_at"]}
+                )
+            else:
+                await client.xadd(
+                    self.dead_stream,
+                    {"job": json.dumps(job, ensure_ascii=False)},
+                    maxlen=self.DEAD_MAX_LEN,
+                    approximate=True
+                )
+
+        pipe = client.pipeline(transaction=True)
+        pipe.xack(self.stream, CONSUMER_GROUP, entry_id)
+        pipe.xdel(self.stream, entry_id)
+        await pipe.execute()
+
+    async def run_worker(self, consumer: str) -> None:
+        """
+        Фоновая задача: читать поток и доставлять задачи.
+        Задачи упавших воркеров забираются через XAUTOCLAIM.
+        """
+        poll_ms = int(settings.OUTBOX_POLL_SEC * 1000)
+        last_claim = 0.0
+
+        while True:
+            try:
+                client = await redis_service.get_client()
+                if client is None:
+                    await asyncio.sleep(settings.OUTBOX_POLL_SEC)
+                    continue
+
+                await self._ensure_group(client)
+                await self._promote_due(client)
+
+                if time.monotonic() - last_claim > settings.OUTBOX_CLAIM_IDLE_SEC:
+                    last_claim = time.monotonic()
+                    claimed = await client.xautoclaim(
+                        self.stream,
+                        CONSUMER_GROUP,
+                        consumer,
+                        min_idle_time=settings.OUTBOX_CLAIM_IDLE_SEC * 1000,
+                        count=self.BATCH_SIZE
+                    )
+                    for entry_id, fields in claimed[1]:
+                        if fields:
+                            await self._process_entry(client, entry_id, fields)
+
+                entries = await client.xreadgroup(
+                    CONSUMER_GROUP,
+                    consumer,
+                    {self.stream: ">"},
+                    count=self.BATCH_SIZE,
+                    block=poll_ms
+                )
+                for _, messages in entries or []:
+                    for entry_id, fields in messages:
+                        await self._process_entry(client, entry_id, fields)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Outbox worker {consumer} error: {type(e).__name__}: {e}")
+                self._group_ready = False
+                self._promote_script = None
+                await asyncio.sleep(settings.OUTBOX_POLL_SEC)
+
+    # ------------------------------------------------------------------
+    # Локальный fallback
+    # ------------------------------------------------------------------
+
+    @property
+    def local_file(self) -> Path:
+        return self.local_dir / "pending.jsonl"
+
+    def _write_lines(self, jobs: List[Dict[str, Any]]) -> None:
+        self.local_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.local_file, "a", encoding="utf-8") as f:
+            for job in jobs:
+                f.write(json.dumps(job, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def _append_local(self, jobs: List[Dict[str, Any]]) -> None:
+        async with self._local_lock:
+            await asyncio.to_thread(self._write_lines, jobs)
+
+    def _claim_local(self) -> List[Path]:
+        """
+        Забрать файлы на разбор атомарным переименованием, чтобы
+        несколько процессов не разбирали одни и те же задачи.
+        Файлы "draining-*" старше OUTBOX_CLAIM_IDLE_SEC остались от
+        упавшего процесса и забираются повторно. rename сохраняет mtime,
+        поэтому забранный файл сразу "трогается", а владелец обновляет
+        mtime по ходу разбора.
+        """
+        if not self.local_dir.exists():
+            return []
+
+        candidates = []
+        if self.local_file.exists():
+            candidates.append(self.local_file)
+        stale_before = time.time() - settings.OUTBOX_CLAIM_IDLE_SEC
+        for path in self.local_dir.glob("draining-*.jsonl"):
+            try:
+                if path.stat().st_mtime < stale_before:
+                    candidates.append(path)
+            except FileNotFoundError:
+                continue
+
+        claimed = []
+        for path in candidates:
+            target = self.local_dir / f"draining-{os.getpid()}-{uuid.uuid4().hex[:8]}.jsonl"
+            try:
+                path.rename(target)
+            except FileNotFoundError:
+                continue  # Забрал другой процесс
+            self._touch(target)
+            claimed.append(target)
+        return claimed
+
+    @staticmethod
+    def _touch(path: Path) -> None:
+        """Отметить файл как разбираемый (не забирать как брошенный)."""
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _read_lines(path: Path) -> List[Dict[str, Any]]:
+        jobs = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    jobs.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.error(f"Outbox: corrupted line in {path.name} skipped")
+        return jobs
+
+    async def drain_local(self) -> None:
+        """
+        Фоновая задача: разбирать локальный файл.
+        Если Redis снова доступен — задачи переносятся в поток,
+        иначе выполняются здесь же; неудачные дописываются обратно.
+        """
+        while True:
+            try:
+                for path in await asyncio.to_thread(self._claim_local):
+                    await self._drain_file(path)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Outbox local drain error: {type(e).__name__}: {e}")
+            await asyncio.sleep(settings.OUTBOX_POLL_SEC)
+
+    async def _drain_file(self, path: Path) -> None:
+        jobs = await asyncio.to_thread(self._read_lines, path)
+        now = time.time()
+
+        due = [job for job in jobs if job.get("next_at", 0) <= now]
+        keep = [job for job in jobs if job.get("next_at", 0) > now]
+
+        if due and not await self._push_redis(due):
+            for job in due:
+                # Доставка без Redis может идти долго (таймауты Telegram)
+                self._touch(path)
+                if await self._deliver(job):
+                    continue
+                retry = self._next_attempt(job)
+                if retry is not None:
+                    keep.append(retry)
+
+        if keep:
+            await self._append_local(keep)
+        await asyncio.to_thread(path.unlink)
+
+    def consumer_name(self, index: int) -> str:
+        """Уникальное имя потребителя для воркера в группе."""
+        return f"{socket.gethostname()}-{os.getpid()}-{index}"
+
+
+# Глобальный экземпляр
+outbox = Outbox()
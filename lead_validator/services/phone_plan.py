@@ -0,0 +1,228 @@
+"""
+Локальная база российской нумерации (план нумерации Россвязи).
+
+Тип номера, оператор и регион определяются диапазоном DEF/ABC-кода,
+поэтому для большинства лидов DaData не нужна. База собирается из CSV
+Россвязи (ABC-3xx, ABC-4xx, ABC-8xx, DEF-9xx) командой
+`python -m lead_validator.load_phone_plan` в бинарный файл, который
+отображается в память (mmap) и ищется бинарным поиском по отсортированным
+диапазонам — несколько микросекунд на номер без загрузки в кучу.
+
+Формат файла (little-endian):
+    заголовок  MAGIC, число диапазонов N, длина таблицы строк
+    starts     N x uint64 — начало диапазона (10-значный номер)
+    ends       N x uint64 — конец диапазона включительно
+    operators  N x uint32 — индекс оператора в таблице строк
+    regions    N x uint32 — индекс региона в таблице строк
+    kinds      N x uint8  — индекс в PHONE_TYPES
+    strings    JSON-список строк (UTF-8)
+
+Номера с добавочным, несколько номеров в строке и непокрытые базой
+диапазоны остаются DaData.
+"""
+
+import bisect
+import csv
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from lead_validator.config import settings
+
+logger = logging.getLogger("lead_validator.phone_plan")
+
+MAGIC = b"LVPHONE1"
+HEADER = struct.Struct("<8sQQ")
+
+PHONE_TYPES = ("Мобильный", "Стационарный")
+
+# 8-800..8-809 — негеографические номера, их тип определяет DaData
+NON_GEOGRAPHIC_CODES = range(800, 810)
+
+# Номер без добавочного: +7 / 8 / 7 и 10 цифр, разделители — пробел, -, ()
+PHONE_RE = re.compile(r"^(?:\+?7|8)?(\d{10})$")
+SEPARATORS_RE = re.compile(r"[\s\-()]")
+
+
+class PlanEntry(NamedTuple):
+    """Результат поиска номера в плане нумерации."""
+    number: str  # 10 цифр без кода страны
+    type: str
+    provider: str
+    region: str
+
+
+def normalize_phone(phone: str) -> Optional[str]:
+    """10-значный российский номер или None, если строка неоднозначна."""
+    match = PHONE_RE.match(SEPARATORS_RE.sub("", phone or ""))
+    return match.group(1) if match else None
+
+
+def read_plan_csv(path: str) -> Iterator[Tuple[int, int, str, str]]:
+    """
+    Диапазоны из CSV Россвязи: (начало, конец, оператор, регион).
+
+    Колонки: АВС/DEF; От; До; Емкость; Оператор; Регион; ...
+    Кодировка — UTF-8 (новые выгрузки) или cp1251.
+    """
+    with open(path, "rb") as f:
+        raw = f.read()
+    try:
+        text = raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        text = raw.decode("cp1251")
+
+    for row in csv.reader(text.splitlines(), delimiter=";"):
+        if len(row) < 6 or not row[0].strip().isdigit():
+            continue  # Заголовок или пустая строка
+        code = int(row[0])
+        if code in NON_GEOGRAPHIC_CODES:
+            continue
+        start, end = int(row[1]), int(row[2])
+        yield code * 10_000_000 + start, code * 10_000_000 + end, row[4].strip(), row[5].strip()
+
+
+def build_phone_plan(csv_paths: Iterable[str], out_path: str) -> int:
+    """
+    Собрать бинарную базу из CSV Россвязи.
+
+    Файл пишется во временный и подменяется атомарно.
+
+    Returns:
+        Количество диапазонов
+    """
+    ranges = []
+    for path in csv_paths:
+        ranges.extend(read_plan_csv(path))
+    ranges.sort()
+
+    strings: List[str] = []
+    index: Dict[str, int] = {}
+
+    def intern(value: str) -> int:
+        if value not in index:
+            index[value] = len(strings)
+            strings.append(value)
+        return index[value]
+
+    count = len(ranges)
+    operators = [intern(operator) for _, _, operator, _ in ranges]
+    regions = [intern(region) for _, _, _, region in ranges]
+    # Код 9xx — мобильная связь (DEF), остальные — стационарная (ABC)
+    kinds = [0 if start // 1_000_000_000 == 9 else 1 for start, _, _, _ in ranges]
+    strings_blob = json.dumps(strings, ensure_ascii=False).encode("utf-8")
+
+    tmp_path = f"{out_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, count, len(strings_blob)))
+        f.write(struct.pack(f"<{count}Q", *(start for start, _, _, _ in ranges)))
+        f.write(struct.pack(f"<{count}Q", *(end for _, end, _, _ in ranges)))
+        f.write(struct.pack(f"<{count}I", *operators))
+        f.write(struct.pack(f"<{count}I", *regions))
+        f.write(struct.pack(f"<{count}B", *kinds))
+        f.write(strings_blob)
+    os.replace(tmp_path, out_path)
+
+    logger.info(f"Phone plan built: {count} ranges, {len(strings)} strings -> {out_path}")
+    return count
+
+
+class PhonePlan:
+    """
+    Поиск номера в базе плана нумерации.
+
+    Файл (PHONE_PLAN_FILE) открывается при первом поиске; если файла нет,
+    lookup всегда возвращает None. После пересборки базы — load() или рестарт.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._mmap: Optional[mmap.mmap] = None
+        self._loaded = False
+        self._starts = self._ends = self._operators = self._regions = self._kinds = None
+        self._strings: List[str] = []
+
+    def load(self, path: Optional[str] = None) -> bool:
+        """Отобразить файл базы в память. False — файла нет или он повреждён."""
+        self.path = path or self.path
+        self._loaded = True
+        self.close()
+        if not self.path or not os.path.exists(self.path):
+            return False
+
+        try:
+            with open(self.path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            logger.error(f"Phone plan open error ({self.path}): {e}")
+            return False
+
+        arrays = []
+        try:
+            magic, count, strings_len = HEADER.unpack_from(mapped)
+            if magic != MAGIC:
+                raise ValueError("bad magic")
+            offset = HEADER.size
+            for fmt, size in (("Q", 8), ("Q", 8), ("I", 4), ("I", 4), ("B", 1)):
+                arrays.append(memoryview(mapped)[offset:offset + count * size].cast(fmt))
+                offset += count * size
+            strings = json.loads(mapped[offset:offset + strings_len].decode("utf-8"))
+        except Exception as e:
+            logger.error(f"Phone plan load error ({self.path}): {e}")
+            for array in arrays:
+                array.release()
+            mapped.close()
+            return False
+
+        self._mmap = mapped
+        self._starts, self._ends, self._operators, self._regions, self._kinds = arrays
+        self._strings = strings
+        logger.info(f"Phone plan loaded: {count} ranges from {self.path}")
+        return True
+
+    def close(self) -> None:
+        if self._mmap is None:
+            return
+        for array in (self._starts, self._ends, self._operators, self._regions, self._kinds):
+            array.release()
+        self._starts = self._ends = self._operators = self._regions = self._kinds = None
+        self._mmap.close()
+        self._mmap = None
+
+    def __len__(self) -> int:
+        return len(self._starts) if self._starts is not None else 0
+
+    def lookup(self, phone: str) -> Optional[PlanEntry]:
+        """
+        Тип, оператор и регион номера.
+
+        Returns:
+            PlanEntry или None (база не загружена, номер неоднозначен
+            или не входит ни в один диапазон)
+        """
+        if not self._loaded:
+            self.load()
+        if self._starts is None:
+            return None
+
+        number = normalize_phone(phone)
+        if number is None:
+            return None
+        value = int(number)
+        i = bisect.bisect_right(self._starts, value) - 1
+        if i < 0 or value > self._ends[i]:
+            return None
+        return PlanEntry(
+            number=number,
+            type=PHONE_TYPES[self._kinds[i]],
+            provider=self._strings[self._operators[i]],
+            region=self._strings[self._regions[i]]
+        )
+
+
+# Глобальный экземпляр
+phone_plan = PhonePlan(settings.PHONE_PLAN_FILE)
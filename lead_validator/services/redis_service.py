@@ -3,22 +3,121 @@ Redis сервис для дедупликации и rate limiting.
 Поддерживает fail-open режим при недоступности Redis.
 """
 
+import asyncio
 import logging
 import hashlib
-from typing import Optional
+import ipaddress
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
 from lead_validator.config import settings
+from lead_validator.services.bloom import RotatingBloomFilter
+from lead_validator.services.circuit_breaker import breakers
+from lead_validator.services.micro_batcher import MicroBatcher
 
 logger = logging.getLogger("lead_validator.redis")
 
 # Redis импортируется опционально для fail-open
 try:
     import redis.asyncio as redis
+    from redis.exceptions import NoScriptError
     REDIS_AVAILABLE = True
 except ImportError:
     REDIS_AVAILABLE = False
     logger.warning("redis package not installed, Redis features disabled")
 
 
+# GCRA (generic cell rate algorithm) по нескольким измерениям сразу.
+# Для каждого ключа хранится TAT — теоретическое время следующей заявки
+# (мкс). Лимит limit за period: интервал period/limit, всплеск до limit.
+# В отличие от фиксированного окна не пропускает 2x на границе окон.
+# Заявка проходит, только если проходит по всем измерениям; отклонённая
+# заявка лимит не расходует.
+#
+# Ожидает locals first_key/first_arg: ключи лимитов KEYS[first_key..],
+# пары ARGV (period_sec, limit) начиная с ARGV[first_arg].
+# Результат: local limited — номер превышенного измерения (с 1) или 0.
+_GCRA_LUA = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000000 + tonumber(time[2])
+local limited = 0
+local new_tats = {}
+for i = first_key, #KEYS do
+    local arg = first_arg + (i - first_key) * 2
+    local period = tonumber(ARGV[arg]) * 1000000
+    local interval = period / tonumber(ARGV[arg + 1])
+    local tat = tonumber(redis.call('GET', KEYS[i])) or now
+    if tat < now then
+        tat = now
+    end
+    local new_tat = tat + interval
+    if new_tat - period > now then
+        limited = i - first_key + 1
+        break
+    end
+    new_tats[i] = new_tat
+end
+if limited == 0 then
+    for i, new_tat in pairs(new_tats) do
+        redis.call('SET', KEYS[i], string.format('%d', new_tat), 'PX', math.ceil((new_tat - now) / 1000))
+    end
+end
+"""
+
+# Rate limit по нескольким измерениям.
+# KEYS: ключи лимитов; ARGV: (period_sec, limit) на каждый ключ
+# Возвращает номер превышенного измерения (с 1) или 0
+RATE_LIMIT_SCRIPT = "local first_key, first_arg = 1, 1\n" + _GCRA_LUA + "return limited\n"
+
+# Атомарная проверка лида за один round trip:
+# rate limit по всем измерениям, дубликат телефона, дубликат email.
+# Если всё чисто — телефон и email резервируются значением "pending"
+# на время валидации, чтобы параллельная заявка с тем же номером
+# увидела дубликат (закрывает гонку check-then-mark).
+#
+# KEYS: phone, email, ключи лимитов...
+# ARGV: email_enabled, pending_ttl, (period_sec, limit) на каждый ключ лимита
+# Возвращает: {limited_dimension, phone_dup, email_dup, reserved}
+CHECK_LEAD_SCRIPT = "local first_key, first_arg = 3, 3\n" + _GCRA_LUA + """
+if limited > 0 then
+    return {limited, 0, 0, 0}
+end
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return {0, 1, 0, 0}
+end
+if ARGV[1] == '1' and redis.call('EXISTS', KEYS[2]) == 1 then
+    return {0, 0, 1, 0}
+end
+redis.call('SET', KEYS[1], 'pending', 'EX', ARGV[2])
+if ARGV[1] == '1' then
+    redis.call('SET', KEYS[2], 'pending', 'EX', ARGV[2])
+end
+return {0, 0, 0, 1}
+"""
+
+# Канал, в который воркеры публикуют хеши отмеченных телефонов/email
+SEEN_CHANNEL = "lead:seen"
+
+# Снять резерв, если ключ ещё не отмечен как принятый лид
+RELEASE_LEAD_SCRIPT = """
+for _, key in ipairs(KEYS) do
+    if redis.call('GET', key) == 'pending' then
+        redis.call('DEL', key)
+    end
+end
+return 1
+"""
+
+
+@dataclass
+class LeadCheckResult:
+    """Результат атомарной проверки лида в Redis."""
+    rate_limited: bool = False
+    rate_limit_dimension: Optional[str] = None  # ip, subnet, phone, placement
+    phone_duplicate: bool = False
+    email_duplicate: bool = False
+    reserved: bool = False  # Телефон/email зарезервированы до mark_lead/release_lead
+
+
 class RedisService:
     """
     Redis операции для дедупликации телефонов и rate limiting по IP.
@@ -31,6 +130,31 @@ class RedisService:
         self.enabled = settings.REDIS_ENABLED and REDIS_AVAILABLE
         self.fail_open = settings.FAIL_OPEN_MODE
         self._client: Optional[redis.Redis] = None
+        self._check_lead_script = None
+        self._release_lead_script = None
+        self._rate_limit_script = None
+        self.breaker = breakers.get("redis")
+        
+        # check_lead одной итерации event loop уходят одним pipeline
+        # (пакетная валидация, всплески на /lead/). Без дедупликации:
+        # одинаковые телефоны в пачке резервируются по очереди.
+        # Резерв отменённой проверки (ответ пришёл после отмены) снимается
+        self._check_batcher = MicroBatcher(
+            self._check_lead_batch,
+            settings.REDIS_CHECK_BATCH_SIZE,
+            0,
+            dedupe=False,
+            on_abandoned=self._release_abandoned
+        )
+        
+        # Локальная предпроверка дубликатов: "нет" в фильтре — точно не дубликат.
+        # Доверяем фильтру только после загрузки ключей из Redis (run_seen_sync)
+        self.seen = RotatingBloomFilter(
+            settings.PHONE_DUPLICATE_TTL_SEC,
+            settings.BLOOM_CAPACITY,
+            settings.BLOOM_ERROR_RATE
+        )
+        self._seen_ready = False
         
     async def _get_client(self) -> Optional[redis.Redis]:
         """Получить или создать Redis клиент"""
@@ -53,6 +177,13 @@ class RedisService:
                 
         return self._client
     
+    async def get_client(self) -> Optional[redis.Redis]:
+        """
+        Общий Redis клиент для сервисов со своими структурами данных
+        (очереди, счётчики). None если Redis выключен или недоступен.
+        """
+        return await self._get_client()
+    
     @staticmethod
     def hash_phone(phone: str) -> str:
         """
@@ -71,6 +202,9 @@ class RedisService:
             True если дубликат найден
             False если это новый телефон или Redis недоступен (fail-open)
         """
+        if self._definitely_new(self.hash_phone(phone)):
+            return False
+        
         client = await self._get_client()
         if client is None:
             if self.fail_open:
@@ -106,7 +240,11 @@ class RedisService:
             key = f"lead:phone:{phone_hash}"
             ttl = settings.PHONE_DUPLICATE_TTL_SEC
             
-            await client.setex(key, ttl, "1")
+            pipe = client.pipeline(transaction=False)
+            pipe.setex(key, ttl, "1")
+            pipe.publish(SEEN_CHANNEL, phone_hash)
+            await pipe.execute()
+            self.seen.add(phone_hash)
             logger.debug(f"Phone marked: {phone_hash[:16]}... TTL={ttl}s")
             return True
             
@@ -114,9 +252,47 @@ class RedisService:
             logger.error(f"Redis mark_phone error: {e}")
             return False
     
+    @staticmethod
+    def _subnet(ip: str) -> Optional[str]:
+        """Подсеть IP: /24 для IPv4, /64 для IPv6."""
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        prefix = 24 if address.version == 4 else 64
+        return str(ipaddress.ip_network(f"{address}/{prefix}", strict=False))
+    
+    def _rate_limits(
+        self,
+        ip: Optional[str],
+        phone: Optional[str] = None,
+        utm_content: Optional[str] = None
+    ) -> List[Tuple[str, str, int, int]]:
+        """
+        Измерения rate limit для заявки: (имя, ключ, period_sec, limit).
+        Измерение пропускается, если значения нет или лимит выключен (0).
+        """
+        subnet = self._subnet(ip) if ip else None
+        dimensions = [
+            ("ip", ip, settings.RATE_LIMIT_WINDOW_SEC, settings.RATE_LIMIT_PER_IP),
+            ("subnet", subnet, settings.RATE_LIMIT_SUBNET_WINDOW_SEC, settings.RATE_LIMIT_PER_SUBNET),
+            ("phone", phone and self.hash_phone(phone), settings.RATE_LIMIT_PHONE_WINDOW_SEC, settings.RATE_LIMIT_PER_PHONE),
+            (
+                "placement",
+                utm_content and hashlib.sha256(utm_content.encode()).hexdigest()[:32],
+                settings.RATE_LIMIT_PLACEMENT_WINDOW_SEC,
+                settings.RATE_LIMIT_PER_PLACEMENT
+            ),
+        ]
+        return [
+            (name, f"lead:gcra:{name}:{value}", period, limit)
+            for name, value, period, limit in dimensions
+            if value and limit > 0 and period > 0
+        ]
+    
     async def check_rate_limit(self, ip: str) -> bool:
         """
-        Проверяет rate limit по IP.
+        Проверяет rate limit по IP и его подсети (GCRA).
         
         Returns:
             True если лимит НЕ превышен (можно продолжать)
@@ -125,24 +301,27 @@ class RedisService:
         client = await self._get_client()
         if client is None:
             return self.fail_open  # True = пропускаем, False = блокируем
+        
+        limits = self._rate_limits(ip)
+        if not limits:
+            return True
             
         try:
-            key = f"lead:rate:{ip}"
-            window = settings.RATE_LIMIT_WINDOW_SEC
-            limit = settings.RATE_LIMIT_PER_IP
+            if self._rate_limit_script is None:
+                self._rate_limit_script = client.register_script(RATE_LIMIT_SCRIPT)
             
-            # Увеличиваем счётчик
-            current = await client.incr(key)
+            args = []
+            for _, _, period, limit in limits:
+                args += [period, limit]
+            limited = await self._rate_limit_script(
+                keys=[key for _, key, _, _ in limits],
+                args=args
+            )
             
-            # При первом запросе устанавливаем TTL
-            if current == 1:
-                await client.expire(key, window)
-                
-            if current > limit:
-                logger.warning(f"Rate limit exceeded for IP: {ip} ({current}/{limit})")
+            if limited:
+                logger.warning(f"Rate limit exceeded for IP: {ip} ({limits[limited - 1][0]})")
                 return False
                 
-            logger.debug(f"Rate limit check for {ip}: {current}/{limit}")
             return True
             
         except Exception as e:
@@ -168,6 +347,9 @@ class RedisService:
         """
         if not email:
             return False
+        
+        if self._definitely_new(self.hash_email(email)):
+            return False
             
         client = await self._get_client()
         if client is None:
@@ -207,7 +389,11 @@ class RedisService:
             key = f"lead:email:{email_hash}"
             ttl = settings.PHONE_DUPLICATE_TTL_SEC  # Используем тот же TTL
             
-            await client.setex(key, ttl, "1")
+            pipe = client.pipeline(transaction=False)
+            pipe.setex(key, ttl, "1")
+            pipe.publish(SEEN_CHANNEL, email_hash)
+            await pipe.execute()
+            self.seen.add(email_hash)
             logger.debug(f"Email marked: {email_hash[:16]}... TTL={ttl}s")
             return True
             
@@ -215,11 +401,253 @@ class RedisService:
             logger.error(f"Redis mark_email error: {e}")
             return False
     
+    @staticmethod
+    def _phone_key(phone: str) -> str:
+        return f"lead:phone:{RedisService.hash_phone(phone)}"
+    
+    @staticmethod
+    def _email_key(email: str) -> str:
+        return f"lead:email:{RedisService.hash_email(email)}"
+    
+    async def check_lead(
+        self,
+        ip: Optional[str],
+        phone: str,
+        email: Optional[str] = None,
+        utm_content: Optional[str] = None,
+        rate_limit: bool = True
+    ) -> LeadCheckResult:
+        """
+        Rate limit (IP, подсеть, телефон, площадка), дубликат телефона
+        и дубликат email одним Lua-скриптом.
+        
+        Если лид чистый, телефон и email резервируются на
+        LEAD_RESERVATION_TTL_SEC: после решения нужно вызвать
+        mark_lead (принят) или release_lead (отклонён).
+        
+        rate_limit=False — только дубликаты (повторная проверка
+        сохранённых лидов: их IP не отражает темп отправки).
+        
+        Returns:
+            LeadCheckResult; при недоступности Redis — по fail-open
+        """
+        client = await self._get_client()
+        if client is None or not self.breaker.allow():
+            if self.fail_open:
+                return LeadCheckResult()
+            return LeadCheckResult(rate_limited=True)
+            
+        try:
+            email_key = self._email_key(email) if email else "lead:email:none"
+            limits = self._rate_limits(ip, phone, utm_content) if rate_limit else []
+            args = [1 if email else 0, settings.LEAD_RESERVATION_TTL_SEC]
+            for _, _, period, limit in limits:
+                args += [period, limit]
+            
+            with self.breaker.track():
+                response = await self._check_batcher.submit(
+                    ([self._phone_key(phone), email_key, *(key for _, key, _, _ in limits)], args)
+                )
+                if response is None:
+                    raise RuntimeError("check_lead pipeline failed")
+            limited, phone_dup, email_dup, reserved = response
+            
+            dimension = limits[limited - 1][0] if limited else None
+            if limited:
+                logger.warning(f"Rate limit exceeded ({dimension}) for IP: {ip}")
+            elif phone_dup:
+                logger.info(f"Duplicate phone detected: {self.hash_phone(phone)[:16]}...")
+            elif email_dup:
+                logger.info(f"Duplicate email detected: {self.hash_email(email)[:16]}...")
+            
+            return LeadCheckResult(
+                rate_limited=bool(limited),
+                rate_limit_dimension=dimension,
+                phone_duplicate=bool(phone_dup),
+                email_duplicate=bool(email_dup),
+                reserved=bool(reserved)
+            )
+            
+        except Exception as e:
+            logger.error(f"Redis check_lead error: {e}")
+            if self.fail_open:
+                return LeadCheckResult()
+            return LeadCheckResult(rate_limited=True)
+    
+    async def _check_lead_batch(self, calls: List[Tuple[List[str], List]]) -> Optional[List]:
+        """
+        Выполнить пачку CHECK_LEAD_SCRIPT одним pipeline.
+        
+        EVALSHA без предварительного SCRIPT EXISTS (его делает pipeline
+        со Script-объектами): при NOSCRIPT ни один вызов не выполнился,
+        скрипт загружается и пачка повторяется.
+        """
+        client = await self._get_client()
+        if client is None:
+            return None
+        if self._check_lead_script is None:
+            self._check_lead_script = client.register_script(CHECK_LEAD_SCRIPT)
+        sha = self._check_lead_script.sha
+        
+        for attempt in range(2):
+            pipe = client.pipeline(transaction=False)
+            for keys, args in calls:
+                pipe.evalsha(sha, len(keys), *keys, *args)
+            try:
+                return await pipe.execute()
+            except NoScriptError:
+                if attempt:
+                    raise
+                await client.script_load(CHECK_LEAD_SCRIPT)
+    
+    async def mark_lead(self, phone: str, email: Optional[str] = None) -> bool:
+        """
+        Отметить телефон и email принятого лида одной транзакцией.
+        
+        Returns:
+            True если успешно сохранено
+        """
+        client = await self._get_client()
+        if client is None:
+            return False
+            
+        try:
+            ttl = settings.PHONE_DUPLICATE_TTL_SEC
+            hashes = [self.hash_phone(phone)]
+            pipe = client.pipeline(transaction=True)
+            pipe.setex(self._phone_key(phone), ttl, "1")
+            if email:
+                hashes.append(self.hash_email(email))
+                pipe.setex(self._email_key(email), ttl, "1")  # Используем тот же TTL
+            for value_hash in hashes:
+                pipe.publish(SEEN_CHANNEL, value_hash)
+            await pipe.execute()
+            for value_hash in hashes:
+                self.seen.add(value_hash)
+            logger.debug(f"Lead marked: {self.hash_phone(phone)[:16]}... TTL={ttl}s")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Redis mark_lead error: {e}")
+            return False
+    
+    async def release_lead(self, phone: str, email: Optional[str] = None) -> None:
+        """Снять резерв check_lead для отклонённого лида."""
+        keys = [self._phone_key(phone)]
+        if email:
+            keys.append(self._email_key(email))
+        await self._release_keys(keys)
+    
+    async def _release_keys(self, keys: List[str]) -> None:
+        client = await self._get_client()
+        if client is None:
+            return
+            
+        try:
+            if self._release_lead_script is None:
+                self._release_lead_script = client.register_script(RELEASE_LEAD_SCRIPT)
+            await self._release_lead_script(keys=keys)
+            
+        except Exception as e:
+            logger.error(f"Redis release_lead error: {e}")
+    
+    async def _release_abandoned(self, call: Tuple[List[str], List], response: List) -> None:
+        """
+        Проверку отменили (лид отклонён другой проверкой), а скрипт уже
+        выполнился: release_lead отработал раньше, резерв снимаем здесь.
+        """
+        keys, _ = call
+        if response[3]:
+            await self._release_keys(keys[:2])
+    
+    def _definitely_new(self, value_hash: str) -> bool:
+        """Фильтр точно не видел хеш — Redis можно не спрашивать."""
+        return self._seen_ready and value_hash not in self.seen
+    
+    async def _load_seen(self, client) -> int:
+        """Загрузить в фильтр хеши всех отмеченных телефонов и email."""
+        loaded = 0
+        for pattern in ("lead:phone:*", "lead:email:*"):
+            async for key in client.scan_iter(match=pattern, count=1000):
+                self.seen.add(key.rsplit(":", 1)[1])
+                loaded += 1
+        return loaded
+    
+    async def run_seen_sync(self) -> None:
+        """
+        Фоновая задача: держать Bloom-фильтр в синхронизации с Redis.
+        Подписка на SEEN_CHANNEL оформляется до загрузки ключей, чтобы не
+        пропустить отметки между ними. Пока подписки нет, фильтру не доверяем.
+        """
+        while True:
+            client = await self._get_client()
+            if client is None:
+                await asyncio.sleep(settings.BLOOM_RESYNC_DELAY_SEC)
+                continue
+            
+            pubsub = client.pubsub()
+            try:
+                await pubsub.subscribe(SEEN_CHANNEL)
+                loaded = await self._load_seen(client)
+                self._seen_ready = True
+                logger.info(f"Duplicate Bloom filter loaded: {loaded} hashes")
+                
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self.seen.add(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Bloom filter sync error: {e}")
+            finally:
+                self._seen_ready = False
+                await pubsub.aclose()
+            
+            await asyncio.sleep(settings.BLOOM_RESYNC_DELAY_SEC)
+    
+    async def cache_get(self, key: str) -> Optional[str]:
+        """
+        Прочитать значение из общего кэша (разделяется между воркерами).
+        
+        Returns:
+            Значение или None если ключа нет или Redis недоступен
+        """
+        client = await self._get_client()
+        if client is None:
+            return None
+            
+        try:
+            return await client.get(key)
+        except Exception as e:
+            logger.error(f"Redis cache_get error: {e}")
+            return None
+    
+    async def cache_set(self, key: str, value: str, ttl: int) -> bool:
+        """
+        Сохранить значение в общий кэш с TTL.
+        
+        Returns:
+            True если успешно сохранено
+        """
+        client = await self._get_client()
+        if client is None:
+            return False
+            
+        try:
+            await client.setex(key, ttl, value)
+            return True
+        except Exception as e:
+            logger.error(f"Redis cache_set error: {e}")
+            return False
+    
     async def close(self):
         """Закрыть соединение с Redis"""
         if self._client:
             await self._client.close()
             self._client = None
+            self._check_lead_script = None
+            self._release_lead_script = None
+            self._rate_limit_script = None
 
 
 # Глобальный экземпляр
@@ -0,0 +1,175 @@
+"""
+Репутация повторного трафика: быстрый путь валидации.
+
+Исходы лидов (принят / отклонён) копятся по ключам: подсеть IP, ym_uid,
+домен email. Вес исхода затухает экспоненциально (REPUTATION_HALF_LIFE_SEC),
+поэтому учитываются только недавние лиды.
+
+Лид низкорисковый, если подсеть или ym_uid заслужили доверие (не меньше
+REPUTATION_MIN_ACCEPTED принятых лидов) и ни у одного ключа доля отклонений
+не выше REPUTATION_MAX_REJECT_RATE. Для такого лида дорогие проверки из
+REPUTATION_SKIP_CHECKS (по умолчанию MX и DaData email) не выполняются.
+
+Лиды, принятые по быстрому пути, репутацию не повышают — доверие
+не подпитывает само себя; отклонения учитываются всегда.
+"""
+
+import logging
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Set
+
+from lead_validator.config import settings
+from lead_validator.schemas import LeadInput
+from lead_validator.services.redis_service import RedisService
+
+logger = logging.getLogger("lead_validator.reputation")
+
+# Отклонения, ничего не говорящие о качестве источника
+NEUTRAL_REASONS = ("duplicate_", "deadline_exceeded", "dadata_unavailable")
+
+# Сглаживание средней задержки этапа на полном пути
+LATENCY_EMA_ALPHA = 0.1
+
+
+@dataclass
+class _Score:
+    accepted: float = 0.0
+    rejected: float = 0.0
+    updated_at: float = 0.0
+
+    def decay(self, now: float) -> None:
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            factor = math.pow(0.5, elapsed / settings.REPUTATION_HALF_LIFE_SEC)
+            self.accepted *= factor
+            self.rejected *= factor
+        self.updated_at = now
+
+    @property
+    def reject_rate(self) -> float:
+        total = self.accepted + self.rejected
+        return self.rejected / total if total else 0.0
+
+
+class ReputationCache:
+    """Счётчики исходов по ключам лида и решение о быстром пути."""
+
+    def __init__(self):
+        self._scores: "OrderedDict[str, _Score]" = OrderedDict()
+        self.stats = {"lookups": 0, "fast_path": 0}
+        self.skipped: Dict[str, int] = {}
+        self.saved_ms: Dict[str, float] = {}
+        # Средняя задержка этапа на полном пути — оценка сэкономленного времени
+        self._stage_ms: Dict[str, float] = {}
+
+    @staticmethod
+    def keys(lead: LeadInput) -> Dict[str, str]:
+        """Ключи репутации лида: ip (подсеть), uid, domain."""
+        keys = {}
+        subnet = RedisService._subnet(lead.client_ip) if lead.client_ip else None
+        if subnet:
+            keys["ip"] = f"ip:{subnet}"
+        if lead.ym_uid:
+            keys["uid"] = f"uid:{lead.ym_uid}"
+        if lead.email and "@" in lead.email:
+            keys["domain"] = f"domain:{lead.email.rsplit('@', 1)[1].lower().strip()}"
+        return keys
+
+    def _get(self, key: str, now: float) -> Optional[_Score]:
+        score = self._scores.get(key)
+        if score is not None:
+            score.decay(now)
+        return score
+
+    def record(
+        self,
+        lead: LeadInput,
+        accepted: bool,
+        reason: Optional[str] = None,
+        fast_path: bool = False
+    ) -> None:
+        """Учесть исход лида (reason — причина отклонения)."""
+        if not settings.REPUTATION_ENABLED or (accepted and fast_path):
+            return
+        if reason and reason.startswith(NEUTRAL_REASONS):
+            return
+
+        now = time.monotonic()
+        for key in self.keys(lead).values():
+            score = self._get(key, now)
+            if score is None:
+                score = _Score(updated_at=now)
+                self._scores[key] = score
+            if accepted:
+                score.accepted += 1
+            else:
+                score.rejected += 1
+            self._scores.move_to_end(key)
+
+        while len(self._scores) > settings.REPUTATION_CACHE_MAX_SIZE:
+            self._scores.popitem(last=False)
+
+    def is_low_risk(self, lead: LeadInput) -> bool:
+        now = time.monotonic()
+        trusted = False
+        for kind, key in self.keys(lead).items():
+            score = self._get(key, now)
+            if score is None:
+                continue
+            if score.reject_rate > settings.REPUTATION_MAX_REJECT_RATE:
+                return False
+            # Домен email (gmail.com) сам по себе доверия не даёт
+            if kind != "domain" and score.accepted >= settings.REPUTATION_MIN_ACCEPTED:
+                trusted = True
+        return trusted
+
+    def skip_checks(self, lead: LeadInput, checks: Iterable[str]) -> Set[str]:
+        """
+        Проверки из checks, которые можно не выполнять для лида.
+
+        Returns:
+            Пустое множество — полный путь
+        """
+        if not settings.REPUTATION_ENABLED:
+            return set()
+        self.stats["lookups"] += 1
+        skip = set(settings.REPUTATION_SKIP_CHECKS) & set(checks)
+        if not skip or not self.is_low_risk(lead):
+            return set()
+        self.stats["fast_path"] += 1
+        logger.debug(f"Reputation fast path for {lead.phone}: skip {sorted(skip)}")
+        return skip
+
+    def observe(self, timings: Dict[str, float], skipped: Set[str]) -> None:
+        """
+        Учесть время этапов лида, прошедшего удалённые проверки целиком.
+
+        Пропущенным этапам засчитывается средняя задержка полного пути.
+        """
+        for stage in skipped:
+            self.skipped[stage] = self.skipped.get(stage, 0) + 1
+            self.saved_ms[stage] = self.saved_ms.get(stage, 0.0) + self._stage_ms.get(stage, 0.0)
+        for stage, elapsed in timings.items():
+            if stage == "local" or stage in skipped:
+                continue
+            average = self._stage_ms.get(stage)
+            self._stage_ms[stage] = elapsed if average is None else (
+                average + LATENCY_EMA_ALPHA * (elapsed - average)
+            )
+
+    def get_stats(self) -> dict:
+        lookups = self.stats["lookups"]
+        return {
+            **self.stats,
+            "hit_rate": round(self.stats["fast_path"] / lookups, 3) if lookups else 0.0,
+            "keys": len(self._scores),
+            "skipped": dict(self.skipped),
+            "saved_ms": {stage: round(ms, 2) for stage, ms in self.saved_ms.items()},
+        }
+
+
+# Глобальный экземпляр
+reputation_cache = ReputationCache()
@@ -1,16 +1,29 @@
 """
 Telegram Bot для отправки уведомлений о новых лидах.
 Улучшенная версия с подробным логированием для отладки.
+
+Уведомления о заявках идут через очередь (logs/telegram/backlog.jsonl)
+с лимитом на чат; при всплеске заявки объединяются в сводки.
 """
 
+import asyncio
+import json
 import logging
+import os
 import httpx
-from typing import Optional
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 from lead_validator.config import settings
 from lead_validator.schemas import LeadInput
+from lead_validator.services.circuit_breaker import breakers
+from lead_validator.services.token_bucket import TokenBucket
 
 logger = logging.getLogger("lead_validator.telegram")
 
+# Ограничение Telegram на длину сообщения
+MESSAGE_MAX_LENGTH = 4096
+DIGEST_SEPARATOR = "\n\n———\n\n"
+
 
 class TelegramNotifier:
     """
@@ -24,6 +37,16 @@ class TelegramNotifier:
         self.chat_id = settings.TELEGRAM_CHAT_ID
         self.enabled = settings.TELEGRAM_ENABLED
         
+        # Очередь уведомлений по чатам, дублируется в файл
+        self._backlog: Dict[str, List[str]] = {}
+        self._backlog_file = Path(settings.TELEGRAM_BUFFER_DIR) / "backlog.jsonl"
+        self._backlog_loaded = False
+        self._backlog_lock = asyncio.Lock()
+        self._pending = asyncio.Event()
+        self._buckets: Dict[str, TokenBucket] = {}
+        self.stats = {"messages": 0, "leads": 0, "dropped": 0}
+        self.breaker = breakers.get("telegram")
+        
         # Логируем состояние при инициализации
         if self.enabled:
             logger.info(f"Telegram notifications ENABLED")
@@ -93,15 +116,15 @@ class TelegramNotifier:
         is_test: bool = False
     ) -> bool:
         """
-        Отправляет уведомление о новом лиде.
+        Уведомление о новом лиде.
+        
+        Боевые заявки ставятся в сохраняемую очередь чата и уходят через
+        run_dispatcher с учётом лимита Telegram; при накоплении очереди
+        объединяются в сводные сообщения. Тестовые отправляются сразу.
+        
+        Returns:
+            True если сообщение отправлено (тестовое) или принято в очередь
         """
-        if not self.enabled and not is_test:  # Тестовые отправляем даже если выключено (если явно вызвано)
-             # Но если токена нет, то не отправим все равно. 
-             # Логика: если self.enabled=False, мы вообще не должны слать продакшн лиды.
-             # А тестовые? Пользователь может хотеть проверить отправку даже если основной поток выключен?
-             # Пока оставим строгую проверку enabled, чтобы не спамить если выключено.
-             pass
-             
         if not self.enabled:
             logger.warning(f"Telegram DISABLED - skipping notification for: {lead.phone}")
             return False
@@ -116,57 +139,225 @@ class TelegramNotifier:
             
         message = self._format_lead_message(lead, phone_type, provider, region, is_test)
         
-        logger.info(f"Sending Telegram notification for phone: {lead.phone} (is_test={is_test})")
-        logger.debug(f"Message content: {message[:100]}...")
+        if is_test:
+            logger.info(f"Sending test Telegram notification for phone: {lead.phone}")
+            async with httpx.AsyncClient(timeout=10.0) as client:
+                status, _ = await self._post_message(client, self.chat_id, message)
+            return status == "ok"
         
+        await self._enqueue(self.chat_id, message)
+        logger.info(f"Telegram notification queued for phone: {lead.phone}")
+        return True
+    
+    # ------------------------------------------------------------------
+    # Очередь уведомлений
+    # ------------------------------------------------------------------
+    
+    def _bucket(self, chat_id: str) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(settings.TELEGRAM_RATE_PER_MIN / 60, settings.TELEGRAM_BURST)
+            self._buckets[chat_id] = bucket
+        return bucket
+    
+    def _load_backlog(self) -> None:
+        """Восстановить неотправленные уведомления после перезапуска."""
+        if not self._backlog_file.exists():
+            return
+        with open(self._backlog_file, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    item = json.loads(line)
+                    self._backlog.setdefault(item["chat_id"], []).append(item["text"])
+                except (json.JSONDecodeError, KeyError):
+                    logger.error("Corrupted Telegram backlog line skipped")
+        logger.info(f"Telegram backlog restored: {self.pending_count()} messages")
+    
+    def _append_to_file(self, chat_id: str, text: str) -> None:
+        self._backlog_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self._backlog_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"chat_id": chat_id, "text": text}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+    
+    def _rewrite_file(self) -> None:
+        """Перезаписать файл очереди текущим содержимым (атомарно)."""
+        items = [
+            {"chat_id": chat_id, "text": text}
+            for chat_id, texts in self._backlog.items() for text in texts
+        ]
+        if not items:
+            self._backlog_file.unlink(missing_ok=True)
+            return
+        tmp = self._backlog_file.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for item in items:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._backlog_file)
+    
+    async def _ensure_loaded(self) -> None:
+        if not self._backlog_loaded:
+            await asyncio.to_thread(self._load_backlog)
+            self._backlog_loaded = True
+    
+    async def _enqueue(self, chat_id: str, text: str) -> None:
+        async with self._backlog_lock:
+            await self._ensure_loaded()
+            await asyncio.to_thread(self._append_to_file, chat_id, text)
+            self._backlog.setdefault(chat_id, []).append(text)
+        self._pending.set()
+    
+    def pending_count(self) -> int:
+        """Количество уведомлений в очереди."""
+        return sum(len(texts) for texts in self._backlog.values())
+    
+    @staticmethod
+    def _build_digest(texts: List[str]) -> Tuple[str, int]:
+        """
+        Одно сообщение или сводка из первых заявок очереди.
+        
+        Returns:
+            (текст, сколько заявок в него вошло)
+        """
+        if len(texts) == 1:
+            return texts[0], 1
+        
+        count = 0
+        length = 0
+        for text in texts[:settings.TELEGRAM_DIGEST_MAX_LEADS]:
+            # Запас под заголовок и разделители
+            if count and length + len(text) + len(DIGEST_SEPARATOR) > MESSAGE_MAX_LENGTH - 100:
+                break
+            length += len(text) + len(DIGEST_SEPARATOR)
+            count += 1
+        
+        if count == 1:
+            return texts[0], 1
+        header = f"📦 *Сводка: {count} заявок*"
+        if len(texts) > count:
+            header += f" (в очереди ещё {len(texts) - count})"
+        return DIGEST_SEPARATOR.join([header, *texts[:count]]), count
+    
+    async def _post_message(
+        self,
+        client: httpx.AsyncClient,
+        chat_id: str,
+        text: str,
+        parse_mode: Optional[str] = "Markdown"
+    ) -> Tuple[str, float]:
+        """
+        Один вызов sendMessage.
+        
+        Returns:
+            ("ok" | "retry" | "drop", пауза в секундах для "retry")
+        """
+        # Цепь открыта — сообщение ждёт в очереди до пробного вызова
+        if not self.breaker.allow():
+            return "retry", settings.BREAKER_OPEN_SEC
+        
+        payload = {"chat_id": chat_id, "text": text}
+        if parse_mode:
+            payload["parse_mode"] = parse_mode
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                url = self._get_url("sendMessage")
-                payload = {
-                    "chat_id": self.chat_id,
-                    "text": message,
-                    "parse_mode": "Markdown"
-                }
-                
-                logger.debug(f"Request URL: {url}")
-                logger.debug(f"Request payload: chat_id={self.chat_id}, text_length={len(message)}")
-                
-                response = await client.post(url, json=payload)
-                
-                logger.info(f"Telegram API response status: {response.status_code}")
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    if result.get("ok"):
-                        logger.info(f"✅ Telegram notification SENT for phone: {lead.phone}")
-                        return True
-                    else:
-                        logger.error(f"Telegram API error: {result}")
-                        return False
-                else:
-                    response_text = response.text
-                    logger.error(
-                        f"❌ Telegram API HTTP error: {response.status_code}\n"
-                        f"Response: {response_text}"
-                    )
-                    
-                    # Попробуем распарсить JSON для более детальной ошибки
-                    try:
-                        error_data = response.json()
-                        error_code = error_data.get("error_code")
-                        description = error_data.get("description")
-                        logger.error(f"Telegram error details: [{error_code}] {description}")
-                    except:
-                        pass
-                    
+            with self.breaker.track():
+                response = await client.post(self._get_url("sendMessage"), json=payload)
+                if response.status_code >= 500:
+                    response.raise_for_status()
         except httpx.TimeoutException:
-            logger.warning(f"⏳ Telegram request TIMEOUT for phone: {lead.phone}")
-        except httpx.ConnectError as e:
+            logger.warning("⏳ Telegram request TIMEOUT")
+            return "retry", settings.TELEGRAM_RETRY_DELAY_SEC
+        except httpx.RequestError as e:
             logger.error(f"🔌 Telegram connection error: {e}")
-        except Exception as e:
-            logger.error(f"💥 Telegram unexpected error: {type(e).__name__}: {e}")
-            
-        return False
+            return "retry", settings.TELEGRAM_RETRY_DELAY_SEC
+        except httpx.HTTPStatusError as e:
+            logger.error(f"❌ Telegram API HTTP error: {e.response.status_code} {e.response.text[:200]}")
+            return "retry", settings.TELEGRAM_RETRY_DELAY_SEC
+        
+        if response.status_code == 200 and response.json().get("ok"):
+            return "ok", 0.0
+        
+        try:
+            error_data = response.json()
+        except ValueError:
+            error_data = {}
+        description = error_data.get("description", response.text[:200])
+        
+        if response.status_code == 429:
+            retry_after = error_data.get("parameters", {}).get("retry_after", settings.TELEGRAM_RETRY_DELAY_SEC)
+            logger.warning(f"Telegram rate limit, retry after {retry_after}s")
+            return "retry", float(retry_after)
+        
+        # 4xx (кроме 429) при повторе не исправится
+        logger.error(f"❌ Telegram rejected message: {response.status_code} {description}")
+        return "drop", 0.0
+    
+    async def _dispatch(self, client: httpx.AsyncClient, chat_id: str) -> None:
+        """Отправить следующее сообщение (или сводку) чата."""
+        async with self._backlog_lock:
+            text, count = self._build_digest(self._backlog[chat_id])
+        
+        status, delay = await self._post_message(client, chat_id, text)
+        if status == "drop":
+            # Чаще всего это разметка из полей формы (_ или * в имени):
+            # повторяем простым текстом, чтобы не потерять всю сводку
+            status, delay = await self._post_message(client, chat_id, text, parse_mode=None)
+        if status == "retry":
+            self._bucket(chat_id).pause(delay)
+            return
+        
+        if status == "ok":
+            logger.info(f"✅ Telegram notification SENT ({count} leads)")
+            self.stats["messages"] += 1
+            self.stats["leads"] += count
+        else:
+            self.stats["dropped"] += count
+        
+        # Новые сообщения дописываются в конец, отправленные — в начале
+        async with self._backlog_lock:
+            self._backlog[chat_id] = self._backlog[chat_id][count:]
+            await asyncio.to_thread(self._rewrite_file)
+    
+    def _next_wait(self) -> Optional[float]:
+        """Секунд до ближайшего токена у чатов с очередью (None — очередь пуста)."""
+        waits = [
+            self._bucket(chat_id).time_until()
+            for chat_id, texts in self._backlog.items() if texts
+        ]
+        return max(min(waits), 0.05) if waits else None
+    
+    async def run_dispatcher(self) -> None:
+        """
+        Фоновая задача: отправка очереди уведомлений.
+        
+        Каждый чат ограничен своим token bucket (TELEGRAM_RATE_PER_MIN).
+        Пока токена нет, заявки копятся и следующим сообщением уходят
+        сводкой, поэтому при всплеске уведомления задерживаются, а не
+        теряются. retry_after из ответа 429 приостанавливает чат.
+        """
+        await self._ensure_loaded()
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            while True:
+                sent = False
+                for chat_id in [c for c, texts in self._backlog.items() if texts]:
+                    if self._bucket(chat_id).try_acquire():
+                        try:
+                            await self._dispatch(client, chat_id)
+                        except Exception as e:
+                            logger.error(f"💥 Telegram dispatch error: {type(e).__name__}: {e}")
+                            self._bucket(chat_id).pause(settings.TELEGRAM_RETRY_DELAY_SEC)
+                        sent = True
+                if sent:
+                    continue
+                
+                try:
+                    await asyncio.wait_for(self._pending.wait(), timeout=self._next_wait())
+                except asyncio.TimeoutError:
+                    pass
+                self._pending.clear()
     
     async def send_message(self, text: str) -> bool:
         """
@@ -0,0 +1,49 @@
+"""
+Token bucket для соблюдения лимитов внешних API (Airtable, Telegram).
+"""
+
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Ограничение частоты запросов: rate токенов в секунду,
+    не больше capacity подряд (всплеск).
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Взять токены без ожидания. False если их недостаточно."""
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def time_until(self, tokens: float = 1) -> float:
+        """Сколько секунд ждать, пока накопятся tokens."""
+        self._refill()
+        return max(0.0, (tokens - self.tokens) / self.rate)
+
+    async def acquire(self, tokens: float = 1) -> None:
+        """Дождаться и взять токены. Ожидающие обслуживаются по очереди."""
+        async with self._lock:
+            while not self.try_acquire(tokens):
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Не выдавать токены seconds секунд (ответ 429 от API)."""
+        self._refill()
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
@@ -1,15 +1,33 @@
 """
 Логирование отклонённых заявок для аналитики.
-Поддерживает Airtable и локальный SQLite fallback.
+Поддерживает Airtable (пакетная запись) и локальный JSONL fallback.
 """
 
+import asyncio
+import gzip
 import logging
 import json
+import os
+import re
+import shutil
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+try:
+    import fcntl
+except ImportError:  # Windows: без межпроцессной блокировки индекса
+    fcntl = None
+
 from lead_validator.config import settings
 from lead_validator.schemas import RejectedLead
+from lead_validator.services.circuit_breaker import breakers
+from lead_validator.services.token_bucket import TokenBucket
 
 logger = logging.getLogger("lead_validator.trash_logger")
 
@@ -19,16 +37,39 @@ class TrashLogger:
     Сохранение отклонённых заявок для анализа источников мусора.
     
     Порядок приоритета:
-    1. Airtable (если настроен)
-    2. SQLite (локальная БД)
-    3. JSON файл (fallback)
+    1. Airtable (если настроен) — через очередь и фоновый writer,
+       пачками по AIRTABLE_BATCH_SIZE записей с лимитом запросов
+    2. JSON файл (fallback для пачек, не записанных после повторов)
+    
+    Локальные файлы:
+    - rejected_{date}.jsonl — пишет один фоновый writer (буфер + fsync
+      раз в TRASH_FSYNC_INTERVAL_SEC), прошлые дни сжимаются в .jsonl.gz
+    - rejected_{date}.stats.json — счётчики по причинам, обновляются
+      при записи, поэтому get_stats не читает сам лог. Процесс держит в
+      памяти только прирост с прошлого сохранения и прибавляет его к файлу
+      под блокировкой .stats.lock, так что воркеры не затирают счётчики
+      друг друга
     """
     
+    AIRTABLE_MAX_BATCH = 10  # Лимит Airtable на один запрос
+    
     def __init__(self):
         self.airtable_enabled = bool(
             settings.AIRTABLE_API_KEY and 
             settings.AIRTABLE_BASE_ID
         )
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer_running = False
+        self._bucket = TokenBucket(settings.AIRTABLE_RATE_LIMIT_PER_SEC)
+        self.breaker = breakers.get("airtable")
+        
+        self._file_queue: Optional[asyncio.Queue] = None
+        self._file_writer_running = False
+        self._file = None
+        self._file_date: Optional[str] = None
+        self._deltas: Dict[str, dict] = {}
+        self._counters_lock = threading.Lock()
+        self._file_lock = threading.RLock()
         self._init_local_storage()
         
     def _init_local_storage(self):
@@ -43,37 +84,21 @@ class TrashLogger:
         Returns:
             True если успешно сохранено
         """
-        # Пробуем Airtable
-        if self.airtable_enabled:
-            success = await self._log_to_airtable(lead)
-            if success:
+        # Airtable: ставим в очередь writer'а, запрос не ждёт API
+        if self.airtable_enabled and self._writer_running:
+            try:
+                self._queue.put_nowait(lead)
                 return True
+            except asyncio.QueueFull:
+                logger.warning("Airtable queue is full, logging to file")
                 
         # Fallback на локальный файл
         return await self._log_to_file(lead)
     
-    async def _log_to_airtable(self, lead: RejectedLead) -> bool:
-        """
-        Отправка в Airtable.
-        
-        TODO: Реализовать после получения ключей Airtable.
-        Лимит: 5 запросов в секунду, нужен bulk-insert для высокой нагрузки.
-        """
-        try:
-            import httpx
-            
-            url = (
-                f"https://api.airtable.com/v0/"
-                f"{settings.AIRTABLE_BASE_ID}/{settings.AIRTABLE_TABLE_NAME}"
-            )
-            
-            headers = {
-                "Authorization": f"Bearer {settings.AIRTABLE_API_KEY}",
-                "Content-Type": "application/json"
-            }
-            
-            # Преобразуем в формат Airtable
-            fields = {
+    @staticmethod
+    def _airtable_fields(lead: RejectedLead) -> dict:
+        """Преобразовать заявку в поля записи Airtable."""
+        return {
                 "Phone": lead.phone,
                 "Email": lead.email or "",
                 "Name": lead.name or "",
@@ -87,24 +112,104 @@ class TrashLogger:
                 "DaData QC": lead.dadata_qc if lead.dadata_qc is not None else "",
                 "Phone Type": lead.phone_type or ""
             }
-            
+    
+    async def run_airtable_writer(self) -> None:
+        """
+        Фоновая задача: забирать заявки из очереди и писать в Airtable
+        пачками. Пачка собирается до AIRTABLE_BATCH_SIZE записей или
+        AIRTABLE_BATCH_WAIT_SEC секунд. При остановке очередь
+        сбрасывается в локальный файл.
+        """
+        if not self.airtable_enabled:
+            return
+        
+        self._queue = asyncio.Queue(maxsize=settings.AIRTABLE_QUEUE_MAX_SIZE)
+        self._writer_running = True
+        batch: List[RejectedLead] = []
+        
+        try:
             async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.post(
-                    url,
-                    headers=headers,
-                    json={"fields": fields}
-                )
+                while True:
+                    await self._collect_batch(batch)
+                    if not await self._send_batch(client, batch):
+                        for lead in batch:
+                            await self._log_to_file(lead)
+                    batch = []
+        finally:
+            self._writer_running = False
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            for lead in batch:
+                await self._log_to_file(lead)
+    
+    async def _collect_batch(self, batch: List[RejectedLead]) -> None:
+        """Дождаться первой заявки и добрать пачку в пределах окна ожидания."""
+        batch.append(await self._queue.get())
+        batch_size = min(settings.AIRTABLE_BATCH_SIZE, self.AIRTABLE_MAX_BATCH)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.AIRTABLE_BATCH_WAIT_SEC
+        
+        while len(batch) < batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+    
+    async def _send_batch(self, client: httpx.AsyncClient, batch: List[RejectedLead]) -> bool:
+        """
+        Отправка пачки в Airtable одним запросом (records),
+        с повторами. Лимит Airtable: 5 запросов в секунду на базу.
+        При открытой цепи "airtable" пачка сразу уходит в файл.
+        """
+        url = (
+            f"https://api.airtable.com/v0/"
+            f"{settings.AIRTABLE_BASE_ID}/{settings.AIRTABLE_TABLE_NAME}"
+        )
+        
+        headers = {
+            "Authorization": f"Bearer {settings.AIRTABLE_API_KEY}",
+            "Content-Type": "application/json"
+        }
+        
+        payload = {"records": [{"fields": self._airtable_fields(lead)} for lead in batch]}
+        
+        for attempt in range(1, settings.AIRTABLE_MAX_RETRIES + 1):
+            if not self.breaker.allow():
+                return False
+            await self._bucket.acquire()
+            try:
+                with self.breaker.track():
+                    response = await client.post(url, headers=headers, json=payload)
+                    if response.status_code >= 500:
+                        response.raise_for_status()
                 
                 if response.status_code in (200, 201):
-                    logger.info(f"Rejected lead logged to Airtable: {lead.phone}")
+                    logger.info(f"Rejected leads logged to Airtable: {len(batch)}")
                     return True
-                else:
+                if response.status_code == 429:
+                    # Airtable блокирует базу на 30 секунд после превышения лимита
+                    self._bucket.pause(30)
+                elif response.status_code < 500:
                     logger.error(
                         f"Airtable error: {response.status_code} - {response.text}"
                     )
+                    return False
+                logger.warning(
+                    f"Airtable error {response.status_code}, attempt {attempt}"
+                )
                     
-        except Exception as e:
-            logger.error(f"Airtable logging error: {e}")
+            except httpx.HTTPStatusError as e:
+                logger.warning(
+                    f"Airtable error {e.response.status_code}, attempt {attempt}"
+                )
+            except Exception as e:
+                logger.error(f"Airtable logging error: {e}")
+            
+            if attempt < settings.AIRTABLE_MAX_RETRIES:
+                await asyncio.sleep(2 ** (attempt - 1))
             
         return False
     
@@ -112,37 +217,267 @@ class TrashLogger:
         """
         Fallback: сохранение в локальный JSON файл.
         Файлы разделены по датам для удобства.
+        
+        Запись ставится в очередь фонового writer'а; если он не запущен,
+        пишется сразу (в отдельном потоке).
         """
         try:
             date_str = datetime.utcnow().strftime("%Y-%m-%d")
-            file_path = self.log_dir / f"rejected_{date_str}.jsonl"
             
             # Сериализуем в JSON
             record = lead.model_dump()
             record["created_at"] = record["created_at"].isoformat()
             
-            # Append в JSONL файл (каждая строка — JSON объект)
-            with open(file_path, "a", encoding="utf-8") as f:
-                f.write(json.dumps(record, ensure_ascii=False) + "\n")
-                
-            logger.debug(f"Rejected lead logged to file: {file_path}")
+            if self._file_writer_running:
+                self._file_queue.put_nowait((date_str, record))
+                return True
+            
+            await asyncio.to_thread(self._write_and_sync, [(date_str, record)])
+            logger.debug(f"Rejected lead logged to file: {date_str}")
             return True
             
         except Exception as e:
             logger.error(f"File logging error: {e}")
             return False
     
+    # ------------------------------------------------------------------
+    # Фоновый writer локальных файлов
+    # ------------------------------------------------------------------
+    
+    def _log_path(self, date_str: str) -> Path:
+        return self.log_dir / f"rejected_{date_str}.jsonl"
+    
+    def _index_path(self, date_str: str) -> Path:
+        return self.log_dir / f"rejected_{date_str}.stats.json"
+    
+    async def run_file_writer(self) -> None:
+        """
+        Фоновая задача: единственный писатель локальных JSONL файлов.
+        Записи копятся в очереди, пишутся пачками; fsync и сохранение
+        счётчиков — раз в TRASH_FSYNC_INTERVAL_SEC.
+        """
+        self._file_queue = asyncio.Queue()
+        self._file_writer_running = True
+        
+        loop = asyncio.get_running_loop()
+        interval = settings.TRASH_FSYNC_INTERVAL_SEC
+        last_sync = loop.time()
+        pending: List[Tuple[str, dict]] = []
+        
+        try:
+            await asyncio.to_thread(self._compress_old_files)
+            while True:
+                timeout = max(0.0, last_sync + interval - loop.time())
+                try:
+                    pending.append(await asyncio.wait_for(self._file_queue.get(), timeout))
+                    while not self._file_queue.empty():
+                        pending.append(self._file_queue.get_nowait())
+                except asyncio.TimeoutError:
+                    pass
+                
+                if pending:
+                    await asyncio.to_thread(self._write_records, pending)
+                    pending = []
+                
+                if loop.time() - last_sync >= interval:
+                    await asyncio.to_thread(self._sync)
+                    last_sync = loop.time()
+        finally:
+            # Остановка: дописываем очередь синхронно, без await
+            self._file_writer_running = False
+            while not self._file_queue.empty():
+                pending.append(self._file_queue.get_nowait())
+            try:
+                self._write_records(pending)
+                self._sync()
+            finally:
+                self._close_file()
+    
+    def _write_and_sync(self, records: List[Tuple[str, dict]]) -> None:
+        """Запись без writer'а (скрипты, тесты, остановка приложения)."""
+        with self._file_lock:
+            try:
+                self._write_records(records)
+                self._sync()
+            finally:
+                self._close_file()
+    
+    def _write_records(self, records: List[Tuple[str, dict]]) -> None:
+        """Дописать записи в файлы своих дат и обновить счётчики."""
+        with self._file_lock:
+            for date_str, record in records:
+                if date_str != self._file_date:
+                    self._rotate(date_str)
+                self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                
+                reason = record.get("rejection_reason", "unknown")
+                with self._counters_lock:
+                    delta = self._deltas.setdefault(date_str, {"total": 0, "by_reason": {}})
+                    self._add(delta, {"total": 1, "by_reason": {reason: 1}})
+    
+    def _rotate(self, date_str: str) -> None:
+        """Переключиться на файл другой даты; прошлые дни сжать."""
+        previous = self._file_date
+        if self._file is not None:
+            self._sync()
+            self._close_file()
+        
+        self._file = open(self._log_path(date_str), "a", encoding="utf-8")
+        self._file_date = date_str
+        
+        if previous and previous < date_str:
+            self._compress_old_files()
+    
+    def _sync(self) -> None:
+        """fsync текущего файла и прибавление прироста счётчиков к индексам."""
+        with self._file_lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            
+            with self._counters_lock:
+                deltas, self._deltas = self._deltas, {}
+            if not deltas:
+                return
+            
+            with self._index_lock():
+                for date_str, delta in deltas.items():
+                    counters = self._load_index(date_str) or {"total": 0, "by_reason": {}}
+                    self._add(counters, delta)
+                    self._save_index(date_str, counters)
+    
+    def _close_file(self) -> None:
+        with self._file_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                self._file_date = None
+    
+    def _compress_old_files(self) -> None:
+        """
+        Сжать JSONL файлы прошлых дней (счётчики сохраняются отдельно).
+        Файл, изменённый за последний час, пропускается: другой воркер
+        может ещё дописывать в него записи, поставленные до полуночи.
+        """
+        today = datetime.utcnow().strftime("%Y-%m-%d")
+        recent = time.time() - 3600
+        for path in self.log_dir.glob("rejected_*.jsonl"):
+            date_str = path.stem[len("rejected_"):]
+            if date_str >= today or date_str == self._file_date:
+                continue
+            try:
+                if path.stat().st_mtime > recent:
+                    continue
+            except FileNotFoundError:
+                continue  # Сжал другой воркер
+            try:
+                with self._index_lock():
+                    if self._load_index(date_str) is None:
+                        self._save_index(date_str, self._count_log(date_str))
+                with open(path, "rb") as src, gzip.open(f"{path}.gz", "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                path.unlink()
+                logger.info(f"Rejected leads log compressed: {path.name}.gz")
+            except Exception as e:
+                logger.error(f"Log compression error for {path.name}: {e}")
+    
+    @contextmanager
+    def _index_lock(self):
+        """Межпроцессная блокировка файлов индекса (чтение-сложение-запись)."""
+        if fcntl is None:
+            yield
+            return
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.log_dir / ".stats.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+    
+    def _load_index(self, date_str: str) -> Optional[dict]:
+        index = self._index_path(date_str)
+        if not index.exists():
+            return None
+        return json.loads(index.read_text(encoding="utf-8"))
+    
+    def _save_index(self, date_str: str, counters: dict) -> None:
+        index = self._index_path(date_str)
+        tmp = index.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(counters), encoding="utf-8")
+        os.replace(tmp, index)
+    
+    @staticmethod
+    def _add(counters: dict, delta: dict) -> None:
+        counters["total"] += delta["total"]
+        for reason, count in delta["by_reason"].items():
+            counters["by_reason"][reason] = counters["by_reason"].get(reason, 0) + count
+    
+    def _count_log(self, date_str: str) -> dict:
+        """Подсчитать причины по логу (для файлов, записанных до индекса)."""
+        counters = {"total": 0, "by_reason": {}}
+        path = self._log_path(date_str)
+        gz_path = Path(f"{path}.gz")
+        
+        if path.exists():
+            f = open(path, "r", encoding="utf-8")
+        elif gz_path.exists():
+            f = gzip.open(gz_path, "rt", encoding="utf-8")
+        else:
+            return counters
+        
+        with f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                counters["total"] += 1
+                reason = record.get("rejection_reason", "unknown")
+                counters["by_reason"][reason] = counters["by_reason"].get(reason, 0) + 1
+        return counters
+    
+    def _read_stats(self, date: str) -> dict:
+        """
+        Счётчики даты: индекс плюс ещё не сохранённый прирост процесса.
+        Лог без индекса (записан до появления индексов) считается один
+        раз и индексируется, если день уже закончился. Для даты без лога
+        ничего не создаётся.
+        """
+        counters = self._load_index(date)
+        if counters is None:
+            log = self._log_path(date)
+            today = datetime.utcnow().strftime("%Y-%m-%d")
+            if date < today and (log.exists() or Path(f"{log}.gz").exists()):
+                with self._index_lock():
+                    counters = self._load_index(date)
+                    if counters is None:
+                        counters = self._count_log(date)
+                        self._save_index(date, counters)
+            else:
+                counters = {"total": 0, "by_reason": {}}
+        
+        with self._counters_lock:
+            delta = self._deltas.get(date)
+            if delta is not None:
+                self._add(counters, delta)
+        return counters
+    
     async def get_stats(self, date: Optional[str] = None) -> dict:
         """
         Получить статистику отклонённых заявок за дату.
+        Берётся из счётчиков, без чтения лога.
         
         Args:
             date: Дата в формате YYYY-MM-DD, по умолчанию сегодня
+        
+        Raises:
+            ValueError: дата не в формате YYYY-MM-DD
         """
         if date is None:
             date = datetime.utcnow().strftime("%Y-%m-%d")
-            
-        file_path = self.log_dir / f"rejected_{date}.jsonl"
+        if not re.fullmatch(r"\d{4}-\d{2}-\d{2}", date):
+            raise ValueError(f"Invalid date: {date!r}, expected YYYY-MM-DD")
+        datetime.strptime(date, "%Y-%m-%d")
         
         stats = {
             "date": date,
@@ -150,18 +485,10 @@ class TrashLogger:
             "by_reason": {}
         }
         
-        if not file_path.exists():
-            return stats
-            
         try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                for line in f:
-                    record = json.loads(line.strip())
-                    stats["total"] += 1
-                    
-                    reason = record.get("rejection_reason", "unknown")
-                    stats["by_reason"][reason] = stats["by_reason"].get(reason, 0) + 1
-                    
+            counters = await asyncio.to_thread(self._read_stats, date)
+            stats["total"] = counters["total"]
+            stats["by_reason"] = counters["by_reason"]
         except Exception as e:
             logger.error(f"Stats reading error: {e}")
             
@@ -0,0 +1,41 @@
+"""
+Ограниченный LRU-кэш в памяти со сроком жизни у каждой записи.
+Используется для результатов MX-проверки, капчи и GeoIP.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """
+    Ограниченный LRU-кэш: при переполнении вытесняется запись, к которой
+    дольше всего не обращались. У каждой записи свой срок жизни.
+    """
+    
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if time.monotonic() >= expires_at:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+    
+    def set(self, key: Hashable, value: Any, ttl: float) -> None:
+        if ttl <= 0:
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+    
+    def __len__(self) -> int:
+        return len(self._data)
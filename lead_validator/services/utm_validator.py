@@ -5,14 +5,21 @@
 1. Подозрительные UTM-метки (странные значения, отсутствие при рекламном трафике)
 2. Соответствие источника и GeoIP (utm_source=yandex + IP не из России = подозрительно)
 3. Чёрный список площадок (utm_content с ID мусорных площадок РСЯ)
+
+Паттерны и чёрный список скомпилированы (см. matchers), чёрный список
+дополняется из UTM_BLACKLIST_FILE и Redis SET lead:lists:utm_blacklist.
 """
 
 import logging
 import re
-from typing import Optional, Tuple, List
+from typing import Optional, Tuple, List, Set
 from dataclasses import dataclass
 
 from lead_validator.config import settings
+from lead_validator.services.matchers import PatternSet, SubstringMatcher, list_reloader
+
+# Странные символы в UTM (кроме стандартных)
+INVALID_CHARS_RE = re.compile(r'[<>"\']')
 
 logger = logging.getLogger("lead_validator.utm_validator")
 
@@ -52,7 +59,10 @@ class UTMValidator:
         
         # Чёрный список площадок (ID или паттерны в utm_content)
         # Заполняется из конфигурации
-        self.blacklisted_placements: List[str] = settings.UTM_BLACKLISTED_PLACEMENTS
+        self.blacklisted_placements: List[str] = list(settings.UTM_BLACKLISTED_PLACEMENTS)
+        # Записи из внешних источников (файл, Redis)
+        self.external_placements: Set[str] = set()
+        self._rebuild_blacklist()
         
         # Подозрительные паттерны в UTM
         self.suspicious_patterns = [
@@ -64,16 +74,35 @@ class UTMValidator:
             r"null",
             r"\{.*\}",  # шаблонные переменные {keyword}
         ]
+        self.suspicious_matcher = PatternSet(self.suspicious_patterns)
         
-        # Страны, откуда НЕ должен идти трафик yandex (упрощённый список)
-        # В реальности нужен GeoIP сервис
+        # Страны, откуда НЕ должен идти трафик yandex (упрощённый список).
+        # Страна лида — из источника или локального GeoIP (services/geoip)
         self.non_russian_countries = {"UA", "BY", "KZ", "UZ", "GE", "AM", "AZ"}
         
+        list_reloader.register(
+            "utm_blacklist",
+            self.set_external_placements,
+            path=settings.UTM_BLACKLIST_FILE,
+            redis_key="lead:lists:utm_blacklist"
+        )
+        
         logger.info(
             f"UTM Validator initialized with {len(self.blacklisted_placements)} "
             f"blacklisted placements"
         )
     
+    def _rebuild_blacklist(self) -> None:
+        # Новый автомат подменяет старый одним присваиванием
+        self.blacklist_matcher = SubstringMatcher(
+            [*self.blacklisted_placements, *self.external_placements]
+        )
+    
+    def set_external_placements(self, placements: Set[str]) -> None:
+        """Заменить площадки из внешних источников (горячая перезагрузка)."""
+        self.external_placements = set(placements)
+        self._rebuild_blacklist()
+    
     def validate(
         self, 
         utm: UTMData, 
@@ -161,31 +190,22 @@ class UTMValidator:
                 issues.append(f"{field_name}_too_long")
             
             # Странные символы (кроме стандартных)
-            if re.search(r'[<>"\']', value):
+            if INVALID_CHARS_RE.search(value):
                 issues.append(f"{field_name}_invalid_chars")
         
         return "; ".join(issues) if issues else None
     
     def _check_blacklist(self, utm: UTMData) -> Optional[str]:
         """Проверить чёрный список площадок."""
-        if not self.blacklisted_placements:
+        if not len(self.blacklist_matcher):
             return None
         
-        # Проверяем utm_content (обычно содержит ID площадки)
-        if utm.content:
-            content_lower = utm.content.lower()
-            for placement in self.blacklisted_placements:
-                if placement.lower() in content_lower:
-                    return placement
-        
-        # Проверяем utm_campaign (иногда ID площадки там)
-        if utm.campaign:
-            campaign_lower = utm.campaign.lower()
-            for placement in self.blacklisted_placements:
-                if placement.lower() in campaign_lower:
-                    return placement
-        
-        return None
+        # Проверяем utm_content (обычно содержит ID площадки),
+        # затем utm_campaign (иногда ID площадки там)
+        return (
+            self.blacklist_matcher.find(utm.content)
+            or self.blacklist_matcher.find(utm.campaign)
+        )
     
     def _check_geo_match(
         self, 
@@ -224,11 +244,8 @@ class UTMValidator:
             if not value:
                 continue
             
-            value_lower = value.lower()
-            for pattern in self.suspicious_patterns:
-                if re.search(pattern, value_lower):
-                    issues.append(f"{field_name}_suspicious")
-                    break
+            if self.suspicious_matcher.search(value.lower()):
+                issues.append(f"{field_name}_suspicious")
         
         return "; ".join(issues) if issues else None
     
@@ -236,6 +253,7 @@ class UTMValidator:
         """Добавить площадку в чёрный список (runtime)."""
         if placement not in self.blacklisted_placements:
             self.blacklisted_placements.append(placement)
+            self._rebuild_blacklist()
             logger.info(f"Added placement to blacklist: {placement}")
 
 
@@ -5,7 +5,9 @@
 
 import logging
 import time
-from typing import Optional, Tuple
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, FrozenSet, Optional, Tuple
 from lead_validator.config import settings
 from lead_validator.schemas import LeadInput, ValidationResult, RejectedLead
 from lead_validator.services.dadata import dadata_service, DaDataPhoneResponse
@@ -19,23 +21,44 @@ from lead_validator.services.request_validator import request_validator
 from lead_validator.services.data_quality import data_quality_validator
 from lead_validator.services.analytics import analytics_service
 from lead_validator.services.email_mx_validator import email_mx_validator, timezone_validator
+from lead_validator.services.outbox import outbox
+from lead_validator.services.reputation import reputation_cache
+from lead_validator.services.geoip import geoip_resolver
+from lead_validator.pipeline import Check, run_concurrent, stage_timer
 
 logger = logging.getLogger("lead_validator.validators")
 
 
+@dataclass
+class ValidationContext:
+    """Результаты удалённых проверок, нужные после их завершения."""
+    dadata: Optional[DaDataPhoneResponse] = None
+    note: Optional[str] = None
+    # Проверка в Redis могла зарезервировать телефон/email — снять при отклонении
+    redis_reserved: bool = False
+    # Проверки, пропущенные по репутации (быстрый путь)
+    skipped: FrozenSet[str] = frozenset()
+
+
 class LeadValidator:
     """
     Многоуровневая валидация лидов.
     
-    Порядок проверок (от дешёвых к дорогим):
-    0. CAPTCHA: Yandex SmartCaptcha
+    Этап 1 — локальные проверки, последовательно (от дешёвых к дорогим):
     0.5. HTTP заголовки: User-Agent, Referer
     1. Антибот: timestamp, honeypot
     2. Качество данных: пустые поля, формат телефона, email, имя
-    3. Rate Limiting: проверка IP (Redis)
-    4. Дедупликация: хеш телефона (Redis)
-    5. DaData: валидация телефона (внешний API)
+    4.7. Timezone браузера (только логирование)
     6. UTM валидация: подозрительные метки, GeoIP, чёрный список
+    
+    Этап 2 — удалённые проверки, параллельно:
+    0. CAPTCHA: Yandex SmartCaptcha
+    3-4. Rate Limiting (IP, подсеть, телефон, площадка) и дедупликация телефона/email (один вызов Redis)
+    4.6. MX-записи email домена (DNS)
+    5. DaData: валидация телефона и email (внешний API)
+    
+    Для повторного трафика с хорошей репутацией (подсеть, ym_uid, домен
+    email) часть удалённых проверок пропускается — см. services/reputation.
     """
     
     async def validate(
@@ -43,78 +66,107 @@ class LeadValidator:
         lead: LeadInput,
         client_ip: Optional[str] = None,
         user_agent: Optional[str] = None,
-        referer: Optional[str] = None
+        referer: Optional[str] = None,
+        replay: bool = False,
+        notify: Optional[bool] = None
     ) -> ValidationResult:
         """
         Главный метод валидации лида.
         
+        Этап 1 — локальные проверки (без сети), последовательно.
+        Этап 2 — независимые удалённые проверки параллельно; первое
+        отклонение отменяет остальные. Время каждого этапа возвращается
+        в ValidationResult.stage_timings_ms.
+        
         Args:
             lead: Входные данные лида
             client_ip: IP адрес клиента для rate limiting
+            replay: Повторная проверка сохранённого лида (/lead/batch):
+                без CAPTCHA и проверки времени заполнения формы —
+                токен одноразовый, а timestamp уже устарел
+            notify: Уведомление в Telegram и конверсия в Метрику о
+                принятом лиде. По умолчанию только для живых заявок
+                (не replay), чтобы импорт не дублировал их
             
         Returns:
             ValidationResult с результатом проверки
         """
         start_time = time.time()
+        timings: Dict[str, float] = {}
         
         # Сохраняем IP в lead для логирования
         if client_ip:
             lead.client_ip = client_ip
+        # Страна из локального GeoIP, если источник её не передал
+        if not lead.geo_country:
+            lead.geo_country = geoip_resolver.country(lead.client_ip)
         
-        # === Уровень 0: CAPTCHA (Yandex SmartCaptcha) ===
-        captcha_passed, captcha_error = await captcha_validator.validate(
-            lead.smart_token or "", 
-            client_ip
+        # === Этап 1: локальные проверки ===
+        with stage_timer(timings, "local"):
+            rejection = self._check_local(lead, client_ip, user_agent, referer, replay)
+        if rejection:
+            return await self._reject(lead, rejection, start_time, timings=timings)
+        
+        # === Этап 2: удалённые проверки параллельно ===
+        # Бюджет на лид — остаток LEAD_DEADLINE_MS после локальных проверок
+        deadline = None
+        if settings.LEAD_DEADLINE_MS > 0:
+            deadline = max(0.0, settings.LEAD_DEADLINE_MS / 1000 - (time.time() - start_time))
+        ctx = ValidationContext()
+        checks = self._remote_checks(lead, client_ip, ctx, replay)
+        ctx.skipped = frozenset(reputation_cache.skip_checks(lead, checks))
+        for name in ctx.skipped:
+            del checks[name]
+        rejection = await run_concurrent(checks, timings, deadline)
+        if rejection:
+            if ctx.redis_reserved:
+                await redis_service.release_lead(lead.phone, lead.email)
+            return await self._reject(
+                lead, 
+                rejection, 
+                start_time,
+                dadata=ctx.dadata,
+                timings=timings
+            )
+        
+        # === ВСЕ ПРОВЕРКИ ПРОЙДЕНЫ ===
+        reputation_cache.observe(timings, ctx.skipped)
+        if notify is None:
+            notify = not replay
+        return await self._accept(
+            lead, ctx.dadata, start_time, note=ctx.note, timings=timings, fast_path=bool(ctx.skipped),
+            notify=notify, replay=replay
         )
-        if not captcha_passed:
-            return await self._reject(lead, f"captcha_failed: {captcha_error}", start_time)
+    
+    def _check_local(
+        self,
+        lead: LeadInput,
+        client_ip: Optional[str],
+        user_agent: Optional[str],
+        referer: Optional[str],
+        replay: bool = False
+    ) -> Optional[str]:
+        """
+        Дешёвые проверки без сетевых вызовов.
         
+        Returns:
+            Причина отклонения или None если OK
+        """
         # === Уровень 0.5: HTTP заголовки (User-Agent, Referer) ===
         if user_agent is not None:
             request_check = request_validator.validate(user_agent, referer)
             if not request_check.is_valid:
-                return await self._reject(lead, request_check.rejection_reason or "request_invalid", start_time)
+                return request_check.rejection_reason or "request_invalid"
         
         # === Уровень 1: Антибот ===
-        rejection = await self._check_antibot(lead)
+        rejection = self._check_antibot(lead, replay)
         if rejection:
-            return await self._reject(lead, rejection, start_time)
+            return rejection
         
         # === Уровень 2: Качество данных ===
         rejection = self._check_data_quality(lead)
         if rejection:
-            return await self._reject(lead, rejection, start_time)
-        
-        # === Уровень 3: Rate Limiting ===
-        if client_ip:
-            allowed = await redis_service.check_rate_limit(client_ip)
-            if not allowed:
-                return await self._reject(
-                    lead, 
-                    "rate_limit_exceeded", 
-                    start_time
-                )
-        
-        # === Уровень 4: Дедупликация телефона ===
-        is_duplicate = await redis_service.is_duplicate(lead.phone)
-        if is_duplicate:
-            return await self._reject(lead, "duplicate_phone", start_time)
-        
-        # === Уровень 4.5: Дедупликация email ===
-        if lead.email:
-            is_email_dup = await redis_service.is_email_duplicate(lead.email)
-            if is_email_dup:
-                return await self._reject(lead, "duplicate_email", start_time)
-        
-        # === Уровень 4.6: MX-записи email домена ===
-        if lead.email and settings.MX_CHECK_ENABLED:
-            mx_result = email_mx_validator.check_mx(lead.email)
-            if not mx_result.has_mx:
-                return await self._reject(
-                    lead, 
-                    f"email_no_mx:{mx_result.error or 'no_records'}", 
-                    start_time
-                )
+            return rejection
         
         # === Уровень 4.7: Проверка timezone браузера ===
         if lead.browser_timezone and lead.geo_country:
@@ -126,62 +178,6 @@ class LeadValidator:
                 logger.warning(f"Suspicious timezone for {lead.phone}: {tz_result.warning}")
                 # Не отклоняем, только логируем (можно изменить на _reject если нужно)
         
-        # === Уровень 5: DaData валидация ===
-        dadata_result = await dadata_service.validate_phone(lead.phone)
-        
-        if dadata_result is None:
-            # DaData недоступен
-            if settings.FAIL_OPEN_MODE:
-                logger.warning(f"DaData unavailable, fail-open for: {lead.phone}")
-                # Пропускаем но помечаем
-                return await self._accept(
-                    lead, 
-                    dadata_result, 
-                    start_time,
-                    note="dadata_unavailable"
-                )
-            else:
-                return await self._reject(
-                    lead, 
-                    "dadata_unavailable", 
-                    start_time
-                )
-        
-        if not dadata_service.is_phone_valid(dadata_result):
-            return await self._reject(
-                lead, 
-                f"invalid_phone_qc_{dadata_result.qc}",
-                start_time,
-                dadata=dadata_result
-            )
-        
-        # === Уровень 5.5: DaData валидация EMAIL ===
-        if lead.email and settings.DADATA_API_KEY:
-            email_result = await dadata_service.validate_email(lead.email)
-            
-            if email_result:
-                # Проверяем qc-код
-                if not dadata_service.is_email_valid(email_result):
-                    return await self._reject(
-                        lead,
-                        f"invalid_email_qc_{email_result.get('qc')}",
-                        start_time,
-                        dadata=dadata_result
-                    )
-                
-                # Проверяем на одноразовый email
-                if dadata_service.is_email_disposable(email_result):
-                    return await self._reject(
-                        lead,
-                        "email_disposable",
-                        start_time,
-                        dadata=dadata_result
-                    )
-                
-                # Логируем тип email
-                email_type = dadata_service.get_email_type(email_result)
-                logger.info(f"Email type for {lead.phone}: {email_type}")
-        
         # === Уровень 6: UTM валидация ===
         if settings.UTM_VALIDATION_ENABLED:
             utm_data = UTMData(
@@ -197,19 +193,123 @@ class LeadValidator:
                 geo_country=lead.geo_country
             )
             if not utm_result.is_valid:
-                return await self._reject(
-                    lead, 
-                    f"utm_invalid:{utm_result.reason}",
-                    start_time,
-                    dadata=dadata_result
-                )
+                return f"utm_invalid:{utm_result.reason}"
             if utm_result.warning:
                 logger.warning(f"UTM warning for {lead.phone}: {utm_result.warning}")
         
-        # === ВСЕ ПРОВЕРКИ ПРОЙДЕНЫ ===
-        return await self._accept(lead, dadata_result, start_time)
+        return None
+    
+    def _remote_checks(
+        self,
+        lead: LeadInput,
+        client_ip: Optional[str],
+        ctx: "ValidationContext",
+        replay: bool = False
+    ) -> Dict[str, Check]:
+        """
+        Независимые удалённые проверки для параллельного запуска.
+        Ключ — имя этапа в stage_timings_ms.
+        """
+        checks: Dict[str, Check] = {
+            # Уровни 3-4.5: Rate Limiting и дедупликация телефона/email
+            "redis": lambda: self._check_redis(lead, client_ip, ctx, replay),
+            # Уровень 5: DaData валидация телефона
+            "dadata_phone": lambda: self._check_dadata_phone(lead, ctx),
+        }
+        
+        if not replay:
+            # Уровень 0: CAPTCHA (Yandex SmartCaptcha)
+            checks["captcha"] = lambda: self._check_captcha(lead, client_ip)
+        
+        if lead.email:
+            # Уровень 4.6: MX-записи email домена
+            if settings.MX_CHECK_ENABLED:
+                checks["mx"] = lambda: self._check_mx(lead)
+            # Уровень 5.5: DaData валидация EMAIL
+            if settings.DADATA_API_KEY:
+                checks["dadata_email"] = lambda: self._check_dadata_email(lead)
+        
+        return checks
+    
+    async def _check_captcha(self, lead: LeadInput, client_ip: Optional[str]) -> Optional[str]:
+        captcha_passed, captcha_error = await captcha_validator.validate(
+            lead.smart_token or "", 
+            client_ip,
+            submission=lead.phone
+        )
+        if not captcha_passed:
+            return f"captcha_failed: {captcha_error}"
+        return None
+    
+    async def _check_redis(
+        self,
+        lead: LeadInput,
+        client_ip: Optional[str],
+        ctx: "ValidationContext",
+        replay: bool = False
+    ) -> Optional[str]:
+        # Отмечаем до вызова: задачу могут отменить после выполнения скрипта
+        ctx.redis_reserved = True
+        # Повторная проверка (replay): лиды пачки пришли с разных IP
+        # в разное время, лимиты частоты к ним не применяются
+        result = await redis_service.check_lead(
+            client_ip, lead.phone, lead.email, utm_content=lead.utm_content,
+            rate_limit=not replay
+        )
+        ctx.redis_reserved = result.reserved
+        
+        if result.rate_limited:
+            if result.rate_limit_dimension:
+                return f"rate_limit_exceeded:{result.rate_limit_dimension}"
+            return "rate_limit_exceeded"
+        if result.phone_duplicate:
+            return "duplicate_phone"
+        if result.email_duplicate:
+            return "duplicate_email"
+        return None
     
-    async def _check_antibot(self, lead: LeadInput) -> Optional[str]:
+    async def _check_mx(self, lead: LeadInput) -> Optional[str]:
+        mx_result = await email_mx_validator.check_mx(lead.email)
+        if not mx_result.has_mx:
+            return f"email_no_mx:{mx_result.error or 'no_records'}"
+        return None
+    
+    async def _check_dadata_phone(self, lead: LeadInput, ctx: "ValidationContext") -> Optional[str]:
+        dadata_result = await dadata_service.validate_phone(lead.phone)
+        
+        if dadata_result is None:
+            # DaData недоступен
+            if settings.FAIL_OPEN_MODE:
+                logger.warning(f"DaData unavailable, fail-open for: {lead.phone}")
+                # Пропускаем но помечаем
+                ctx.note = "dadata_unavailable"
+                return None
+            return "dadata_unavailable"
+        
+        ctx.dadata = dadata_result
+        if not dadata_service.is_phone_valid(dadata_result):
+            return f"invalid_phone_qc_{dadata_result.qc}"
+        return None
+    
+    async def _check_dadata_email(self, lead: LeadInput) -> Optional[str]:
+        email_result = await dadata_service.validate_email(lead.email)
+        if not email_result:
+            return None
+        
+        # Проверяем qc-код
+        if not dadata_service.is_email_valid(email_result):
+            return f"invalid_email_qc_{email_result.get('qc')}"
+        
+        # Проверяем на одноразовый email
+        if dadata_service.is_email_disposable(email_result):
+            return "email_disposable"
+        
+        # Логируем тип email
+        email_type = dadata_service.get_email_type(email_result)
+        logger.info(f"Email type for {lead.phone}: {email_type}")
+        return None
+    
+    def _check_antibot(self, lead: LeadInput, replay: bool = False) -> Optional[str]:
         """
         Проверка антибот-полей.
         
@@ -221,8 +321,8 @@ class LeadValidator:
             logger.info(f"Honeypot triggered: {lead.phone}")
             return "honeypot_filled"
         
-        # Проверка timestamp
-        if lead.timestamp is not None:
+        # Проверка timestamp (при повторной проверке он заведомо старый)
+        if lead.timestamp is not None and not replay:
             current_time = int(time.time())
             fill_time = current_time - lead.timestamp
             
@@ -276,7 +376,8 @@ class LeadValidator:
         lead: LeadInput, 
         reason: str, 
         start_time: float,
-        dadata: Optional[DaDataPhoneResponse] = None
+        dadata: Optional[DaDataPhoneResponse] = None,
+        timings: Optional[Dict[str, float]] = None
     ) -> ValidationResult:
         """
         Отклонить лид и залогировать.
@@ -293,6 +394,7 @@ class LeadValidator:
             rejected=True,
             rejection_reason=reason
         )
+        reputation_cache.record(lead, accepted=False, reason=reason)
         
         # Логируем в Airtable/файл (async, не блокируем ответ)
         rejected = RejectedLead(
@@ -319,7 +421,8 @@ class LeadValidator:
             rejection_reason=reason,
             execution_time_ms=round(execution_time, 2),
             dadata_qc=dadata.qc if dadata else None,
-            phone_type=dadata.type if dadata else None
+            phone_type=dadata.type if dadata else None,
+            stage_timings_ms=timings
         )
     
     async def _accept(
@@ -327,10 +430,16 @@ class LeadValidator:
         lead: LeadInput, 
         dadata: Optional[DaDataPhoneResponse],
         start_time: float,
-        note: Optional[str] = None
+        note: Optional[str] = None,
+        timings: Optional[Dict[str, float]] = None,
+        fast_path: bool = False,
+        notify: bool = True,
+        replay: bool = False
     ) -> ValidationResult:
         """
-        Принять лид, отправить в Telegram, сохранить хеш.
+        Принять лид, сохранить хеш, поставить уведомления в outbox
+        (при notify). Конверсия переигранного лида — со временем его
+        timestamp, а не текущим.
         """
         execution_time = (time.time() - start_time) * 1000
         
@@ -343,32 +452,28 @@ class LeadValidator:
             utm_content=lead.utm_content,
             rejected=False
         )
-        
-        # Сохраняем хеш телефона для дедупликации
-        await redis_service.mark_phone(lead.phone)
-        
-        # Сохраняем хеш email для дедупликации
-        if lead.email:
-            await redis_service.mark_email(lead.email)
-        
-        # Отправляем уведомление в Telegram
-        try:
-            await telegram_notifier.send_new_lead(
-                lead,
-                phone_type=dadata.type if dadata else None,
-                provider=dadata.provider if dadata else None,
-                region=dadata.region if dadata else None
-            )
-        except Exception as e:
-            logger.error(f"Failed to send Telegram notification: {e}")
-        
-        # Отправляем конверсию в Яндекс.Метрику
-        try:
+        reputation_cache.record(lead, accepted=True, fast_path=fast_path)
+        
+        # Сохраняем хеши телефона и email для дедупликации (снимает резерв)
+        await redis_service.mark_lead(lead.phone, lead.email)
+        
+        # Уведомление в Telegram доставляется фоновыми воркерами outbox
+        if notify and telegram_notifier.enabled:
+            await outbox.enqueue("telegram_new_lead", {
+                "lead": lead.model_dump(mode="json"),
+                "phone_type": dadata.type if dadata else None,
+                "provider": dadata.provider if dadata else None,
+                "region": dadata.region if dadata else None
+            })
+        
+        # Конверсия в Яндекс.Метрику (буфер, загружается пачками)
+        if notify and metrica_service.enabled:
             # Используем ym_uid если есть, иначе IP как fallback
             client_id = lead.ym_uid or lead.client_ip or "unknown"
-            await metrica_service.send_quality_lead(client_id)
-        except Exception as e:
-            logger.error(f"Failed to send Metrica conversion: {e}")
+            conversion_time = None
+            if replay and lead.timestamp:
+                conversion_time = datetime.fromtimestamp(lead.timestamp)
+            await metrica_service.send_quality_lead(client_id, conversion_time=conversion_time)
         
         return ValidationResult(
             success=True,
@@ -377,10 +482,24 @@ class LeadValidator:
             phone_type=dadata.type if dadata else None,
             phone_provider=dadata.provider if dadata else None,
             phone_region=dadata.region if dadata else None,
-            dadata_qc=dadata.qc if dadata else None
+            dadata_qc=dadata.qc if dadata else None,
+            stage_timings_ms=timings
         )
 
 
+async def _send_telegram_lead(payload: Dict[str, Any]) -> bool:
+    """Обработчик outbox: уведомление о принятом лиде в очередь Telegram."""
+    return await telegram_notifier.send_new_lead(
+        LeadInput.model_validate(payload["lead"]),
+        phone_type=payload.get("phone_type"),
+        provider=payload.get("provider"),
+        region=payload.get("region")
+    )
+
+
+outbox.register("telegram_new_lead", _send_telegram_lead)
+
+
 # Глобальный экземпляр
 lead_validator = LeadValidator()
 
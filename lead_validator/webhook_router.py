@@ -11,6 +11,7 @@ from fastapi import APIRouter, Request, HTTPException
 from pydantic import BaseModel, Field
 from lead_validator.schemas import LeadInput, ValidationResult
 from lead_validator.validators import lead_validator
+from lead_validator.services.geoip import geoip_resolver
 
 logger = logging.getLogger("lead_validator.webhook")
 
@@ -466,8 +467,10 @@ async def debug_marquiz_webhook(data: MarquizWebhookData, request: Request) -> D
         utm_content = utm_content or utm_from_url.get("utm_content")
         utm_term = utm_term or utm_from_url.get("utm_term")
     
-    # Geo и timezone
-    geo_country = extract_country_from_location(data.location)
+    # Geo и timezone (без location — по IP, как при валидации)
+    geo_country = extract_country_from_location(data.location) or geoip_resolver.country(
+        data.IP or _get_client_ip(request)
+    )
     browser_timezone = parse_timezone_offset(data.leadTimezone)
     
     # Формируем LeadInput
@@ -0,0 +1,115 @@
+"""
+Unit tests for lead source analytics
+
+Tests cover:
+- In-memory stats when Redis is disabled
+- Buffering of counter increments for the Redis flush
+- Failed flush keeps increments for the next attempt
+- Stale rate scores in Redis do not mark a source as bad
+"""
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from lead_validator.services.analytics import AnalyticsService
+
+
+class TestInMemoryAnalytics:
+    """Test the fallback without Redis"""
+
+    @pytest.fixture
+    def analytics(self):
+        with patch('lead_validator.services.analytics.redis_service') as redis_mock:
+            redis_mock.enabled = False
+            redis_mock.get_client = AsyncMock(return_value=None)
+            yield AnalyticsService()
+
+    @pytest.mark.asyncio
+    async def test_bad_sources_sorted_by_rejection_rate(self, analytics):
+        for i in range(10):
+            analytics.record_lead("yandex", "c1", "site-a", rejected=i < 6, rejection_reason="bot_detected:honeypot")
+            analytics.record_lead("yandex", "c1", "site-b", rejected=i < 9, rejection_reason="duplicate_phone")
+
+        bad = await analytics.get_bad_sources()
+
+        assert [s.content for s in bad] == ["site-b", "site-a"]
+        assert bad[1].rejection_reasons == {"bot_detected": 6}
+
+    @pytest.mark.asyncio
+    async def test_weekly_report_totals(self, analytics):
+        analytics.record_lead("vk", rejected=False)
+        analytics.record_lead("vk", rejected=True, rejection_reason="invalid_phone")
+
+        report = await analytics.generate_weekly_report()
+
+        assert report.total_leads == 2
+        assert report.total_rejected == 1
+        assert report.top_rejection_reasons == {"invalid_phone": 1}
+
+
+class TestRedisBuffer:
+    """Test buffering of increments for the Redis flush"""
+
+    @pytest.fixture
+    def analytics(self):
+        with patch('lead_validator.services.analytics.redis_service') as redis_mock:
+            redis_mock.enabled = True
+            yield AnalyticsService(), redis_mock
+
+    def test_record_lead_only_buffers(self, analytics):
+        service, _ = analytics
+        service.record_lead("yandex", "c1", "site-a", rejected=True, rejection_reason="bot_detected:ua")
+        service.record_lead("yandex", "c1", "site-a", rejected=False)
+
+        (counts,) = service._pending.values()
+        assert counts["total"] == 2
+        assert counts["rejected"] == 1
+        assert counts["reasons"] == {"bot_detected": 1}
+        assert service._stats == {}
+
+    @pytest.mark.asyncio
+    async def test_failed_flush_keeps_increments(self, analytics):
+        service, redis_mock = analytics
+        client = MagicMock()
+        client.register_script.side_effect = ConnectionError("redis down")
+        redis_mock.get_client = AsyncMock(return_value=client)
+        service.record_lead("yandex", rejected=True, rejection_reason="duplicate_phone")
+
+        assert not await service.flush()
+
+        (counts,) = service._pending.values()
+        assert counts["total"] == 1
+        assert counts["reasons"] == {"duplicate_phone": 1}
+
+
+
+class TestRedisBadSources:
+    """Test bad sources read from Redis counters (fakeredis)"""
+
+    @pytest.fixture
+    def analytics(self):
+        fakeredis = pytest.importorskip("fakeredis")
+        pytest.importorskip("lupa")
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        with patch('lead_validator.services.analytics.redis_service') as redis_mock:
+            redis_mock.enabled = True
+            redis_mock.get_client = AsyncMock(return_value=client)
+            yield AnalyticsService(), client
+
+    @pytest.mark.asyncio
+    async def test_stale_rate_score_ignored(self, analytics):
+        service, client = analytics
+        for i in range(10):
+            service.record_lead("yandex", "c1", "site-a", rejected=i < 2, rejection_reason="invalid_phone")
+            service.record_lead("yandex", "c1", "site-b", rejected=i < 8, rejection_reason="invalid_phone")
+        assert await service.flush()
+
+        # Score left over from days that have since left the window
+        await client.zadd(service.rates_key, {"yandex|c1|site-a": 90.0})
+
+        bad = await service.get_bad_sources()
+
+        assert [s.content for s in bad] == ["site-b"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
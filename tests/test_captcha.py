@@ -0,0 +1,113 @@
+"""
+Unit tests for the SmartCaptcha verification layer
+
+Tests cover:
+- Retries of the same submission are served from the result cache
+- A token reused for another lead is rejected (local cache and Redis)
+- Provider errors are fail-open and not cached
+- Open circuit skips the provider without waiting for timeouts
+"""
+
+import pytest
+import httpx
+from unittest.mock import AsyncMock, patch
+from lead_validator.services.captcha import CaptchaValidator, REPLAY_ERROR
+from lead_validator.services.circuit_breaker import CircuitBreaker
+
+
+def make_validator() -> CaptchaValidator:
+    validator = CaptchaValidator()
+    validator.breaker = CircuitBreaker("smartcaptcha")
+    return validator
+
+
+@pytest.fixture(autouse=True)
+def captcha_settings():
+    with patch('lead_validator.services.captcha.settings.SMARTCAPTCHA_ENABLED', True), \
+         patch('lead_validator.services.captcha.settings.SMARTCAPTCHA_SERVER_KEY', "secret"), \
+         patch('lead_validator.services.captcha.settings.FAIL_OPEN_MODE', True), \
+         patch('lead_validator.services.captcha.redis_service.get_client', new=AsyncMock(return_value=None)):
+        yield
+
+
+class TestCaptchaCache:
+    """Test result caching and replay detection"""
+
+    @pytest.mark.asyncio
+    async def test_retry_of_same_submission_is_cached(self):
+        validator = make_validator()
+        validator._call_provider = AsyncMock(return_value=(True, ""))
+
+        assert await validator.validate("token", "10.0.0.1", submission="+79161234567") == (True, "")
+        assert await validator.validate("token", "10.0.0.1", submission="+79161234567") == (True, "")
+
+        validator._call_provider.assert_awaited_once()
+        assert validator.counters["cache_hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_token_reused_for_other_lead_is_replay(self):
+        validator = make_validator()
+        validator._call_provider = AsyncMock(return_value=(True, ""))
+
+        await validator.validate("token", submission="+79161234567")
+        result = await validator.validate("token", submission="+79160000000")
+
+        assert result == (False, REPLAY_ERROR)
+        assert validator.counters["replays"] == 1
+
+    @pytest.mark.asyncio
+    async def test_replay_across_processes_via_redis(self):
+        fakeredis = pytest.importorskip("fakeredis")
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        first, second = make_validator(), make_validator()
+        first._call_provider = AsyncMock(return_value=(True, ""))
+        second._call_provider = AsyncMock(return_value=(True, ""))
+
+        with patch('lead_validator.services.captcha.redis_service.get_client', new=AsyncMock(return_value=client)):
+            assert (await first.validate("token", submission="+79161234567"))[0]
+            assert await second.validate("token", submission="+79160000000") == (False, REPLAY_ERROR)
+            assert (await second.validate("token", submission="+79161234567"))[0]
+
+        second._call_provider.assert_not_awaited()
+
+
+class TestCaptchaProvider:
+    """Test provider metrics and fail-open decisions"""
+
+    @pytest.mark.asyncio
+    async def test_timeout_is_fail_open_and_not_cached(self):
+        validator = make_validator()
+        validator._call_provider = AsyncMock(side_effect=httpx.ReadTimeout("slow"))
+
+        assert await validator.validate("token") == (True, "")
+        assert await validator.validate("token") == (True, "")
+
+        assert validator._call_provider.await_count == 2
+        assert validator.breaker.snapshot()["error_rate"] == 1.0
+
+    @pytest.mark.asyncio
+    async def test_open_circuit_skips_provider(self):
+        validator = make_validator()
+        validator._call_provider = AsyncMock(side_effect=httpx.ConnectError("down"))
+
+        with patch('lead_validator.services.circuit_breaker.settings.BREAKER_MIN_CALLS', 3):
+            for i in range(6):
+                assert await validator.validate(f"token-{i}") == (True, "")
+
+        # Three errors open the circuit, the rest fail open without a call
+        assert validator._call_provider.await_count == 3
+        assert validator.breaker.state == "open"
+        assert validator.breaker.rejected == 3
+
+    @pytest.mark.asyncio
+    async def test_rejected_token_is_cached(self):
+        validator = make_validator()
+        validator._call_provider = AsyncMock(return_value=(False, "CAPTCHA: invalid"))
+
+        assert await validator.validate("bad") == (False, "CAPTCHA: invalid")
+        assert await validator.validate("bad") == (False, "CAPTCHA: invalid")
+        validator._call_provider.assert_awaited_once()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,213 @@
+"""
+Unit tests for circuit breakers and the per-lead deadline
+
+Tests cover:
+- Circuit opens after the failure rate threshold and rejects calls
+- Half-open probe closes or re-opens the circuit
+- Slow calls count as failures, expected exceptions as successes
+- run_concurrent fails open (or rejects) when the deadline expires
+- Calls cancelled by the deadline count as failures and open the circuit
+"""
+
+import asyncio
+import pytest
+from unittest.mock import patch
+from lead_validator.pipeline import run_concurrent
+from lead_validator.services.circuit_breaker import CircuitBreaker, BreakerRegistry
+
+
+@pytest.fixture(autouse=True)
+def breaker_settings():
+    with patch('lead_validator.services.circuit_breaker.settings.BREAKER_MIN_CALLS', 4), \
+         patch('lead_validator.services.circuit_breaker.settings.BREAKER_FAILURE_RATE', 0.5), \
+         patch('lead_validator.services.circuit_breaker.settings.BREAKER_SLOW_CALL_MS', 100), \
+         patch('lead_validator.services.circuit_breaker.settings.BREAKER_OPEN_SEC', 5.0):
+        yield
+
+
+def fail(breaker: CircuitBreaker, times: int) -> None:
+    for _ in range(times):
+        with pytest.raises(ConnectionError):
+            with breaker.track():
+                raise ConnectionError("down")
+
+
+class TestCircuitBreaker:
+    """Test breaker state transitions"""
+
+    def test_opens_after_failure_rate(self):
+        breaker = CircuitBreaker("test")
+        breaker.record(5, ok=True)
+        fail(breaker, 2)
+        # Below BREAKER_MIN_CALLS the circuit stays closed
+        assert breaker.state == "closed"
+
+        fail(breaker, 1)
+        assert breaker.state == "open"
+        assert not breaker.allow()
+        assert breaker.rejected == 1
+
+    def test_mostly_successful_calls_keep_circuit_closed(self):
+        breaker = CircuitBreaker("test")
+        for _ in range(7):
+            breaker.record(5, ok=True)
+        fail(breaker, 3)
+        assert breaker.state == "closed"
+        assert breaker.snapshot()["error_rate"] == 0.3
+
+    def test_half_open_probe_closes_circuit(self):
+        breaker = CircuitBreaker("test")
+        fail(breaker, 4)
+        breaker.opened_at -= 10
+
+        # Only one probe is let through
+        assert breaker.allow()
+        assert not breaker.allow()
+        with breaker.track():
+            pass
+        assert breaker.state == "closed"
+        assert breaker.allow()
+
+    def test_failed_probe_reopens_circuit(self):
+        breaker = CircuitBreaker("test")
+        fail(breaker, 4)
+        breaker.opened_at -= 10
+
+        assert breaker.allow()
+        fail(breaker, 1)
+        assert breaker.state == "open"
+        assert not breaker.allow()
+
+    def test_slow_call_counts_as_failure(self):
+        breaker = CircuitBreaker("test")
+        for _ in range(4):
+            breaker.record(500, ok=True)
+        assert breaker.state == "open"
+
+    def test_expected_exception_counts_as_success(self):
+        breaker = CircuitBreaker("test")
+        for _ in range(4):
+            with pytest.raises(KeyError):
+                with breaker.track(KeyError):
+                    raise KeyError("no such record")
+        assert breaker.state == "closed"
+        assert breaker.snapshot()["calls"] == 4
+
+    def test_registry_reuses_breakers(self):
+        registry = BreakerRegistry()
+        assert registry.get("dns") is registry.get("dns")
+        registry.get("redis").record(12, ok=True)
+        snapshot = registry.snapshot()
+        assert list(snapshot) == ["dns", "redis"]
+        assert snapshot["redis"]["latency_p50_ms"] == 12
+
+
+class TestLeadDeadline:
+    """Test the deadline of concurrent remote checks"""
+
+    @staticmethod
+    def checks():
+        async def fast():
+            return None
+
+        async def slow():
+            await asyncio.sleep(5)
+            return "slow_rejection"
+
+        return {"fast": fast, "slow": slow}
+
+    @pytest.mark.asyncio
+    async def test_deadline_fails_open(self):
+        timings = {}
+        with patch('lead_validator.pipeline.settings.FAIL_OPEN_MODE', True):
+            result = await run_concurrent(self.checks(), timings, deadline=0.05)
+        assert result is None
+        # The unfinished check is cancelled at the deadline
+        assert timings["slow"] < 1000
+
+    @pytest.mark.asyncio
+    async def test_deadline_rejects_without_fail_open(self):
+        with patch('lead_validator.pipeline.settings.FAIL_OPEN_MODE', False):
+            result = await run_concurrent(self.checks(), {}, deadline=0.05)
+        assert result == "deadline_exceeded"
+
+    @pytest.mark.asyncio
+    async def test_rejection_before_deadline_wins(self):
+        async def reject():
+            return "rejected"
+
+        checks = {**self.checks(), "reject": reject}
+        assert await run_concurrent(checks, {}, deadline=1.0) == "rejected"
+
+
+class TestDeadlineCancellation:
+    """Test breaker accounting of calls cancelled by run_concurrent"""
+
+    @staticmethod
+    def hung_check(breaker: CircuitBreaker, started: asyncio.Event = None):
+        async def call():
+            if not breaker.allow():
+                return None  # fail-open
+            with breaker.track():
+                if started is not None:
+                    started.set()
+                await asyncio.Event().wait()  # never returns
+        return call
+
+    @pytest.mark.asyncio
+    async def test_hung_upstream_opens_circuit(self):
+        breaker = CircuitBreaker("hung")
+
+        with patch('lead_validator.pipeline.settings.FAIL_OPEN_MODE', True):
+            for _ in range(30):
+                await run_concurrent({"upstream": self.hung_check(breaker)}, {}, deadline=0.01)
+
+        assert breaker.state == "open"
+        # Only BREAKER_MIN_CALLS leads paid the deadline, the rest failed open at once
+        assert breaker.snapshot()["calls"] == 4
+        assert breaker.rejected == 26
+
+    @pytest.mark.asyncio
+    async def test_cancel_after_rejection_not_recorded(self):
+        breaker = CircuitBreaker("hung")
+
+        async def reject():
+            await asyncio.sleep(0)
+            return "rejected"
+
+        checks = {"upstream": self.hung_check(breaker), "reject": reject}
+        assert await run_concurrent(checks, {}, deadline=1.0) == "rejected"
+        assert breaker.snapshot()["calls"] == 0
+
+    @pytest.mark.asyncio
+    async def test_cancelled_probe_lets_next_probe_through(self):
+        breaker = CircuitBreaker("hung")
+        fail(breaker, 4)
+        breaker.opened_at -= 10
+        started = asyncio.Event()
+
+        task = asyncio.create_task(self.hung_check(breaker, started)())
+        await started.wait()
+        assert not breaker.allow()
+
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert breaker.allow()
+
+    @pytest.mark.asyncio
+    async def test_cancelled_other_call_keeps_probe(self):
+        breaker = CircuitBreaker("hung")
+        # Call started while the circuit was still closed
+        other = asyncio.create_task(self.hung_check(breaker)())
+        await asyncio.sleep(0)
+        fail(breaker, 4)
+        breaker.opened_at -= 10
+        assert breaker.allow()  # the probe
+
+        other.cancel()
+        await asyncio.gather(other, return_exceptions=True)
+        assert not breaker.allow()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,111 @@
+"""
+Unit tests for the DaData response cache
+
+Tests cover:
+- Cache hit skips the paid API call
+- Concurrent lookups of one phone are coalesced
+- Errors are not cached
+- Caller cancellation does not lose a paid response
+"""
+
+import pytest
+import asyncio
+import json
+from unittest.mock import AsyncMock, patch
+from lead_validator.services.dadata import DaDataService
+
+
+PHONE_RESPONSE = {"source": "+79161234567", "qc": 0, "type": "Мобильный", "phone": "+7 916 123-45-67"}
+
+
+class FakeCache:
+    """In-memory stand-in for redis_service.cache_get/cache_set"""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ttl):
+        self.data[key] = value
+        return True
+
+
+@pytest.fixture
+def cache():
+    fake = FakeCache()
+    with patch('lead_validator.services.dadata.redis_service.cache_get', new=fake.get), \
+         patch('lead_validator.services.dadata.redis_service.cache_set', new=fake.set):
+        yield fake
+
+
+class TestDaDataCache:
+    """Test cached and coalesced DaData lookups"""
+
+    @pytest.mark.asyncio
+    async def test_second_lookup_is_served_from_cache(self, cache):
+        service = DaDataService()
+        service._fetch_phone = AsyncMock(return_value=PHONE_RESPONSE)
+
+        first = await service.validate_phone("+79161234567")
+        second = await service.validate_phone("+7 (916) 123-45-67")
+
+        assert first.qc == 0 and second.type == "Мобильный"
+        service._fetch_phone.assert_awaited_once()
+        assert service.stats["cache_hits"] == 1
+        # The phone only appears hashed in the cache key
+        assert all("79161234567" not in key for key in cache.data)
+
+    @pytest.mark.asyncio
+    async def test_concurrent_lookups_are_coalesced(self, cache):
+        service = DaDataService()
+        calls = 0
+
+        async def slow_fetch(phone):
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return PHONE_RESPONSE
+
+        service._fetch_phone = slow_fetch
+        results = await asyncio.gather(*[service.validate_phone("+79161234567") for _ in range(5)])
+
+        assert calls == 1
+        assert all(r.qc == 0 for r in results)
+        assert service.stats["coalesced"] == 4
+        assert not service._inflight
+
+    @pytest.mark.asyncio
+    async def test_error_is_not_cached(self, cache):
+        service = DaDataService()
+        service._fetch_email = AsyncMock(return_value=None)
+
+        assert await service.validate_email("user@example.ru") is None
+        assert await service.validate_email("user@example.ru") is None
+
+        assert service._fetch_email.await_count == 2
+        assert not cache.data
+
+    @pytest.mark.asyncio
+    async def test_cancelled_caller_still_caches_response(self, cache):
+        service = DaDataService()
+        release = asyncio.Event()
+
+        async def fetch(email):
+            await release.wait()
+            return {"source": email, "qc": 0, "type": "PERSONAL"}
+
+        service._fetch_email = fetch
+        caller = asyncio.create_task(service.validate_email("User@Example.ru"))
+        await asyncio.sleep(0)
+        caller.cancel()
+        release.set()
+        await asyncio.sleep(0.01)
+
+        assert len(cache.data) == 1
+        assert json.loads(next(iter(cache.data.values())))["type"] == "PERSONAL"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,93 @@
+"""
+Unit tests for the async MX validator
+
+Tests cover:
+- Bounded TTL cache
+- Positive/negative caching of DNS answers
+- Timeouts are not cached (fail-open)
+"""
+
+import pytest
+import dns.exception
+import dns.resolver
+from unittest.mock import AsyncMock, MagicMock, patch
+from lead_validator.services.email_mx_validator import EmailMXValidator, MXCache, MXCheckResult
+
+
+def mx_answer(exchanges, ttl=600):
+    """Build a fake dns.asyncresolver answer"""
+    answer = MagicMock()
+    answer.__iter__.return_value = [MagicMock(exchange=f"{e}.") for e in exchanges]
+    answer.rrset.ttl = ttl
+    return answer
+
+
+class TestMXCache:
+    """Test the bounded TTL cache"""
+
+    def test_evicts_least_recently_used(self):
+        cache = MXCache(max_size=2)
+        result = MXCheckResult(has_mx=True, mx_records=[])
+        cache.set("a.ru", result, 60)
+        cache.set("b.ru", result, 60)
+        cache.get("a.ru")
+        cache.set("c.ru", result, 60)
+
+        assert cache.get("a.ru") is result
+        assert cache.get("b.ru") is None
+        assert len(cache) == 2
+
+    def test_expired_entry_is_dropped(self):
+        cache = MXCache(max_size=10)
+        cache.set("a.ru", MXCheckResult(has_mx=True, mx_records=[]), 60)
+
+        with patch('lead_validator.services.email_mx_validator.time.monotonic', return_value=10 ** 9):
+            assert cache.get("a.ru") is None
+
+
+class TestEmailMXValidator:
+    """Test check_mx with a mocked async resolver"""
+
+    @pytest.fixture
+    def validator(self):
+        v = EmailMXValidator()
+        v._resolver = MagicMock()
+        with patch('lead_validator.services.email_mx_validator.settings.MX_CACHE_SHARED', False):
+            yield v
+
+    @pytest.mark.asyncio
+    async def test_positive_answer_is_cached(self, validator):
+        validator._resolver.resolve = AsyncMock(return_value=mx_answer(["mx.example.ru"]))
+
+        first = await validator.check_mx("user@example.ru")
+        second = await validator.check_mx("other@Example.ru")
+
+        assert first.has_mx and first.mx_records == ["mx.example.ru"]
+        assert second is first
+        validator._resolver.resolve.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_nxdomain_is_negatively_cached(self, validator):
+        validator._resolver.resolve = AsyncMock(side_effect=dns.resolver.NXDOMAIN())
+
+        result = await validator.check_mx("user@no-such-domain.ru")
+        await validator.check_mx("user@no-such-domain.ru")
+
+        assert not result.has_mx
+        assert result.error == "domain_not_found"
+        validator._resolver.resolve.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_timeout_is_fail_open_and_not_cached(self, validator):
+        validator._resolver.resolve = AsyncMock(side_effect=dns.exception.Timeout())
+
+        result = await validator.check_mx("user@slow.ru")
+        await validator.check_mx("user@slow.ru")
+
+        assert result.has_mx
+        assert result.error == "dns_timeout"
+        assert validator._resolver.resolve.await_count == 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
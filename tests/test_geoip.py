@@ -0,0 +1,106 @@
+"""
+Unit tests for the offline GeoIP resolver
+
+Tests cover:
+- DB-IP (IP strings), IP2Location (integers) and CIDR CSV formats
+- IPv4, IPv6 and IPv4-mapped IPv6 lookups, gaps between ranges
+- Per-IP cache and private addresses
+- LeadValidator fills geo_country from the client IP
+"""
+
+import pytest
+from unittest.mock import patch
+from lead_validator.schemas import LeadInput
+from lead_validator.validators import lead_validator
+from lead_validator.services.geoip import GeoIPResolver
+from lead_validator.services.utm_validator import utm_validator, UTMData
+
+DBIP_CSV = (
+    "5.3.0.0,5.3.255.255,RU\n"
+    "5.8.0.0,5.8.255.255,UA\n"
+    "2a00:1fa0::,2a00:1fa0:ffff:ffff:ffff:ffff:ffff:ffff,RU\n"
+    "6.0.0.0,6.0.0.255,ZZ\n"
+)
+IP2LOCATION_CSV = (
+    '"ip_from","ip_to","country_code","country_name"\n'
+    '"16777216","16777471","AU","Australia"\n'
+    '"281470766153728","281470766153983","BY","Belarus"\n'
+)
+CIDR_CSV = "network,country\n77.88.0.0/18,RU\n"
+
+
+@pytest.fixture
+def resolver(tmp_path):
+    path = tmp_path / "geoip.csv"
+    path.write_text(DBIP_CSV, encoding="utf-8")
+    resolver = GeoIPResolver()
+    assert resolver.load(str(path))
+    return resolver
+
+
+class TestGeoIPLookup:
+    """Test range lookups"""
+
+    def test_ipv4(self, resolver):
+        assert resolver.country("5.3.10.1") == "RU"
+        assert resolver.country("5.8.0.0") == "UA"
+        assert resolver.country("5.5.0.1") is None  # Gap between ranges
+        assert resolver.country("6.0.0.1") is None  # Unknown country skipped
+
+    def test_ipv6_and_mapped(self, resolver):
+        assert resolver.country("2a00:1fa0:42::1") == "RU"
+        assert resolver.country("2a00:1fa1::1") is None
+        assert resolver.country("::ffff:5.8.1.1") == "UA"
+
+    def test_cache_and_private_addresses(self, resolver):
+        assert resolver.country("5.3.10.1") == "RU"
+        assert resolver.country("5.3.10.1") == "RU"
+        assert resolver.country("10.0.0.1") is None
+        assert resolver.country("10.0.0.1") is None
+        assert resolver.country("not-an-ip") is None
+        assert resolver.stats["cache_hits"] == 2
+
+    def test_integer_and_cidr_formats(self, tmp_path):
+        ip2location = tmp_path / "ip2location.csv"
+        ip2location.write_text(IP2LOCATION_CSV, encoding="utf-8")
+        cidr = tmp_path / "cidr.csv"
+        cidr.write_text(CIDR_CSV, encoding="utf-8")
+
+        resolver = GeoIPResolver()
+        assert resolver.load(str(ip2location))
+        assert resolver.country("1.0.0.7") == "AU"
+        # IPv4-mapped integers from the IPv6 edition are stored as IPv4
+        assert resolver.country("5.8.0.9") == "BY"
+
+        assert resolver.load(str(cidr))
+        assert resolver.country("77.88.21.3") == "RU"
+
+    def test_missing_database(self, tmp_path):
+        resolver = GeoIPResolver()
+        assert not resolver.load(str(tmp_path / "missing.csv"))
+        assert resolver.country("5.3.10.1") is None
+
+
+class TestLeadGeoCountry:
+    """Test geo_country enrichment in LeadValidator"""
+
+    def test_geo_mismatch_detected_from_ip(self, resolver):
+        result = utm_validator.validate(
+            UTMData(source="yandex"),
+            geo_country=resolver.country("5.8.1.1")
+        )
+        assert "geo_mismatch:source=yandex,country=UA" in result.warning
+
+    @pytest.mark.asyncio
+    async def test_validate_fills_geo_country(self, resolver):
+        lead = LeadInput(phone="123", utm_source="yandex")
+
+        with patch('lead_validator.validators.geoip_resolver', resolver), \
+             patch('lead_validator.validators.trash_logger.log_rejected'):
+            await lead_validator.validate(lead, client_ip="5.3.10.1")
+
+        assert lead.geo_country == "RU"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
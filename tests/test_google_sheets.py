@@ -0,0 +1,152 @@
+"""
+Unit tests for Google Sheets export
+
+Tests cover:
+- Sheet metadata caching
+- Incremental Raw Data export from a date
+- Fallback to full rewrite for legacy/unsorted sheets
+- Tail of the sheet is cleared only after a successful write
+"""
+
+import pytest
+from datetime import date
+from unittest.mock import Mock, MagicMock, patch
+from automation.google_sheets import GoogleSheetsService, RAW_DATA_HEADER
+
+
+def make_service(column_values=None, titles=("Raw Data",)):
+    """Build GoogleSheetsService with a mocked googleapiclient resource"""
+    with patch('automation.google_sheets.os.path.exists', return_value=False):
+        gs = GoogleSheetsService()
+    gs.service = MagicMock()
+    spreadsheets = gs.service.spreadsheets.return_value
+    spreadsheets.get.return_value.execute.return_value = {
+        "sheets": [{"properties": {"title": t}} for t in titles]
+    }
+    spreadsheets.values.return_value.get.return_value.execute.return_value = {
+        "values": column_values or []
+    }
+    return gs, spreadsheets
+
+
+@pytest.fixture(autouse=True)
+def clear_metadata_cache():
+    GoogleSheetsService._sheet_titles.clear()
+    yield
+    GoogleSheetsService._sheet_titles.clear()
+
+
+class TestSheetMetadataCache:
+    """Test that spreadsheet metadata is fetched once"""
+
+    def test_metadata_fetched_once(self):
+        """Several writes to the same spreadsheet fetch metadata only once"""
+        gs, spreadsheets = make_service()
+
+        gs._write_to_sheet("sheet-id", "Raw Data!A1", [["a"]])
+        gs._write_to_sheet("sheet-id", "Raw Data!A1", [["b"]])
+
+        assert spreadsheets.get.call_count == 1
+        spreadsheets.batchUpdate.assert_not_called()
+
+    def test_missing_sheet_created_and_cached(self):
+        """A missing sheet is created once and remembered"""
+        gs, spreadsheets = make_service(titles=())
+
+        gs._write_to_sheet("sheet-id", "Goals!A1", [["a"]])
+        gs._write_to_sheet("sheet-id", "Goals!A1", [["b"]])
+
+        assert spreadsheets.batchUpdate.call_count == 1
+
+
+class TestIncrementalRawData:
+    """Test incremental export of the Raw Data sheet"""
+
+    def test_find_first_row(self):
+        """First row dated `since` or later is located in a sorted sheet"""
+        column = [["Date"], ["2024-01-01"], ["2024-01-02"], ["2024-01-03"]]
+        gs, _ = make_service(column)
+
+        assert gs._find_first_row("sheet-id", "Raw Data", "2024-01-02") == 3
+        assert gs._find_first_row("sheet-id", "Raw Data", "2024-02-01") == 5
+
+    def test_unsorted_sheet_falls_back(self):
+        """Legacy layout (not date-ordered) can't be updated incrementally"""
+        column = [["Date"], ["2024-01-03"], ["2024-01-01"]]
+        gs, _ = make_service(column)
+
+        assert gs._find_first_row("sheet-id", "Raw Data", "2024-01-02") is None
+
+    def test_export_writes_from_first_changed_row(self):
+        """Only rows from the first changed date are rewritten"""
+        column = [["Date"], ["2024-01-01"], ["2024-01-02"]]
+        gs, spreadsheets = make_service(column)
+        rows = [["2024-01-02", "VK", "Campaign", 10, 1, 5.0, 0]]
+
+        with patch.object(gs, '_fetch_raw_rows', return_value=rows):
+            gs.export_raw_data("sheet-id", "client", Mock(), since=date(2024, 1, 2))
+
+        values = spreadsheets.values.return_value
+        values.clear.assert_called_once_with(spreadsheetId="sheet-id", range="Raw Data!A4:Z")
+        body = values.batchUpdate.call_args.kwargs["body"]
+        assert body["data"] == [{"range": "Raw Data!A3", "values": rows}]
+
+    def test_export_without_since_rewrites_sheet(self):
+        """Full export writes the header and all rows from A1"""
+        gs, spreadsheets = make_service()
+        rows = [["2024-01-01", "Yandex", "Campaign", 10, 1, 5.0, 0]]
+
+        with patch.object(gs, '_fetch_raw_rows', return_value=rows):
+            gs.export_raw_data("sheet-id", "client", Mock())
+
+        body = spreadsheets.values.return_value.batchUpdate.call_args.kwargs["body"]
+        assert body["data"] == [{"range": "Raw Data!A1", "values": [RAW_DATA_HEADER] + rows}]
+
+    def test_unsorted_sheet_rewritten_with_full_history(self):
+        """Fallback rewrite refetches all rows, not only the rows since `since`"""
+        column = [["Date"], ["2024-01-03"], ["2024-01-01"]]
+        gs, spreadsheets = make_service(column)
+        old_rows = [["2024-01-01", "Yandex", "Campaign", 10, 1, 5.0, 0]]
+        new_rows = [["2024-01-03", "VK", "Campaign", 20, 2, 7.0, 1]]
+
+        def fetch(db, client_id, since):
+            return new_rows if since else old_rows + new_rows
+
+        with patch.object(gs, '_fetch_raw_rows', side_effect=fetch) as fetch_mock:
+            gs.export_raw_data("sheet-id", "client", Mock(), since=date(2024, 1, 2))
+
+        fetch_mock.assert_called_once()
+        assert fetch_mock.call_args.args[2] is None
+        body = spreadsheets.values.return_value.batchUpdate.call_args.kwargs["body"]
+        assert body["data"] == [{"range": "Raw Data!A1", "values": [RAW_DATA_HEADER] + old_rows + new_rows}]
+
+
+class TestWriteRows:
+    """Test ordering of writes and tail cleanup"""
+
+    def test_tail_cleared_after_write(self):
+        """Rows below the written block are cleared after batchUpdate"""
+        gs, spreadsheets = make_service()
+        values = spreadsheets.values.return_value
+        calls = []
+        values.batchUpdate.side_effect = lambda **kw: calls.append("write") or MagicMock()
+        values.clear.side_effect = lambda **kw: calls.append("clear") or MagicMock()
+
+        gs._write_rows("sheet-id", "Raw Data", 2, [["a"], ["b"]])
+
+        assert calls == ["write", "clear"]
+        values.clear.assert_called_once_with(spreadsheetId="sheet-id", range="Raw Data!A4:Z")
+
+    def test_failed_write_keeps_tail(self):
+        """A failed batchUpdate leaves the existing rows in place"""
+        gs, spreadsheets = make_service()
+        values = spreadsheets.values.return_value
+        values.batchUpdate.return_value.execute.side_effect = Exception("quota exceeded")
+
+        gs._write_rows("sheet-id", "Raw Data", 2, [["a"]])
+
+        values.clear.assert_not_called()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
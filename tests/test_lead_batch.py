@@ -0,0 +1,236 @@
+"""
+Unit tests for batch lead validation (/lead/batch)
+
+Tests cover:
+- NDJSON parsing across chunk boundaries
+- Results stream back with their input index
+- Invalid items do not stop the batch
+- Replay mode skips CAPTCHA and stale timestamps
+- Replay sends Telegram/Metrica side effects only with notify
+- Streamed NDJSON bodies through a real uvicorn server
+- Duplicates inside one batch are resolved through the Redis pipeline
+- Replay is not rate limited by the IP of the stored leads
+"""
+
+import pytest
+import json
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+import httpx
+from fastapi import FastAPI
+from core import security
+from lead_validator.batch import iter_list, iter_ndjson, validate_stream
+from lead_validator.schemas import ValidationResult
+from lead_validator.services.dadata import DaDataPhoneResponse
+from lead_validator.services.redis_service import LeadCheckResult, RedisService
+from lead_validator.router import router
+from lead_validator.validators import lead_validator
+
+
+async def chunks(*parts):
+    for part in parts:
+        yield part
+
+
+async def collect(stream):
+    return [json.loads(line) async for line in stream]
+
+
+class TestBatchInput:
+    """Test request body parsing"""
+
+    @pytest.mark.asyncio
+    async def test_ndjson_lines_split_across_chunks(self):
+        items = [i async for i in iter_ndjson(chunks(b'{"phone": "1"}\n{"pho', b'ne": "2"}\n\nnot json\n{"phone": "3"}'))]
+
+        assert items == [({"phone": "1"}, None), ({"phone": "2"}, None), (None, "invalid_json"), ({"phone": "3"}, None)]
+
+
+class TestValidateStream:
+    """Test concurrent validation with streamed results"""
+
+    @pytest.mark.asyncio
+    async def test_every_item_gets_an_indexed_result(self):
+        ok = ValidationResult(success=True, execution_time_ms=1.0)
+
+        with patch('lead_validator.batch.lead_validator.validate', new=AsyncMock(return_value=ok)) as validate:
+            lines = await collect(validate_stream(iter_list([
+                {"phone": "+79161234567", "client_ip": "10.0.0.1"},
+                {"name": "no phone"},
+                {"phone": "+79161234568"},
+            ])))
+
+        by_index = {line["index"]: line for line in lines}
+        assert set(by_index) == {0, 1, 2}
+        assert by_index[0]["success"] and by_index[2]["success"]
+        assert by_index[1]["rejection_reason"] == "invalid_input:phone"
+        assert validate.await_args_list[0].args[1] == "10.0.0.1"
+        assert validate.await_args_list[0].kwargs == {"replay": True, "notify": False}
+
+    @pytest.mark.asyncio
+    async def test_batch_size_limit(self):
+        ok = ValidationResult(success=True, execution_time_ms=1.0)
+
+        with patch('lead_validator.batch.settings.LEAD_BATCH_MAX_SIZE', 2), \
+             patch('lead_validator.batch.lead_validator.validate', new=AsyncMock(return_value=ok)):
+            lines = await collect(validate_stream(iter_list([{"phone": f"+7916123456{i}"} for i in range(3)])))
+
+        assert len([line for line in lines if "index" in line]) == 2
+        assert {"error": "batch_too_large", "max_size": 2} in lines
+
+
+class TestReplayMode:
+    """Test LeadValidator.validate(replay=True)"""
+
+    @pytest.mark.asyncio
+    async def test_replay_skips_captcha_and_timestamp(self):
+        lead_data = {"phone": "+79161234567", "timestamp": int(time.time()) - 86400}
+        dadata = DaDataPhoneResponse(source="+79161234567", qc=0, type="Мобильный")
+
+        with patch('lead_validator.validators.dadata_service.validate_phone', new=AsyncMock(return_value=dadata)), \
+             patch('lead_validator.validators.redis_service.check_lead', new=AsyncMock(return_value=LeadCheckResult(reserved=True))), \
+             patch('lead_validator.validators.redis_service.mark_lead', new=AsyncMock(return_value=True)), \
+             patch('lead_validator.validators.captcha_validator.validate', new=AsyncMock(return_value=(False, "no_token"))) as captcha, \
+             patch('lead_validator.validators.telegram_notifier.send_new_lead', new=AsyncMock(return_value=True)), \
+             patch('lead_validator.validators.metrica_service.send_quality_lead', new=AsyncMock(return_value=True)):
+
+            lines = await collect(validate_stream(iter_list([lead_data])))
+
+        assert lines[0]["success"], lines[0]
+        assert "captcha" not in lines[0]["stage_timings_ms"]
+        captcha.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("notify", [False, True])
+    async def test_side_effects_only_with_notify(self, notify):
+        timestamp = int(time.time()) - 86400
+        lead_data = {"phone": "+79161234567", "ym_uid": "ym-1", "timestamp": timestamp}
+        dadata = DaDataPhoneResponse(source="+79161234567", qc=0, type="Мобильный")
+
+        with patch('lead_validator.validators.dadata_service.validate_phone', new=AsyncMock(return_value=dadata)), \
+             patch('lead_validator.validators.redis_service.check_lead', new=AsyncMock(return_value=LeadCheckResult(reserved=True))), \
+             patch('lead_validator.validators.redis_service.mark_lead', new=AsyncMock(return_value=True)), \
+             patch('lead_validator.validators.telegram_notifier.enabled', True), \
+             patch('lead_validator.validators.metrica_service.enabled', True), \
+             patch('lead_validator.validators.outbox.enqueue', new=AsyncMock()) as enqueue, \
+             patch('lead_validator.validators.metrica_service.send_quality_lead', new=AsyncMock(return_value=True)) as metrica:
+
+            lines = await collect(validate_stream(iter_list([lead_data]), notify=notify))
+
+        assert lines[0]["success"], lines[0]
+        assert enqueue.await_count == int(notify)
+        assert metrica.await_count == int(notify)
+        if notify:
+            # Conversion keeps the time of the original lead
+            assert metrica.await_args.kwargs["conversion_time"] == datetime.fromtimestamp(timestamp)
+
+    @pytest.mark.asyncio
+    async def test_duplicates_in_one_batch(self):
+        fakeredis = pytest.importorskip("fakeredis")
+        pytest.importorskip("lupa")
+        service = RedisService()
+        service.enabled = True
+        service._client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        dadata = DaDataPhoneResponse(source="+79161234567", qc=0, type="Мобильный")
+
+        with patch('lead_validator.validators.redis_service', service), \
+             patch('lead_validator.validators.dadata_service.validate_phone', new=AsyncMock(return_value=dadata)), \
+             patch('lead_validator.validators.telegram_notifier.send_new_lead', new=AsyncMock(return_value=True)), \
+             patch('lead_validator.validators.metrica_service.send_quality_lead', new=AsyncMock(return_value=True)), \
+             patch('lead_validator.validators.trash_logger.log_rejected', new=AsyncMock(return_value=True)):
+
+            lines = await collect(validate_stream(iter_list([{"phone": "+79161234567"}] * 3)))
+
+        reasons = sorted(str(line["rejection_reason"]) for line in lines)
+        assert reasons == ["None", "duplicate_phone", "duplicate_phone"]
+
+    @pytest.mark.asyncio
+    async def test_replay_skips_rate_limits(self):
+        fakeredis = pytest.importorskip("fakeredis")
+        pytest.importorskip("lupa")
+        service = RedisService()
+        service.enabled = True
+        service._client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        dadata = DaDataPhoneResponse(source="+79161234567", qc=0, type="Мобильный")
+        leads = [{"phone": f"+791612345{i:02d}", "client_ip": "10.0.0.1"} for i in range(15)]
+
+        with patch('lead_validator.validators.redis_service', service), \
+             patch('lead_validator.validators.settings.RATE_LIMIT_PER_IP', 10), \
+             patch('lead_validator.validators.dadata_service.validate_phone', new=AsyncMock(return_value=dadata)), \
+             patch('lead_validator.validators.trash_logger.log_rejected', new=AsyncMock(return_value=True)):
+
+            lines = await collect(validate_stream(iter_list(leads)))
+
+        assert [line["rejection_reason"] for line in lines] == [None] * 15
+
+
+
+@pytest.fixture
+def lead_server():
+    """The lead router served by uvicorn in a thread (ASGI 2.3 like production)"""
+    uvicorn = pytest.importorskip("uvicorn")
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[security.get_current_user] = lambda: SimpleNamespace(id=1)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="error", lifespan="off"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        assert time.monotonic() < deadline, "uvicorn did not start"
+        time.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}"
+    server.should_exit = True
+    thread.join(timeout=5)
+
+
+class TestBatchEndpoint:
+    """Test POST /lead/batch through uvicorn"""
+
+    LEADS = [{"phone": f"+7916{i:07d}"} for i in range(200)]
+
+    def post(self, base_url, content, content_type="application/x-ndjson"):
+        ok = ValidationResult(success=True, execution_time_ms=1.0)
+        with patch('lead_validator.batch.lead_validator.validate', new=AsyncMock(return_value=ok)):
+            response = httpx.post(
+                f"{base_url}/lead/batch", content=content,
+                headers={"Content-Type": content_type}, timeout=10
+            )
+        return response
+
+    def test_streamed_ndjson_body(self, lead_server):
+        def body():
+            for lead in self.LEADS:
+                yield (json.dumps(lead) + "\n").encode()
+
+        response = self.post(lead_server, body())
+
+        assert response.status_code == 200
+        indexes = {json.loads(line)["index"] for line in response.text.splitlines()}
+        assert indexes == set(range(len(self.LEADS)))
+
+    def test_single_chunk_ndjson_body(self, lead_server):
+        response = self.post(lead_server, "".join(json.dumps(lead) + "\n" for lead in self.LEADS))
+
+        assert response.status_code == 200
+        assert len(response.text.splitlines()) == len(self.LEADS)
+
+    def test_json_array_body(self, lead_server):
+        response = self.post(lead_server, json.dumps(self.LEADS), "application/json")
+
+        assert response.status_code == 200
+        assert len(response.text.splitlines()) == len(self.LEADS)
+
+    def test_ndjson_over_max_size(self, lead_server):
+        with patch('lead_validator.router.settings.LEAD_BATCH_MAX_SIZE', 10):
+            response = self.post(lead_server, "".join(json.dumps(lead) + "\n" for lead in self.LEADS))
+
+        assert response.status_code == 413
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,129 @@
+"""
+Unit tests for the lead validation pipeline
+
+Tests cover:
+- Concurrent execution of independent remote checks
+- Cancellation on the first rejection
+- Per-stage timings in ValidationResult
+"""
+
+import pytest
+import asyncio
+import time
+from unittest.mock import AsyncMock, patch
+from lead_validator.pipeline import run_concurrent
+from lead_validator.schemas import LeadInput
+from lead_validator.validators import lead_validator
+from lead_validator.services.dadata import DaDataPhoneResponse
+from lead_validator.services.redis_service import LeadCheckResult
+
+
+class TestRunConcurrent:
+    """Test the concurrent stage executor"""
+
+    @pytest.mark.asyncio
+    async def test_checks_run_concurrently(self):
+        """Total time is close to the slowest check, not the sum"""
+        async def slow():
+            await asyncio.sleep(0.1)
+            return None
+
+        timings = {}
+        started = time.perf_counter()
+        result = await run_concurrent({"a": slow, "b": slow, "c": slow}, timings)
+        elapsed = time.perf_counter() - started
+
+        assert result is None
+        assert elapsed < 0.25
+        assert set(timings) == {"a", "b", "c"}
+
+    @pytest.mark.asyncio
+    async def test_first_rejection_cancels_rest(self):
+        """A fast rejection cancels checks that are still running"""
+        cancelled = asyncio.Event()
+
+        async def reject():
+            return "rejected"
+
+        async def hang():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        result = await run_concurrent({"reject": reject, "hang": hang}, {})
+
+        assert result == "rejected"
+        assert cancelled.is_set()
+
+    @pytest.mark.asyncio
+    async def test_check_error_is_fail_open(self):
+        """An unexpected error in a check does not reject the lead in fail-open mode"""
+        async def broken():
+            raise RuntimeError("boom")
+
+        with patch('lead_validator.pipeline.settings.FAIL_OPEN_MODE', True):
+            assert await run_concurrent({"broken": broken}, {}) is None
+
+
+class TestLeadValidatorStages:
+    """Test LeadValidator.validate with mocked upstreams"""
+
+    @pytest.mark.asyncio
+    async def test_accepted_lead_reports_stage_timings(self):
+        """Accepted lead carries timings of local and remote stages"""
+        lead = LeadInput(phone="+79161234567", name="Иван")
+        dadata = DaDataPhoneResponse(source="+79161234567", qc=0, type="Мобильный")
+
+        with patch('lead_validator.validators.dadata_service.validate_phone', new=AsyncMock(return_value=dadata)), \
+             patch('lead_validator.validators.redis_service.check_lead', new=AsyncMock(return_value=LeadCheckResult(reserved=True))), \
+             patch('lead_validator.validators.redis_service.mark_lead', new=AsyncMock(return_value=True)) as mark_lead, \
+             patch('lead_validator.validators.telegram_notifier.send_new_lead', new=AsyncMock(return_value=True)), \
+             patch('lead_validator.validators.metrica_service.send_quality_lead', new=AsyncMock(return_value=True)):
+
+            result = await lead_validator.validate(lead, client_ip="10.0.0.1")
+
+        assert result.success
+        assert result.phone_type == "Мобильный"
+        assert {"local", "captcha", "redis", "dadata_phone"} <= set(result.stage_timings_ms)
+        mark_lead.assert_awaited_once_with("+79161234567", None)
+
+    @pytest.mark.asyncio
+    async def test_duplicate_rejects_and_cancels_dadata(self):
+        """Duplicate phone rejects without waiting for DaData"""
+        lead = LeadInput(phone="+79161234567")
+
+        async def slow_dadata(phone):
+            await asyncio.sleep(10)
+
+        with patch('lead_validator.validators.dadata_service.validate_phone', new=slow_dadata), \
+             patch('lead_validator.validators.redis_service.check_lead', new=AsyncMock(return_value=LeadCheckResult(phone_duplicate=True))), \
+             patch('lead_validator.validators.redis_service.release_lead', new=AsyncMock()) as release_lead, \
+             patch('lead_validator.validators.trash_logger.log_rejected', new=AsyncMock(return_value=True)):
+
+            result = await asyncio.wait_for(lead_validator.validate(lead), timeout=2)
+
+        assert not result.success
+        assert result.rejection_reason == "duplicate_phone"
+        release_lead.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_rejection_releases_redis_reservation(self):
+        """A lead rejected after the Redis reservation frees the phone again"""
+        lead = LeadInput(phone="+79161234567")
+        dadata = DaDataPhoneResponse(source="+79161234567", qc=2)
+
+        with patch('lead_validator.validators.dadata_service.validate_phone', new=AsyncMock(return_value=dadata)), \
+             patch('lead_validator.validators.redis_service.check_lead', new=AsyncMock(return_value=LeadCheckResult(reserved=True))), \
+             patch('lead_validator.validators.redis_service.release_lead', new=AsyncMock()) as release_lead, \
+             patch('lead_validator.validators.trash_logger.log_rejected', new=AsyncMock(return_value=True)):
+
+            result = await lead_validator.validate(lead)
+
+        assert result.rejection_reason == "invalid_phone_qc_2"
+        release_lead.assert_awaited_once_with("+79161234567", None)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,111 @@
+"""
+Unit tests for the load-test harness
+
+Tests cover:
+- Percentile calculation and endpoint mix parsing
+- Regression detection between two reports
+- A short in-process run against stub upstreams
+- Service settings are restored after the run
+- Buffers and logs of the run stay out of the working directory
+"""
+
+import pytest
+import httpx
+from lead_validator import loadtest
+from lead_validator.config import settings
+from lead_validator.services.metrica_service import metrica_service
+from lead_validator.services.redis_service import redis_service
+from lead_validator.services.telegram import telegram_notifier
+
+
+def make_args(**overrides):
+    args = loadtest.build_parser().parse_args([])
+    for name, value in {"rps": 20, "duration": 0.5, "upstream_latency_ms": 1, "drain_sec": 0.1, **overrides}.items():
+        setattr(args, name, value)
+    return args
+
+
+def make_report(p95, throughput, error_rate=0.0):
+    return {
+        "endpoints": {"lead": {"latency_ms": {"p95": p95}}},
+        "stages": {"dadata": {"p95": p95 / 2}},
+        "totals": {"throughput_rps": throughput, "error_rate": error_rate},
+    }
+
+
+class TestReportHelpers:
+    """Test report aggregation helpers"""
+
+    def test_percentiles(self):
+        result = loadtest.percentiles([float(i) for i in range(1, 101)])
+        assert result["p50"] == 51.0
+        assert result["p95"] == 96.0
+        assert result["p99"] == 100.0
+        assert loadtest.percentiles([])["p95"] is None
+
+    def test_parse_mix(self):
+        assert loadtest.parse_mix("lead=3,tilda") == {"lead": 3.0, "tilda": 1.0}
+        with pytest.raises(ValueError):
+            loadtest.parse_mix("lead=1,unknown=1")
+
+    def test_compare_reports(self):
+        baseline = make_report(p95=100.0, throughput=50.0)
+        assert loadtest.compare_reports(baseline, make_report(105.0, 49.0), threshold=0.1) == []
+
+        regressions = loadtest.compare_reports(baseline, make_report(150.0, 30.0, 0.05), threshold=0.1)
+        assert any(line.startswith("endpoint lead") for line in regressions)
+        assert any(line.startswith("stage dadata") for line in regressions)
+        assert any(line.startswith("throughput") for line in regressions)
+        assert any(line.startswith("error rate") for line in regressions)
+
+
+class TestRunWorker:
+    """Test a short in-process load run"""
+
+    @pytest.mark.asyncio
+    async def test_run_against_stubs(self, tmp_path, monkeypatch):
+        cwd = tmp_path / "cwd"
+        cwd.mkdir()
+        monkeypatch.chdir(cwd)
+        args = make_args(captcha=False, work_dir=str(tmp_path / "work"))
+        captcha_enabled = settings.SMARTCAPTCHA_ENABLED
+        telegram_enabled = telegram_notifier.enabled
+        redis_enabled = redis_service.enabled
+        client_class = httpx.AsyncClient
+        metrica_buffer = metrica_service.buffer_dir
+        metrica_dir = settings.METRICA_BUFFER_DIR
+
+        result = await loadtest.run_worker(0, args)
+        report = loadtest.build_report([result], args)
+
+        assert report["totals"]["requests"] == 10
+        assert report["totals"]["errors"] == 0
+        assert report["totals"]["completed"] == 10
+        assert report["stages"]
+        assert report["upstream_calls"].get("dadata", 0) > 0
+        assert report["workers"][0]["throughput_rps"] > 0
+
+        # Global state is put back after the run
+        assert settings.SMARTCAPTCHA_ENABLED == captcha_enabled
+        assert telegram_notifier.enabled == telegram_enabled
+        assert redis_service.enabled == redis_enabled
+        assert httpx.AsyncClient is client_class
+        assert metrica_service.buffer_dir == metrica_buffer
+        assert settings.METRICA_BUFFER_DIR == metrica_dir
+
+        # Nothing is left where the production service replays its buffers
+        assert list(cwd.iterdir()) == []
+        assert (tmp_path / "work" / "worker-0" / "rejected_leads").is_dir()
+
+    @pytest.mark.asyncio
+    async def test_network_outside_stubs_is_blocked(self):
+        transport = loadtest.StubTransport(loadtest.build_stub_app(0, 0, loadtest.Counter()))
+        async with httpx.AsyncClient(transport=transport) as client:
+            response = await client.get("https://smartcaptcha.yandexcloud.net/validate")
+            assert response.json()["status"] == "ok"
+            with pytest.raises(httpx.ConnectError):
+                await client.get("https://example.com/")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,116 @@
+"""
+Unit tests for the compiled UTM / data-quality matchers
+
+Tests cover:
+- Combined regex keeps backreferences of every pattern working
+- Aho-Corasick placement blacklist (C extension and pure Python fallback)
+- Subdomains of disposable email domains
+- Hot reload of lists from a file and Redis
+"""
+
+import pytest
+import re
+from unittest.mock import AsyncMock, patch
+from lead_validator.services import matchers
+from lead_validator.services.matchers import (
+    DomainSuffixSet, ListReloader, PatternSet, SubstringMatcher, _PyAhoCorasick
+)
+from lead_validator.services.data_quality import DataQualityValidator, SUSPICIOUS_NAME_PATTERNS
+from lead_validator.services.utm_validator import UTMValidator, UTMData
+
+
+class TestPatternSet:
+    """Test the combined regex"""
+
+    def test_matches_same_values_as_separate_patterns(self):
+        combined = PatternSet(SUSPICIOUS_NAME_PATTERNS, re.IGNORECASE)
+        separate = [re.compile(p, re.IGNORECASE) for p in SUSPICIOUS_NAME_PATTERNS]
+
+        for value in ["аааа", "иван", "anna", "a1", "ab", "john@", "петр12345", "ольга"]:
+            expected = any(p.search(value) for p in separate)
+            assert combined.search(value) == expected, value
+
+    def test_backreferences_are_renumbered(self):
+        patterns = PatternSet([r"(x)(y)", r"^(.)\1$"])
+
+        assert patterns.search("zz")
+        assert not patterns.search("zq")
+
+
+class TestSubstringMatcher:
+    """Test the placement blacklist automaton"""
+
+    @pytest.mark.parametrize("available", [True, False])
+    def test_finds_placement_in_text(self, available):
+        if available and not matchers.AHOCORASICK_AVAILABLE:
+            pytest.skip("pyahocorasick not installed")
+        with patch.object(matchers, "AHOCORASICK_AVAILABLE", available):
+            matcher = SubstringMatcher(["Spam-Site.ru", "123456", ""])
+
+            assert matcher.find("rsya_spam-site.ru_x") == "spam-site.ru"
+            assert matcher.find("block_1234567") == "123456"
+            assert matcher.find("good-site.ru") is None
+            assert matcher.find(None) is None
+
+    def test_python_fallback_follows_failure_links(self):
+        automaton = _PyAhoCorasick(["abcd", "bc"])
+
+        assert automaton.find("xabce") == "bc"
+        assert automaton.find("xabd") is None
+
+
+class TestDomainSuffixSet:
+    """Test subdomain-aware domain matching"""
+
+    def test_matches_subdomains_only(self):
+        domains = DomainSuffixSet(["mailinator.com"])
+
+        assert domains.match("mailinator.com") == "mailinator.com"
+        assert domains.match("x.y.Mailinator.com") == "mailinator.com"
+        assert domains.match("mymailinator.com") is None
+
+    def test_disposable_subdomain_is_rejected(self):
+        result = DataQualityValidator().validate_email_domain("user@inbox.yopmail.com")
+
+        assert not result.is_valid
+        assert result.rejection_reason == "email_disposable:inbox.yopmail.com"
+
+
+class TestListReload:
+    """Test hot reload of external lists"""
+
+    @pytest.mark.asyncio
+    async def test_file_changes_are_picked_up(self, tmp_path):
+        path = tmp_path / "placements.txt"
+        path.write_text("bad-site.ru  # spam\n\n", encoding="utf-8")
+        validator = UTMValidator()
+        reloader = ListReloader()
+        reloader.register("utm", validator.set_external_placements, path=str(path))
+
+        with patch('lead_validator.services.redis_service.redis_service.get_client', new=AsyncMock(return_value=None)):
+            assert await reloader.reload() == ["utm"]
+            assert await reloader.reload() == []
+
+        result = validator.validate(UTMData(source="yandex", content="bad-site.ru"))
+        assert result.reason == "blacklisted_placement:bad-site.ru"
+
+    @pytest.mark.asyncio
+    async def test_redis_set_is_merged(self):
+        fakeredis = pytest.importorskip("fakeredis")
+        client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        await client.sadd("lead:lists:garbage_names", "Тестер")
+        validator = DataQualityValidator()
+        reloader = ListReloader()
+        reloader.register("names", validator.set_external_names, redis_key="lead:lists:garbage_names")
+
+        with patch('lead_validator.services.redis_service.redis_service.get_client', new=AsyncMock(return_value=client)):
+            await reloader.reload()
+            await client.sadd("lead:lists:garbage_names", "Ноунейм")
+            assert await reloader.reload() == ["names"]
+
+        assert validator.validate_name("ноунейм").rejection_reason == "name_garbage:ноунейм"
+        assert validator.validate_name("Тестер").rejection_reason == "name_garbage:тестер"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,191 @@
+"""
+Unit tests for batched Metrica offline-conversion uploads
+
+Tests cover:
+- Conversions are buffered instead of uploaded one by one
+- One multi-row CSV per flush
+- Rows are saved to a per-process file, one fsync per batch
+- Failed upload keeps rows, buffer survives restart
+- Buffers of dead workers are claimed, live ones are left alone
+- 5xx and 429 are retried, other 4xx batches are dead-lettered
+"""
+
+import json
+import os
+import time
+import pytest
+import httpx
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+from lead_validator.services.metrica_service import MetricaService
+
+
+@pytest.fixture
+def metrica(tmp_path):
+    service = MetricaService()
+    service.enabled = True
+    service.counter_id = "12345"
+    service.oauth_token = "token"
+    service.buffer_dir = Path(tmp_path)
+    service._rejected_file = Path(tmp_path) / "rejected.jsonl"
+    return service
+
+
+def mock_metrica_api(status_code, body=None):
+    """Patch httpx.AsyncClient so uploads get the given response"""
+    original = httpx.AsyncClient
+    transport = httpx.MockTransport(lambda request: httpx.Response(status_code, json=body or {}))
+    return patch(
+        'lead_validator.services.metrica_service.httpx.AsyncClient',
+        lambda **kwargs: original(transport=transport, **kwargs)
+    )
+
+
+class TestMetricaBuffer:
+    """Test the conversion buffer of MetricaService"""
+
+    @pytest.mark.asyncio
+    async def test_send_quality_lead_only_buffers(self, metrica):
+        metrica._upload_conversions = AsyncMock()
+
+        assert await metrica.send_quality_lead("ym-1")
+
+        metrica._upload_conversions.assert_not_awaited()
+        assert metrica.pending_count() == 2
+        assert not list(metrica.buffer_dir.iterdir())  # No disk I/O on the request path
+
+    @pytest.mark.asyncio
+    async def test_persist_writes_batch_with_one_fsync(self, metrica):
+        for i in range(5):
+            await metrica.send_conversion(f"ym-{i}", "all_leads")
+
+        with patch('lead_validator.services.metrica_service.os.fsync') as fsync:
+            await metrica._persist()
+
+        fsync.assert_called_once()
+        assert metrica._buffer_file.name.startswith(f"pending-{os.getpid()}-")
+        assert len(metrica._buffer_file.read_text(encoding="utf-8").splitlines()) == 5
+        assert metrica._unsaved == []
+
+    @pytest.mark.asyncio
+    async def test_flush_uploads_one_csv(self, metrica):
+        metrica._upload_conversions = AsyncMock(return_value={"upload_id": 7, "counter_id": "12345"})
+        for i in range(3):
+            await metrica.send_quality_lead(f"ym-{i}")
+
+        uploads = await metrica.flush()
+
+        metrica._upload_conversions.assert_awaited_once()
+        csv_content = metrica._upload_conversions.await_args.args[0]
+        assert len(csv_content.strip().splitlines()) == 7  # header + 6 rows
+        assert uploads[0]["rows"] == 6
+        assert metrica.pending_count() == 0
+        assert not list(metrica.buffer_dir.glob("pending-*"))
+
+    @pytest.mark.asyncio
+    async def test_failed_upload_keeps_rows_across_restart(self, metrica):
+        metrica._upload_conversions = AsyncMock(return_value=None)
+        await metrica.send_spam_lead("ym-1")
+
+        await metrica._persist()
+        await metrica.flush()
+        assert metrica.pending_count() == 2
+
+        # The process dies: its file is no longer touched by run_flusher
+        stale = time.time() - 3600
+        os.utime(metrica._buffer_file, (stale, stale))
+
+        restarted = MetricaService()
+        restarted.counter_id = "12345"
+        restarted.buffer_dir = metrica.buffer_dir
+        await restarted._restore()
+
+        assert restarted.pending_count() == 2
+        assert not metrica._buffer_file.exists()
+        assert len(restarted._buffer_file.read_text(encoding="utf-8").splitlines()) == 2
+
+    @pytest.mark.asyncio
+    async def test_live_worker_buffer_not_claimed(self, metrica):
+        await metrica.send_spam_lead("ym-1")
+        await metrica._persist()
+
+        other = MetricaService()
+        other.counter_id = "12345"
+        other.buffer_dir = metrica.buffer_dir
+        await other._restore()
+
+        assert other.pending_count() == 0
+        assert metrica._buffer_file.exists()
+
+    @pytest.mark.asyncio
+    async def test_legacy_shared_buffer_is_claimed(self, metrica):
+        legacy = metrica.buffer_dir / "pending.jsonl"
+        legacy.write_text(json.dumps({
+            "client_id": "ym-1", "goal_name": "все_лиды",
+            "datetime_str": "2024-01-01 00:00:00", "counter_id": "12345",
+        }) + "\n", encoding="utf-8")
+
+        await metrica._restore()
+
+        assert metrica.pending_count() == 1
+        assert not legacy.exists()
+
+    @pytest.mark.asyncio
+    async def test_flush_respects_batch_size(self, metrica):
+        metrica._upload_conversions = AsyncMock(return_value={"upload_id": 1, "counter_id": "12345"})
+        for i in range(3):
+            await metrica.send_conversion(f"ym-{i}", "all_leads")
+
+        with patch('lead_validator.services.metrica_service.settings.METRICA_BATCH_SIZE', 2):
+            await metrica.flush()
+
+        assert metrica.pending_count() == 1
+
+
+
+class TestMetricaUploadErrors:
+    """Test handling of Metrica API errors"""
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("status_code", [429, 500, 503])
+    async def test_retryable_errors_keep_rows(self, metrica, status_code):
+        await metrica.send_spam_lead("ym-1")
+
+        with mock_metrica_api(status_code):
+            assert await metrica.flush() == []
+
+        assert metrica.pending_count() == 2
+        assert not metrica._rejected_file.exists()
+
+    @pytest.mark.asyncio
+    async def test_rejected_batch_is_dead_lettered(self, metrica):
+        await metrica.send_spam_lead("ym-1")
+
+        with mock_metrica_api(400, {"message": "Invalid CSV"}):
+            uploads = await metrica.flush()
+
+        assert metrica.pending_count() == 0
+        assert uploads[0]["status"] == "REJECTED"
+        assert uploads[0]["error"].startswith("400")
+        assert list(metrica.uploads) == uploads
+
+        rejected = [json.loads(line) for line in metrica._rejected_file.read_text(encoding="utf-8").splitlines()]
+        assert [r["client_id"] for r in rejected] == ["ym-1", "ym-1"]
+        assert rejected[0]["error"].startswith("400")
+
+    @pytest.mark.asyncio
+    async def test_rejected_batch_does_not_block_next_conversions(self, metrica):
+        await metrica.send_spam_lead("ym-1")
+        with mock_metrica_api(403):
+            await metrica.flush()
+
+        await metrica.send_quality_lead("ym-2")
+        with mock_metrica_api(200, {"uploading": {"id": 5, "status": "UPLOADED"}}):
+            uploads = await metrica.flush()
+
+        assert uploads[0]["upload_id"] == 5
+        assert metrica.pending_count() == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
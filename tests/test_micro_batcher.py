@@ -0,0 +1,137 @@
+"""
+Unit tests for DaData micro-batching
+
+Tests cover:
+- Concurrent lookups are sent as one array request
+- Batches are split at max_size
+- A failed batch request is fail-open for every waiter
+- Cancelled items are not sent; late results go to on_abandoned
+- Bulk re-validation of JSONL lead logs
+"""
+
+import pytest
+import asyncio
+import gzip
+import io
+import json
+from unittest.mock import AsyncMock, patch
+from lead_validator.services.micro_batcher import MicroBatcher
+from lead_validator.services.dadata import DaDataService
+from lead_validator import revalidate
+
+
+class TestMicroBatcher:
+    """Test collecting concurrent calls into batches"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_items_share_one_request(self):
+        send = AsyncMock(side_effect=lambda items: [item.upper() for item in items])
+        batcher = MicroBatcher(send, max_size=10, max_wait=0.01)
+
+        results = await asyncio.gather(*[batcher.submit(x) for x in ["a", "b", "a", "c"]])
+
+        assert results == ["A", "B", "A", "C"]
+        send.assert_awaited_once_with(["a", "b", "c"])
+
+    @pytest.mark.asyncio
+    async def test_full_batch_is_sent_without_waiting(self):
+        send = AsyncMock(side_effect=lambda items: items)
+        batcher = MicroBatcher(send, max_size=2, max_wait=10)
+
+        results = await asyncio.wait_for(
+            asyncio.gather(*[batcher.submit(str(i)) for i in range(4)]), timeout=1
+        )
+
+        assert results == ["0", "1", "2", "3"]
+        assert send.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_failed_request_returns_none_to_all(self):
+        batcher = MicroBatcher(AsyncMock(side_effect=RuntimeError("boom")), max_size=10, max_wait=0.001)
+
+        results = await asyncio.gather(batcher.submit("a"), batcher.submit("b"))
+
+        assert results == [None, None]
+
+    @pytest.mark.asyncio
+    async def test_cancelled_item_is_not_sent(self):
+        send = AsyncMock(side_effect=lambda items: items)
+        batcher = MicroBatcher(send, max_size=10, max_wait=0.01, dedupe=False)
+
+        cancelled = asyncio.create_task(batcher.submit("a"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+
+        assert await batcher.submit("b") == "b"
+        send.assert_awaited_once_with(["b"])
+
+    @pytest.mark.asyncio
+    async def test_result_after_cancel_goes_to_on_abandoned(self):
+        in_flight, gate = asyncio.Event(), asyncio.Event()
+
+        async def send(items):
+            in_flight.set()
+            await gate.wait()
+            return items
+
+        on_abandoned = AsyncMock()
+        batcher = MicroBatcher(send, max_size=10, max_wait=0, dedupe=False, on_abandoned=on_abandoned)
+
+        task = asyncio.create_task(batcher.submit("a"))
+        await in_flight.wait()
+        task.cancel()
+        gate.set()
+        await batcher.close()
+
+        on_abandoned.assert_awaited_once_with("a", "a")
+
+
+class TestDaDataBatching:
+    """Test DaDataService routing lookups through the batcher"""
+
+    @pytest.mark.asyncio
+    async def test_phones_are_cleaned_in_one_request(self):
+        service = DaDataService()
+
+        async def clean(url, phones):
+            return [{"source": p, "qc": 0, "type": "Мобильный"} for p in phones]
+
+        service._clean_batch = AsyncMock(side_effect=clean)
+        with patch('lead_validator.services.dadata.redis_service.cache_get', new=AsyncMock(return_value=None)), \
+             patch('lead_validator.services.dadata.redis_service.cache_set', new=AsyncMock(return_value=False)):
+            results = await asyncio.gather(
+                service.validate_phone("+79161234567"),
+                service.validate_phone("+79161234568"),
+            )
+
+        assert [r.source for r in results] == ["+79161234567", "+79161234568"]
+        service._clean_batch.assert_awaited_once()
+
+
+class TestRevalidate:
+    """Test the bulk re-validation CLI core"""
+
+    @pytest.mark.asyncio
+    async def test_records_are_enriched(self, tmp_path):
+        path = tmp_path / "rejected_2026-01-01.jsonl.gz"
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.write(json.dumps({"phone": "+79161234567", "rejection_reason": "invalid_phone_qc_1"}) + "\n")
+            f.write("not json\n")
+
+        service = DaDataService()
+        service._fetch_phone = AsyncMock(return_value={"source": "+79161234567", "qc": 0, "type": "Мобильный"})
+        out = io.StringIO()
+
+        with patch('lead_validator.revalidate.dadata_service', service), \
+             patch('lead_validator.services.dadata.redis_service.cache_get', new=AsyncMock(return_value=None)), \
+             patch('lead_validator.services.dadata.redis_service.cache_set', new=AsyncMock(return_value=False)):
+            count = await revalidate.revalidate([str(path)], out)
+
+        record = json.loads(out.getvalue())
+        assert count == 1
+        assert record["dadata_qc"] == 0
+        assert record["phone_valid"] is True
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
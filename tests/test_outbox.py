@@ -0,0 +1,92 @@
+"""
+Unit tests for the post-accept side-effect outbox
+
+Tests cover:
+- Local file fallback when Redis is unavailable
+- Retry with backoff for failed jobs
+- Giving up after OUTBOX_MAX_ATTEMPTS
+- Claimed files are not re-claimed as abandoned by another process
+"""
+
+import os
+import time
+import pytest
+from unittest.mock import AsyncMock, patch
+from lead_validator.services.outbox import Outbox
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    with patch('lead_validator.services.outbox.redis_service.get_client', new=AsyncMock(return_value=None)):
+        box = Outbox()
+        box.enabled = True
+        box.local_dir = tmp_path
+        yield box
+
+
+class TestLocalOutbox:
+    """Test the append-only file fallback"""
+
+    @pytest.mark.asyncio
+    async def test_enqueue_writes_local_file_without_redis(self, outbox):
+        handler = AsyncMock(return_value=True)
+        outbox.register("notify", handler)
+
+        await outbox.enqueue_many([("notify", {"n": 1}), ("notify", {"n": 2})])
+
+        handler.assert_not_awaited()
+        assert len(outbox.local_file.read_text(encoding="utf-8").splitlines()) == 2
+
+    @pytest.mark.asyncio
+    async def test_drain_delivers_and_removes_file(self, outbox):
+        handler = AsyncMock(return_value=True)
+        outbox.register("notify", handler)
+        await outbox.enqueue("notify", {"n": 1})
+
+        for path in outbox._claim_local():
+            await outbox._drain_file(path)
+
+        handler.assert_awaited_once_with({"n": 1})
+        assert list(outbox.local_dir.iterdir()) == []
+
+    @pytest.mark.asyncio
+    async def test_failed_job_is_kept_for_retry(self, outbox):
+        outbox.register("notify", AsyncMock(side_effect=RuntimeError("timeout")))
+        await outbox.enqueue("notify", {"n": 1})
+
+        for path in outbox._claim_local():
+            await outbox._drain_file(path)
+
+        jobs = outbox._read_lines(outbox.local_file)
+        assert len(jobs) == 1
+        assert jobs[0]["attempts"] == 1
+        assert jobs[0]["next_at"] > jobs[0]["created_at"]
+
+    def test_fresh_claim_of_idle_file_not_reclaimed(self, outbox):
+        """A just-claimed file keeps nothing of the idle mtime it had before"""
+        outbox.local_dir.mkdir(exist_ok=True)
+        abandoned = outbox.local_dir / "draining-1-dead.jsonl"
+        abandoned.write_text('{"id": "x", "kind": "notify", "payload": {}}\n', encoding="utf-8")
+        old = time.time() - 3600
+        os.utime(abandoned, (old, old))
+
+        with patch('lead_validator.services.outbox.settings.OUTBOX_CLAIM_IDLE_SEC', 300):
+            (claimed,) = outbox._claim_local()
+            # Another process scanning right after the claim finds nothing
+            assert outbox._claim_local() == []
+
+        assert claimed.exists()
+
+    def test_gives_up_after_max_attempts(self, outbox):
+        job = {"id": "x", "kind": "notify", "payload": {}, "attempts": 0}
+
+        with patch('lead_validator.services.outbox.settings.OUTBOX_MAX_ATTEMPTS', 2):
+            retry = outbox._next_attempt(job)
+            assert retry["attempts"] == 1
+            assert outbox._next_attempt(retry) is None
+
+        assert outbox.stats["dead"] == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,109 @@
+"""
+Unit tests for the offline phone numbering plan
+
+Tests cover:
+- Building the database from Rossvyaz CSV (UTF-8 and cp1251)
+- Range lookup: type, operator, region, gaps between ranges
+- Ambiguous inputs are left to DaData
+- DaDataService.validate_phone answers from the plan without an API call
+"""
+
+import pytest
+from unittest.mock import AsyncMock, patch
+from lead_validator.services.dadata import DaDataService
+from lead_validator.services.phone_plan import PhonePlan, build_phone_plan, normalize_phone
+
+DEF_CSV = (
+    "АВС/ DEF;От;До;Емкость;Оператор;Регион;Территория ГАР;ИНН\n"
+    "916;0000000;1999999;2000000;ПАО \"Мобильные ТелеСистемы\";г. Москва и Московская область;;7740000076\n"
+    "916;3000000;3999999;1000000;ПАО \"Мобильные ТелеСистемы\";г. Москва и Московская область;;7740000076\n"
+    "999;0000000;0999999;1000000;ООО \"Скартел\";Российская Федерация;;7701725181\n"
+)
+ABC_CSV = (
+    "АВС/ DEF;От;До;Емкость;Оператор;Регион\n"
+    "495;1000000;1999999;1000000;ПАО \"Ростелеком\";г. Москва\n"
+    "800;0000000;9999999;10000000;ПАО \"Ростелеком\";Российская Федерация\n"
+)
+
+
+@pytest.fixture
+def plan(tmp_path):
+    (tmp_path / "DEF-9xx.csv").write_text(DEF_CSV, encoding="utf-8")
+    (tmp_path / "ABC-4xx.csv").write_bytes(ABC_CSV.encode("cp1251"))
+    out = tmp_path / "phone_plan.bin"
+    count = build_phone_plan([str(tmp_path / "DEF-9xx.csv"), str(tmp_path / "ABC-4xx.csv")], str(out))
+    # Non-geographic 8-800 range is skipped
+    assert count == 4
+
+    plan = PhonePlan(str(out))
+    yield plan
+    plan.close()
+
+
+class TestPhonePlanLookup:
+    """Test binary search over the memory-mapped ranges"""
+
+    def test_mobile_number(self, plan):
+        entry = plan.lookup("+7 (916) 123-45-67")
+        assert entry.type == "Мобильный"
+        assert entry.provider == 'ПАО "Мобильные ТелеСистемы"'
+        assert entry.region == "г. Москва и Московская область"
+        assert entry.number == "9161234567"
+
+    def test_landline_from_cp1251_file(self, plan):
+        entry = plan.lookup("84951234567")
+        assert entry.type == "Стационарный"
+        assert entry.provider == 'ПАО "Ростелеком"'
+
+    def test_range_boundaries_and_gaps(self, plan):
+        assert plan.lookup("79161999999") is not None
+        assert plan.lookup("79162000000") is None  # Gap between two ranges
+        assert plan.lookup("79163000000") is not None
+        assert plan.lookup("79990999999").region == "Российская Федерация"
+        assert plan.lookup("79991000000") is None
+        assert plan.lookup("88001234567") is None
+
+    def test_ambiguous_inputs(self):
+        assert normalize_phone("8 (916) 123-45-67") == "9161234567"
+        assert normalize_phone("9161234567") == "9161234567"
+        assert normalize_phone("+7 916 123-45-67 доб. 12") is None
+        assert normalize_phone("+380501234567") is None
+
+    def test_missing_file(self, tmp_path):
+        plan = PhonePlan(str(tmp_path / "missing.bin"))
+        assert plan.lookup("+79161234567") is None
+        assert len(plan) == 0
+
+    def test_reload_after_close(self, plan):
+        assert plan.lookup("+79161234567") is not None
+        plan.close()
+        assert plan.load()
+        assert len(plan) == 4
+
+
+class TestDaDataPlanFastPath:
+    """Test that DaData is only called for numbers outside the plan"""
+
+    @pytest.mark.asyncio
+    async def test_plan_hit_skips_api(self, plan):
+        service = DaDataService()
+        fetch = AsyncMock(return_value=None)
+
+        with patch('lead_validator.services.dadata.phone_plan', plan), \
+             patch.object(service, '_cached', new=fetch):
+            result = await service.validate_phone("+79161234567")
+            assert result.qc == 0
+            assert result.type == "Мобильный"
+            assert result.phone == "+7 916 123-45-67"
+            assert service.is_phone_valid(result)
+            fetch.assert_not_awaited()
+
+            # A number outside the plan still goes to DaData
+            await service.validate_phone("+79162000000")
+            fetch.assert_awaited_once()
+
+        assert service.stats["plan_hits"] == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
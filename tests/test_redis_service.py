@@ -0,0 +1,174 @@
+"""
+Unit tests for the Redis lead checks (Lua scripts)
+
+Runs the scripts against fakeredis when it is installed.
+
+Tests cover:
+- GCRA rate limit per IP and per subnet
+- Rejected requests do not consume the limit
+- Duplicate detection and reservation release
+- A check cancelled by another rejection leaves no reservation
+- Bloom-filter pre-check synced over pub/sub
+"""
+
+import pytest
+import asyncio
+import hashlib
+from unittest.mock import AsyncMock, patch
+from lead_validator.schemas import LeadInput
+from lead_validator.services.bloom import RotatingBloomFilter
+from lead_validator.services.dadata import DaDataPhoneResponse
+from lead_validator.services.redis_service import RedisService
+from lead_validator.validators import lead_validator
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+
+@pytest.fixture
+def fake_server():
+    return fakeredis.FakeServer()
+
+
+def make_service(server) -> RedisService:
+    service = RedisService()
+    service.enabled = True
+    service._client = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    return service
+
+
+@pytest.fixture
+def redis_service(fake_server):
+    return make_service(fake_server)
+
+
+class TestRateLimit:
+    """Test the multi-dimension GCRA limiter"""
+
+    @pytest.mark.asyncio
+    async def test_ip_limit(self, redis_service):
+        with patch('lead_validator.services.redis_service.settings.RATE_LIMIT_PER_IP', 3):
+            results = [
+                await redis_service.check_lead("10.0.0.1", f"+7916000000{i}") for i in range(4)
+            ]
+
+        assert [r.rate_limited for r in results] == [False, False, False, True]
+        assert results[-1].rate_limit_dimension == "ip"
+        assert not results[-1].reserved
+
+    @pytest.mark.asyncio
+    async def test_subnet_limit_across_ips(self, redis_service):
+        with patch('lead_validator.services.redis_service.settings.RATE_LIMIT_PER_SUBNET', 2):
+            allowed = [await redis_service.check_rate_limit(f"10.0.0.{i}") for i in range(1, 4)]
+
+        assert allowed == [True, True, False]
+
+    @pytest.mark.asyncio
+    async def test_placement_limit(self, redis_service):
+        with patch('lead_validator.services.redis_service.settings.RATE_LIMIT_PER_PLACEMENT', 1):
+            first = await redis_service.check_lead("10.0.0.1", "+79160000001", utm_content="site.ru")
+            second = await redis_service.check_lead("10.0.1.1", "+79160000002", utm_content="site.ru")
+
+        assert not first.rate_limited
+        assert second.rate_limit_dimension == "placement"
+
+
+class TestDedup:
+    """Test duplicate detection with reservations"""
+
+    @pytest.mark.asyncio
+    async def test_reservation_blocks_concurrent_duplicate(self, redis_service):
+        first = await redis_service.check_lead("10.0.0.1", "+79160000001")
+        second = await redis_service.check_lead("10.0.0.2", "+79160000001")
+
+        assert first.reserved
+        assert second.phone_duplicate
+
+    @pytest.mark.asyncio
+    async def test_release_frees_phone_but_not_marked(self, redis_service):
+        await redis_service.check_lead("10.0.0.1", "+79160000001")
+        await redis_service.release_lead("+79160000001")
+        assert not (await redis_service.check_lead("10.0.0.2", "+79160000001")).phone_duplicate
+
+        await redis_service.mark_lead("+79160000001")
+        await redis_service.release_lead("+79160000001")
+        assert (await redis_service.check_lead("10.0.0.3", "+79160000001")).phone_duplicate
+
+    @pytest.mark.asyncio
+    async def test_captcha_reject_then_resubmit(self, redis_service):
+        """The Redis script finishing after a captcha rejection does not leave the phone pending"""
+        in_flight, gate = asyncio.Event(), asyncio.Event()
+        send = redis_service._check_batcher.send
+
+        async def gated_send(calls):
+            in_flight.set()
+            await gate.wait()
+            return await send(calls)
+
+        async def captcha_reject(*args, **kwargs):
+            await in_flight.wait()
+            return False, "invalid_token"
+
+        redis_service._check_batcher.send = gated_send
+        dadata = DaDataPhoneResponse(source="+79161234567", qc=0, type="Мобильный")
+
+        with patch('lead_validator.validators.redis_service', redis_service), \
+             patch('lead_validator.validators.captcha_validator.validate', new=captcha_reject), \
+             patch('lead_validator.validators.dadata_service.validate_phone', new=AsyncMock(return_value=dadata)), \
+             patch('lead_validator.validators.trash_logger.log_rejected', new=AsyncMock(return_value=True)):
+
+            result = await lead_validator.validate(LeadInput(phone="+79161234567"), client_ip="10.0.0.1")
+            gate.set()
+            await redis_service._check_batcher.close()
+
+        assert result.rejection_reason.startswith("captcha_failed")
+        resubmit = await redis_service.check_lead("10.0.0.1", "+79161234567")
+        assert not resubmit.phone_duplicate
+        assert resubmit.reserved
+
+
+class TestBloomPrecheck:
+    """Test the local Bloom filter in front of Redis"""
+
+    def test_rotating_filter_forgets_old_values(self):
+        bloom = RotatingBloomFilter(ttl_sec=30, capacity=1000, buckets=4)
+        value = hashlib.sha256(b"79160000001").hexdigest()
+
+        with patch('lead_validator.services.bloom.time.time', return_value=1000.0):
+            bloom.add(value)
+            assert value in bloom
+            assert hashlib.sha256(b"other").hexdigest() not in bloom
+        with patch('lead_validator.services.bloom.time.time', return_value=1035.0):
+            assert value in bloom
+        with patch('lead_validator.services.bloom.time.time', return_value=1050.0):
+            assert value not in bloom
+
+    @pytest.mark.asyncio
+    async def test_definite_miss_skips_redis(self, redis_service):
+        redis_service._seen_ready = True
+        redis_service._get_client = AsyncMock()
+
+        assert not await redis_service.is_duplicate("+79160000001")
+        redis_service._get_client.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_marks_are_synced_between_workers(self, redis_service, fake_server):
+        await redis_service.mark_lead("+79160000001")
+
+        other = make_service(fake_server)
+        sync = asyncio.create_task(other.run_seen_sync())
+        while not other._seen_ready:
+            await asyncio.sleep(0.01)
+
+        await redis_service.mark_phone("+79160000002")
+        await asyncio.sleep(0.1)
+        sync.cancel()
+        await asyncio.gather(sync, return_exceptions=True)
+
+        assert other.hash_phone("+79160000001") in other.seen
+        assert other.hash_phone("+79160000002") in other.seen
+        assert other.hash_phone("+79160000003") not in other.seen
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,154 @@
+"""
+Unit tests for weekly/monthly report generation
+
+Runs the set-based statements against an in-memory SQLite database.
+
+Tests cover:
+- Yandex and VK stats aggregated per client and week (Monday to Sunday)
+- Recomputing a week or month that already has a report
+- Month and year boundaries of the recomputed window
+- The PostgreSQL statement uses date_trunc and ON CONFLICT DO UPDATE
+"""
+
+import uuid
+import pytest
+from datetime import date
+from decimal import Decimal
+from unittest.mock import Mock
+from sqlalchemy import BigInteger, Integer, MetaData, create_engine
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+from core.database import Base
+from core import models
+from automation.reports import generate_weekly_reports, generate_monthly_reports
+
+
+@pytest.fixture
+def db():
+    """SQLite session with the app schema (BIGINT ids as INTEGER so they autoincrement)"""
+    metadata = MetaData()
+    for table in Base.metadata.sorted_tables:
+        copy = table.to_metadata(metadata)
+        for column in copy.primary_key.columns:
+            if isinstance(column.type, BigInteger):
+                column.type = Integer()
+    engine = create_engine("sqlite://")
+    metadata.create_all(engine)
+    session = Session(engine)
+    yield session
+    session.close()
+
+
+def add_stats(db, model, client_id, day, cost, clicks, conversions):
+    db.add(model(client_id=client_id, date=day, campaign_name="Campaign",
+                 cost=cost, clicks=clicks, conversions=conversions))
+    db.flush()
+
+
+class TestWeeklyReports:
+    """Test weekly aggregation and upsert"""
+
+    def test_week_aggregates_both_platforms(self, db):
+        """Both platforms of a client land in one Monday-Sunday report"""
+        client_a, client_b = uuid.uuid4(), uuid.uuid4()
+        add_stats(db, models.YandexStats, client_a, date(2024, 1, 1), 100, 10, 2)  # Monday
+        add_stats(db, models.VKStats, client_a, date(2024, 1, 7), 50, 5, 1)  # Sunday
+        add_stats(db, models.YandexStats, client_b, date(2024, 1, 3), 30, 0, 0)
+
+        generate_weekly_reports(db, date(2024, 1, 3), date(2024, 1, 3))
+
+        report = db.query(models.WeeklyReport).filter_by(client_id=client_a).one()
+        assert (report.week_start, report.week_end) == (date(2024, 1, 1), date(2024, 1, 7))
+        assert report.total_cost == Decimal("150.00")
+        assert (report.total_clicks, report.total_conversions) == (15, 3)
+        assert report.avg_cpc == Decimal("10.00")
+        assert report.avg_cpa == Decimal("50.00")
+
+        no_clicks = db.query(models.WeeklyReport).filter_by(client_id=client_b).one()
+        assert no_clicks.avg_cpc == 0
+        assert no_clicks.avg_cpa == 0
+
+    def test_existing_week_recomputed(self, db):
+        """A week that already has a report is updated in place"""
+        client_id = uuid.uuid4()
+        db.add(models.WeeklyReport(client_id=client_id, week_start=date(2024, 1, 1), week_end=date(2024, 1, 7),
+                                   total_cost=1, total_clicks=1, total_conversions=1, avg_cpc=1, avg_cpa=1))
+        add_stats(db, models.YandexStats, client_id, date(2024, 1, 2), 80, 4, 1)
+
+        generate_weekly_reports(db, date(2024, 1, 2), date(2024, 1, 2))
+        generate_weekly_reports(db, date(2024, 1, 2), date(2024, 1, 2))
+        db.expire_all()
+
+        report = db.query(models.WeeklyReport).filter_by(client_id=client_id).one()
+        assert report.total_cost == Decimal("80.00")
+        assert report.total_clicks == 4
+        assert report.avg_cpc == Decimal("20.00")
+
+    def test_only_touched_weeks_recomputed(self, db):
+        """Weeks outside the window are neither created nor changed"""
+        client_id = uuid.uuid4()
+        add_stats(db, models.YandexStats, client_id, date(2023, 12, 31), 10, 1, 0)  # previous Sunday
+        add_stats(db, models.YandexStats, client_id, date(2024, 1, 8), 10, 1, 0)  # next Monday
+        add_stats(db, models.YandexStats, client_id, date(2024, 1, 5), 20, 2, 0)
+
+        generate_weekly_reports(db, date(2024, 1, 5), date(2024, 1, 5))
+
+        reports = db.query(models.WeeklyReport).all()
+        assert [(r.week_start, r.total_cost) for r in reports] == [(date(2024, 1, 1), Decimal("20.00"))]
+
+
+class TestMonthlyReports:
+    """Test monthly aggregation and upsert"""
+
+    def test_month_boundaries(self, db):
+        """Rows are split by calendar month, the window covers whole months"""
+        client_id = uuid.uuid4()
+        add_stats(db, models.YandexStats, client_id, date(2023, 12, 31), 5, 1, 0)
+        add_stats(db, models.YandexStats, client_id, date(2024, 1, 1), 10, 1, 0)
+        add_stats(db, models.VKStats, client_id, date(2024, 1, 31), 20, 1, 1)
+        add_stats(db, models.YandexStats, client_id, date(2024, 2, 1), 40, 2, 0)
+        add_stats(db, models.YandexStats, client_id, date(2024, 3, 1), 80, 4, 0)
+
+        generate_monthly_reports(db, date(2024, 1, 15), date(2024, 2, 10))
+
+        reports = db.query(models.MonthlyReport).order_by(models.MonthlyReport.month).all()
+        assert [(r.year, r.month, r.total_cost) for r in reports] == [
+            (2024, 1, Decimal("30.00")),
+            (2024, 2, Decimal("40.00")),
+        ]
+        assert reports[0].avg_cpa == Decimal("30.00")
+
+    def test_year_boundary_and_recompute(self, db):
+        """December and January are separate reports; reruns update them"""
+        client_id = uuid.uuid4()
+        db.add(models.MonthlyReport(client_id=client_id, month=12, year=2023, total_cost=999,
+                                    total_clicks=0, total_conversions=0, avg_cpc=0, avg_cpa=0))
+        add_stats(db, models.YandexStats, client_id, date(2023, 12, 31), 5, 1, 0)
+        add_stats(db, models.YandexStats, client_id, date(2024, 1, 1), 10, 2, 0)
+
+        generate_monthly_reports(db, date(2023, 12, 31), date(2024, 1, 1))
+        db.expire_all()
+
+        reports = db.query(models.MonthlyReport).order_by(models.MonthlyReport.year).all()
+        assert [(r.year, r.month, r.total_cost, r.total_clicks) for r in reports] == [
+            (2023, 12, Decimal("5.00"), 1),
+            (2024, 1, Decimal("10.00"), 2),
+        ]
+
+
+class TestPostgresStatement:
+    """Test the statement sent to PostgreSQL"""
+
+    def test_weekly_statement(self):
+        db = Mock()
+        db.get_bind.return_value.dialect.name = "postgresql"
+
+        generate_weekly_reports(db, date(2024, 1, 3), date(2024, 1, 3))
+
+        sql = str(db.execute.call_args.args[0].compile(dialect=postgresql.dialect()))
+        assert "date_trunc" in sql
+        assert "ON CONFLICT (client_id, week_start) DO UPDATE" in sql
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
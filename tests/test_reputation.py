@@ -0,0 +1,111 @@
+"""
+Unit tests for the reputation fast path
+
+Tests cover:
+- Trust requires enough accepted leads from the subnet or ym_uid
+- Rejections revoke trust; neutral reasons and fast-path accepts are ignored
+- Saved latency is estimated from full-path stage timings
+- LeadValidator skips MX for a low-risk lead
+"""
+
+import pytest
+from unittest.mock import AsyncMock, patch
+from lead_validator.schemas import LeadInput
+from lead_validator.validators import lead_validator
+from lead_validator.services.dadata import DaDataPhoneResponse
+from lead_validator.services.redis_service import LeadCheckResult
+from lead_validator.services.reputation import ReputationCache
+
+
+def make_lead(**kwargs) -> LeadInput:
+    data = {"phone": "+79161234567", "email": "ivan@example.ru", "client_ip": "10.1.2.3"}
+    data.update(kwargs)
+    return LeadInput(**data)
+
+
+@pytest.fixture(autouse=True)
+def reputation_settings():
+    with patch('lead_validator.services.reputation.settings.REPUTATION_ENABLED', True), \
+         patch('lead_validator.services.reputation.settings.REPUTATION_MIN_ACCEPTED', 3), \
+         patch('lead_validator.services.reputation.settings.REPUTATION_MAX_REJECT_RATE', 0.1), \
+         patch('lead_validator.services.reputation.settings.REPUTATION_SKIP_CHECKS', ["mx", "dadata_email"]):
+        yield
+
+
+class TestReputationCache:
+    """Test the trust decision"""
+
+    def test_trust_after_enough_accepted_leads(self):
+        cache = ReputationCache()
+        for _ in range(2):
+            cache.record(make_lead(), accepted=True)
+        assert cache.skip_checks(make_lead(), ["redis", "mx"]) == set()
+
+        # Weights decay, so the threshold needs one more lead than its value
+        for _ in range(2):
+            cache.record(make_lead(), accepted=True)
+        # Another address from the same /24 subnet is trusted too
+        lead = make_lead(client_ip="10.1.2.99")
+        assert cache.skip_checks(lead, ["redis", "mx", "dadata_email"]) == {"mx", "dadata_email"}
+        assert cache.get_stats()["hit_rate"] == 0.5
+
+    def test_email_domain_alone_gives_no_trust(self):
+        cache = ReputationCache()
+        for i in range(5):
+            cache.record(make_lead(client_ip=f"10.0.{i}.1"), accepted=True)
+        assert not cache.is_low_risk(make_lead(client_ip="192.168.0.1"))
+
+    def test_rejection_revokes_trust(self):
+        cache = ReputationCache()
+        for _ in range(5):
+            cache.record(make_lead(), accepted=True)
+        cache.record(make_lead(), accepted=False, reason="invalid_email_qc_2")
+        assert not cache.is_low_risk(make_lead())
+
+    def test_neutral_and_fast_path_outcomes_are_ignored(self):
+        cache = ReputationCache()
+        cache.record(make_lead(), accepted=False, reason="duplicate_phone")
+        cache.record(make_lead(), accepted=True, fast_path=True)
+        assert cache.get_stats()["keys"] == 0
+
+    def test_saved_latency_uses_full_path_average(self):
+        cache = ReputationCache()
+        cache.observe({"local": 1.0, "mx": 40.0, "redis": 2.0}, set())
+        cache.observe({"local": 1.0, "redis": 2.0}, {"mx"})
+
+        stats = cache.get_stats()
+        assert stats["skipped"] == {"mx": 1}
+        assert stats["saved_ms"] == {"mx": 40.0}
+
+
+class TestFastPathValidation:
+    """Test LeadValidator with a trusted subnet"""
+
+    @pytest.mark.asyncio
+    async def test_low_risk_lead_skips_mx(self):
+        cache = ReputationCache()
+        for _ in range(4):
+            cache.record(make_lead(), accepted=True)
+        dadata = DaDataPhoneResponse(source="+79161234567", qc=0, type="Мобильный")
+        check_mx = AsyncMock()
+
+        with patch('lead_validator.validators.reputation_cache', cache), \
+             patch('lead_validator.validators.settings.MX_CHECK_ENABLED', True), \
+             patch('lead_validator.validators.captcha_validator.validate', new=AsyncMock(return_value=(True, ""))), \
+             patch('lead_validator.validators.email_mx_validator.check_mx', new=check_mx), \
+             patch('lead_validator.validators.dadata_service.validate_phone', new=AsyncMock(return_value=dadata)), \
+             patch('lead_validator.validators.redis_service.check_lead', new=AsyncMock(return_value=LeadCheckResult(reserved=True))), \
+             patch('lead_validator.validators.redis_service.mark_lead', new=AsyncMock(return_value=True)), \
+             patch('lead_validator.validators.outbox.enqueue', new=AsyncMock()), \
+             patch('lead_validator.validators.metrica_service.send_quality_lead', new=AsyncMock(return_value=True)):
+
+            result = await lead_validator.validate(make_lead(), client_ip="10.1.2.3")
+
+        assert result.success
+        check_mx.assert_not_awaited()
+        assert "mx" not in result.stage_timings_ms
+        assert cache.get_stats()["fast_path"] == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,121 @@
+"""
+Unit tests for the Telegram notification dispatcher
+
+Tests cover:
+- Leads are queued and persisted instead of sent inline
+- Queued leads are merged into digest messages
+- retry_after from a 429 pauses the chat and keeps the backlog
+- Markdown errors fall back to plain text
+"""
+
+import pytest
+import asyncio
+import httpx
+from unittest.mock import patch
+from lead_validator.schemas import LeadInput
+from lead_validator.services.telegram import TelegramNotifier
+
+
+def make_notifier(tmp_path) -> TelegramNotifier:
+    with patch('lead_validator.services.telegram.settings.TELEGRAM_BUFFER_DIR', str(tmp_path)):
+        notifier = TelegramNotifier()
+    notifier.enabled = True
+    notifier.token = "token"
+    notifier.chat_id = "100"
+    return notifier
+
+
+def telegram_client(responses, sent):
+    """httpx client answering sendMessage with the given responses in order"""
+    def handler(request: httpx.Request) -> httpx.Response:
+        sent.append(request)
+        status, body = responses.pop(0) if responses else (200, {"ok": True})
+        return httpx.Response(status, json=body)
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+class TestTelegramQueue:
+    """Test the persisted notification backlog"""
+
+    @pytest.mark.asyncio
+    async def test_lead_is_queued_and_restored(self, tmp_path):
+        notifier = make_notifier(tmp_path)
+
+        assert await notifier.send_new_lead(LeadInput(phone="+79161234567"), phone_type="Мобильный")
+
+        restored = make_notifier(tmp_path)
+        await restored._ensure_loaded()
+        assert restored.pending_count() == 1
+        assert "+79161234567" in restored._backlog["100"][0]
+
+
+class TestTelegramDispatch:
+    """Test rate-aware sending"""
+
+    @pytest.mark.asyncio
+    async def test_backlog_is_sent_as_digest(self, tmp_path):
+        notifier = make_notifier(tmp_path)
+        for i in range(5):
+            await notifier.send_new_lead(LeadInput(phone=f"+7916123456{i}"))
+        sent = []
+
+        async with telegram_client([], sent) as client:
+            await notifier._dispatch(client, "100")
+
+        assert len(sent) == 1
+        assert "Сводка: 5 заявок" in sent[0].read().decode()
+        assert notifier.pending_count() == 0
+        assert notifier.stats == {"messages": 1, "leads": 5, "dropped": 0}
+        assert not (tmp_path / "backlog.jsonl").exists()
+
+    @pytest.mark.asyncio
+    async def test_retry_after_pauses_chat(self, tmp_path):
+        notifier = make_notifier(tmp_path)
+        await notifier.send_new_lead(LeadInput(phone="+79161234567"))
+        sent = []
+        too_many = (429, {"ok": False, "error_code": 429, "parameters": {"retry_after": 30}})
+
+        async with telegram_client([too_many], sent) as client:
+            await notifier._dispatch(client, "100")
+
+        assert notifier.pending_count() == 1
+        assert notifier._bucket("100").time_until() > 25
+
+    @pytest.mark.asyncio
+    async def test_markdown_error_falls_back_to_plain_text(self, tmp_path):
+        notifier = make_notifier(tmp_path)
+        await notifier.send_new_lead(LeadInput(phone="+79161234567", name="Иван_"))
+        sent = []
+        bad_markup = (400, {"ok": False, "description": "Bad Request: can't parse entities"})
+
+        async with telegram_client([bad_markup], sent) as client:
+            await notifier._dispatch(client, "100")
+
+        assert len(sent) == 2
+        assert b"parse_mode" not in sent[1].read()
+        assert notifier.stats["leads"] == 1
+
+    @pytest.mark.asyncio
+    async def test_dispatcher_respects_chat_rate(self, tmp_path):
+        notifier = make_notifier(tmp_path)
+        for i in range(3):
+            await notifier.send_new_lead(LeadInput(phone=f"+7916123456{i}"))
+        notifier._bucket("100").tokens = 1
+        sent = []
+
+        client = telegram_client([], sent)
+
+        with patch('lead_validator.services.telegram.httpx.AsyncClient', lambda **kw: client):
+            task = asyncio.create_task(notifier.run_dispatcher())
+            await asyncio.sleep(0.05)
+            await notifier.send_new_lead(LeadInput(phone="+79169999999"))
+            await asyncio.sleep(0.05)
+            task.cancel()
+
+        # One token: one digest with all queued leads, the new lead waits
+        assert len(sent) == 1
+        assert notifier.pending_count() == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
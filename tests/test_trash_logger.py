@@ -0,0 +1,187 @@
+"""
+Unit tests for batched Airtable logging of rejected leads
+
+Tests cover:
+- Token bucket rate limiting
+- Grouping queued leads into Airtable batches
+- File fallback only for failed batches
+- Buffered local log with an indexed per-day stats sidecar
+- Stats of several workers are merged, unknown dates leave no files
+"""
+
+import pytest
+import asyncio
+import gzip
+import json
+import os
+import time
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+from fastapi import HTTPException
+from lead_validator.router import get_stats as stats_endpoint
+from lead_validator.schemas import RejectedLead
+from lead_validator.services.token_bucket import TokenBucket
+from lead_validator.services.trash_logger import TrashLogger
+
+
+def rejected(i: int) -> RejectedLead:
+    return RejectedLead(phone=f"+7916000{i:04d}", rejection_reason="duplicate_phone")
+
+
+class TestTokenBucket:
+    """Test the token bucket"""
+
+    @pytest.mark.asyncio
+    async def test_burst_then_rate(self):
+        bucket = TokenBucket(rate=20, capacity=5)
+        started = time.perf_counter()
+        for _ in range(7):
+            await bucket.acquire()
+        elapsed = time.perf_counter() - started
+
+        # 5 tokens at once, 2 more at 50 ms each
+        assert 0.08 < elapsed < 0.5
+
+
+class TestAirtableWriter:
+    """Test the background Airtable writer"""
+
+    @pytest.fixture
+    def logger(self, tmp_path):
+        trash = TrashLogger()
+        trash.airtable_enabled = True
+        trash.log_dir = tmp_path
+        with patch('lead_validator.services.trash_logger.settings.AIRTABLE_BATCH_WAIT_SEC', 0.05):
+            yield trash
+
+    async def _run(self, trash, leads):
+        writer = asyncio.create_task(trash.run_airtable_writer())
+        await asyncio.sleep(0)
+        for lead in leads:
+            assert await trash.log_rejected(lead)
+        while not trash._queue.empty():
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.1)
+        writer.cancel()
+        await asyncio.gather(writer, return_exceptions=True)
+
+    @pytest.mark.asyncio
+    async def test_leads_are_sent_in_batches_of_ten(self, logger):
+        logger._send_batch = AsyncMock(return_value=True)
+        logger._log_to_file = AsyncMock(return_value=True)
+
+        await self._run(logger, [rejected(i) for i in range(25)])
+
+        sizes = [len(call.args[1]) for call in logger._send_batch.await_args_list]
+        assert sizes == [10, 10, 5]
+        logger._log_to_file.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_failed_batch_falls_back_to_file(self, logger):
+        logger._send_batch = AsyncMock(side_effect=[True, False])
+        logger._log_to_file = AsyncMock(return_value=True)
+
+        await self._run(logger, [rejected(i) for i in range(15)])
+
+        assert logger._log_to_file.await_count == 5
+
+    @pytest.mark.asyncio
+    async def test_without_writer_logs_to_file(self, logger):
+        logger._log_to_file = AsyncMock(return_value=True)
+
+        await logger.log_rejected(rejected(1))
+
+        logger._log_to_file.assert_awaited_once()
+
+
+class TestLocalLog:
+    """Test the buffered JSONL writer and stats index"""
+
+    @pytest.fixture
+    def trash(self, tmp_path):
+        trash = TrashLogger()
+        trash.airtable_enabled = False
+        trash.log_dir = tmp_path
+        return trash
+
+    @pytest.mark.asyncio
+    async def test_writer_maintains_stats_index(self, trash):
+        writer = asyncio.create_task(trash.run_file_writer())
+        await asyncio.sleep(0)
+        for i in range(3):
+            await trash.log_rejected(rejected(i))
+        await trash.log_rejected(RejectedLead(phone="+79160000009", rejection_reason="bot_detected"))
+        writer.cancel()
+        await asyncio.gather(writer, return_exceptions=True)
+
+        # A fresh instance reads only the index
+        restarted = TrashLogger()
+        restarted.log_dir = trash.log_dir
+        restarted._count_log = None
+        stats = await restarted.get_stats()
+
+        assert stats["total"] == 4
+        assert stats["by_reason"] == {"duplicate_phone": 3, "bot_detected": 1}
+
+    @pytest.mark.asyncio
+    async def test_old_log_is_indexed_and_compressed(self, trash):
+        old_log = trash.log_dir / "rejected_2020-01-01.jsonl"
+        old_log.write_text(
+            json.dumps({"rejection_reason": "duplicate_phone"}) + "\n", encoding="utf-8"
+        )
+        stale = time.time() - 7200
+        os.utime(old_log, (stale, stale))
+
+        trash._compress_old_files()
+
+        assert not old_log.exists()
+        with gzip.open(f"{old_log}.gz", "rt", encoding="utf-8") as f:
+            assert len(f.readlines()) == 1
+        stats = await trash.get_stats("2020-01-01")
+        assert stats["by_reason"] == {"duplicate_phone": 1}
+
+    @pytest.mark.asyncio
+    async def test_workers_merge_counters(self, trash):
+        other = TrashLogger()
+        other.log_dir = trash.log_dir
+
+        for worker in (trash, other, trash):
+            await worker.log_rejected(rejected(1))
+
+        restarted = TrashLogger()
+        restarted.log_dir = trash.log_dir
+        stats = await restarted.get_stats()
+        assert stats["total"] == 3
+
+    @pytest.mark.asyncio
+    async def test_unsynced_counts_are_included(self, trash):
+        trash._write_records([("2024-03-01", {"rejection_reason": "bot_detected"})])
+
+        stats = await trash.get_stats("2024-03-01")
+
+        assert stats["by_reason"] == {"bot_detected": 1}
+        trash._close_file()
+
+    @pytest.mark.asyncio
+    async def test_unknown_date_leaves_no_files(self, trash):
+        stats = await trash.get_stats("2021-05-05")
+
+        assert stats["total"] == 0
+        assert not list(trash.log_dir.iterdir())
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("date", ["garbage", "2024-1-5", "2024-13-01", "../../etc"])
+    async def test_invalid_date_is_rejected(self, trash, date):
+        with pytest.raises(ValueError):
+            await trash.get_stats(date)
+        assert not list(trash.log_dir.iterdir())
+
+    @pytest.mark.asyncio
+    async def test_stats_endpoint_rejects_invalid_date(self):
+        with pytest.raises(HTTPException) as exc:
+            await stats_endpoint(date="garbage", current_user=SimpleNamespace(id=1))
+        assert exc.value.status_code == 400
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])